@@ -308,15 +308,17 @@ async def set_active_provider(
 
     await ProviderRegistry.notify_change(active.domain, active.version or 1)
 
-    if idem_key:
-        await set_idempotency_result(idem_key, status_code=200, ttl_seconds=None, request=request)
-
-    return ActiveProviderOut(
+    out = ActiveProviderOut(
         domain=active.domain,
         provider=active.provider,
         version=active.version or 1,
         updated_at=active.updated_at,
     )
+    if idem_key:
+        await set_idempotency_result(
+            idem_key, status_code=200, ttl_seconds=None, request=request, body=out.model_dump(mode="json")
+        )
+    return out
 
 
 @router.get("/events", response_model=list[ProviderEventOut])
@@ -414,16 +416,19 @@ async def set_provider_config(
         actor_user_id=getattr(admin, "id", None),
         actor_email=getattr(admin, "email", None),
     )
-    if idem_key:
-        await set_idempotency_result(idem_key, status_code=200, ttl_seconds=None, request=request)
     cfg = await ProviderConfigService.get_redacted_config(db, domain=item.domain, provider=item.provider)
-    return ProviderConfigOut(
+    out = ProviderConfigOut(
         domain=item.domain,
         provider=item.provider,
         config=cfg,
         key_id=item.key_id,
         updated_at=item.updated_at,
     )
+    if idem_key:
+        await set_idempotency_result(
+            idem_key, status_code=200, ttl_seconds=None, request=request, body=out.model_dump(mode="json")
+        )
+    return out
 
 
 @router.post(
@@ -539,16 +544,19 @@ async def set_messaging_config(
         actor_user_id=getattr(admin, "id", None),
         actor_email=getattr(admin, "email", None),
     )
-    if idem_key:
-        await set_idempotency_result(idem_key, status_code=200, ttl_seconds=None, request=request)
     cfg = await ProviderConfigService.get_redacted_config(db, domain=item.domain, provider=item.provider)
-    return ProviderConfigOut(
+    out = ProviderConfigOut(
         domain=item.domain,
         provider=item.provider,
         config=cfg,
         key_id=item.key_id,
         updated_at=item.updated_at,
     )
+    if idem_key:
+        await set_idempotency_result(
+            idem_key, status_code=200, ttl_seconds=None, request=request, body=out.model_dump(mode="json")
+        )
+    return out
 
 
 @router.get("/messaging/healthcheck", response_model=ProviderHealthcheckOut)
@@ -654,16 +662,19 @@ async def set_payment_config(
         meta=payload.meta,
         actor_user_id=getattr(admin, "id", None),
     )
-    if idem_key:
-        await set_idempotency_result(idem_key, status_code=200, ttl_seconds=None, request=request)
     cfg = await ProviderConfigService.get_redacted_config(db, domain=item.domain, provider=item.provider)
-    return ProviderConfigOut(
+    out = ProviderConfigOut(
         domain=item.domain,
         provider=item.provider,
         config=cfg,
         key_id=item.key_id,
         updated_at=item.updated_at,
     )
+    if idem_key:
+        await set_idempotency_result(
+            idem_key, status_code=200, ttl_seconds=None, request=request, body=out.model_dump(mode="json")
+        )
+    return out
 
 
 @router.get("/payments/healthcheck", response_model=ProviderHealthcheckOut)
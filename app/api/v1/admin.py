@@ -70,7 +70,7 @@ from app.services.campaign_runner import (
     queue_campaign_run as queue_campaign_run_service,
 )
 from app.services.repricing import run_reprcing_for_company
-from app.services.subscriptions import activate_plan, renew_if_due
+from app.services.subscriptions import activate_plan, renew_due_subscriptions
 from app.services.tenant_diagnostics import get_tenant_diagnostics_summary
 from app.services.tenant_export import build_tenant_export_manifest
 from app.utils.tokens import generate_token, hash_token
@@ -252,13 +252,9 @@ async def run_subscription_renew_task(
     db: AsyncSession = Depends(get_async_db),
 ) -> dict:
     _ = admin
-    processed = await renew_if_due(db, now=datetime.now(UTC))
-    if processed:
-        await db.commit()
-    else:
-        await db.rollback()
+    stats = await renew_due_subscriptions(db, now=datetime.now(UTC), commit_per_chunk=True)
     rid = _ensure_request_id(request)
-    return {"ok": True, "processed": processed, "request_id": rid}
+    return {"ok": True, "processed": stats.processed, "run": stats.as_dict(), "request_id": rid}
 
 
 class CampaignRunIn(BaseModel):
@@ -32,6 +32,7 @@ from app.schemas.analytics import (
     ProductAnalytics,
     SalesAnalytics,
 )
+from app.services.sales_rollups import read_sales_buckets, rollups_enabled, truncate_period
 from app.utils.excel import export_analytics_to_excel
 from app.utils.pdf import export_analytics_to_pdf
 
@@ -519,6 +520,19 @@ async def get_sales_data(
     """
     interval = _normalize_interval(interval)
 
+    resolved_company_id = resolve_tenant_company_id(current_user, not_found_detail="Company not set")
+
+    if rollups_enabled():
+        # Закрытые периоды — из sales_rollups, сырые заказы только для открытого часа и краёв диапазона.
+        revenue_by_period: dict[datetime, Decimal] = {}
+        buckets = await read_sales_buckets(db, company_id=resolved_company_id, date_from=start_date, date_to=end_date)
+        for bucket in buckets:
+            if not bucket.paid_orders_count:
+                continue
+            period = truncate_period(bucket.bucket_start, interval)
+            revenue_by_period[period] = revenue_by_period.get(period, Decimal("0")) + Decimal(bucket.paid_revenue)
+        return _build_sales_analytics(sorted(revenue_by_period.items()), interval)
+
     # date_trunc by interval
     if interval == "day":
         date_trunc = func.date_trunc("day", Order.created_at)
@@ -527,8 +541,6 @@ async def get_sales_data(
     else:  # month
         date_trunc = func.date_trunc("month", Order.created_at)
 
-    resolved_company_id = resolve_tenant_company_id(current_user, not_found_detail="Company not set")
-
     res = await db.execute(
         select(
             date_trunc.label("period"),
@@ -545,19 +557,21 @@ async def get_sales_data(
         .group_by("period")
         .order_by("period")
     )
-    rows = res.all()
+    return _build_sales_analytics([(row.period, row.revenue) for row in res.all()], interval)
+
 
+def _build_sales_analytics(rows: list[tuple[datetime, Decimal | float | int | None]], interval: str) -> SalesAnalytics:
     labels: list[str] = []
     data: list[float] = []
-    for row in rows:
-        period: datetime = row.period  # date_trunc returns timestamp
+    for period, revenue in rows:
+        # period — начало day/week/month (date_trunc)
         if interval == "day":
             labels.append(period.strftime("%Y-%m-%d"))
         elif interval == "week":
             labels.append(f"Week of {period.strftime('%Y-%m-%d')}")
         else:
             labels.append(period.strftime("%Y-%m"))
-        data.append(_float_safe(row.revenue))
+        data.append(_float_safe(revenue))
 
     total = _float_safe(sum(data))
     average = total / len(data) if data else 0.0
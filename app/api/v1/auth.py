@@ -28,7 +28,7 @@ import time
 from datetime import UTC, datetime, timedelta
 from typing import Any
 
-from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, HTTPException, Query, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel, Field
 from sqlalchemy import select, update
@@ -37,7 +37,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import noload
 
 from app.core.config import settings
-from app.core.db import get_async_db
+from app.core.db import get_async_db, get_async_session_maker
 from app.core.dependencies import (
     auth_rate_limit,
     enforce_rate_limit,
@@ -56,18 +56,20 @@ from app.core.exceptions import (
 from app.core.logging import audit_logger, get_logger
 from app.core.rbac import is_superuser
 from app.core.security import (
+    PasswordHashingBusy,
     create_access_token,
     create_refresh_token,
     decode_and_validate,
     denylist_key_for_token,
-    get_password_hash,
+    get_password_hash_async,
     get_refresh_from_cookie,
     mark_access_token_revoked,
+    needs_rehash,
     resolve_tenant_company_id,
     revoke_token,
     validate_csrf_token,
     validate_password_policy,
-    verify_password,
+    verify_password_async,
 )
 from app.integrations.errors import ProviderNotConfiguredError
 from app.integrations.ports.otp import OtpProvider
@@ -91,6 +93,7 @@ from app.schemas.user import (
     UserCreate,
     UserLogin,
 )
+from app.services.message_dispatch import MessageQueueFull, dispatch_otp
 from app.services.messaging import MessagingConfigError, send_email
 from app.services.otp_providers import is_otp_active, require_otp_provider_or_admin_bypass
 from app.utils.otp import create_otp_attempt, verify_otp_code
@@ -314,46 +317,6 @@ def _public_url() -> str:
     return str(getattr(settings, "PUBLIC_URL", os.getenv("PUBLIC_URL", "http://localhost:8000")) or "").rstrip("/")
 
 
-# =============================================================================
-# SMS provider (ленивая инициализация)
-# =============================================================================
-
-_SMS_CLIENT = None
-
-
-def _get_sms_client_or_none():
-    """
-    Ожидается реализация через app.integrations.sms_base.get_sms_client().
-    Если провайдер не сконфигурирован — возвращаем None (без падений).
-    """
-    global _SMS_CLIENT
-    if _SMS_CLIENT is not None:
-        return _SMS_CLIENT
-    try:
-        from app.integrations.sms_base import get_sms_client  # type: ignore
-
-        _SMS_CLIENT = get_sms_client()
-        return _SMS_CLIENT
-    except Exception:
-        return None
-
-
-def _send_otp_via_provider(phone: str, text: str) -> dict | None:
-    client = _get_sms_client_or_none()
-    if client is None:
-        return None
-    try:
-        return client.send_sms(recipient=phone, text=text)
-    except Exception as e:
-        audit_logger.log_system_event(
-            level="warning",
-            event="sms_send_failed",
-            message=str(e),
-            meta={"phone": phone},
-        )
-        return {"success": False, "error": str(e)}
-
-
 # =============================================================================
 # Health/debug
 # =============================================================================
@@ -435,7 +398,7 @@ async def register(user_data: UserCreate, request: Request, db: AsyncSession = D
 
     try:
         _enforce_password_policy(user_data.password, username=phone or None, email=email)
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await get_password_hash_async(user_data.password)
 
         # Create draft Company (tenant) for the new user
         company_name = (user_data.company_name or "").strip()
@@ -525,12 +488,35 @@ async def register(user_data: UserCreate, request: Request, db: AsyncSession = D
 # =============================================================================
 
 
+async def _rehash_password(user_id: int, old_hash: str, password: str) -> None:
+    """Пересчёт устаревшего хеша (bcrypt→argon2, новые параметры) после ответа на логин."""
+    try:
+        new_hash = await get_password_hash_async(password)
+        async with get_async_session_maker()() as session:
+            # compare-and-set: не затираем пароль, сменённый параллельно
+            await session.execute(
+                update(User)
+                .where(User.id == user_id, User.hashed_password == old_hash)
+                .values(hashed_password=new_hash)
+            )
+            await session.commit()
+    except PasswordHashingBusy:
+        return  # пул занят — пересчитаем при следующем входе
+    except Exception as exc:
+        logger.warning("password rehash failed user_id=%s error=%s", user_id, exc)
+
+
 @router.post(
     "/login",
     response_model=TokenResponse,
     dependencies=[Depends(auth_rate_limit)],
 )
-async def login(login_data: UserLogin, request: Request, db: AsyncSession = Depends(get_async_db)):
+async def login(
+    login_data: UserLogin,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+):
     """Аутентификация по телефону и паролю. Возвращает access/refresh токены."""
     client_info = get_client_info(request)
     identifier = (login_data.identifier or "").strip()
@@ -574,7 +560,7 @@ async def login(login_data: UserLogin, request: Request, db: AsyncSession = Depe
         user.otp_setup_required = False
     else:
         password = login_data.password or ""
-        if not user or not verify_password(password, user.hashed_password):
+        if not user or not await verify_password_async(password, user.hashed_password):
             if user:
                 user.failed_login_attempts = (user.failed_login_attempts or 0) + 1
                 if user.failed_login_attempts >= LOGIN_MAX_FAILS:
@@ -587,6 +573,8 @@ async def login(login_data: UserLogin, request: Request, db: AsyncSession = Depe
                 reason="Invalid credentials",
             )
             raise AuthenticationError("Invalid credentials", "INVALID_CREDENTIALS")
+        if needs_rehash(user.hashed_password):
+            background_tasks.add_task(_rehash_password, user.id, user.hashed_password, password)
 
     if not user.is_active:
         audit_logger.log_auth_failure(
@@ -844,14 +832,14 @@ async def change_password(
     db: AsyncSession = Depends(get_async_db),
 ):
     """Change password for current user and revoke active refresh sessions."""
-    if not verify_password(payload.current_password, current_user.hashed_password):
+    if not await verify_password_async(payload.current_password, current_user.hashed_password):
         raise AuthenticationError("Current password is incorrect", "INVALID_OLD_PASSWORD")
 
     if payload.current_password == payload.new_password:
         raise SmartSellValidationError("New password must be different", "PASSWORD_SAME")
 
     _enforce_password_policy(payload.new_password, username=current_user.phone, email=current_user.email)
-    new_hash = get_password_hash(payload.new_password)
+    new_hash = await get_password_hash_async(payload.new_password)
 
     # Persist password change + reset counters in a single UPDATE to avoid stale identity issues
     await db.execute(
@@ -954,7 +942,8 @@ async def request_otp(
     provider_version: int | None = None
 
     try:
-        send_result = await otp_service.send_otp(
+        send_result = await dispatch_otp(
+            otp_service,
             phone=phone,
             code=code,
             ttl_seconds=int(ttl.total_seconds()),
@@ -964,6 +953,8 @@ async def request_otp(
         provider_version = (send_result or {}).get("version") or getattr(otp_service, "version", None)
     except ProviderNotConfiguredError as exc:
         raise HTTPException(status_code=503, detail=exc.code)
+    except MessageQueueFull:
+        raise
     except Exception as exc:
         provider_name = getattr(otp_service, "name", None) or "noop"
         provider_version = getattr(otp_service, "version", None)
@@ -1173,7 +1164,7 @@ async def accept_invitation(payload: InvitationAccept, db: AsyncSession = Depend
             role=invite.role,
             is_active=True,
             is_verified=False,
-            hashed_password=get_password_hash(payload.password),
+            hashed_password=await get_password_hash_async(payload.password),
         )
         db.add(user)
         invite.used_at = _utcnow_naive()
@@ -1224,7 +1215,7 @@ async def reset_password(reset_data: PasswordReset, db: AsyncSession = Depends(g
         raise AuthenticationError("User not found", "USER_NOT_FOUND")
 
     _enforce_password_policy(reset_data.new_password, username=user.phone, email=user.email)
-    user.hashed_password = get_password_hash(reset_data.new_password)
+    user.hashed_password = await get_password_hash_async(reset_data.new_password)
     user.failed_login_attempts = 0
     user.locked_until = None
 
@@ -1287,7 +1278,8 @@ async def phone_change_request(
     provider_version: int | None = None
 
     try:
-        send_result = await otp_service.send_otp(
+        send_result = await dispatch_otp(
+            otp_service,
             phone=phone,
             code=code,
             ttl_seconds=int(timedelta(minutes=OTP_TTL_MINUTES).total_seconds()),
@@ -1297,6 +1289,8 @@ async def phone_change_request(
         provider_version = (send_result or {}).get("version") or getattr(otp_service, "version", None)
     except ProviderNotConfiguredError as exc:
         raise HTTPException(status_code=503, detail=exc.code)
+    except MessageQueueFull:
+        raise
     except Exception as exc:
         provider_name = getattr(otp_service, "name", None) or "noop"
         provider_version = getattr(otp_service, "version", None)
@@ -1427,6 +1421,7 @@ async def password_reset_request(
             subject="Password reset",
             body=f"Reset your password: {reset_url}",
             meta={"user_id": user.id},
+            queued=True,
         )
     except MessagingConfigError:
         if _is_production():
@@ -1468,7 +1463,7 @@ async def password_reset_confirm(
             raise SmartSellValidationError("Invalid or expired token", "RESET_TOKEN_INVALID")
 
         _enforce_password_policy(payload.new_password, username=user.phone, email=user.email)
-        user.hashed_password = get_password_hash(payload.new_password)
+        user.hashed_password = await get_password_hash_async(payload.new_password)
         user.failed_login_attempts = 0
         user.locked_until = None
         reset_obj.used_at = _utcnow_naive()
@@ -1,15 +1,15 @@
 from __future__ import annotations
 
+from collections.abc import AsyncIterator, Callable, Sequence
 from datetime import UTC, date, datetime, time
-from io import BytesIO
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
-from openpyxl import Workbook
-from sqlalchemy import func, select
+from sqlalchemy import Select, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.db import get_async_db
 from app.core.dependencies import (
     get_current_verified_user,
@@ -18,14 +18,18 @@ from app.core.dependencies import (
     require_store_admin_company,
 )
 from app.core.security import resolve_tenant_company_id
-from app.models.billing import BillingInvoice
 from app.models.order import Order, OrderItem
 from app.models.product import Product
 from app.models.user import User
-from app.services.exports.products_xlsx import build_products_xlsx
-from app.services.exports.sales_xlsx import build_sales_xlsx
+from app.services.exports.orders_xlsx import ORDERS_HEADERS, ORDERS_SHEET_TITLE
+from app.services.exports.products_xlsx import PRODUCTS_HEADERS, PRODUCTS_SHEET_TITLE
+from app.services.exports.sales_xlsx import SALES_HEADERS, SALES_SHEET_TITLE
+from app.services.exports.xlsx_stream import XLSX_MEDIA_TYPE, stream_xlsx
 from app.utils.pii import mask_phone
 
+# Выгрузка потоковая (серверный курсор + запись zip в отдельном потоке), поэтому лимит — сотни тысяч строк.
+_MAX_EXPORT_ROWS = max(1, int(getattr(settings, "EXPORT_XLSX_MAX_ROWS", 500_000) or 500_000))
+
 
 async def _require_company_context(current_user: User = Depends(get_current_verified_user)) -> User:
     resolve_tenant_company_id(current_user, not_found_detail="Company not set")
@@ -74,14 +78,7 @@ def _date_bounds(date_from: date | None, date_to: date | None) -> tuple[datetime
     return start_dt, end_dt
 
 
-async def _fetch_orders(
-    db: AsyncSession,
-    *,
-    company_id: int,
-    date_from: datetime | None,
-    date_to: datetime | None,
-    limit: int,
-) -> list[dict[str, Any]]:
+def _items_count_column():
     items_count_sq = (
         select(
             OrderItem.order_id.label("oid"),
@@ -90,64 +87,60 @@ async def _fetch_orders(
         .group_by(OrderItem.order_id)
         .subquery()
     )
-    items_count = func.coalesce(items_count_sq.c.items_count, 0).label("items_count")
+    return items_count_sq, func.coalesce(items_count_sq.c.items_count, 0).label("items_count")
 
-    last_invoice_id_sq = (
-        select(func.max(BillingInvoice.id))
-        .where(BillingInvoice.order_id == Order.id)
-        .correlate(Order)
-        .scalar_subquery()
-    )
 
+def _orders_stmt(
+    *,
+    company_id: int,
+    date_from: datetime | None,
+    date_to: datetime | None,
+    limit: int,
+) -> Select:
+    items_count_sq, items_count = _items_count_column()
     stmt = (
-        select(Order, items_count, BillingInvoice)
+        select(
+            Order.id,
+            Order.created_at,
+            Order.status,
+            Order.total_amount,
+            Order.customer_name,
+            Order.customer_phone,
+            items_count,
+        )
         .outerjoin(items_count_sq, items_count_sq.c.oid == Order.id)
-        .outerjoin(BillingInvoice, BillingInvoice.id == last_invoice_id_sq)
         .where(Order.company_id == company_id)
     )
     if date_from:
         stmt = stmt.where(Order.created_at >= date_from)
     if date_to:
         stmt = stmt.where(Order.created_at <= date_to)
-    stmt = stmt.order_by(Order.created_at.desc()).limit(limit)
-    rows = (await db.execute(stmt)).all()
-
-    results: list[dict[str, Any]] = []
-    for order, count, _invoice in rows:
-        results.append(
-            {
-                "order_id": order.id,
-                "created_at": order.created_at.isoformat() if order.created_at else None,
-                "status": str(order.status),
-                "total_price": str(order.total_amount) if order.total_amount is not None else None,
-                "customer_name": order.customer_name or "",
-                "customer_phone": mask_phone(order.customer_phone or "") if order.customer_phone else "",
-                "items_count": int(count or 0),
-            }
-        )
-    return results
+    return stmt.order_by(Order.created_at.desc()).limit(limit)
+
+
+def _order_row(row: Sequence[Any]) -> list[Any]:
+    order_id, created_at, status, total_amount, customer_name, customer_phone, count = row
+    return [
+        order_id,
+        created_at.isoformat() if created_at else None,
+        str(status),
+        str(total_amount) if total_amount is not None else None,
+        customer_name or "",
+        mask_phone(customer_phone or "") if customer_phone else "",
+        int(count or 0),
+    ]
 
 
-async def _fetch_sales_rows(
-    db: AsyncSession,
+def _sales_stmt(
     *,
     company_id: int,
     date_from: datetime | None,
     date_to: datetime | None,
     limit: int,
-) -> list[dict[str, Any]]:
-    items_count_sq = (
-        select(
-            OrderItem.order_id.label("oid"),
-            func.count(OrderItem.id).label("items_count"),
-        )
-        .group_by(OrderItem.order_id)
-        .subquery()
-    )
-    items_count = func.coalesce(items_count_sq.c.items_count, 0).label("items_count")
-
+) -> Select:
+    items_count_sq, items_count = _items_count_column()
     stmt = (
-        select(Order, items_count)
+        select(Order.id, Order.created_at, Order.total_amount, items_count)
         .outerjoin(items_count_sq, items_count_sq.c.oid == Order.id)
         .where(Order.company_id == company_id)
     )
@@ -155,90 +148,87 @@ async def _fetch_sales_rows(
         stmt = stmt.where(Order.created_at >= date_from)
     if date_to:
         stmt = stmt.where(Order.created_at <= date_to)
-    stmt = stmt.order_by(Order.created_at.desc()).limit(limit)
-    rows = (await db.execute(stmt)).all()
-
-    results: list[dict[str, Any]] = []
-    for order, count in rows:
-        results.append(
-            {
-                "order_id": order.id,
-                "created_at": order.created_at.isoformat() if order.created_at else None,
-                "total_amount": str(order.total_amount) if order.total_amount is not None else None,
-                "items_count": int(count or 0),
-            }
-        )
-    return results
+    return stmt.order_by(Order.created_at.desc()).limit(limit)
 
 
-async def _fetch_products_rows(
-    db: AsyncSession,
-    *,
-    company_id: int,
-    limit: int,
-) -> list[dict[str, Any]]:
-    stmt = (
+def _sales_row(row: Sequence[Any]) -> list[Any]:
+    order_id, created_at, total_amount, count = row
+    return [
+        order_id,
+        created_at.isoformat() if created_at else None,
+        str(total_amount) if total_amount is not None else None,
+        int(count or 0),
+    ]
+
+
+def _products_stmt(*, company_id: int, limit: int) -> Select:
+    return (
         select(Product.id, Product.sku, Product.name, Product.price, Product.created_at)
         .where(Product.company_id == company_id)
         .order_by(Product.created_at.desc())
         .limit(limit)
     )
-    rows = (await db.execute(stmt)).all()
-
-    results: list[dict[str, Any]] = []
-    for pid, sku, name, price, created_at in rows:
-        results.append(
-            {
-                "product_id": pid,
-                "sku": sku or "",
-                "name": name or "",
-                "price": str(price) if price is not None else "",
-                "created_at": created_at.isoformat() if created_at else "",
-            }
-        )
-    return results
+
+
+def _product_row(row: Sequence[Any]) -> list[Any]:
+    pid, sku, name, price, created_at = row
+    return [
+        pid,
+        sku or "",
+        name or "",
+        str(price) if price is not None else "",
+        created_at.isoformat() if created_at else "",
+    ]
+
+
+async def _iter_batches(
+    db: AsyncSession,
+    stmt: Select,
+    convert: Callable[[Sequence[Any]], list[Any]],
+) -> AsyncIterator[list[list[Any]]]:
+    """Server-side cursor: rows arrive in ``EXPORT_XLSX_BATCH_SIZE`` partitions."""
+    batch_size = max(1, int(getattr(settings, "EXPORT_XLSX_BATCH_SIZE", 2000) or 2000))
+    result = await db.stream(stmt.execution_options(yield_per=batch_size))
+    try:
+        async for partition in result.partitions():
+            yield [convert(row) for row in partition]
+    finally:
+        await result.close()
+
+
+def _xlsx_response(
+    filename: str,
+    *,
+    sheet_title: str,
+    headers: list[str],
+    batches: AsyncIterator[list[list[Any]]],
+) -> StreamingResponse:
+    return StreamingResponse(
+        stream_xlsx(sheet_title=sheet_title, headers=headers, batches=batches),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
 
 
 @router.get("/orders.xlsx")
 async def export_orders_xlsx(
     date_from: str | None = Query(default=None),
     date_to: str | None = Query(default=None),
-    limit: int = Query(default=1000, ge=1, le=5000),
+    limit: int = Query(default=1000, ge=1, le=_MAX_EXPORT_ROWS),
     admin: User = Depends(get_current_verified_user),
     db: AsyncSession = Depends(get_async_db),
-) -> Response:
+) -> StreamingResponse:
     _ = admin
     company_id = resolve_tenant_company_id(admin, not_found_detail="Company not set")
     df = _parse_dt(date_from, "date_from")
     dt = _parse_dt(date_to, "date_to")
 
-    rows = await _fetch_orders(db, company_id=company_id, date_from=df, date_to=dt, limit=limit)
-
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = "orders"
-
-    headers = [
-        "order_id",
-        "created_at",
-        "status",
-        "total_price",
-        "customer_name",
-        "customer_phone",
-        "items_count",
-    ]
-    sheet.append(headers)
-    for row in rows:
-        sheet.append([row.get(h) for h in headers])
-
-    buffer = BytesIO()
-    workbook.save(buffer)
-    buffer.seek(0)
-
-    return Response(
-        content=buffer.getvalue(),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=orders.xlsx"},
+    stmt = _orders_stmt(company_id=company_id, date_from=df, date_to=dt, limit=limit)
+    return _xlsx_response(
+        "orders.xlsx",
+        sheet_title=ORDERS_SHEET_TITLE,
+        headers=ORDERS_HEADERS,
+        batches=_iter_batches(db, stmt, _order_row),
     )
 
 
@@ -246,7 +236,7 @@ async def export_orders_xlsx(
 async def export_sales_xlsx(
     date_from: str | None = Query(default=None),
     date_to: str | None = Query(default=None),
-    limit: int = Query(default=1000, ge=1, le=5000),
+    limit: int = Query(default=1000, ge=1, le=_MAX_EXPORT_ROWS),
     admin: User = Depends(get_current_verified_user),
     db: AsyncSession = Depends(get_async_db),
 ) -> StreamingResponse:
@@ -254,30 +244,28 @@ async def export_sales_xlsx(
     company_id = resolve_tenant_company_id(admin, not_found_detail="Company not set")
     start_dt, end_dt = _date_bounds(_parse_date(date_from, "date_from"), _parse_date(date_to, "date_to"))
 
-    rows = await _fetch_sales_rows(db, company_id=company_id, date_from=start_dt, date_to=end_dt, limit=limit)
-    content = build_sales_xlsx(rows)
-
-    return StreamingResponse(
-        BytesIO(content),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=sales.xlsx"},
+    stmt = _sales_stmt(company_id=company_id, date_from=start_dt, date_to=end_dt, limit=limit)
+    return _xlsx_response(
+        "sales.xlsx",
+        sheet_title=SALES_SHEET_TITLE,
+        headers=SALES_HEADERS,
+        batches=_iter_batches(db, stmt, _sales_row),
     )
 
 
 @router.get("/products.xlsx")
 async def export_products_xlsx(
-    limit: int = Query(default=1000, ge=1, le=5000),
+    limit: int = Query(default=1000, ge=1, le=_MAX_EXPORT_ROWS),
     admin: User = Depends(get_current_verified_user),
     db: AsyncSession = Depends(get_async_db),
 ) -> StreamingResponse:
     _ = admin
     company_id = resolve_tenant_company_id(admin, not_found_detail="Company not set")
 
-    rows = await _fetch_products_rows(db, company_id=company_id, limit=limit)
-    content = build_products_xlsx(rows)
-
-    return StreamingResponse(
-        BytesIO(content),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=products.xlsx"},
+    stmt = _products_stmt(company_id=company_id, limit=limit)
+    return _xlsx_response(
+        "products.xlsx",
+        sheet_title=PRODUCTS_SHEET_TITLE,
+        headers=PRODUCTS_HEADERS,
+        batches=_iter_batches(db, stmt, _product_row),
     )
@@ -34,21 +34,35 @@ import io
 import json
 import os
 import secrets
+import tempfile
 import time
+from collections.abc import Iterator
 from datetime import UTC, datetime, timedelta
 from decimal import Decimal
 from email.utils import formatdate, parsedate_to_datetime
 from hashlib import sha256
 from pathlib import Path
-from typing import Any, Literal
+from typing import IO, Any, Literal
 from uuid import UUID, uuid4
 from xml.etree import ElementTree as ET
 
 import httpx
 import sqlalchemy as sa
-from fastapi import APIRouter, Body, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Body,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from openpyxl import Workbook, load_workbook
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 from sqlalchemy import bindparam, literal_column, select, text
@@ -136,6 +150,14 @@ from app.models.kaspi_import_run import KaspiImportRun
 from app.models.kaspi_mc_session import KaspiMcSession
 from app.models.kaspi_offer import KaspiOffer
 from app.models.kaspi_order_sync_state import KaspiOrderSyncState
+from app.models.kaspi_sync_now_job import (
+    SYNC_NOW_JOB_ACTIVE_STATUSES,
+    SYNC_NOW_JOB_DONE,
+    SYNC_NOW_JOB_FAILED,
+    SYNC_NOW_JOB_PENDING,
+    SYNC_NOW_JOB_RUNNING,
+    KaspiSyncNowJob,
+)
 from app.models.marketplace import KaspiStoreToken
 from app.models.order import Order, OrderSource, OrderStatus, OrderStatusHistory
 from app.models.user import User
@@ -157,6 +179,8 @@ from app.schemas.kaspi_local_legacy import (
     KaspiMcSyncOut,
     KaspiTokenMaskedOut,
 )
+from app.services import kaspi_catalog_import as catalog_import_service
+from app.services import kaspi_orders_sync_scheduler
 from app.services.integration_events import record_integration_event
 from app.services.kaspi_feed_upload_service import (
     compute_feed_payload_hash,
@@ -200,6 +224,7 @@ MASK_CHAR = "..."
 STATUS_LAST_ERROR_MAX_LEN = 500
 FAST_PROBE_TIMEOUT = 5.0
 SYNC_NOW_TIMEOUT_SEC = 25.0
+SYNC_NOW_EVENTS_POLL_SEC = 1.0
 
 
 try:  # pragma: no cover - py<3.11 compatibility
@@ -386,6 +411,81 @@ async def _release_sync_now_lock(session: AsyncSession, *, company_id: int, merc
     await session.execute(text("SELECT pg_advisory_unlock(:lock_key)").bindparams(lock_key=lock_key))
 
 
+def _sync_now_background_timeout() -> float:
+    return max(1.0, float(getattr(settings, "KASPI_SYNC_NOW_BACKGROUND_TIMEOUT_SECONDS", 600.0) or 600.0))
+
+
+def _sync_now_stale_before(now: datetime | None = None) -> datetime:
+    # Фоновый синк ограничен бюджетом; без записи прогресса дольше бюджета (+запас) — процесс умер.
+    return (now or datetime.utcnow()) - timedelta(seconds=_sync_now_background_timeout() + 60)
+
+
+async def _fail_stale_sync_now_jobs(
+    session: AsyncSession,
+    *,
+    company_id: int,
+    merchant_uid: str | None = None,
+    job_id: Any = None,
+) -> int:
+    """Активные задачи без прогресса дольше бюджета → FAILED (освобождает и unique-индекс активных)."""
+    now = datetime.utcnow()
+    stmt = sa.update(KaspiSyncNowJob).where(
+        KaspiSyncNowJob.company_id == company_id,
+        KaspiSyncNowJob.status.in_(SYNC_NOW_JOB_ACTIVE_STATUSES),
+        KaspiSyncNowJob.updated_at < _sync_now_stale_before(now),
+    )
+    if merchant_uid is not None:
+        stmt = stmt.where(KaspiSyncNowJob.merchant_uid == merchant_uid)
+    if job_id is not None:
+        stmt = stmt.where(KaspiSyncNowJob.id == job_id)
+    res = await session.execute(
+        stmt.values(
+            status=SYNC_NOW_JOB_FAILED,
+            error_code="kaspi_sync_stale",
+            error_message="Background sync stopped reporting progress",
+            finished_at=now,
+            updated_at=now,
+        ).execution_options(synchronize_session=False)
+    )
+    swept = int(res.rowcount or 0)
+    if swept:
+        await session.commit()
+    return swept
+
+
+async def _update_sync_now_job(session_factory: Any, job_id: Any, **values: Any) -> None:
+    # Прогресс пишется короткой отдельной транзакцией: сессия синка держит свою до конца фазы.
+    async with session_factory() as progress_session:
+        await progress_session.execute(
+            sa.update(KaspiSyncNowJob)
+            .where(KaspiSyncNowJob.id == job_id)
+            .values(**values, updated_at=datetime.utcnow())
+        )
+        await progress_session.commit()
+
+
+def _sync_now_job_to_out(job: KaspiSyncNowJob) -> KaspiSyncNowJobOut:
+    return KaspiSyncNowJobOut(
+        job_id=str(job.id),
+        status=job.status,
+        phase=job.phase,
+        company_id=job.company_id,
+        merchant_uid=job.merchant_uid,
+        pages_fetched=job.pages_fetched or 0,
+        orders_fetched=job.orders_fetched or 0,
+        orders_upserted=job.orders_upserted or 0,
+        http_status=job.http_status,
+        result=job.result_json,
+        error_code=job.error_code,
+        error_message=job.error_message,
+        request_id=job.request_id,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+    )
+
+
 async def _resolve_kaspi_token(session: AsyncSession, company_id: int) -> tuple[str, str]:
     company = (await session.execute(sa.select(Company).where(Company.id == company_id))).scalars().first()
     if not company:
@@ -789,75 +889,75 @@ def _normalize_catalog_row(raw: dict[str, Any]) -> dict[str, Any]:
     }
 
 
-def _parse_csv_rows(content: bytes) -> list[dict[str, Any]]:
-    try:
-        text = content.decode("utf-8-sig", errors="replace")
-    except Exception:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_encoding")
-
+def _iter_csv_rows(stream: IO[str]) -> Iterator[dict[str, Any]]:
     try:
-        sample = text[:4096]
+        sample = stream.read(4096)
+        stream.seek(0)
         dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
     except Exception:
         dialect = csv.excel
         dialect.delimiter = ","
 
-    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    reader = csv.DictReader(stream, dialect=dialect)
     if not reader.fieldnames:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="missing_headers")
 
-    rows: list[dict[str, Any]] = []
     for raw in reader:
         if raw is None:
             continue
         if all((str(v).strip() == "" if v is not None else True) for v in raw.values()):
             continue
-        rows.append(raw)
-    return rows
+        yield raw
 
 
-def _parse_xlsx_rows(content: bytes) -> list[dict[str, Any]]:
+def _parse_csv_rows(content: bytes) -> list[dict[str, Any]]:
     try:
-        wb = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        text = content.decode("utf-8-sig", errors="replace")
     except Exception:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_xlsx")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_encoding")
+    return list(_iter_csv_rows(io.StringIO(text)))
 
-    sheet = wb.worksheets[0]
-    header_row: list[str] | None = None
-    rows: list[dict[str, Any]] = []
 
-    for row in sheet.iter_rows(values_only=True):
-        values = [str(c).strip() if c is not None else "" for c in row]
-        if header_row is None:
-            if any(values):
-                header_row = values
-            continue
+def _iter_xlsx_rows(source: str | Path | IO[bytes]) -> Iterator[dict[str, Any]]:
+    try:
+        wb = load_workbook(source, read_only=True, data_only=True)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_xlsx")
 
-        if not any(values):
-            continue
+    try:
+        sheet = wb.worksheets[0]
+        header_row: list[str] | None = None
+
+        for row in sheet.iter_rows(values_only=True):
+            values = [str(c).strip() if c is not None else "" for c in row]
+            if header_row is None:
+                if any(values):
+                    header_row = values
+                continue
 
-        raw: dict[str, Any] = {}
-        for idx, header in enumerate(header_row):
-            if not header:
+            if not any(values):
                 continue
-            raw[header] = row[idx] if idx < len(row) else None
-        rows.append(raw)
 
-    if header_row is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="missing_headers")
+            raw: dict[str, Any] = {}
+            for idx, header in enumerate(header_row):
+                if not header:
+                    continue
+                raw[header] = row[idx] if idx < len(row) else None
+            yield raw
 
-    return rows
+        if header_row is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="missing_headers")
+    finally:
+        wb.close()
 
 
-def _parse_json_rows(content: bytes, is_jsonl: bool) -> list[dict[str, Any]]:
-    try:
-        text = content.decode("utf-8-sig", errors="replace")
-    except Exception:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_encoding")
+def _parse_xlsx_rows(content: bytes) -> list[dict[str, Any]]:
+    return list(_iter_xlsx_rows(io.BytesIO(content)))
+
 
-    rows: list[dict[str, Any]] = []
+def _iter_json_rows(stream: IO[str], is_jsonl: bool) -> Iterator[dict[str, Any]]:
     if is_jsonl:
-        for line in text.splitlines():
+        for line in stream:
             if not line.strip():
                 continue
             try:
@@ -866,11 +966,12 @@ def _parse_json_rows(content: bytes, is_jsonl: bool) -> list[dict[str, Any]]:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_json")
             if not isinstance(payload, dict):
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_json_row")
-            rows.append(payload)
-        return rows
+            yield payload
+        return
 
+    # Обычный JSON документ парсится целиком (массив без потокового парсера не разобрать).
     try:
-        payload = json.loads(text)
+        payload = json.load(stream)
     except json.JSONDecodeError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_json")
 
@@ -883,27 +984,58 @@ def _parse_json_rows(content: bytes, is_jsonl: bool) -> list[dict[str, Any]]:
     for item in payload:
         if not isinstance(item, dict):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_json_row")
-        rows.append(item)
-    return rows
+        yield item
 
 
-def parse_catalog_file(file_bytes: bytes, filename: str) -> list[dict[str, Any]]:
-    name = (filename or "").lower()
+def _parse_json_rows(content: bytes, is_jsonl: bool) -> list[dict[str, Any]]:
+    try:
+        text = content.decode("utf-8-sig", errors="replace")
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid_encoding")
+    return list(_iter_json_rows(io.StringIO(text), is_jsonl))
+
 
+def _catalog_file_kind(filename: str) -> str:
+    name = (filename or "").lower()
     if name.endswith(".xlsx") or name.endswith(".xlsm"):
+        return "xlsx"
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith(".jsonl"):
+        return "jsonl"
+    if name.endswith(".json"):
+        return "json"
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="unsupported_file_type")
+
+
+def parse_catalog_file(file_bytes: bytes, filename: str) -> list[dict[str, Any]]:
+    kind = _catalog_file_kind(filename)
+
+    if kind == "xlsx":
         rows = _parse_xlsx_rows(file_bytes)
-    elif name.endswith(".csv"):
+    elif kind == "csv":
         rows = _parse_csv_rows(file_bytes)
-    elif name.endswith(".jsonl"):
-        rows = _parse_json_rows(file_bytes, is_jsonl=True)
-    elif name.endswith(".json"):
-        rows = _parse_json_rows(file_bytes, is_jsonl=False)
     else:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="unsupported_file_type")
+        rows = _parse_json_rows(file_bytes, is_jsonl=kind == "jsonl")
 
     return [_normalize_catalog_row(raw) for raw in rows]
 
 
+def iter_catalog_file(path: str | Path, filename: str) -> Iterator[dict[str, Any]]:
+    """Incremental twin of parse_catalog_file for a spooled upload on disk."""
+    kind = _catalog_file_kind(filename)
+
+    if kind == "xlsx":
+        for raw in _iter_xlsx_rows(path):
+            yield _normalize_catalog_row(raw)
+        return
+
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as stream:
+        rows = _iter_csv_rows(stream) if kind == "csv" else _iter_json_rows(stream, is_jsonl=kind == "jsonl")
+        for raw in rows:
+            yield _normalize_catalog_row(raw)
+
+
 def _truncate_raw(raw: Any, max_len: int = 2000) -> str | None:
     if raw is None:
         return None
@@ -2105,6 +2237,7 @@ async def kaspi_orders_sync(
                     "fetched": result.get("fetched"),
                     "inserted": result.get("inserted"),
                     "updated": result.get("updated"),
+                    "unchanged": result.get("unchanged"),
                     "watermark": result.get("watermark"),
                 },
             )
@@ -2288,6 +2421,10 @@ class KaspiSyncStateOut(BaseModel):
 
 class KaspiSyncOpsOut(KaspiSyncStateOut):
     lock_available: bool
+    next_run_at: datetime | None = None
+    sync_interval_seconds: int | None = None
+    consecutive_failures: int = 0
+    leased: bool = False
 
 
 class KaspiCatalogItemOut(BaseModel):
@@ -2341,6 +2478,16 @@ async def kaspi_orders_sync_state(
     )
 
 
+def _sync_schedule_fields(state: KaspiOrderSyncState | None) -> dict[str, Any]:
+    snapshot = kaspi_orders_sync_scheduler.schedule_snapshot(state)
+    return {
+        "next_run_at": snapshot["next_run_at"],
+        "sync_interval_seconds": snapshot["sync_interval_seconds"],
+        "consecutive_failures": snapshot["consecutive_failures"],
+        "leased": snapshot["leased"],
+    }
+
+
 async def kaspi_orders_sync_ops(
     current_user: User = Depends(_auth_user),
     session: AsyncSession = Depends(get_async_db),
@@ -2381,6 +2528,7 @@ async def kaspi_orders_sync_ops(
         last_error_code=last_error_code,
         last_error_message=last_error_message,
         lock_available=bool(lock_available),
+        **_sync_schedule_fields(state),
     )
 
 
@@ -2650,6 +2798,26 @@ class KaspiSyncNowOut(BaseModel):
     offers_feed_upload_result: dict[str, Any] | None = None
 
 
+class KaspiSyncNowJobOut(BaseModel):
+    job_id: str
+    status: str
+    phase: str | None = None
+    company_id: int
+    merchant_uid: str
+    pages_fetched: int = 0
+    orders_fetched: int = 0
+    orders_upserted: int = 0
+    http_status: int | None = None
+    result: dict[str, Any] | None = None
+    error_code: str | None = None
+    error_message: str | None = None
+    request_id: str | None = None
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+
 class KaspiFeedUploadIn(BaseModel):
     merchant_uid: str = Field(..., min_length=3, max_length=128)
     source: str = Field(..., description="public_token | export_id | local_file_path")
@@ -3895,10 +4063,12 @@ async def kaspi_goods_import_refresh(
 
 async def kaspi_sync_now(
     request: Request,
+    background_tasks: BackgroundTasks,
     body: KaspiSyncNowIn | None = Body(None),
     merchant_uid: str | None = Query(None, min_length=1, alias="merchantUid"),
     timeout_sec: float = Query(SYNC_NOW_TIMEOUT_SEC, ge=0.1, le=60.0),
     hard: int = Query(0, ge=0, le=1),
+    background: bool = Query(False),
     current_user: User = Depends(require_store_admin_then_feature(FEATURE_KASPI_SYNC_NOW)),
     session: AsyncSession = Depends(get_async_db),
 ):
@@ -3920,6 +4090,9 @@ async def kaspi_sync_now(
     rid = request_id or request.headers.get("X-Request-ID") or str(uuid4())
 
     phase = "init"
+    if background:
+        # Фоновый запуск не держит воркер запроса — бюджет берём из настроек, а не из timeout_sec.
+        timeout_sec = _sync_now_background_timeout()
 
     def _err(code: str, detail: str, phase_for_error: str, status: str | None = None) -> dict[str, Any]:
         payload: dict[str, Any] = {
@@ -3950,13 +4123,23 @@ async def kaspi_sync_now(
         merchant_uid_source=merchant_source,
         hard=hard,
         timeout_sec=timeout_sec,
+        background=background,
         phase=phase,
         monotonic_start=started_mono,
     )
 
-    async def _run_sync_now_bounded() -> KaspiSyncNowOut | JSONResponse:
+    # session — параметр: фоновый режим подставляет собственную сессию вместо сессии запроса.
+    async def _run_sync_now_bounded(
+        session: AsyncSession = session,
+        on_progress: Any = None,
+    ) -> KaspiSyncNowOut | JSONResponse:
         lock_acquired = False
         token: str | None = None
+
+        async def _publish_phase() -> None:
+            if on_progress is not None:
+                await on_progress({"phase": phase})
+
         try:
             try:
                 _store_name, token = await _resolve_kaspi_token(session, company_id)
@@ -4046,6 +4229,8 @@ async def kaspi_sync_now(
                 orders_timed_out = False
                 try:
                     phase = "orders_sync"
+                    await _publish_phase()
+                    orders_progress = {"on_progress": on_progress} if on_progress is not None else {}
                     orders_result = await asyncio.wait_for(
                         svc.sync_orders(
                             db=session,
@@ -4055,6 +4240,7 @@ async def kaspi_sync_now(
                             timeout_seconds=final_orders_timeout,
                             orders_max_attempts=1,
                             client_retries=0,
+                            **orders_progress,
                         ),
                         timeout=final_orders_timeout,
                     )
@@ -4211,6 +4397,7 @@ async def kaspi_sync_now(
                         )
 
                 phase = "goods_import"
+                await _publish_phase()
                 company = await session.get(Company, company_id)
                 flags = _get_goods_import_flags(company, merchant_uid)
                 payload = await load_offers_payload(
@@ -4464,6 +4651,7 @@ async def kaspi_sync_now(
                         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="kaspi_upstream_error")
 
                 phase = "offers_feed"
+                await _publish_phase()
                 offers = (
                     (
                         await session.execute(
@@ -4704,6 +4892,146 @@ async def kaspi_sync_now(
             if lock_acquired:
                 await _release_sync_now_lock(session, company_id=company_id, merchant_uid=merchant_uid)
 
+    async def _run_sync_now_job(job_id: Any) -> None:
+        from app.core.db import get_async_session_maker
+
+        session_factory = get_async_session_maker()
+
+        async def _publish(progress: dict[str, Any]) -> None:
+            fields = ("phase", "pages_fetched", "orders_fetched", "orders_upserted")
+            await _update_sync_now_job(session_factory, job_id, **{k: progress[k] for k in fields if k in progress})
+
+        final: dict[str, Any]
+        try:
+            await _update_sync_now_job(
+                session_factory, job_id, status=SYNC_NOW_JOB_RUNNING, started_at=datetime.utcnow()
+            )
+            async with session_factory() as job_session:
+                response_obj = await asyncio.wait_for(
+                    _run_sync_now_bounded(job_session, on_progress=_publish),
+                    timeout=timeout_sec,
+                )
+            if isinstance(response_obj, JSONResponse):
+                http_status_value = response_obj.status_code
+                result = json.loads(response_obj.body)
+            else:
+                http_status_value = status.HTTP_200_OK
+                result = response_obj.model_dump(mode="json")
+            failed = http_status_value >= 400
+            final = {
+                "status": SYNC_NOW_JOB_FAILED if failed else SYNC_NOW_JOB_DONE,
+                "http_status": http_status_value,
+                "result_json": result,
+                "error_code": (result.get("code") or result.get("detail")) if failed else None,
+            }
+        except asyncio.TimeoutError:
+            final = {
+                "status": SYNC_NOW_JOB_FAILED,
+                "http_status": status.HTTP_504_GATEWAY_TIMEOUT,
+                "error_code": "kaspi_sync_timeout",
+                "error_message": "Kaspi sync now timed out",
+            }
+        except HTTPException as exc:
+            final = {
+                "status": SYNC_NOW_JOB_FAILED,
+                "http_status": exc.status_code,
+                "error_code": str(exc.detail)[:64],
+            }
+        except Exception as exc:
+            final = {
+                "status": SYNC_NOW_JOB_FAILED,
+                "http_status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "error_code": "kaspi_sync_failed",
+                "error_message": safe_error_message(exc),
+            }
+            _safe_log_warning(
+                "kaspi_sync_now_job_failed",
+                request_id=rid,
+                company_id=company_id,
+                merchant_uid=merchant_uid,
+                job_id=str(job_id),
+                phase=phase,
+                exc_type=type(exc).__name__,
+            )
+        try:
+            await _update_sync_now_job(session_factory, job_id, phase=phase, finished_at=datetime.utcnow(), **final)
+        except Exception as exc:  # pragma: no cover - best-effort status write
+            logger.warning("kaspi_sync_now job finalize failed", extra={"job_id": str(job_id), "error": str(exc)})
+        _safe_log_info(
+            "kaspi_sync_now_job_done",
+            request_id=rid,
+            company_id=company_id,
+            merchant_uid=merchant_uid,
+            job_id=str(job_id),
+            phase=phase,
+            job_status=final["status"],
+            http_status=final.get("http_status"),
+            elapsed_ms=int((time.perf_counter() - started_mono) * 1000),
+        )
+
+    if background:
+        # Уже идущий фоновый синк этого мерчанта возвращаем вместо второго запуска.
+        # Зависшие сначала закрываются, затем INSERT .. ON CONFLICT DO NOTHING по
+        # uq_kaspi_sync_now_jobs_active: из двух параллельных POST задачу создаёт один.
+        await _fail_stale_sync_now_jobs(session, company_id=company_id, merchant_uid=merchant_uid)
+        created_id = (
+            await session.execute(
+                insert(KaspiSyncNowJob)
+                .values(
+                    company_id=company_id,
+                    merchant_uid=merchant_uid,
+                    status=SYNC_NOW_JOB_PENDING,
+                    phase=phase,
+                    request_id=str(rid)[:64],
+                    requested_by_user_id=getattr(current_user, "id", None),
+                )
+                .on_conflict_do_nothing(
+                    index_elements=[KaspiSyncNowJob.company_id, KaspiSyncNowJob.merchant_uid],
+                    index_where=KaspiSyncNowJob.status.in_(SYNC_NOW_JOB_ACTIVE_STATUSES),
+                )
+                .returning(KaspiSyncNowJob.id)
+            )
+        ).scalar_one_or_none()
+        await session.commit()
+        active = sa.select(KaspiSyncNowJob).where(
+            KaspiSyncNowJob.company_id == company_id, KaspiSyncNowJob.merchant_uid == merchant_uid
+        )
+        if created_id is not None:
+            active = active.where(KaspiSyncNowJob.id == created_id)
+        else:
+            active = active.where(KaspiSyncNowJob.status.in_(SYNC_NOW_JOB_ACTIVE_STATUSES))
+        job = (await session.execute(active.order_by(KaspiSyncNowJob.created_at.desc()).limit(1))).scalars().first()
+        if job is None:
+            # Активная задача завершилась между INSERT и SELECT — отдаём последнюю.
+            job = (
+                (
+                    await session.execute(
+                        sa.select(KaspiSyncNowJob)
+                        .where(KaspiSyncNowJob.company_id == company_id, KaspiSyncNowJob.merchant_uid == merchant_uid)
+                        .order_by(KaspiSyncNowJob.created_at.desc())
+                        .limit(1)
+                    )
+                )
+                .scalars()
+                .first()
+            )
+        if created_id is not None:
+            background_tasks.add_task(_run_sync_now_job, created_id)
+        _safe_log_info(
+            "kaspi_sync_now_accepted",
+            request_id=rid,
+            company_id=company_id,
+            merchant_uid=merchant_uid,
+            job_id=str(job.id),
+            job_status=job.status,
+        )
+        out = _sync_now_job_to_out(job)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=out.model_dump(mode="json"),
+            headers={"X-Request-ID": rid, "Location": f"{request.url.path}/jobs/{out.job_id}"},
+        )
+
     try:
         response_obj = await asyncio.wait_for(_run_sync_now_bounded(), timeout=timeout_sec)
         if isinstance(response_obj, JSONResponse):
@@ -4861,6 +5189,78 @@ async def kaspi_sync_now(
         )
 
 
+async def _get_company_sync_now_job(session: AsyncSession, *, company_id: int, job_id: UUID) -> KaspiSyncNowJob:
+    job = (
+        (
+            await session.execute(
+                sa.select(KaspiSyncNowJob).where(
+                    KaspiSyncNowJob.company_id == company_id,
+                    KaspiSyncNowJob.id == job_id,
+                )
+            )
+        )
+        .scalars()
+        .first()
+    )
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="sync_job_not_found")
+    return job
+
+
+async def kaspi_sync_now_job_get(
+    job_id: UUID,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_db),
+):
+    await _require_store_admin_company_scoped(current_user)
+    company_id = _resolve_company_id(current_user)
+    await _fail_stale_sync_now_jobs(session, company_id=company_id, job_id=job_id)
+    job = await _get_company_sync_now_job(session, company_id=company_id, job_id=job_id)
+    return _sync_now_job_to_out(job)
+
+
+async def kaspi_sync_now_job_events(
+    job_id: UUID,
+    current_user: User = Depends(get_current_user),
+):
+    """SSE-поток прогресса фонового sync-now: событие на каждое изменение, ``done`` — по завершении."""
+    from app.core.db import get_async_session_maker
+
+    await _require_store_admin_company_scoped(current_user)
+    company_id = _resolve_company_id(current_user)
+    session_factory = get_async_session_maker()
+    # Сессия на каждый опрос — поток не держит соединение с БД между событиями.
+    async with session_factory() as session:
+        await _get_company_sync_now_job(session, company_id=company_id, job_id=job_id)
+
+    async def _events():
+        deadline = time.monotonic() + _sync_now_background_timeout() + 60
+        last_payload: str | None = None
+        while True:
+            async with session_factory() as session:
+                await _fail_stale_sync_now_jobs(session, company_id=company_id, job_id=job_id)
+                job = await session.get(KaspiSyncNowJob, job_id)
+            if job is None:
+                return
+            out = _sync_now_job_to_out(job)
+            payload = json.dumps(out.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":"))
+            finished = job.status not in SYNC_NOW_JOB_ACTIVE_STATUSES
+            if payload != last_payload:
+                last_payload = payload
+                yield f"event: {'done' if finished else 'progress'}\ndata: {payload}\n\n"
+            elif not finished:
+                yield ": keep-alive\n\n"
+            if finished or time.monotonic() >= deadline:
+                return
+            await asyncio.sleep(SYNC_NOW_EVENTS_POLL_SEC)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 async def kaspi_token_health(
     request: Request,
     current_user: User = Depends(_auth_user),
@@ -5209,10 +5609,43 @@ async def kaspi_token_selftest(
     )
 
 
+async def _spool_catalog_upload(file: UploadFile) -> tuple[str, str, int]:
+    """Copies the upload to a temp file in chunks; returns (path, sha256, size)."""
+    spool_dir = getattr(settings, "KASPI_CATALOG_IMPORT_SPOOL_DIR", None) or None
+    if spool_dir:
+        os.makedirs(spool_dir, exist_ok=True)
+    suffix = Path(file.filename or "").suffix
+    fd, path = tempfile.mkstemp(prefix="kaspi_catalog_", suffix=suffix, dir=spool_dir)
+    digest = sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                await asyncio.to_thread(out.write, chunk)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, digest.hexdigest(), size
+
+
+def _remove_spool(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
 async def kaspi_catalog_import(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     merchant_uid: str | None = Query(None, alias="merchantUid"),
     dry_run: bool = Query(False, alias="dry_run"),
+    background: bool | None = Query(None),
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_db),
 ):
@@ -5225,191 +5658,109 @@ async def kaspi_catalog_import(
 
     company_id = _resolve_company_id(current_user)
 
-    content = await file.read()
-    if not content:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="empty_file")
-
     filename = file.filename or "catalog.csv"
-    rows = parse_catalog_file(content, filename)
-
-    batch: CatalogImportBatch | None = None
-    if not dry_run:
-        content_hash = sha256(content).hexdigest()
-        batch = CatalogImportBatch(
-            company_id=company_id,
-            source="kaspi",
-            filename=filename,
-            content_hash=content_hash,
-            status="RUNNING",
-            merchant_uid=merchant_uid,
-            started_at=datetime.utcnow(),
-        )
-        session.add(batch)
-        await session.commit()
-        await session.refresh(batch)
-
-    rows_total = len(rows)
-    rows_ok = 0
-    rows_skipped = 0
-    error_counts: dict[str, int] = {}
-    row_records: list[dict[str, Any]] = []
-    offer_records: list[dict[str, Any]] = []
-
-    for idx, row in enumerate(rows, start=1):
-        raw = row.get("raw")
-        sku = row.get("sku")
-        master_sku = row.get("master_sku")
-        title = row.get("title")
-        price = row.get("price")
-        old_price = row.get("old_price")
-        stock_count = row.get("stock_count")
-        pre_order = row.get("pre_order")
-        stock_specified = row.get("stock_specified")
-        updated_at = row.get("updated_at")
-
-        error = None
-        if not sku:
-            error = "missing_sku"
-        if error:
-            rows_skipped += 1
-            error_counts[error] = error_counts.get(error, 0) + 1
-            if not dry_run and batch is not None:
-                row_records.append(
-                    {
-                        "batch_id": batch.id,
-                        "company_id": company_id,
-                        "row_num": idx,
-                        "raw": raw,
-                        "sku": sku,
-                        "master_sku": master_sku,
-                        "title": title,
-                        "price": price,
-                        "old_price": old_price,
-                        "stock_count": stock_count,
-                        "pre_order": pre_order,
-                        "stock_specified": stock_specified,
-                        "updated_at": updated_at,
-                        "error": error,
-                    }
-                )
-            continue
-
-        rows_ok += 1
-        if not dry_run and batch is not None:
-            row_records.append(
-                {
-                    "batch_id": batch.id,
-                    "company_id": company_id,
-                    "row_num": idx,
-                    "raw": raw,
-                    "sku": sku,
-                    "master_sku": master_sku,
-                    "title": title,
-                    "price": price,
-                    "old_price": old_price,
-                    "stock_count": stock_count,
-                    "pre_order": pre_order,
-                    "stock_specified": stock_specified,
-                    "updated_at": updated_at,
-                    "error": None,
-                }
-            )
-            offer_records.append(
-                {
-                    "company_id": company_id,
-                    "merchant_uid": merchant_uid,
-                    "sku": sku,
-                    "master_sku": master_sku,
-                    "title": title,
-                    "price": price,
-                    "old_price": old_price,
-                    "stock_count": stock_count,
-                    "pre_order": pre_order,
-                    "stock_specified": stock_specified,
-                    "raw": raw,
-                    "updated_at": datetime.utcnow(),
-                }
-            )
+    _catalog_file_kind(filename)
 
-    top_errors = [
-        {"error": key, "count": count}
-        for key, count in sorted(error_counts.items(), key=lambda item: (-item[1], item[0]))
-    ][:5]
+    path, content_hash, size = await _spool_catalog_upload(file)
+    if not size:
+        _remove_spool(path)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="empty_file")
 
-    if dry_run or batch is None:
+    if dry_run:
+        try:
+            stats = await catalog_import_service.count_catalog_rows(iter_catalog_file(path, filename))
+        finally:
+            _remove_spool(path)
         return KaspiCatalogImportOut(
             batch_id=None,
             status="DRY_RUN",
-            rows_total=rows_total,
-            rows_ok=rows_ok,
-            rows_skipped=rows_skipped,
-            top_errors=top_errors,
+            rows_total=stats.rows_total,
+            rows_ok=stats.rows_ok,
+            rows_skipped=stats.rows_skipped,
+            top_errors=stats.top_errors(),
             dry_run=True,
         )
 
-    try:
-        if row_records:
-            await session.execute(sa.insert(CatalogImportRow), row_records)
-
-        if offer_records:
-            deduped: dict[tuple[int, str, str], dict[str, Any]] = {}
-            for record in offer_records:
-                key = (record["company_id"], record["merchant_uid"], record["sku"])
-                deduped[key] = record
-            deduped_records = list(deduped.values())
-
-            for chunk_start in range(0, len(deduped_records), 500):
-                chunk = deduped_records[chunk_start : chunk_start + 500]
-                stmt = sa.dialects.postgresql.insert(KaspiOffer).values(chunk)
-                stmt = stmt.on_conflict_do_update(
-                    index_elements=["company_id", "merchant_uid", "sku"],
-                    set_={
-                        "master_sku": sa.func.coalesce(
-                            sa.func.nullif(stmt.excluded.master_sku, ""),
-                            KaspiOffer.master_sku,
-                        ),
-                        "title": sa.func.coalesce(sa.func.nullif(stmt.excluded.title, ""), KaspiOffer.title),
-                        "price": sa.func.coalesce(stmt.excluded.price, KaspiOffer.price),
-                        "old_price": sa.func.coalesce(stmt.excluded.old_price, KaspiOffer.old_price),
-                        "stock_count": sa.func.coalesce(stmt.excluded.stock_count, KaspiOffer.stock_count),
-                        "pre_order": sa.func.coalesce(stmt.excluded.pre_order, KaspiOffer.pre_order),
-                        "stock_specified": sa.func.coalesce(stmt.excluded.stock_specified, KaspiOffer.stock_specified),
-                        "raw": sa.func.coalesce(stmt.excluded.raw, KaspiOffer.raw),
-                        "updated_at": datetime.utcnow(),
-                    },
-                )
-                await session.execute(stmt)
+    inline_max = int(getattr(settings, "KASPI_CATALOG_IMPORT_INLINE_MAX_BYTES", 2 * 1024 * 1024) or 0)
+    run_in_background = background if background is not None else size > inline_max
 
-        batch.rows_total = rows_total
-        batch.rows_ok = rows_ok
-        batch.rows_failed = rows_skipped
-        batch.status = "DONE"
-        batch.finished_at = datetime.utcnow()
-        if rows_skipped:
-            batch.error_summary = "; ".join({e["error"] for e in top_errors})
+    batch = CatalogImportBatch(
+        company_id=company_id,
+        source="kaspi",
+        filename=filename,
+        content_hash=content_hash,
+        status=catalog_import_service.STATUS_PENDING if run_in_background else catalog_import_service.STATUS_RUNNING,
+        merchant_uid=merchant_uid,
+        started_at=None if run_in_background else datetime.utcnow(),
+    )
+    session.add(batch)
+    await session.commit()
+    await session.refresh(batch)
+
+    if run_in_background:
+        # Большие файлы: парсинг + COPY в фоне, прогресс — через /catalog/import/batches/{id}.
+        background_tasks.add_task(
+            catalog_import_service.run_catalog_import_job,
+            batch_id=batch.id,
+            company_id=company_id,
+            merchant_uid=merchant_uid,
+            path=path,
+            rows_factory=lambda: iter_catalog_file(path, filename),
+        )
+        out = KaspiCatalogImportOut(
+            batch_id=str(batch.id),
+            status=batch.status,
+            rows_total=0,
+            rows_ok=0,
+            rows_skipped=0,
+            top_errors=[],
+            dry_run=False,
+        )
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=out.model_dump(mode="json"))
 
+    batch_id = batch.id
+    try:
+        stats = await catalog_import_service.import_catalog_rows(
+            session,
+            batch_id=batch_id,
+            company_id=company_id,
+            merchant_uid=merchant_uid,
+            rows=iter_catalog_file(path, filename),
+        )
+        batch = await session.get(CatalogImportBatch, batch_id)
+        catalog_import_service.apply_batch_result(batch, stats)
         await session.commit()
+    except HTTPException as exc:
+        await session.rollback()
+        await _fail_catalog_batch(session, batch_id, str(exc.detail))
+        raise
     except Exception as exc:
         await session.rollback()
-        batch = await session.get(CatalogImportBatch, batch.id)
-        if batch:
-            batch.status = "FAILED"
-            batch.finished_at = datetime.utcnow()
-            batch.error_summary = str(exc)[:500]
-            await session.commit()
+        await _fail_catalog_batch(session, batch_id, str(exc))
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="catalog_import_failed")
+    finally:
+        _remove_spool(path)
 
     return KaspiCatalogImportOut(
         batch_id=str(batch.id),
         status=batch.status,
-        rows_total=rows_total,
-        rows_ok=rows_ok,
-        rows_skipped=rows_skipped,
-        top_errors=top_errors,
+        rows_total=stats.rows_total,
+        rows_ok=stats.rows_ok,
+        rows_skipped=stats.rows_skipped,
+        top_errors=stats.top_errors(),
         dry_run=False,
     )
 
 
+async def _fail_catalog_batch(session: AsyncSession, batch_id: Any, error: str) -> None:
+    batch = await session.get(CatalogImportBatch, batch_id)
+    if batch:
+        batch.status = catalog_import_service.STATUS_FAILED
+        batch.finished_at = datetime.utcnow()
+        batch.error_summary = error[:500]
+        await session.commit()
+
+
 register_kaspi_goods_routes(
     router,
     kaspi_goods_schema=kaspi_goods_schema,
@@ -5426,6 +5777,8 @@ register_kaspi_goods_routes(
     kaspi_goods_import_get=kaspi_goods_import_get,
     kaspi_goods_import_refresh=kaspi_goods_import_refresh,
     kaspi_sync_now=kaspi_sync_now,
+    kaspi_sync_now_job_get=kaspi_sync_now_job_get,
+    kaspi_sync_now_job_events=kaspi_sync_now_job_events,
     kaspi_token_health=kaspi_token_health,
     kaspi_token_selftest=kaspi_token_selftest,
     kaspi_catalog_import=kaspi_catalog_import,
@@ -5435,6 +5788,7 @@ register_kaspi_goods_routes(
     kaspi_goods_result_out_model=KaspiGoodsResultOut,
     kaspi_goods_import_record_out_model=KaspiGoodsImportRecordOut,
     kaspi_sync_now_out_model=KaspiSyncNowOut,
+    kaspi_sync_now_job_out_model=KaspiSyncNowJobOut,
     kaspi_token_health_out_model=KaspiTokenHealthOut,
     kaspi_token_selftest_out_model=KaspiTokenSelftestOut,
     kaspi_catalog_import_out_model=KaspiCatalogImportOut,
@@ -5595,6 +5949,9 @@ async def kaspi_catalog_import_batches(
     await _require_store_admin_company_scoped(current_user)
     company_id = _resolve_company_id(current_user)
 
+    if await catalog_import_service.fail_stale_catalog_imports(session, company_id=company_id):
+        await session.commit()
+
     result = await session.execute(
         sa.select(CatalogImportBatch)
         .where(CatalogImportBatch.company_id == company_id)
@@ -5630,6 +5987,9 @@ async def kaspi_catalog_import_batch_detail(
     await _require_store_admin_company_scoped(current_user)
     company_id = _resolve_company_id(current_user)
 
+    if await catalog_import_service.fail_stale_catalog_imports(session, company_id=company_id):
+        await session.commit()
+
     result = await session.execute(
         sa.select(CatalogImportBatch).where(
             CatalogImportBatch.company_id == company_id,
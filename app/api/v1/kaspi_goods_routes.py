@@ -20,6 +20,8 @@ def register_kaspi_goods_routes(
     kaspi_goods_import_get,
     kaspi_goods_import_refresh,
     kaspi_sync_now,
+    kaspi_sync_now_job_get,
+    kaspi_sync_now_job_events,
     kaspi_token_health,
     kaspi_token_selftest,
     kaspi_catalog_import,
@@ -29,6 +31,7 @@ def register_kaspi_goods_routes(
     kaspi_goods_result_out_model,
     kaspi_goods_import_record_out_model,
     kaspi_sync_now_out_model,
+    kaspi_sync_now_job_out_model,
     kaspi_token_health_out_model,
     kaspi_token_selftest_out_model,
     kaspi_catalog_import_out_model,
@@ -126,6 +129,20 @@ def register_kaspi_goods_routes(
         methods=["POST"],
         summary="Kaspi sync now",
         response_model=kaspi_sync_now_out_model,
+        responses={202: {"model": kaspi_sync_now_job_out_model, "description": "Background sync job accepted"}},
+    )
+    router.add_api_route(
+        "/sync/now/jobs/{job_id}",
+        kaspi_sync_now_job_get,
+        methods=["GET"],
+        summary="Kaspi sync now background job progress",
+        response_model=kaspi_sync_now_job_out_model,
+    )
+    router.add_api_route(
+        "/sync/now/jobs/{job_id}/events",
+        kaspi_sync_now_job_events,
+        methods=["GET"],
+        summary="Kaspi sync now background job progress (SSE)",
     )
     router.add_api_route(
         "/token/health",
@@ -68,6 +68,7 @@ from app.models.repricing import RepricingRun
 from app.models.user import User
 from app.models.warehouse import ProductStock, Warehouse
 from app.services.reports.sales_pdf import build_sales_pdf
+from app.services.sales_rollups import read_sales_buckets, rollups_enabled
 from app.utils.pii import mask_phone
 
 
@@ -1030,6 +1031,19 @@ async def _fetch_sales_metrics(
     date_from: datetime | None,
     date_to: datetime | None,
 ) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+    if rollups_enabled():
+        buckets = await read_sales_buckets(db, company_id=company_id, date_from=date_from, date_to=date_to)
+        total_orders = sum(int(b.orders_count or 0) for b in buckets)
+        total_revenue = sum((Decimal(b.revenue or 0) for b in buckets), Decimal("0"))
+        avg_order_value = (total_revenue / total_orders) if total_orders else Decimal("0")
+        metrics = {
+            "total_orders": total_orders,
+            "total_revenue": total_revenue,
+            "avg_order_value": avg_order_value,
+            "items_sold_total": sum(int(b.items_sold or 0) for b in buckets),
+        }
+        return metrics, await _fetch_top_skus(db, company_id=company_id, date_from=date_from, date_to=date_to)
+
     base_stmt = select(
         func.count(Order.id).label("total_orders"),
         func.coalesce(func.sum(Order.total_amount), 0).label("total_revenue"),
@@ -1052,6 +1066,23 @@ async def _fetch_sales_metrics(
         items_stmt = items_stmt.where(Order.created_at <= date_to)
     items_sold_total = (await db.execute(items_stmt)).scalar_one()
 
+    top_skus = await _fetch_top_skus(db, company_id=company_id, date_from=date_from, date_to=date_to)
+    metrics = {
+        "total_orders": total_orders,
+        "total_revenue": total_revenue,
+        "avg_order_value": avg_order_value,
+        "items_sold_total": int(items_sold_total or 0),
+    }
+    return metrics, top_skus
+
+
+async def _fetch_top_skus(
+    db: AsyncSession,
+    *,
+    company_id: int,
+    date_from: datetime | None,
+    date_to: datetime | None,
+) -> list[dict[str, Any]]:
     top_stmt = (
         select(OrderItem.sku, func.sum(OrderItem.quantity).label("qty"))
         .join(Order, OrderItem.order_id == Order.id)
@@ -1065,15 +1096,7 @@ async def _fetch_sales_metrics(
     if date_to:
         top_stmt = top_stmt.where(Order.created_at <= date_to)
     top_rows = (await db.execute(top_stmt)).all()
-
-    top_skus = [{"sku": sku or "", "qty": int(qty or 0)} for sku, qty in top_rows]
-    metrics = {
-        "total_orders": total_orders,
-        "total_revenue": total_revenue,
-        "avg_order_value": avg_order_value,
-        "items_sold_total": int(items_sold_total or 0),
-    }
-    return metrics, top_skus
+    return [{"sku": sku or "", "qty": int(qty or 0)} for sku, qty in top_rows]
 
 
 @router.get(
@@ -15,7 +15,7 @@ from app.core.dependencies import api_rate_limit, get_current_user, get_current_
 from app.core.exceptions import AuthenticationError, AuthorizationError, NotFoundError, SmartSellValidationError
 from app.core.logging import audit_logger
 from app.core.rbac import Role, is_store_admin, normalize_role
-from app.core.security import get_password_hash, resolve_tenant_company_id, verify_password
+from app.core.security import get_password_hash_async, resolve_tenant_company_id, verify_password_async
 from app.models.company import Company
 from app.models.user import User, UserSession
 from app.schemas.base import SuccessResponse
@@ -387,13 +387,13 @@ async def change_password(
     if not db_user:
         raise AuthenticationError("User not found", "USER_NOT_FOUND")
 
-    if not verify_password(req.old_password, db_user.hashed_password):
+    if not await verify_password_async(req.old_password, db_user.hashed_password):
         raise AuthenticationError("Old password is incorrect", "INVALID_OLD_PASSWORD")
 
     if req.old_password == req.new_password:
         raise SmartSellValidationError("New password must be different", "PASSWORD_SAME")
 
-    db_user.hashed_password = get_password_hash(req.new_password)
+    db_user.hashed_password = await get_password_hash_async(req.new_password)
 
     await db.execute(
         update(UserSession)
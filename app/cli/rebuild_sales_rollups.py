@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from app.cli.reset_password import _to_sync_url
+from app.core.config import get_settings
+from app.models.sales_rollup import rollup_refresh_statements
+
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Rebuild sales_rollups from raw orders (backfill).")
+    parser.add_argument("--company-id", type=int, default=None, help="Only this company (default: all)")
+    parser.add_argument("--date-from", type=date.fromisoformat, default=None, help="First day, YYYY-MM-DD")
+    parser.add_argument("--date-to", type=date.fromisoformat, default=None, help="Last day (inclusive), YYYY-MM-DD")
+    parser.add_argument("--chunk-days", type=int, default=31, help="Days rebuilt per transaction")
+    return parser.parse_args(argv)
+
+
+def _rebuild(company_id: int | None, date_from: date | None, date_to: date | None, chunk_days: int) -> int:
+    settings = get_settings()
+    db_url = getattr(settings, "DATABASE_URL", None) or os.getenv("DATABASE_URL")
+    if not db_url:
+        sys.stderr.write("ERR: DATABASE_URL is required\n")
+        return 1
+
+    engine = create_engine(_to_sync_url(db_url))
+    if date_from is None or date_to is None:
+        # Без границ — один проход по всей истории.
+        with engine.begin() as conn:
+            for stmt in rollup_refresh_statements(
+                company_id=company_id,
+                date_from=datetime.combine(date_from, datetime.min.time()) if date_from else None,
+                date_to=datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else None,
+            ):
+                conn.execute(stmt)
+        sys.stdout.write(f"sales_rollups rebuilt company_id={company_id} range=all\n")
+        return 0
+
+    step = timedelta(days=max(1, int(chunk_days)))
+    cursor = datetime.combine(date_from, datetime.min.time())
+    end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    chunks = 0
+    while cursor < end:
+        upper = min(cursor + step, end)
+        with engine.begin() as conn:
+            for stmt in rollup_refresh_statements(company_id=company_id, date_from=cursor, date_to=upper):
+                conn.execute(stmt)
+        chunks += 1
+        cursor = upper
+    sys.stdout.write(f"sales_rollups rebuilt company_id={company_id} from={date_from} to={date_to} chunks={chunks}\n")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv or sys.argv[1:])
+    return _rebuild(args.company_id, args.date_from, args.date_to, args.chunk_days)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
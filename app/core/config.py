@@ -532,6 +532,16 @@ class Settings(BaseSettings):
     PASSWORD_MIN_LENGTH: int = Field(
         default=8, description="Password min length", validation_alias="PASSWORD_MIN_LENGTH"
     )
+    PASSWORD_HASH_WORKERS: int = Field(
+        default=0,
+        description="Threads for password hashing/verification; 0 = CPU count (max 8)",
+        validation_alias="PASSWORD_HASH_WORKERS",
+    )
+    PASSWORD_HASH_QUEUE_LIMIT: int = Field(
+        default=64,
+        description="Hashing jobs allowed to wait for a worker; beyond that requests get 503",
+        validation_alias="PASSWORD_HASH_QUEUE_LIMIT",
+    )
     SUPERUSER_ALLOWLIST: list[str] = Field(
         default_factory=list,
         description="Comma-separated superuser allowlist identifiers",
@@ -563,6 +573,16 @@ class Settings(BaseSettings):
     SQLALCHEMY_POOL_RECYCLE: int = Field(
         default=1800, description="Pool recycle (s)", validation_alias="SQLALCHEMY_POOL_RECYCLE"
     )
+    BULK_COPY_CHUNK_ROWS: int = Field(
+        default=10000,
+        description="Rows per COPY round-trip when bulk-loading into a staging table",
+        validation_alias="BULK_COPY_CHUNK_ROWS",
+    )
+    BULK_COPY_MIN_ROWS: int = Field(
+        default=1000,
+        description="Upserts of at least this many rows go through COPY + staging instead of multi-row VALUES",
+        validation_alias="BULK_COPY_MIN_ROWS",
+    )
 
     # ---- Redis/Celery
     REDIS_URL: str = Field(default="redis://localhost:6379", description="Redis URL", validation_alias="REDIS_URL")
@@ -619,8 +639,186 @@ class Settings(BaseSettings):
         description="Max campaign processing attempts (0 disables limit)",
         validation_alias="CAMPAIGN_MAX_ATTEMPTS",
     )
+    CAMPAIGN_PROCESS_CONCURRENCY: int = Field(
+        default=4,
+        description="Campaigns processed in parallel per worker tick (own session each)",
+        validation_alias="CAMPAIGN_PROCESS_CONCURRENCY",
+    )
+    CAMPAIGN_PROCESS_LEASE_SECONDS: int = Field(
+        default=300,
+        description="Lease duration for a claimed campaign before another worker may reclaim it",
+        validation_alias="CAMPAIGN_PROCESS_LEASE_SECONDS",
+    )
     EAGER_SIDE_EFFECTS: bool = Field(default=True, validation_alias="EAGER_SIDE_EFFECTS")
 
+    # Campaign message delivery (batched SMTP worker)
+    CAMPAIGN_DELIVERY_BATCH_ENABLED: bool = Field(
+        default=False,
+        description="Deliver campaign messages in claimed batches over pooled SMTP connections",
+        validation_alias="CAMPAIGN_DELIVERY_BATCH_ENABLED",
+    )
+    CAMPAIGN_DELIVERY_BATCH_SIZE: int = Field(
+        default=200,
+        description="Max messages claimed per delivery batch",
+        validation_alias="CAMPAIGN_DELIVERY_BATCH_SIZE",
+    )
+    CAMPAIGN_DELIVERY_MAX_BATCHES: int = Field(
+        default=50,
+        description="Max delivery batches per worker run (0 disables limit)",
+        validation_alias="CAMPAIGN_DELIVERY_MAX_BATCHES",
+    )
+    CAMPAIGN_DELIVERY_MAX_CONCURRENCY: int = Field(
+        default=4,
+        description="Concurrent SMTP sends (and pooled SMTP connections) per worker",
+        validation_alias="CAMPAIGN_DELIVERY_MAX_CONCURRENCY",
+    )
+    CAMPAIGN_DELIVERY_RATE_PER_SECOND: float = Field(
+        default=10.0,
+        description="Max messages per second per SMTP provider (0 disables limit)",
+        validation_alias="CAMPAIGN_DELIVERY_RATE_PER_SECOND",
+    )
+    CAMPAIGN_DELIVERY_INTERVAL_SECONDS: int = Field(
+        default=30,
+        description="Interval of the batched delivery job in seconds",
+        validation_alias="CAMPAIGN_DELIVERY_INTERVAL_SECONDS",
+    )
+    CAMPAIGN_DELIVERY_LEASE_SECONDS: int = Field(
+        default=600,
+        description="Lease of a claimed (SENDING) message before another delivery run may reclaim it",
+        validation_alias="CAMPAIGN_DELIVERY_LEASE_SECONDS",
+    )
+
+    # InventoryOutbox relay (drains inventory_outbox to marketplace/webhook/task handlers)
+    INVENTORY_OUTBOX_RELAY_ENABLED: bool = Field(
+        default=False,
+        description="Run the InventoryOutbox relay job in the scheduler worker",
+        validation_alias="INVENTORY_OUTBOX_RELAY_ENABLED",
+    )
+    INVENTORY_OUTBOX_RELAY_INTERVAL_SECONDS: int = Field(
+        default=15,
+        description="Interval of the InventoryOutbox relay job in seconds",
+        validation_alias="INVENTORY_OUTBOX_RELAY_INTERVAL_SECONDS",
+    )
+    INVENTORY_OUTBOX_BATCH_SIZE: int = Field(
+        default=500,
+        description="Max outbox events claimed per relay batch",
+        validation_alias="INVENTORY_OUTBOX_BATCH_SIZE",
+    )
+    INVENTORY_OUTBOX_MAX_BATCHES: int = Field(
+        default=20,
+        description="Max relay batches per run (0 disables limit)",
+        validation_alias="INVENTORY_OUTBOX_MAX_BATCHES",
+    )
+    INVENTORY_OUTBOX_CONCURRENCY: int = Field(
+        default=4,
+        description="Default concurrent deliveries per outbox channel",
+        validation_alias="INVENTORY_OUTBOX_CONCURRENCY",
+    )
+    INVENTORY_OUTBOX_CHANNEL_CONCURRENCY: str = Field(
+        default="",
+        description="Per-channel delivery concurrency overrides, e.g. 'marketplace=2,webhook=8'",
+        validation_alias="INVENTORY_OUTBOX_CHANNEL_CONCURRENCY",
+    )
+    INVENTORY_OUTBOX_LEASE_SECONDS: int = Field(
+        default=300,
+        description="Lease on claimed outbox events before another relay may reclaim them",
+        validation_alias="INVENTORY_OUTBOX_LEASE_SECONDS",
+    )
+    INVENTORY_OUTBOX_DELIVERY_TIMEOUT_SECONDS: int = Field(
+        default=30,
+        description="Timeout of a single outbox delivery (0 disables)",
+        validation_alias="INVENTORY_OUTBOX_DELIVERY_TIMEOUT_SECONDS",
+    )
+    INVENTORY_OUTBOX_MAX_ATTEMPTS: int = Field(
+        default=8,
+        description="Delivery attempts before an outbox event is parked as failed",
+        validation_alias="INVENTORY_OUTBOX_MAX_ATTEMPTS",
+    )
+    INVENTORY_OUTBOX_BACKOFF_BASE_SECONDS: int = Field(
+        default=30,
+        description="Base of the exponential retry backoff for outbox events",
+        validation_alias="INVENTORY_OUTBOX_BACKOFF_BASE_SECONDS",
+    )
+    INVENTORY_OUTBOX_BACKOFF_MAX_SECONDS: int = Field(
+        default=3600,
+        description="Cap of the outbox retry backoff",
+        validation_alias="INVENTORY_OUTBOX_BACKOFF_MAX_SECONDS",
+    )
+    INVENTORY_OUTBOX_RETENTION_DAYS: int = Field(
+        default=0,
+        description="Opt-in: hard-delete delivered outbox events older than this many days (0 keeps them)",
+        validation_alias="INVENTORY_OUTBOX_RETENTION_DAYS",
+    )
+    INVENTORY_OUTBOX_WEBHOOK_URL: str = Field(
+        default="",
+        description="Default endpoint for webhook/erp/marketplace/task outbox events (empty: only per-channel URLs)",
+        validation_alias="INVENTORY_OUTBOX_WEBHOOK_URL",
+    )
+    INVENTORY_OUTBOX_CHANNEL_WEBHOOK_URLS: str = Field(
+        default="",
+        description="Per-channel outbox endpoints, e.g. 'erp=https://erp/hook,task=https://tasks/hook'",
+        validation_alias="INVENTORY_OUTBOX_CHANNEL_WEBHOOK_URLS",
+    )
+    INVENTORY_OUTBOX_WEBHOOK_TIMEOUT_SECONDS: float = Field(
+        default=10.0,
+        description="HTTP timeout of outbox webhook deliveries",
+        validation_alias="INVENTORY_OUTBOX_WEBHOOK_TIMEOUT_SECONDS",
+    )
+
+    # Tenant-sharded worker coordination (repricing autorun, Kaspi import/feed pollers)
+    WORKER_SHARDING_ENABLED: bool = Field(
+        default=False,
+        description="Split sharded worker jobs by tenant shard leases instead of one global advisory lock",
+        validation_alias="WORKER_SHARDING_ENABLED",
+    )
+    WORKER_SHARD_COUNT: int = Field(
+        default=16,
+        description="Number of tenant shards (company_id % N) leased across worker replicas",
+        validation_alias="WORKER_SHARD_COUNT",
+    )
+    WORKER_SHARD_LEASE_SECONDS: int = Field(
+        default=90,
+        description="Shard lease TTL; shards of a worker without heartbeat are taken over after it",
+        validation_alias="WORKER_SHARD_LEASE_SECONDS",
+    )
+    WORKER_SHARD_HEARTBEAT_SECONDS: int = Field(
+        default=30,
+        description="Interval of the shard lease heartbeat job (keep well below the lease TTL)",
+        validation_alias="WORKER_SHARD_HEARTBEAT_SECONDS",
+    )
+
+    # Transactional message dispatch (OTP SMS / password reset email off the request path)
+    MESSAGE_DISPATCH_ENABLED: bool = Field(
+        default=False,
+        description="Queue OTP/transactional messages in-process instead of sending inside the request",
+        validation_alias="MESSAGE_DISPATCH_ENABLED",
+    )
+    MESSAGE_DISPATCH_WORKERS: int = Field(
+        default=4,
+        description="Concurrent delivery tasks of the in-process message queue",
+        validation_alias="MESSAGE_DISPATCH_WORKERS",
+    )
+    MESSAGE_DISPATCH_QUEUE_SIZE: int = Field(
+        default=1000,
+        description="Max queued messages per process; beyond it requests get 503",
+        validation_alias="MESSAGE_DISPATCH_QUEUE_SIZE",
+    )
+    MESSAGE_DISPATCH_MAX_ATTEMPTS: int = Field(
+        default=3,
+        description="Delivery attempts per message (transient provider errors are retried)",
+        validation_alias="MESSAGE_DISPATCH_MAX_ATTEMPTS",
+    )
+    MESSAGE_DISPATCH_RETRY_BASE_SECONDS: float = Field(
+        default=1.0,
+        description="Base delay of the exponential retry backoff",
+        validation_alias="MESSAGE_DISPATCH_RETRY_BASE_SECONDS",
+    )
+    MESSAGE_DISPATCH_RATE_PER_SECOND: float = Field(
+        default=10.0,
+        description="Max messages per second per provider (0 disables limit)",
+        validation_alias="MESSAGE_DISPATCH_RATE_PER_SECOND",
+    )
+
     # Kaspi Auto-Sync Settings
     KASPI_AUTOSYNC_ENABLED: bool = Field(
         default=False,
@@ -731,6 +929,101 @@ class Settings(BaseSettings):
         description="Max attempts per Kaspi feed upload",
         validation_alias="KASPI_FEED_UPLOAD_MAX_ATTEMPTS",
     )
+    KASPI_SYNC_NOW_BACKGROUND_TIMEOUT_SECONDS: float = Field(
+        default=600.0,
+        description="Time budget for sync-now runs started with background=true (returns 202 + job id)",
+        validation_alias="KASPI_SYNC_NOW_BACKGROUND_TIMEOUT_SECONDS",
+    )
+    KASPI_CATALOG_IMPORT_INLINE_MAX_BYTES: int = Field(
+        default=2 * 1024 * 1024,
+        description="Catalog uploads larger than this are imported as a background job",
+        validation_alias="KASPI_CATALOG_IMPORT_INLINE_MAX_BYTES",
+    )
+    KASPI_CATALOG_IMPORT_CHUNK_SIZE: int = Field(
+        default=5000,
+        description="Rows parsed and COPY-loaded per chunk during catalog import",
+        validation_alias="KASPI_CATALOG_IMPORT_CHUNK_SIZE",
+    )
+    KASPI_CATALOG_IMPORT_SPOOL_DIR: str | None = Field(
+        default=None,
+        description="Directory for spooled catalog uploads (system temp dir when unset)",
+        validation_alias="KASPI_CATALOG_IMPORT_SPOOL_DIR",
+    )
+    KASPI_CATALOG_IMPORT_STALE_SECONDS: int = Field(
+        default=900,
+        description="PENDING/RUNNING catalog import batches without progress for this long are marked FAILED",
+        validation_alias="KASPI_CATALOG_IMPORT_STALE_SECONDS",
+    )
+    KASPI_CATALOG_IMPORT_SWEEP_INTERVAL_SECONDS: int = Field(
+        default=300,
+        description="Scheduler interval of the stale catalog import sweep",
+        validation_alias="KASPI_CATALOG_IMPORT_SWEEP_INTERVAL_SECONDS",
+    )
+    KASPI_SYNC_ADAPTIVE_ENABLED: bool = Field(
+        default=False,
+        description="Kaspi orders sync runner uses adaptive per-merchant schedules instead of a fixed sweep",
+        validation_alias="KASPI_SYNC_ADAPTIVE_ENABLED",
+    )
+    KASPI_SYNC_SCHEDULER_TICK_SECONDS: int = Field(
+        default=15,
+        description="How often the adaptive Kaspi sync scheduler looks for due merchants",
+        validation_alias="KASPI_SYNC_SCHEDULER_TICK_SECONDS",
+    )
+    KASPI_SYNC_MIN_INTERVAL_SECONDS: int = Field(
+        default=60,
+        description="Shortest per-merchant Kaspi orders sync interval",
+        validation_alias="KASPI_SYNC_MIN_INTERVAL_SECONDS",
+    )
+    KASPI_SYNC_BASE_INTERVAL_SECONDS: int = Field(
+        default=300,
+        description="Initial per-merchant Kaspi orders sync interval and error backoff base",
+        validation_alias="KASPI_SYNC_BASE_INTERVAL_SECONDS",
+    )
+    KASPI_SYNC_MAX_INTERVAL_SECONDS: int = Field(
+        default=1800,
+        description="Longest per-merchant Kaspi orders sync interval",
+        validation_alias="KASPI_SYNC_MAX_INTERVAL_SECONDS",
+    )
+    KASPI_SYNC_BUSY_ORDERS_THRESHOLD: int = Field(
+        default=50,
+        description="Orders fetched in one run that mark a merchant busy (next run at the minimum interval)",
+        validation_alias="KASPI_SYNC_BUSY_ORDERS_THRESHOLD",
+    )
+    KASPI_SYNC_GLOBAL_CONCURRENCY: int = Field(
+        default=8,
+        description="Max Kaspi orders syncs in flight across all worker processes",
+        validation_alias="KASPI_SYNC_GLOBAL_CONCURRENCY",
+    )
+    KASPI_SYNC_LEASE_SECONDS: int = Field(
+        default=600,
+        description="Lease on a claimed merchant schedule; expired leases are reclaimed by other workers",
+        validation_alias="KASPI_SYNC_LEASE_SECONDS",
+    )
+    KASPI_ORDERS_FETCH_CONCURRENCY: int = Field(
+        default=4,
+        description="Concurrent Kaspi order page streams (state x window slice) per merchant sync; 1 = serial",
+        validation_alias="KASPI_ORDERS_FETCH_CONCURRENCY",
+    )
+    KASPI_ORDERS_FETCH_SLICE_HOURS: int = Field(
+        default=24,
+        description="Creation-window slice size for concurrent order fetching; 0 disables slicing",
+        validation_alias="KASPI_ORDERS_FETCH_SLICE_HOURS",
+    )
+    KASPI_ORDERS_FETCH_PREFETCH_PAGES: int = Field(
+        default=2,
+        description="Pages buffered per order stream ahead of the persistence stage",
+        validation_alias="KASPI_ORDERS_FETCH_PREFETCH_PAGES",
+    )
+    KASPI_TOKEN_CACHE_TTL_SECONDS: int = Field(
+        default=60,
+        description="TTL of the in-process decrypted Kaspi store token cache (0 disables)",
+        validation_alias="KASPI_TOKEN_CACHE_TTL_SECONDS",
+    )
+    KASPI_TOKEN_CACHE_MAX_ENTRIES: int = Field(
+        default=1024,
+        description="Max store tokens kept in the in-process cache (LRU eviction)",
+        validation_alias="KASPI_TOKEN_CACHE_MAX_ENTRIES",
+    )
 
     # ---- rate limits
     RATE_LIMIT_PER_MINUTE: int = Field(
@@ -747,6 +1040,16 @@ class Settings(BaseSettings):
         description="Master switch for rate limiting",
         validation_alias="RATE_LIMIT_ENABLED",
     )
+    RATE_LIMIT_MEMORY_MAX_KEYS: int = Field(
+        default=10000,
+        description="Max in-memory rate limit buckets kept (LRU eviction)",
+        validation_alias="RATE_LIMIT_MEMORY_MAX_KEYS",
+    )
+    RATE_LIMIT_LOCAL_HEADROOM: float = Field(
+        default=0.0,
+        description="Share of each bucket admitted locally before consulting Redis (0 disables)",
+        validation_alias="RATE_LIMIT_LOCAL_HEADROOM",
+    )
     AUTH_RATE_LIMIT_PER_MINUTE: int = Field(
         default=10,
         description="Auth endpoints rate limit per minute",
@@ -777,6 +1080,57 @@ class Settings(BaseSettings):
         description="Redis key prefix for idempotency storage",
         validation_alias="IDEMPOTENCY_CACHE_PREFIX",
     )
+    IDEMPOTENCY_REDIS_ENABLED: bool = Field(
+        default=False,
+        description="Use Redis SET NX as the idempotency fast path (PostgreSQL stays the durable store)",
+        validation_alias="IDEMPOTENCY_REDIS_ENABLED",
+    )
+    IDEMPOTENCY_REPLAY_MAX_BYTES: int = Field(
+        default=65536,
+        description="Max cached response body size for idempotent replay (0 disables)",
+        validation_alias="IDEMPOTENCY_REPLAY_MAX_BYTES",
+    )
+    IDEMPOTENCY_REPLAY_CACHE_SIZE: int = Field(
+        default=1024,
+        description="Max in-process replay cache entries when Redis is unavailable",
+        validation_alias="IDEMPOTENCY_REPLAY_CACHE_SIZE",
+    )
+    IDEMPOTENCY_PURGE_BATCH_SIZE: int = Field(
+        default=1000,
+        description="Rows deleted per batch by the expired idempotency key purge",
+        validation_alias="IDEMPOTENCY_PURGE_BATCH_SIZE",
+    )
+
+    # ---- analytics
+    SALES_ROLLUPS_ENABLED: bool = Field(
+        default=False,
+        description="Maintain sales_rollups on order writes and serve sales analytics from them",
+        validation_alias="SALES_ROLLUPS_ENABLED",
+    )
+
+    # ---- exports
+    EXPORT_XLSX_MAX_ROWS: int = Field(
+        default=500_000,
+        description="Upper bound for the limit parameter of streaming XLSX exports",
+        validation_alias="EXPORT_XLSX_MAX_ROWS",
+    )
+    EXPORT_XLSX_BATCH_SIZE: int = Field(
+        default=2000,
+        description="Rows fetched per server-side cursor partition during XLSX export",
+        validation_alias="EXPORT_XLSX_BATCH_SIZE",
+    )
+    EXPORT_XLSX_WORKERS: int = Field(
+        default=4,
+        description="Threads encoding XLSX exports concurrently",
+        validation_alias="EXPORT_XLSX_WORKERS",
+    )
+
+    # ---- billing
+    SUBSCRIPTION_RENEWAL_CHUNK_SIZE: int = Field(
+        default=500,
+        description="Due subscriptions claimed (FOR UPDATE SKIP LOCKED) and committed per renewal chunk",
+        validation_alias="SUBSCRIPTION_RENEWAL_CHUNK_SIZE",
+    )
 
     # ---- CORS/hosts
     ALLOWED_HOSTS: list[str] = Field(
@@ -801,6 +1155,20 @@ class Settings(BaseSettings):
     LOG_PATH: str = Field(default="logs/app.log", description="Log file path", validation_alias="LOG_PATH")
     LOG_LEVEL: str = Field(default="INFO", description="Logging level", validation_alias="LOG_LEVEL")
     LOG_FORMAT: str = Field(default="json", description="Logging format (json|text)", validation_alias="LOG_FORMAT")
+    LOG_FILE_FORMAT: str = Field(
+        default="text", description="Log file line format (text|json lines)", validation_alias="LOG_FILE_FORMAT"
+    )
+    LOG_QUEUE_ENABLED: bool = Field(
+        default=False,
+        description="Route log records through a bounded queue and a background writer thread",
+        validation_alias="LOG_QUEUE_ENABLED",
+    )
+    LOG_QUEUE_MAX_SIZE: int = Field(
+        default=10000, description="Max queued log records before dropping", validation_alias="LOG_QUEUE_MAX_SIZE"
+    )
+    LOG_QUEUE_BATCH_SIZE: int = Field(
+        default=256, description="Max log records written per batch", validation_alias="LOG_QUEUE_BATCH_SIZE"
+    )
 
     # ---- Frontend
     FRONTEND_URL: AnyHttpUrl | str = Field(
@@ -1464,6 +1832,10 @@ class Settings(BaseSettings):
         return {
             "default_ttl": int(self.IDEMPOTENCY_DEFAULT_TTL),
             "prefix": self.IDEMPOTENCY_CACHE_PREFIX,
+            "redis_enabled": bool(self.IDEMPOTENCY_REDIS_ENABLED),
+            "replay_max_bytes": int(self.IDEMPOTENCY_REPLAY_MAX_BYTES),
+            "replay_cache_size": int(self.IDEMPOTENCY_REPLAY_CACHE_SIZE),
+            "purge_batch_size": int(self.IDEMPOTENCY_PURGE_BATCH_SIZE),
         }
 
     @property
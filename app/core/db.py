@@ -12,6 +12,7 @@ Unified database configuration and session management for SmartSell (async + syn
 - 🧰 Утилиты:
     Async: get_async_db(), get_async_session(), init_db_async(), close_db_async(),
            reload_async_engine(), health_check_db_async(), ensure_extensions_async()
+    Bulk:  copy_records(), bulk_upsert() — COPY в staging + INSERT ... SELECT ... ON CONFLICT
     Sync:  get_db(), get_session(), session_scope(), init_db(), drop_db(), recreate_db(),
            dispose_engine(), reload_engine(), health_check_db(), ensure_extensions()
     Alembic: get_alembic_engine_url()
@@ -24,14 +25,19 @@ Unified database configuration and session management for SmartSell (async + syn
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
 import os
 import time as _time
-from collections.abc import AsyncIterator, Generator, Iterator
+from collections.abc import AsyncIterable, AsyncIterator, Generator, Iterable, Iterator, Mapping, Sequence
 from contextlib import contextmanager
 from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+from uuid import uuid4
 
-from sqlalchemy import create_engine, event, text
+from sqlalchemy import JSON, Table, create_engine, event, text
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.engine import Engine
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.exc import IllegalStateChangeError, OperationalError, SQLAlchemyError
@@ -104,6 +110,10 @@ __all__ = [
     "reload_async_engine",
     "health_check_db_async",
     "ensure_extensions_async",
+    # Bulk load
+    "BulkLoadResult",
+    "bulk_upsert",
+    "copy_records",
     # Sync
     "get_db",
     "get_session",  # совместимость
@@ -690,6 +700,167 @@ async def ensure_extensions_async() -> None:
         logger.warning("Async ensure_extensions failed (non-critical): %s", e)
 
 
+# -----------------------------------------------------------------------------
+# Bulk load: COPY в temp staging + INSERT ... SELECT ... ON CONFLICT
+# -----------------------------------------------------------------------------
+_PG_QUOTE = postgresql.dialect().identifier_preparer
+_BULK_ORD_COLUMN = "_bulk_ord"
+
+
+@dataclass
+class BulkLoadResult:
+    staged: int = 0
+    inserted: int = 0
+    updated: int = 0
+
+    @property
+    def written(self) -> int:
+        return self.inserted + self.updated
+
+
+def bulk_copy_chunk_rows() -> int:
+    return max(1, int(getattr(settings, "BULK_COPY_CHUNK_ROWS", 10000) or 10000))
+
+
+def bulk_copy_min_rows() -> int:
+    return max(1, int(getattr(settings, "BULK_COPY_MIN_ROWS", 1000) or 1000))
+
+
+async def copy_records(
+    session: AsyncSession,
+    table_name: str,
+    columns: Sequence[str],
+    records: Sequence[tuple],
+) -> None:
+    """
+    COPY ``records`` (tuples in ``columns`` order) into ``table_name`` on the
+    session's connection (asyncpg binary COPY). Drivers without COPY fall back
+    to executemany. JSON values must already be serialized to text.
+    """
+    if not records:
+        return
+    conn = await session.connection()
+    raw_conn = await conn.get_raw_connection()
+    driver_conn = getattr(raw_conn, "driver_connection", None)
+    copy_to_table = getattr(driver_conn, "copy_records_to_table", None)
+    if copy_to_table is not None:
+        await copy_to_table(table_name, records=records, columns=list(columns))
+        return
+    placeholders = ", ".join(f":{name}" for name in columns)
+    await session.execute(
+        text(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"),
+        [dict(zip(columns, record, strict=True)) for record in records],
+    )
+
+
+def _bulk_target(target: Any) -> Table:
+    table = getattr(target, "__table__", target)
+    if not isinstance(table, Table):
+        raise TypeError(f"bulk_upsert target must be a Table or mapped class, got {type(target).__name__}")
+    return table
+
+
+async def _iter_rows(rows: Iterable[Any] | AsyncIterable[Any]) -> AsyncIterator[Any]:
+    if isinstance(rows, AsyncIterable):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+def _bulk_merge_sql(
+    table: Table,
+    stage: str,
+    columns: Sequence[str],
+    conflict_columns: Sequence[str],
+    update_columns: Sequence[str],
+    update_set: Mapping[str, str],
+) -> str:
+    q = _PG_QUOTE.quote
+    cols = ", ".join(q(c) for c in columns)
+    conflict = ", ".join(q(c) for c in conflict_columns)
+    assignments = [f"{q(c)} = {update_set.get(c, f'EXCLUDED.{q(c)}')}" for c in update_columns]
+    assignments += [f"{q(c)} = {expr}" for c, expr in update_set.items() if c not in update_columns]
+    on_conflict = f"DO UPDATE SET {', '.join(assignments)}" if assignments else "DO NOTHING"
+    # DISTINCT ON + ORDER BY ord DESC: при повторе ключа в пачке побеждает последняя строка
+    # (иначе ON CONFLICT DO UPDATE упадёт на «cannot affect row a second time»).
+    return (
+        f"WITH merged AS ("
+        f"INSERT INTO {_PG_QUOTE.format_table(table)} AS t ({cols}) "
+        f"SELECT DISTINCT ON ({conflict}) {cols} FROM {stage} "
+        f"ORDER BY {conflict}, {_BULK_ORD_COLUMN} DESC "
+        f"ON CONFLICT ({conflict}) {on_conflict} "
+        f"RETURNING (xmax = 0) AS inserted"
+        f") SELECT count(*) FILTER (WHERE inserted), count(*) FROM merged"
+    )
+
+
+async def bulk_upsert(
+    session: AsyncSession,
+    target: Any,
+    rows: Iterable[Mapping[str, Any] | Sequence[Any]] | AsyncIterable[Mapping[str, Any] | Sequence[Any]],
+    *,
+    columns: Sequence[str],
+    conflict_columns: Sequence[str],
+    update_columns: Sequence[str] | None = None,
+    update_set: Mapping[str, str] | None = None,
+    chunk_rows: int | None = None,
+) -> BulkLoadResult:
+    """
+    Streams ``rows`` (mappings or tuples in ``columns`` order, sync or async
+    iterable) through COPY into a per-call temp staging table shaped like
+    ``target`` and merges them with one ``INSERT ... SELECT ... ON CONFLICT``.
+
+    ``update_columns`` defaults to every non-conflict column; ``update_set``
+    overrides assignments with SQL expressions (``t`` is the target row,
+    ``EXCLUDED`` the incoming one). Runs inside the session's transaction —
+    the caller commits. Postgres only.
+    """
+    table = _bulk_target(target)
+    columns = list(columns)
+    conflict_columns = list(conflict_columns)
+    if update_columns is None:
+        update_columns = [c for c in columns if c not in conflict_columns]
+    json_idx = [i for i, c in enumerate(columns) if isinstance(table.c[c].type, JSON)]
+    chunk_rows = max(1, int(chunk_rows or bulk_copy_chunk_rows()))
+
+    stage = f"_bulk_{table.name}_{uuid4().hex[:8]}"
+    quoted_cols = ", ".join(_PG_QUOTE.quote(c) for c in columns)
+    await session.execute(
+        text(
+            f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS "
+            f"SELECT {quoted_cols}, 0::bigint AS {_BULK_ORD_COLUMN} "
+            f"FROM {_PG_QUOTE.format_table(table)} WITH NO DATA"
+        )
+    )
+
+    result = BulkLoadResult()
+    stage_columns = [*columns, _BULK_ORD_COLUMN]
+    chunk: list[tuple] = []
+    async for row in _iter_rows(rows):
+        values = [row.get(c) for c in columns] if isinstance(row, Mapping) else list(row)
+        for i in json_idx:
+            value = values[i]
+            if value is not None and not isinstance(value, str):
+                values[i] = json.dumps(value, ensure_ascii=False, default=str)
+        result.staged += 1
+        values.append(result.staged)
+        chunk.append(tuple(values))
+        if len(chunk) >= chunk_rows:
+            await copy_records(session, stage, stage_columns, chunk)
+            chunk = []
+    await copy_records(session, stage, stage_columns, chunk)
+
+    if result.staged:
+        merge_sql = _bulk_merge_sql(table, stage, columns, conflict_columns, update_columns, update_set or {})
+        inserted, written = (await session.execute(text(merge_sql))).one()
+        result.inserted = int(inserted or 0)
+        result.updated = int(written or 0) - result.inserted
+    await session.execute(text(f"DROP TABLE {stage}"))
+    return result
+
+
 # -----------------------------------------------------------------------------
 # Sync API (FastAPI dependency и утилиты)
 # -----------------------------------------------------------------------------
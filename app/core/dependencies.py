@@ -23,6 +23,7 @@ ENV (optional):
 import os
 import sys
 from collections.abc import Callable, Sequence
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from typing import Any
 
@@ -248,6 +249,7 @@ except Exception:  # pragma: no cover
 # ------------------------------------------------------------------------------
 # Redis (optional)
 # ------------------------------------------------------------------------------
+from app.core.exceptions import IdempotentReplay
 from app.core.idempotency import IdempotencyEnforcer
 from app.core.rate_limiter import RateLimiter, rate_limit_dependency
 from app.core.redis_client import get_redis
@@ -636,7 +638,17 @@ _AUTH_RATE_WINDOW = _int_setting(_rate_cfg.get("auth_window_seconds", 60), 60)
 _OTP_RATE_LIMIT = _int_setting(_rate_cfg.get("otp_per_minute", 5), 5)
 _OTP_RATE_WINDOW = _int_setting(_rate_cfg.get("otp_window_seconds", 60), 60)
 
-_rate_limiter = RateLimiter(redis=get_redis(), env=_env_tag, prefix="rl") if _RATE_ENABLED else None
+_rate_limiter = (
+    RateLimiter(
+        redis=get_redis(),
+        env=_env_tag,
+        prefix="rl",
+        memory_max_keys=_int_setting(getattr(settings, "RATE_LIMIT_MEMORY_MAX_KEYS", 10000), 10000),
+        local_headroom=float(getattr(settings, "RATE_LIMIT_LOCAL_HEADROOM", 0.0) or 0.0),
+    )
+    if _RATE_ENABLED
+    else None
+)
 
 
 def _limit_dep(tag: str, max_requests: int, window_seconds: int, per_user: bool = True):
@@ -713,14 +725,26 @@ api_rate_limit_dep = api_rate_limit
 _idem_cfg = getattr(settings, "idempotency_settings", {}) or {}
 _idem_default_ttl = _int_setting(_idem_cfg.get("default_ttl", getattr(settings, "IDEMPOTENCY_DEFAULT_TTL", 900)), 900)
 
-_idempotency_enforcer = IdempotencyEnforcer(default_ttl=_idem_default_ttl, env=_env_tag)
+_idempotency_enforcer = IdempotencyEnforcer(
+    redis=get_redis() if bool(_idem_cfg.get("redis_enabled", False)) else None,
+    default_ttl=_idem_default_ttl,
+    env=_env_tag,
+    replay_max_bytes=_int_setting(_idem_cfg.get("replay_max_bytes", 65536), 65536),
+    replay_cache_size=_int_setting(_idem_cfg.get("replay_cache_size", 1024), 1024),
+)
 
 
-async def _get_idempotency_db():
+@asynccontextmanager
+async def _idempotency_session():
+    """Сессия БД для идемпотентности — открывается только когда действительно нужна."""
     if not get_async_db:
         raise RuntimeError("Async DB session is required for idempotency")
-    async for db in get_async_db():
+    sessions = get_async_db()
+    db = await sessions.__anext__()
+    try:
         yield db
+    finally:
+        await sessions.aclose()
 
 
 def _resolve_idempotency_scope(current_user: Any | None, key: str) -> tuple[int | None, str]:
@@ -750,7 +774,6 @@ async def _apply_idempotency(
     request: Request,
     response: Response,
     current_user: Any | None,
-    db,
     *,
     allow_replay: bool,
 ):
@@ -782,8 +805,9 @@ async def _apply_idempotency(
         return True
 
     try:
+        # Сессия передаётся фабрикой: при успешном SET NX в Redis соединение с БД не берётся
         allowed, processed_status = await _idempotency_enforcer.reserve(
-            db, company_id=company_id, key=scoped_key, ttl_seconds=ttl_seconds
+            _idempotency_session, company_id=company_id, key=scoped_key, ttl_seconds=ttl_seconds
         )
     except Exception as exc:
         log.error("Idempotency DB error", extra={"error": str(exc)})
@@ -791,6 +815,9 @@ async def _apply_idempotency(
 
     if not allowed:
         if processed_status is not None and allow_replay:
+            cached = await _idempotency_enforcer.get_replay(company_id, scoped_key)
+            if cached is not None:
+                raise IdempotentReplay(cached[0], cached[1], headers={"Idempotency-Key": raw_key})
             request.state.idempotency_key = scoped_key
             request.state.idempotency_ttl = ttl_seconds
             request.state.idempotency_company_id = company_id
@@ -811,18 +838,16 @@ async def ensure_idempotency(
     request: Request,
     response: Response,
     current_user: Any | None = Depends(get_current_user_optional),
-    db=Depends(_get_idempotency_db, use_cache=False),
 ):
-    return await _apply_idempotency(request, response, current_user, db, allow_replay=False)
+    return await _apply_idempotency(request, response, current_user, allow_replay=False)
 
 
 async def ensure_idempotency_replay(
     request: Request,
     response: Response,
     current_user: Any | None = Depends(get_current_user_optional),
-    db=Depends(_get_idempotency_db, use_cache=False),
 ):
-    return await _apply_idempotency(request, response, current_user, db, allow_replay=True)
+    return await _apply_idempotency(request, response, current_user, allow_replay=True)
 
 
 async def set_idempotency_result(
@@ -832,6 +857,7 @@ async def set_idempotency_result(
     ttl_seconds: int | None = None,
     request: Request | None = None,
     company_id: int | None = None,
+    body: Any | None = None,
 ):
     scoped_company_id = company_id
     scoped_key = key
@@ -842,15 +868,15 @@ async def set_idempotency_result(
     if scoped_company_id is None:
         return
 
-    async for db in _get_idempotency_db():
+    async with _idempotency_session() as db:
         await _idempotency_enforcer.set_result(
             db,
             company_id=int(scoped_company_id),
             key=scoped_key,
             status_code=int(status_code),
             ttl_seconds=ttl_seconds,
+            body=body,
         )
-        return
 
 
 # ------------------------------------------------------------------------------
@@ -21,7 +21,7 @@ from collections.abc import Mapping
 from typing import Any
 
 from fastapi import FastAPI, HTTPException, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import ValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
@@ -103,6 +103,16 @@ class ExternalServiceError(SmartSellException):
     """External service errors."""
 
 
+class IdempotentReplay(Exception):
+    """Short-circuits a duplicate idempotent request with its cached response."""
+
+    def __init__(self, status_code: int, body: bytes, headers: dict[str, str] | None = None):
+        self.status_code = int(status_code)
+        self.body = body
+        self.headers = headers or {}
+        super().__init__(f"idempotent replay ({self.status_code})")
+
+
 # -----------------------------------------------------------------------------
 # HTTP shortcuts (factory style, single point of truth)
 # -----------------------------------------------------------------------------
@@ -500,12 +510,21 @@ async def operational_error_handler(request: Request, exc: OperationalError) ->
 # -----------------------------------------------------------------------------
 
 
+async def idempotent_replay_handler(request: Request, exc: IdempotentReplay) -> Response:
+    """
+    Returns the cached body of an already processed idempotent request.
+    """
+    headers = {**exc.headers, "Idempotent-Replayed": "true"}
+    return Response(content=exc.body, status_code=exc.status_code, media_type="application/json", headers=headers)
+
+
 def register_exception_handlers(app: FastAPI) -> None:
     """
     Attach all exception handlers to FastAPI app.
     """
     # Domain
     app.add_exception_handler(SmartSellException, smartsell_exception_handler)
+    app.add_exception_handler(IdempotentReplay, idempotent_replay_handler)
 
     # HTTP / Pydantic / FastAPI request-level validation
     app.add_exception_handler(HTTPException, http_exception_handler)
@@ -542,6 +561,7 @@ __all__ = [
     "ConflictError",
     "RateLimitError",
     "ExternalServiceError",
+    "IdempotentReplay",
     # HTTP shortcuts
     "http_error",
     "bad_request",
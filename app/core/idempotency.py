@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import json
 import logging
 import time
+from collections import OrderedDict
+from collections.abc import Callable
+from contextlib import AbstractAsyncContextManager
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Optional
 
 from fastapi import HTTPException, Request, Response, status
 from sqlalchemy import delete, select
@@ -15,9 +19,21 @@ from app.models.idempotency_key import IdempotencyKey
 
 log = logging.getLogger(__name__)
 
+_PROCESSING_MARKER = "102"
+
 
 class IdempotencyEnforcer:
-    """Idempotency helper backed by PostgreSQL."""
+    """Idempotency helper backed by PostgreSQL.
+
+    When a Redis client is configured, ``reserve`` is decided by ``SET NX PX``
+    alone and PostgreSQL is not touched; it is only used when Redis is
+    unavailable. The durable row is written once, by ``set_result``, which also
+    mirrors the final status to Redis. ``reserve`` accepts either a session or a
+    session factory (async context manager), so the Redis path never checks out
+    a DB connection. Small response bodies can be cached for replay
+    (``replay_max_bytes`` per entry, ``replay_cache_size`` entries when kept in
+    process memory).
+    """
 
     def __init__(
         self,
@@ -25,12 +41,18 @@ class IdempotencyEnforcer:
         prefix: str = "idemp",
         default_ttl: int = 900,
         env: str = "dev",
+        *,
+        replay_max_bytes: int = 65536,
+        replay_cache_size: int = 1024,
     ) -> None:
         self.redis = redis
         self.prefix = prefix
         self.default_ttl = max(1, int(default_ttl or 1))
         self.env = env or "dev"
+        self.replay_max_bytes = max(0, int(replay_max_bytes or 0))
+        self.replay_cache_size = max(1, int(replay_cache_size or 1))
         self._mem: dict[str, tuple[int, float]] = {}
+        self._replay: OrderedDict[str, tuple[int, bytes, float]] = OrderedDict()
 
     def _is_production(self) -> bool:
         try:
@@ -41,43 +63,113 @@ class IdempotencyEnforcer:
     def _key(self, key: str) -> str:
         return f"{self.env}:{self.prefix}:{key}"
 
+    def _scoped_key(self, company_id: int, key: str) -> str:
+        return self._key(f"{int(company_id)}:{key}")
+
     async def reserve(
         self,
-        db: AsyncSession,
+        db: AsyncSession | Callable[[], AbstractAsyncContextManager[AsyncSession]],
         company_id: int,
         key: str,
         ttl_seconds: int,
     ) -> tuple[bool, Optional[int]]:
         ttl = max(1, int(ttl_seconds))
+
+        if self.redis is not None:
+            try:
+                return await self._reserve_redis_scoped(company_id, key, ttl)
+            except Exception as exc:
+                log.warning("Idempotency redis error; using PostgreSQL", extra={"error": str(exc)})
+
+        if isinstance(db, AsyncSession):
+            return await self._reserve_pg(db, company_id, key, ttl)
+        async with db() as session:
+            return await self._reserve_pg(session, company_id, key, ttl)
+
+    async def _reserve_pg(self, db: AsyncSession, company_id: int, key: str, ttl: int) -> tuple[bool, Optional[int]]:
         now = datetime.utcnow()
         expires_at = now + timedelta(seconds=ttl)
 
-        inserted = await self._insert_processing(db, company_id, key, expires_at)
-        if inserted:
+        # Один upsert покрывает и новый ключ, и перезахват просроченного (без inline delete).
+        if await self._insert_processing(db, company_id, key, expires_at, now=now):
             await db.commit()
             return True, None
 
         existing = await self._get_existing(db, company_id, key)
-        if existing and existing.expires_at and existing.expires_at <= now:
-            await db.execute(
-                delete(IdempotencyKey).where(
-                    IdempotencyKey.company_id == company_id,
-                    IdempotencyKey.key == key,
-                )
-            )
-            await db.commit()
-            inserted = await self._insert_processing(db, company_id, key, expires_at)
-            if inserted:
-                await db.commit()
-                return True, None
-            existing = await self._get_existing(db, company_id, key)
-
         if not existing:
             return True, None
 
         status_code = existing.status_code
         return False, int(status_code) if status_code is not None else None
 
+    async def _reserve_redis_scoped(self, company_id: int, key: str, ttl: int) -> tuple[bool, Optional[int]]:
+        rkey = self._scoped_key(company_id, key)
+        for _ in range(2):
+            inserted = await self.redis.set(rkey, _PROCESSING_MARKER, nx=True, px=ttl * 1000)  # type: ignore[attr-defined]
+            if inserted:
+                return True, None
+            existing = await self.redis.get(rkey)  # type: ignore[attr-defined]
+            if existing is None:
+                continue  # expired between SET and GET
+            if isinstance(existing, bytes):
+                existing = existing.decode()
+            if str(existing) == _PROCESSING_MARKER:
+                return False, None
+            try:
+                return False, int(existing)
+            except Exception:
+                return False, None
+        return True, None
+
+    async def get_replay(self, company_id: int, key: str) -> tuple[int, bytes] | None:
+        """Return cached (status_code, body) for a completed request, if any."""
+        rkey = self._scoped_key(company_id, key) + ":resp"
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(rkey)  # type: ignore[attr-defined]
+            except Exception as exc:
+                log.warning("Idempotency replay cache error", extra={"error": str(exc)})
+                raw = None
+            if raw is None:
+                return None
+            if isinstance(raw, str):
+                raw = raw.encode()
+            status_raw, _, body = bytes(raw).partition(b"\n")
+            try:
+                return int(status_raw), body
+            except ValueError:
+                return None
+
+        rec = self._replay.get(rkey)
+        if rec is None:
+            return None
+        status_code, body, exp = rec
+        if time.time() >= exp:
+            self._replay.pop(rkey, None)
+            return None
+        self._replay.move_to_end(rkey)
+        return status_code, body
+
+    async def _store_replay(self, company_id: int, key: str, status_code: int, body: Any, ttl: int) -> None:
+        if body is None or self.replay_max_bytes <= 0:
+            return
+        payload = body if isinstance(body, bytes) else json.dumps(body, default=str, separators=(",", ":")).encode()
+        if len(payload) > self.replay_max_bytes:
+            return
+        rkey = self._scoped_key(company_id, key) + ":resp"
+        if self.redis is not None:
+            try:
+                await self.redis.set(  # type: ignore[attr-defined]
+                    rkey, str(int(status_code)).encode() + b"\n" + payload, px=ttl * 1000
+                )
+            except Exception as exc:
+                log.warning("Idempotency replay cache error", extra={"error": str(exc)})
+            return
+        self._replay[rkey] = (int(status_code), payload, time.time() + ttl)
+        self._replay.move_to_end(rkey)
+        while len(self._replay) > self.replay_cache_size:
+            self._replay.popitem(last=False)
+
     async def set_result(self, *args, **kwargs) -> None:
         if args and isinstance(args[0], AsyncSession):
             db = args[0]
@@ -85,6 +177,7 @@ class IdempotencyEnforcer:
             key = kwargs.get("key")
             status_code = kwargs.get("status_code")
             ttl_seconds = kwargs.get("ttl_seconds")
+            body = kwargs.get("body")
             if company_id is None or key is None or status_code is None:
                 return
             ttl = max(1, int(ttl_seconds or self.default_ttl))
@@ -109,6 +202,14 @@ class IdempotencyEnforcer:
             )
             await db.execute(stmt)
             await db.commit()
+            if self.redis is not None:
+                try:
+                    await self.redis.set(  # type: ignore[attr-defined]
+                        self._scoped_key(int(company_id), str(key)), str(int(status_code)), px=ttl * 1000
+                    )
+                except Exception as exc:
+                    log.warning("Idempotency redis error", extra={"error": str(exc)})
+            await self._store_replay(int(company_id), str(key), int(status_code), body, ttl)
             return
 
         key = args[0] if args else kwargs.get("key")
@@ -132,6 +233,8 @@ class IdempotencyEnforcer:
         company_id: int,
         key: str,
         expires_at: datetime,
+        *,
+        now: datetime,
     ) -> bool:
         stmt = (
             pg_insert(IdempotencyKey)
@@ -141,10 +244,15 @@ class IdempotencyEnforcer:
                 status_code=None,
                 expires_at=expires_at,
             )
-            .on_conflict_do_nothing(index_elements=["company_id", "key"])
+            .on_conflict_do_update(
+                index_elements=["company_id", "key"],
+                set_={"status_code": None, "expires_at": expires_at, "updated_at": now},
+                where=IdempotencyKey.expires_at <= now,
+            )
+            .returning(IdempotencyKey.id)
         )
         res = await db.execute(stmt)
-        return bool(res.rowcount and res.rowcount > 0)
+        return res.first() is not None
 
     async def _get_existing(self, db: AsyncSession, company_id: int, key: str) -> IdempotencyKey | None:
         res = await db.execute(
@@ -243,6 +351,23 @@ class IdempotencyEnforcer:
         return dep
 
 
+async def purge_expired_idempotency_keys(db: AsyncSession, *, batch_size: int = 1000) -> int:
+    """Delete expired IdempotencyKey rows in bounded batches (background cleanup)."""
+    batch = max(1, int(batch_size))
+    now = datetime.utcnow()
+    total = 0
+    while True:
+        ids = select(IdempotencyKey.id).where(IdempotencyKey.expires_at <= now).limit(batch).scalar_subquery()
+        res = await db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        deleted = int(res.rowcount or 0)
+        total += deleted
+        if deleted < batch:
+            return total
+
+
 def ensure_idempotency_dep(enforcer: IdempotencyEnforcer | None = None, *args, **kwargs):
     if enforcer is not None:
         return enforcer.dependency(*args, **kwargs)
@@ -259,4 +384,9 @@ def ensure_idempotency_replay_dep(enforcer: IdempotencyEnforcer | None = None, *
     return ensure_idempotency_replay(*args, **kwargs)
 
 
-__all__ = ["IdempotencyEnforcer", "ensure_idempotency_dep", "ensure_idempotency_replay_dep"]
+__all__ = [
+    "IdempotencyEnforcer",
+    "ensure_idempotency_dep",
+    "ensure_idempotency_replay_dep",
+    "purge_expired_idempotency_keys",
+]
@@ -0,0 +1,156 @@
+"""
+In-process cache of decrypted Kaspi store tokens.
+
+KaspiStoreToken.get_token() is hit on every sync-now, autosync tick, feed upload
+poll, catalog sync and token health check; each call used to run
+``pgp_sym_decrypt`` in Postgres. Tokens are cached per normalized store name for
+a short TTL and kept re-encrypted in memory with a per-process ephemeral Fernet
+key, so a heap dump or a stray repr never shows a plaintext token.
+
+Writers (upsert/rotate/rename/delete) invalidate explicitly; other processes
+pick up a change within the TTL. A generation counter keeps a lookup that raced
+with an invalidation from re-populating the cache with the old value.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from cryptography.fernet import Fernet
+
+from app.core.config import settings
+
+try:
+    from prometheus_client import Counter
+except Exception:  # pragma: no cover - optional metrics dependency
+    Counter = None
+
+_CACHE_REQUESTS = (
+    Counter(
+        "smartsell_kaspi_token_cache_requests_total",
+        "Kaspi store token cache lookups",
+        ["result"],
+    )
+    if Counter
+    else None
+)
+_CACHE_INVALIDATIONS = (
+    Counter("smartsell_kaspi_token_cache_invalidations_total", "Kaspi store token cache invalidations")
+    if Counter
+    else None
+)
+
+
+def normalize_store_name(name: str | None) -> str:
+    return (name or "").strip().lower()
+
+
+def _ttl_seconds() -> float:
+    try:
+        return max(0.0, float(getattr(settings, "KASPI_TOKEN_CACHE_TTL_SECONDS", 60) or 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _max_entries() -> int:
+    try:
+        return max(1, int(getattr(settings, "KASPI_TOKEN_CACHE_MAX_ENTRIES", 1024) or 1024))
+    except (TypeError, ValueError):
+        return 1024
+
+
+class KaspiTokenCache:
+    """
+    TTL + LRU cache ``store -> token``. ``enabled=None`` means "on unless testing":
+    tests truncate tables between cases, so a process-wide cache would leak tokens.
+    """
+
+    def __init__(self, *, enabled: bool | None = None) -> None:
+        self._enabled = enabled
+        self._fernet = Fernet(Fernet.generate_key())
+        self._entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        if _ttl_seconds() <= 0:
+            return False
+        if self._enabled is None:
+            return not getattr(settings, "is_testing", False)
+        return self._enabled
+
+    def _record(self, result: str) -> None:
+        if result == "hit":
+            self.hits += 1
+        else:
+            self.misses += 1
+        if _CACHE_REQUESTS is not None:
+            _CACHE_REQUESTS.labels(result=result).inc()
+
+    def generation(self) -> int:
+        """Snapshot to pass to ``put`` — taken before reading the token from the DB."""
+        with self._lock:
+            return self._generation
+
+    def get(self, store_name: str) -> str | None:
+        if not self.enabled:
+            return None
+        key = normalize_store_name(store_name)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                entry = None
+                result = "expired"
+            elif entry is not None:
+                self._entries.move_to_end(key)
+                result = "hit"
+            else:
+                result = "miss"
+        self._record(result)
+        if entry is None:
+            return None
+        return self._fernet.decrypt(entry[0]).decode("utf-8")
+
+    def put(self, store_name: str, token: str, *, generation: int | None = None) -> None:
+        if not self.enabled or not token:
+            return
+        key = normalize_store_name(store_name)
+        ciphertext = self._fernet.encrypt(token.encode("utf-8"))
+        expires_at = time.monotonic() + _ttl_seconds()
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return  # между чтением из БД и записью в кэш токен поменяли
+            self._entries[key] = (ciphertext, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > _max_entries():
+                self._entries.popitem(last=False)
+
+    def invalidate(self, store_name: str | None = None) -> None:
+        """Drop one store (or everything when ``store_name`` is None)."""
+        with self._lock:
+            self._generation += 1
+            if store_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(normalize_store_name(store_name), None)
+        if _CACHE_INVALIDATIONS is not None:
+            _CACHE_INVALIDATIONS.inc()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+        return {"enabled": self.enabled, "size": size, "hits": self.hits, "misses": self.misses}
+
+
+kaspi_token_cache = KaspiTokenCache()
+
+
+__all__ = ["KaspiTokenCache", "kaspi_token_cache", "normalize_store_name"]
@@ -29,14 +29,21 @@ Env knobs (optional):
   ENABLE_GCLOUD_LOGGING=1
   ENABLE_CLOUDWATCH_LOGGING=1, CLOUDWATCH_LOG_GROUP=smartsell3, CLOUDWATCH_REGION=...
   SLOW_SQL_THRESHOLD_MS=300
+  LOG_QUEUE_ENABLED=1, LOG_QUEUE_MAX_SIZE=10000, LOG_QUEUE_BATCH_SIZE=256
+  LOG_FILE_FORMAT=text|json
 """
 
 from __future__ import annotations
 
+import atexit
+import copy
 import json
 import logging
 import logging.config
+import logging.handlers
 import os
+import queue
+import re
 import sys
 import threading
 import time
@@ -44,6 +51,7 @@ import uuid
 from contextlib import contextmanager
 from contextvars import ContextVar, Token
 from datetime import datetime
+from functools import lru_cache
 from typing import Any
 
 # ---------- Safe settings import ----------
@@ -57,6 +65,10 @@ except Exception:  # pragma: no cover
         LOG_PATH = os.getenv("LOG_PATH", "logs/app.log")
         LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
         LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+        LOG_QUEUE_ENABLED = os.getenv("LOG_QUEUE_ENABLED", "0") in ("1", "true", "True")
+        LOG_QUEUE_MAX_SIZE = int(os.getenv("LOG_QUEUE_MAX_SIZE", "10000"))
+        LOG_QUEUE_BATCH_SIZE = int(os.getenv("LOG_QUEUE_BATCH_SIZE", "256"))
+        LOG_FILE_FORMAT = os.getenv("LOG_FILE_FORMAT", "text")
         PROJECT_NAME = "SmartSell3"
         VERSION = "0.1.0"
         SENTRY_DSN = os.getenv("SENTRY_DSN")
@@ -106,6 +118,18 @@ _CONFIGURED = False
 
 # ---------- Secrets redaction ----------
 _SECRET_KEYS = ("secret", "password", "token", "dsn", "api_key", "api_secret", "access_key", "key")
+# Один скомпилированный regex вместо any(x in lk ...) по всем подстрокам; классификация ключей мемоизируется.
+_SECRET_KEY_RE = re.compile("|".join(re.escape(k) for k in _SECRET_KEYS))
+_REDACT_MAX_DEPTH = 8
+_REDACT_MAX_ITEMS = 1000
+_REDACT_TRUNCATED_KEY = "__truncated__"
+_CONTAINERS = (dict, list, tuple)
+
+
+@lru_cache(maxsize=4096)
+def _is_secret_key(key: str) -> bool:
+    lk = key.lower()
+    return _SECRET_KEY_RE.search(lk) is not None and "public" not in lk
 
 
 def _mask_secret_value(v: Any) -> Any:
@@ -118,23 +142,41 @@ def _mask_secret_value(v: Any) -> Any:
     return s[:3] + "***" + s[-3:]
 
 
-def redact_secrets(data: Any) -> Any:
+def _redact(data: Any, depth: int) -> Any:
     if isinstance(data, dict):
-        out: dict[str, Any] = {}
-        for k, v in data.items():
-            lk = str(k).lower()
-            if any(x in lk for x in _SECRET_KEYS) and "public" not in lk:
+        if depth >= _REDACT_MAX_DEPTH:
+            return "***"
+        out: dict[Any, Any] = {}
+        for i, (k, v) in enumerate(data.items()):
+            if i >= _REDACT_MAX_ITEMS:
+                out[_REDACT_TRUNCATED_KEY] = len(data) - i
+                break
+            if _is_secret_key(k if isinstance(k, str) else str(k)):
                 out[k] = _mask_secret_value(v)
+            elif isinstance(v, _CONTAINERS):
+                out[k] = _redact(v, depth + 1)
             else:
-                out[k] = redact_secrets(v)
+                out[k] = v
         return out
-    if isinstance(data, list):
-        return [redact_secrets(v) for v in data]
-    if isinstance(data, tuple):
-        return tuple(redact_secrets(v) for v in data)
+    if isinstance(data, list | tuple):
+        if depth >= _REDACT_MAX_DEPTH:
+            return "***"
+        items = [_redact(v, depth + 1) if isinstance(v, _CONTAINERS) else v for v in data[:_REDACT_MAX_ITEMS]]
+        if len(data) > _REDACT_MAX_ITEMS:
+            items.append(f"...(+{len(data) - _REDACT_MAX_ITEMS} more)")
+        return tuple(items) if isinstance(data, tuple) else items
     return data
 
 
+def redact_secrets(data: Any) -> Any:
+    """
+    Masks values under secret-looking keys in nested dict/list/tuple structures.
+    Containers deeper than _REDACT_MAX_DEPTH are replaced with "***"; containers
+    longer than _REDACT_MAX_ITEMS are truncated with a marker.
+    """
+    return _redact(data, 0)
+
+
 # ---------- OTEL trace/span injection ----------
 def _otel_trace_injector(_, __, event_dict):
     try:
@@ -184,7 +226,11 @@ def _inject_context(_, __, event_dict):
 
 
 def _redact_processor(_, __, event_dict):
-    return redact_secrets(event_dict)
+    # Fast path: плоское событие без секретных ключей отдаём как есть, без копирования.
+    for k, v in event_dict.items():
+        if isinstance(v, _CONTAINERS) or _is_secret_key(k if isinstance(k, str) else str(k)):
+            return redact_secrets(event_dict)
+    return event_dict
 
 
 def _add_app(build_info: bool = True):
@@ -214,9 +260,13 @@ if _HAS_PROM and _ENABLE_PROM:
         "Slow SQL query duration seconds",
         buckets=(0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10),
     )
+    LOG_QUEUE_DROPPED_TOTAL = Counter(
+        "smartsell3_log_queue_dropped_total", "Log records dropped because the log queue was full", ["level"]
+    )
 else:
     LOG_EVENTS_TOTAL = None
     SLOW_SQL_SECONDS = None
+    LOG_QUEUE_DROPPED_TOTAL = None
 
 if _HAS_STATSD and _ENABLE_STATSD:
     _statsd = StatsClient(
@@ -318,6 +368,279 @@ class CriticalAlertHandler(logging.Handler):
         threading.Thread(target=_send, daemon=True).start()
 
 
+# ---------- Queue-based pipeline (opt-in) ----------
+# При LOG_QUEUE_ENABLED=1 вызов logger.* на горячем пути только кладёт запись в
+# ограниченную очередь; форматирование и файловый I/O выполняет поток QueueListener,
+# который пишет пачками (один lock/write/flush на пачку).
+_QUEUE_BLOCK_TIMEOUT_S = 0.05
+_LOGRECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _queue_enabled() -> bool:
+    return bool(getattr(settings, "LOG_QUEUE_ENABLED", False))
+
+
+def _file_json_lines() -> bool:
+    return str(getattr(settings, "LOG_FILE_FORMAT", "text") or "text").lower() == "json"
+
+
+class LogQueueStats:
+    """Счётчики очереди логов (best-effort, без блокировок: значения приблизительные под нагрузкой)."""
+
+    def __init__(self) -> None:
+        self.enqueued = 0
+        self.overflow = 0
+        self.dropped = 0
+        self.batches = 0
+        self.max_batch = 0
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "enqueued": self.enqueued,
+            "overflow": self.overflow,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+        }
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking QueueHandler for a bounded queue.
+    When the queue is full, DEBUG/INFO records are dropped immediately; WARNING+
+    get a short blocking retry before being dropped. Both cases are counted.
+    """
+
+    def __init__(self, q: queue.Queue, stats: LogQueueStats | None = None):
+        super().__init__(q)
+        self.stats = stats or LogQueueStats()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Дешевле стандартного prepare(): без полного format(), traceback сохраняется в exc_text.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            self.stats.enqueued += 1
+            return
+        except queue.Full:
+            self.stats.overflow += 1
+        if record.levelno >= logging.WARNING:
+            try:
+                self.queue.put(record, timeout=_QUEUE_BLOCK_TIMEOUT_S)
+                self.stats.enqueued += 1
+                return
+            except queue.Full:
+                pass
+        self.stats.dropped += 1
+        try:
+            if LOG_QUEUE_DROPPED_TOTAL is not None:
+                LOG_QUEUE_DROPPED_TOTAL.labels(level=record.levelname).inc()
+        except Exception:
+            pass
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that drains up to ``batch_size`` records per wake-up and hands
+    them to handlers as a batch (``emit_batch`` when the handler supports it).
+    """
+
+    def __init__(
+        self,
+        q: queue.Queue,
+        *handlers: logging.Handler,
+        batch_size: int = 256,
+        stats: LogQueueStats | None = None,
+    ):
+        super().__init__(q, *handlers, respect_handler_level=True)
+        self.batch_size = max(1, int(batch_size))
+        self.stats = stats or LogQueueStats()
+
+    def _drain(self) -> tuple[list[logging.LogRecord], bool]:
+        batch: list[logging.LogRecord] = []
+        stop = False
+        record = self.queue.get()
+        while True:
+            if record is self._sentinel:
+                stop = True
+            else:
+                batch.append(record)
+            if stop or len(batch) >= self.batch_size:
+                break
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        return batch, stop
+
+    def dispatch(self, batch: list[logging.LogRecord]) -> None:
+        for handler in self.handlers:
+            records = [r for r in batch if r.levelno >= handler.level]
+            if not records:
+                continue
+            emit_batch = getattr(handler, "emit_batch", None)
+            if emit_batch is not None:
+                emit_batch(records)
+            else:
+                for record in records:
+                    handler.handle(record)
+
+    def _monitor(self) -> None:
+        q = self.queue
+        while True:
+            batch, stop = self._drain()
+            if batch:
+                self.stats.batches += 1
+                self.stats.max_batch = max(self.stats.max_batch, len(batch))
+                try:
+                    self.dispatch(batch)
+                except Exception:  # pragma: no cover - обработчики сами зовут handleError
+                    pass
+            for _ in range(len(batch) + int(stop)):
+                q.task_done()
+            if stop:
+                break
+
+
+class _BatchWriteMixin:
+    """emit_batch(): one lock, one rollover check and one write+flush per batch."""
+
+    def emit_batch(self, records: list[logging.LogRecord]) -> None:
+        lines: list[str] = []
+        for record in records:
+            if not self.filter(record):
+                continue
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        self.acquire()
+        try:
+            should_rollover = getattr(self, "shouldRollover", None)
+            if should_rollover is not None and should_rollover(records[-1]):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write("".join(lines))
+            self.stream.flush()
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+
+class BatchingStreamHandler(_BatchWriteMixin, logging.StreamHandler):
+    pass
+
+
+class BatchingTimedRotatingFileHandler(_BatchWriteMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+class BatchingRotatingFileHandler(_BatchWriteMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class JsonLineFormatter(logging.Formatter):
+    """
+    One JSON object per line. Messages already rendered as JSON by structlog are
+    merged into the object instead of being double-encoded.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: dict[str, Any] = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        message = record.getMessage()
+        parsed = None
+        if message.startswith("{") and message.endswith("}"):
+            try:
+                parsed = json.loads(message)
+            except ValueError:
+                parsed = None
+        if isinstance(parsed, dict):
+            payload.update(parsed)
+        else:
+            payload["message"] = message
+        payload.setdefault("module", record.module)
+        payload.setdefault("line", record.lineno)
+        for key, value in record.__dict__.items():
+            if key not in _LOGRECORD_ATTRS and not key.startswith("_"):
+                payload.setdefault(key, value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        if record.stack_info:
+            payload["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+_QUEUE_LISTENER: BatchingQueueListener | None = None
+_QUEUE_HANDLER: DroppingQueueHandler | None = None
+
+
+def _install_log_queue() -> None:
+    """Moves root/uvicorn handlers behind a bounded queue served by one listener thread."""
+    global _QUEUE_LISTENER, _QUEUE_HANDLER
+    if _QUEUE_LISTENER is not None:
+        return
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if not handlers:
+        return
+    max_size = max(1, int(getattr(settings, "LOG_QUEUE_MAX_SIZE", 10000) or 10000))
+    batch_size = int(getattr(settings, "LOG_QUEUE_BATCH_SIZE", 256) or 256)
+    stats = LogQueueStats()
+    q: queue.Queue = queue.Queue(maxsize=max_size)
+    queue_handler = DroppingQueueHandler(q, stats)
+    # uvicorn-логгеры делят те же экземпляры handlers (dictConfig), поэтому достаточно одного listener.
+    for lg in (root, *(logging.getLogger(n) for n in ("uvicorn", "uvicorn.error", "uvicorn.access"))):
+        for handler in list(lg.handlers):
+            lg.removeHandler(handler)
+        lg.addHandler(queue_handler)
+    listener = BatchingQueueListener(q, *handlers, batch_size=batch_size, stats=stats)
+    listener.start()
+    _QUEUE_LISTENER, _QUEUE_HANDLER = listener, queue_handler
+    atexit.register(shutdown_log_queue)
+
+
+def shutdown_log_queue() -> None:
+    """Flushes queued records and stops the listener thread (idempotent)."""
+    global _QUEUE_LISTENER
+    listener = _QUEUE_LISTENER
+    if listener is None:
+        return
+    _QUEUE_LISTENER = None
+    try:
+        listener.stop()
+    except Exception:
+        pass
+
+
+def get_log_queue_stats() -> dict[str, int]:
+    """Queue pipeline counters; empty dict when the pipeline is disabled."""
+    if _QUEUE_HANDLER is None:
+        return {}
+    out = _QUEUE_HANDLER.stats.snapshot()
+    out["queue_size"] = _QUEUE_HANDLER.queue.qsize()
+    return out
+
+
 # ---------- Stdlib dictConfig ----------
 def _build_stdlib_dict_config(logs_dir: str) -> dict:
     os.makedirs(logs_dir, exist_ok=True)
@@ -328,24 +651,29 @@ def _build_stdlib_dict_config(logs_dir: str) -> dict:
         else "%(asctime)s [%(levelname)s] %(name)s:%(lineno)d - %(message)s"
     )
     fmt_file = "%(asctime)s [%(levelname)s] %(name)s:%(filename)s:%(funcName)s:%(lineno)d - %(message)s"
+    # В режиме очереди handlers пишут пачками из потока listener'а (см. _install_log_queue).
+    queued = _queue_enabled()
+    file_formatter = "json_lines" if _file_json_lines() else "file_detailed"
 
     # Weekly rotate app log on Monday (W0), keep 5 backups.
     app_log_handler = {
         "level": "DEBUG",
-        "class": "logging.handlers.TimedRotatingFileHandler",
+        "class": (
+            f"{__name__}.BatchingTimedRotatingFileHandler" if queued else "logging.handlers.TimedRotatingFileHandler"
+        ),
         "when": "W0",
         "backupCount": 5,
-        "formatter": "file_detailed",
+        "formatter": file_formatter,
         "filename": os.path.join(logs_dir, "smartsell3.log"),
         "encoding": "utf8",
     }
 
     error_log_handler = {
         "level": "ERROR",
-        "class": "logging.handlers.RotatingFileHandler",
+        "class": f"{__name__}.BatchingRotatingFileHandler" if queued else "logging.handlers.RotatingFileHandler",
         "maxBytes": 10 * 1024 * 1024,
         "backupCount": 5,
-        "formatter": "file_detailed",
+        "formatter": file_formatter,
         "filename": os.path.join(logs_dir, "errors.log"),
         "encoding": "utf8",
     }
@@ -365,11 +693,12 @@ def _build_stdlib_dict_config(logs_dir: str) -> dict:
         "formatters": {
             "console": {"format": fmt_console, "datefmt": "%Y-%m-%d %H:%M:%S"},
             "file_detailed": {"format": fmt_file, "datefmt": "%Y-%m-%d %H:%M:%S"},
+            "json_lines": {"()": f"{__name__}.JsonLineFormatter"},
         },
         "handlers": {
             "console": {
                 "level": level,
-                "class": "logging.StreamHandler",
+                "class": f"{__name__}.BatchingStreamHandler" if queued else "logging.StreamHandler",
                 "formatter": "console",
                 "stream": "ext://sys.stdout",
             },
@@ -495,6 +824,7 @@ def setup_logging() -> None:
     """
     Centralized logging setup:
     - stdlib dictConfig (console + weekly file + error file + critical alerts)
+    - optional bounded queue + listener thread in front of those handlers (LOG_QUEUE_ENABLED)
     - structlog (JSON/console)
     - Sentry + Cloud loggers (best-effort)
     """
@@ -504,6 +834,8 @@ def setup_logging() -> None:
 
     logs_dir = os.path.dirname(getattr(settings, "LOG_PATH", "logs/app.log")) or "logs"
     logging.config.dictConfig(_build_stdlib_dict_config(logs_dir))
+    if _queue_enabled():
+        _install_log_queue()
     _configure_structlog()
     _try_init_sentry()
     _try_init_gcloud_logging()
@@ -954,4 +1286,9 @@ __all__ = [
     "enable_sqlalchemy_slow_query_logging",
     "get_query_stats_bridge",
     "redact_secrets",
+    "get_log_queue_stats",
+    "shutdown_log_queue",
+    "DroppingQueueHandler",
+    "BatchingQueueListener",
+    "JsonLineFormatter",
 ]
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import logging
 import time
-from collections import defaultdict, deque
+from collections import OrderedDict, deque
 
 from fastapi import HTTPException, Request, status
 
@@ -13,6 +13,32 @@ except Exception:  # pragma: no cover
 
 log = logging.getLogger(__name__)
 
+try:
+    from prometheus_client import Counter, Histogram
+
+    _RL_DECISIONS = Counter(
+        "smartsell_rate_limiter_decisions_total",
+        "Rate limiter decisions by backend",
+        ["backend", "result"],
+    )
+    _RL_LATENCY = Histogram(
+        "smartsell_rate_limiter_latency_seconds",
+        "Rate limiter check latency by backend",
+        ["backend"],
+        buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+    )
+except Exception:  # pragma: no cover - optional metrics dependency
+    _RL_DECISIONS = None
+    _RL_LATENCY = None
+
+
+def _observe(backend: str, allowed: bool, started: float) -> None:
+    if _RL_DECISIONS is not None:
+        _RL_DECISIONS.labels(backend=backend, result="allowed" if allowed else "limited").inc()
+    if _RL_LATENCY is not None:
+        _RL_LATENCY.labels(backend=backend).observe(time.perf_counter() - started)
+
+
 _RL_LUA = r"""
 local key        = KEYS[1]
 local rate       = tonumber(ARGV[1])   -- tokens per second
@@ -20,6 +46,7 @@ local burst      = tonumber(ARGV[2])   -- bucket capacity
 local now_ms     = tonumber(ARGV[3])   -- current time in ms
 local cost       = tonumber(ARGV[4])   -- tokens cost (usually 1)
 local ttl_sec    = tonumber(ARGV[5])   -- bucket ttl seconds
+local debt       = tonumber(ARGV[6] or "0")  -- tokens already spent locally
 
 local data = redis.call('HMGET', key, 'tokens', 'ts')
 local tokens = tonumber(data[1])
@@ -34,6 +61,7 @@ else
   tokens = math.min(burst, tokens + refill)
   ts = now_ms
 end
+tokens = math.max(0, tokens - debt)
 
 local allowed = 0
 local retry_after_ms = 0
@@ -52,19 +80,47 @@ return {allowed, math.floor(tokens), retry_after_ms}
 """
 
 
+class _LocalBucket:
+    """Per-key mirror of the Redis bucket used by the local pre-check."""
+
+    __slots__ = ("tokens", "ts", "debt")
+
+    def __init__(self, tokens: float, ts: float) -> None:
+        self.tokens = tokens
+        self.ts = ts
+        self.debt = 0
+
+
 class RateLimiter:
     """Redis-backed token bucket with in-memory fallback.
 
     - redis: optional async Redis client.
     - env: environment tag to namespace keys.
     - prefix: key prefix.
+    - memory_max_keys: LRU bound for the in-memory sliding windows (fallback) and local pre-check buckets.
+    - local_headroom: fraction of the bucket (0..1) that may be spent locally
+      before Redis is consulted; 0 disables the pre-check. Requests admitted
+      locally are charged to Redis on the next round trip.
     """
 
-    def __init__(self, redis=None, env: str = "dev", prefix: str = "rl") -> None:
+    def __init__(
+        self,
+        redis=None,
+        env: str = "dev",
+        prefix: str = "rl",
+        *,
+        memory_max_keys: int = 10_000,
+        local_headroom: float = 0.0,
+    ) -> None:
         self.redis = redis
         self.env = env or "dev"
         self.prefix = prefix
-        self._mem: dict[str, deque[float]] = defaultdict(deque)
+        self.memory_max_keys = max(1, int(memory_max_keys))
+        self.local_headroom = min(max(float(local_headroom or 0.0), 0.0), 1.0)
+        # key -> request timestamps in the window; OrderedDict gives O(1) LRU touch/evict.
+        self._mem: OrderedDict[str, deque[float]] = OrderedDict()
+        self._local: OrderedDict[str, _LocalBucket] = OrderedDict()
+        self._script_sha: str | None = None
 
     def _key(self, tag: str, ident: str) -> str:
         return f"{self.env}:{self.prefix}:{tag}:{ident}"
@@ -83,26 +139,85 @@ class RateLimiter:
         if window_seconds <= 0:
             window_seconds = 1
 
+        started = time.perf_counter()
+        key = self._key(tag, ident)
+        rate = max_requests / float(window_seconds)
+
         if self.redis is not None:
-            rate = max_requests / float(window_seconds)
-            burst = max_requests
+            if self.local_headroom > 0 and self._allow_local(key, rate, max_requests):
+                _observe("local", True, started)
+                return True, 0
+
+            local = self._local.get(key) if self.local_headroom > 0 else None
+            debt = local.debt if local is not None else 0
             now_ms = int(time.time() * 1000)
             try:
-                res = await self.redis.eval(  # type: ignore[attr-defined]
-                    _RL_LUA, 1, self._key(tag, ident), rate, burst, now_ms, 1, window_seconds * 2
-                )
-                allowed, _tokens, retry_ms = int(res[0]), int(res[1]), int(res[2])
+                res = await self._eval_bucket(key, rate, max_requests, now_ms, window_seconds * 2, debt)
+                allowed, tokens, retry_ms = int(res[0]), int(res[1]), int(res[2])
+                if self.local_headroom > 0:
+                    self._sync_local(key, tokens, now_ms / 1000.0, spent=debt)
+                _observe("redis", allowed == 1, started)
                 return (allowed == 1), int((retry_ms + 999) / 1000)
             except Exception as exc:  # pragma: no cover - fallback path
                 log.warning("Redis rate-limit error; falling back to memory", extra={"error": str(exc)})
 
-        return self._allow_mem(tag, ident, max_requests, window_seconds)
+        allowed, retry = self._allow_mem(tag, ident, max_requests, window_seconds)
+        _observe("memory", allowed, started)
+        return allowed, retry
+
+    async def _eval_bucket(self, key: str, rate: float, burst: int, now_ms: int, ttl: int, debt: int):
+        args = (rate, burst, now_ms, 1, ttl, debt)
+        if self._script_sha is None:
+            self._script_sha = await self.redis.script_load(_RL_LUA)  # type: ignore[attr-defined]
+        try:
+            return await self.redis.evalsha(self._script_sha, 1, key, *args)  # type: ignore[attr-defined]
+        except Exception as exc:
+            # Script cache flushed (SCRIPT FLUSH / failover): re-register once and ship the body.
+            if "NOSCRIPT" not in str(exc).upper():
+                raise
+            self._script_sha = None
+            return await self.redis.eval(_RL_LUA, 1, key, *args)  # type: ignore[attr-defined]
+
+    def _allow_local(self, key: str, rate: float, burst: int) -> bool:
+        bucket = self._local.get(key)
+        if bucket is None:
+            return False
+        now = time.time()
+        tokens = min(float(burst), bucket.tokens + max(0.0, now - bucket.ts) * rate) - bucket.debt
+        # Only far from the limit: keep (1 - headroom) of the bucket for the authoritative Redis check.
+        if tokens - 1 < burst * (1.0 - self.local_headroom):
+            return False
+        bucket.debt += 1
+        self._local.move_to_end(key)
+        return True
+
+    def _sync_local(self, key: str, tokens: int, ts: float, *, spent: int) -> None:
+        bucket = self._local.get(key)
+        if bucket is None:
+            self._local[key] = _LocalBucket(float(tokens), ts)
+            self._evict(self._local)
+            return
+        bucket.tokens = float(tokens)
+        bucket.ts = ts
+        bucket.debt = max(0, bucket.debt - spent)
+        self._local.move_to_end(key)
+
+    def _evict(self, store: OrderedDict) -> None:
+        while len(store) > self.memory_max_keys:
+            store.popitem(last=False)
 
     def _allow_mem(self, tag: str, ident: str, max_requests: int, window_seconds: int) -> tuple[bool, int]:
+        # Скользящее окно (как до LRU): не больше max_requests за любые window_seconds.
         now = time.time()
         cutoff = now - window_seconds
         key = self._key(tag, ident)
-        q = self._mem[key]
+        q = self._mem.get(key)
+        if q is None:
+            q = deque()
+            self._mem[key] = q
+            self._evict(self._mem)
+        else:
+            self._mem.move_to_end(key)
         while q and q[0] <= cutoff:
             q.popleft()
         if len(q) >= max_requests:
@@ -51,13 +51,16 @@ ENV (опционально):
 
 from __future__ import annotations
 
+import asyncio
 import base64
 import hashlib
 import hmac
 import os
 import re
 import secrets
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime, timedelta
 from typing import Any, Literal
 
@@ -80,6 +83,11 @@ try:
 except Exception:
     _HAS_REDIS = False
 
+try:
+    from prometheus_client import Counter
+except Exception:
+    Counter = None  # pragma: no cover - optional metrics dependency
+
 try:
     # sync engine используется (на уровне env/alembic) — не тянем async здесь.
     from sqlalchemy import BigInteger, Column, MetaData, String, Table, select, text
@@ -99,6 +107,7 @@ except Exception:
     _SYNC_ENGINE_AVAILABLE = False
 
 from app.core.config import settings
+from app.core.exceptions import SmartSellException
 
 # =============================================================================
 # Password hashing (Argon2 -> bcrypt), pepper, migration helper
@@ -163,6 +172,96 @@ def migrate_hash_if_needed(plain_password: str, hashed_password: str) -> tuple[b
     return False, hashed_password
 
 
+# =============================================================================
+# Async hashing: выделенный ограниченный пул потоков
+# =============================================================================
+# argon2/bcrypt намеренно дорогие (десятки мс CPU); в event loop они блокируют все запросы воркера.
+# Хеширование уходит в отдельный пул (C-реализации отпускают GIL), а число ожидающих задач
+# ограничено: при переполнении — 503 с Retry-After вместо растущей очереди.
+class PasswordHashingBusy(SmartSellException):
+    """Password hashing pool is saturated (maps to 503)."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            "Authentication is temporarily overloaded, retry shortly",
+            "AUTH_BUSY",
+            headers={"Retry-After": "1"},
+            http_status=503,
+        )
+
+
+_PASSWORD_HASH_SHED = (
+    Counter("smartsell_password_hash_shed_total", "Password hashing jobs rejected because the pool queue is full")
+    if Counter
+    else None
+)
+
+_hash_executor: ThreadPoolExecutor | None = None
+_hash_executor_lock = threading.Lock()
+_hash_inflight = 0
+
+
+def _password_hash_workers() -> int:
+    configured = int(getattr(settings, "PASSWORD_HASH_WORKERS", 0) or 0)
+    return configured if configured > 0 else max(1, min(os.cpu_count() or 1, 8))
+
+
+def _password_hash_capacity() -> int:
+    queue_limit = max(0, int(getattr(settings, "PASSWORD_HASH_QUEUE_LIMIT", 64) or 0))
+    return _password_hash_workers() + queue_limit
+
+
+def _get_hash_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            _hash_executor = ThreadPoolExecutor(
+                max_workers=_password_hash_workers(), thread_name_prefix="password-hash"
+            )
+        return _hash_executor
+
+
+def _release_hash_slot(_future: Any = None) -> None:
+    global _hash_inflight
+    with _hash_executor_lock:
+        _hash_inflight = max(0, _hash_inflight - 1)
+
+
+async def _run_password_job(fn: Any, *args: Any) -> Any:
+    global _hash_inflight
+    executor = _get_hash_executor()
+    with _hash_executor_lock:
+        if _hash_inflight >= _password_hash_capacity():
+            if _PASSWORD_HASH_SHED is not None:
+                _PASSWORD_HASH_SHED.inc()
+            raise PasswordHashingBusy()
+        _hash_inflight += 1
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        _release_hash_slot()
+        raise
+    # Слот освобождается, когда поток действительно закончил (а не когда отменили await).
+    future.add_done_callback(_release_hash_slot)
+    return await asyncio.wrap_future(future)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash() в пуле хеширования; PasswordHashingBusy при переполнении."""
+    return await _run_password_job(get_password_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password() в пуле хеширования; PasswordHashingBusy при переполнении."""
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+
+def password_hash_pool_stats() -> dict[str, int]:
+    with _hash_executor_lock:
+        inflight = _hash_inflight
+    return {"workers": _password_hash_workers(), "capacity": _password_hash_capacity(), "inflight": inflight}
+
+
 # =============================================================================
 # Password policy (strength + banned words)
 # =============================================================================
@@ -1094,6 +1193,10 @@ __all__ = [
     "needs_rehash",
     "migrate_hash_if_needed",
     "validate_password_policy",
+    "PasswordHashingBusy",
+    "get_password_hash_async",
+    "verify_password_async",
+    "password_hash_pool_stats",
     # jwt core
     "create_jwt",
     "decode_and_validate",
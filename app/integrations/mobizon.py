@@ -18,14 +18,25 @@ class MobizonClient:
         if not self.api_key:
             raise RuntimeError("MOBIZON_API_KEY is not set")
 
-        # готовим клиент (keep-alive)
-        self._client = httpx.Client(
-            base_url=self.base_url,
-            headers={"Authorization": f"Token {self.api_key}"},
-            timeout=15.0,
-        )
+        # async keep-alive клиент создаётся лениво (нужен работающий event loop)
+        self._client: httpx.AsyncClient | None = None
 
-    def send_sms(self, recipient: str, text: str, *, sender: str | None = None) -> dict[str, Any]:
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Token {self.api_key}"},
+                timeout=15.0,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def send_sms(self, recipient: str, text: str, *, sender: str | None = None) -> dict[str, Any]:
         """
         Отправка SMS. Возвращает dict с success/error, raw ответом провайдера.
         Документация Mobizon: /service/message/sendSms (формат form-encoded).
@@ -44,7 +55,7 @@ class MobizonClient:
         # Mobizon принимает form-data/URL-encoded; ответ JSON
         url = "/message/sendSms"
         try:
-            resp = self._client.post(url, data=payload)
+            resp = await self._get_client().post(url, data=payload)
             resp.raise_for_status()
             data = resp.json()
         except httpx.HTTPError as e:
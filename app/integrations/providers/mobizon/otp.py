@@ -15,6 +15,9 @@ from app.utils.pii import mask_phone
 
 log = get_logger(__name__)
 
+_POOL_MAX_CONNECTIONS = 20
+_POOL_MAX_KEEPALIVE = 10
+
 
 def _mobizon_log_start(operation: str) -> float:
     started_at = perf_counter()
@@ -71,6 +74,8 @@ class MobizonOtpProvider(OtpProvider):
         ).rstrip("/")
         self.timeout_seconds = float(cfg.get("timeout_s") or settings.MOBIZON_TIMEOUT_SEC or 5.0)
         self._max_retries = int(cfg.get("retries") or 1)
+        self._client: Any = None
+        self._client_loop: asyncio.AbstractEventLoop | None = None
         if settings.is_production and not self.api_key:
             raise ProviderNotConfiguredError("otp_provider_not_configured")
 
@@ -87,6 +92,27 @@ class MobizonOtpProvider(OtpProvider):
         raw = f"{phone}:{code}:{ttl}:{self.name}:{self.version}".encode()
         return hashlib.sha256(raw).hexdigest()
 
+    def _get_client(self, timeout: httpx.Timeout) -> Any:
+        """
+        Один keep-alive клиент на провайдера (резолвер кэширует экземпляр), а не TLS-рукопожатие
+        на каждое SMS. Привязан к event loop: на новом loop создаётся заново.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=_POOL_MAX_CONNECTIONS, max_keepalive_connections=_POOL_MAX_KEEPALIVE
+                ),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        client, self._client, self._client_loop = self._client, None, None
+        if client is not None and hasattr(client, "aclose"):
+            await client.aclose()
+
     async def _request(
         self,
         method: str,
@@ -103,9 +129,8 @@ class MobizonOtpProvider(OtpProvider):
         params_all = {**(params or {}), **self._auth_params()}
         while attempt <= self._max_retries:
             try:
-                async with httpx.AsyncClient(timeout=timeout) as client:
-                    resp = await client.request(method, url, data=data, params=params_all, headers=headers)
-                return resp
+                client = self._get_client(timeout)
+                return await client.request(method, url, data=data, params=params_all, headers=headers)
             except (httpx.TimeoutException, httpx.RequestError) as exc:  # network/timeout
                 last_exc = exc
                 attempt += 1
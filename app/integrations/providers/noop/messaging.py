@@ -11,6 +11,9 @@ log = get_logger(__name__)
 
 
 class NoOpMessagingProvider(MessagingProvider):
+    # Без сетевого I/O — диспетчер вызывает его прямо в запросе (dev-ответы зависят от результата).
+    deliver_inline = True
+
     def __init__(
         self,
         name: str | None = None,
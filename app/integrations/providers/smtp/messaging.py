@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import os
 import smtplib
 from email.mime.application import MIMEApplication
@@ -86,6 +87,18 @@ class SmtpMessagingProvider(MessagingProvider):
                     msg.attach(attachment)
         return msg
 
+    def _send_blocking(self, msg: Any, recipients: list[str]) -> None:
+        if self.use_ssl:
+            with smtplib.SMTP_SSL(self.host, self.port) as server:
+                server.login(self.user, self.password)
+                server.send_message(msg, to_addrs=recipients)
+        else:
+            with smtplib.SMTP(self.host, self.port) as server:
+                if self.use_tls:
+                    server.starttls()
+                server.login(self.user, self.password)
+                server.send_message(msg, to_addrs=recipients)
+
     async def send_message(
         self,
         to: str,
@@ -122,16 +135,8 @@ class SmtpMessagingProvider(MessagingProvider):
             recipients.extend(bcc)
 
         try:
-            if self.use_ssl:
-                with smtplib.SMTP_SSL(self.host, self.port) as server:
-                    server.login(self.user, self.password)
-                    server.send_message(msg, to_addrs=recipients)
-            else:
-                with smtplib.SMTP(self.host, self.port) as server:
-                    if self.use_tls:
-                        server.starttls()
-                    server.login(self.user, self.password)
-                    server.send_message(msg, to_addrs=recipients)
+            # smtplib блокирующий — не держим event loop на время SMTP-сессии
+            await asyncio.to_thread(self._send_blocking, msg, recipients)
             log.info(
                 "smtp_email_sent",
                 extra={"to": mask_email(to), "provider": self.name, "version": self.version},
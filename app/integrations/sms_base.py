@@ -6,7 +6,7 @@ from typing import Any, Protocol
 
 
 class SmsProvider(Protocol):
-    def send_sms(self, recipient: str, text: str, *, sender: str | None = None) -> dict[str, Any]:
+    async def send_sms(self, recipient: str, text: str, *, sender: str | None = None) -> dict[str, Any]:
         ...
 
 
@@ -237,14 +237,24 @@ async def run_lifespan_startup(
         elif global_state.get("kaspi_sync_started"):
             logger.info("Kaspi sync runner already started")
         else:
-            from app.services.kaspi_orders_sync_runner import run_kaspi_orders_sync_once
+            from app.services.kaspi_orders_sync_runner import run_kaspi_orders_sync_due, run_kaspi_orders_sync_once
 
             async def _kaspi_sync_loop():
-                interval_seconds = int(os.getenv("KASPI_SYNC_INTERVAL_SECONDS", "300"))
-                logger.info("kaspi_sync_runner: background task started", interval_seconds=interval_seconds)
+                adaptive = bool(getattr(settings, "KASPI_SYNC_ADAPTIVE_ENABLED", False))
+                if adaptive:
+                    # Частый тик: сами мерчанты синхронизируются по своему next_run_at.
+                    interval_seconds = int(getattr(settings, "KASPI_SYNC_SCHEDULER_TICK_SECONDS", 15) or 15)
+                else:
+                    interval_seconds = int(os.getenv("KASPI_SYNC_INTERVAL_SECONDS", "300"))
+                logger.info(
+                    "kaspi_sync_runner: background task started", interval_seconds=interval_seconds, adaptive=adaptive
+                )
                 while True:
                     try:
-                        await run_kaspi_orders_sync_once()
+                        if adaptive:
+                            await run_kaspi_orders_sync_due()
+                        else:
+                            await run_kaspi_orders_sync_once()
                     except Exception as exc:
                         logger.error("kaspi_sync_runner: unexpected error in loop", error=str(exc), exc_info=True)
                     await asyncio.sleep(interval_seconds)
@@ -268,6 +278,13 @@ async def run_lifespan_shutdown(*, logger: logging.Logger, global_state: dict[st
             pass
         logger.info("Kaspi sync runner stopped")
 
+    try:
+        from app.services.message_dispatch import dispatcher as message_dispatcher
+
+        await message_dispatcher.shutdown()
+    except Exception:
+        pass
+
     try:
         client = global_state.get("httpx")
         if client is not None:
@@ -170,6 +170,7 @@ _LAZY_MODELS: dict[str, tuple[str, str]] = {
     "RepricingRun": ("app.models.repricing", "RepricingRun"),
     "RepricingDiff": ("app.models.repricing", "RepricingDiff"),
     "RepricingRunItem": ("app.models.repricing", "RepricingRunItem"),
+    "RepricingDirtyCompany": ("app.models.repricing", "RepricingDirtyCompany"),
     "Preorder": ("app.models.preorder", "Preorder"),
     "PreorderItem": ("app.models.preorder", "PreorderItem"),
     # пользователи
@@ -208,7 +209,11 @@ _LAZY_MODELS: dict[str, tuple[str, str]] = {
     "KaspiImportRun": ("app.models.kaspi_import_run", "KaspiImportRun"),
     "CatalogImportBatch": ("app.models.catalog_import", "CatalogImportBatch"),
     "CatalogImportRow": ("app.models.catalog_import", "CatalogImportRow"),
+    "KaspiSyncNowJob": ("app.models.kaspi_sync_now_job", "KaspiSyncNowJob"),
     "KaspiOffer": ("app.models.kaspi_offer", "KaspiOffer"),
+    "SalesRollup": ("app.models.sales_rollup", "SalesRollup"),
+    "WorkerShardLease": ("app.models.worker_shard_lease", "WorkerShardLease"),
+    "WorkerShardMember": ("app.models.worker_shard_lease", "WorkerShardMember"),
 }
 
 # Поддерживаемые модули доменов для «массового» импорта (ручной whitelisting).
@@ -236,12 +241,15 @@ _DOMAIN_MODULES: tuple[str, ...] = (
     "app.models.kaspi_feed_upload",
     "app.models.kaspi_goods_import",
     "app.models.catalog_import",
+    "app.models.kaspi_sync_now_job",
     "app.models.kaspi_offer",
+    "app.models.sales_rollup",
     "app.models.system_integrations",
     "app.models.integration_provider",
     "app.models.integration_provider_config",
     "app.models.integration_event",
     "app.models.subscription_override",
+    "app.models.worker_shard_lease",
 )
 
 # Критичные модули/классы, чья регистрация нужна даже при «холодном» старте (FK/relationship)
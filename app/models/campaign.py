@@ -179,6 +179,9 @@ class Campaign(SoftDeleteMixin, Base):
     next_attempt_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
     last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
     attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Lease for concurrent queue processing: owner token + expiry instead of long-held row locks
+    lease_owner: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     requested_by_user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     # Multitenant
@@ -211,6 +214,7 @@ class Campaign(SoftDeleteMixin, Base):
         Index("ix_campaign_scheduled_at_status", "scheduled_at", "status"),
         Index("ix_campaign_processing_status_queued_at", "processing_status", "queued_at"),
         Index("ix_campaign_processing_next_attempt_at", "processing_status", "next_attempt_at"),
+        Index("ix_campaign_lease_expires_at", "lease_expires_at"),
         UniqueConstraint("company_id", "title", "scheduled_at", name="uq_campaign_company_title_scheduled"),
     )
 
@@ -802,6 +806,8 @@ class Message(SoftDeleteMixin, Base):
     provider_message_id: Mapped[str | None] = mapped_column(String(255), nullable=True, index=True)
     sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     delivered_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Время захвата батч-воркером (SENDING); по истечении lease сообщение забирается повторно
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     error_code: Mapped[str | None] = mapped_column(String(MAX_ERROR_CODE_LEN), nullable=True, index=True)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -813,6 +819,7 @@ class Message(SoftDeleteMixin, Base):
         CheckConstraint("length(content) > 0", name="ck_message_content_non_empty"),
         CheckConstraint(f"length(content) <= {MAX_CONTENT_LEN}", name="ck_message_content_maxlen"),
         Index("ix_message_campaign_status_channel", "campaign_id", "status", "channel"),
+        Index("ix_message_status_claimed_at", "status", "claimed_at"),
     )
 
     # --------- Валидации ---------
@@ -24,6 +24,12 @@ class KaspiOrderSyncState(Base):
     last_error_at = Column(DateTime, nullable=True)
     last_error_code = Column(String(64), nullable=True)
     last_error_message = Column(String(500), nullable=True)
+    # Адаптивное расписание (kaspi_orders_sync_scheduler): следующий запуск, интервал, лизинг между воркерами.
+    next_run_at = Column(DateTime, nullable=True, index=True)
+    sync_interval_seconds = Column(Integer, nullable=True)
+    consecutive_failures = Column(Integer, nullable=False, default=0, server_default="0")
+    lease_owner = Column(String(128), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     company = relationship("Company", backref="kaspi_sync_state")
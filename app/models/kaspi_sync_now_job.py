@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.models.base import Base
+
+SYNC_NOW_JOB_PENDING = "PENDING"
+SYNC_NOW_JOB_RUNNING = "RUNNING"
+SYNC_NOW_JOB_DONE = "DONE"
+SYNC_NOW_JOB_FAILED = "FAILED"
+
+SYNC_NOW_JOB_ACTIVE_STATUSES = (SYNC_NOW_JOB_PENDING, SYNC_NOW_JOB_RUNNING)
+
+
+class KaspiSyncNowJob(Base):
+    """
+    Фоновый запуск POST /kaspi/sync/now?background=true: прогресс (фаза, страницы,
+    заказы) пишется по ходу синка, итоговый ответ sync-now — в result_json.
+    """
+
+    __tablename__ = "kaspi_sync_now_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
+    company_id = Column(ForeignKey("companies.id", ondelete="CASCADE"), nullable=False)
+    merchant_uid = Column(String(128), nullable=False)
+    status = Column(String(16), nullable=False, server_default=text("'PENDING'"))
+    phase = Column(String(32), nullable=True)
+
+    pages_fetched = Column(Integer, nullable=False, server_default=text("0"))
+    orders_fetched = Column(Integer, nullable=False, server_default=text("0"))
+    orders_upserted = Column(Integer, nullable=False, server_default=text("0"))
+
+    http_status = Column(Integer, nullable=True)
+    result_json = Column(JSONB, nullable=True)
+    error_code = Column(String(64), nullable=True)
+    error_message = Column(Text, nullable=True)
+
+    request_id = Column(String(64), nullable=True)
+    requested_by_user_id = Column(Integer, nullable=True)
+
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_kaspi_sync_now_jobs_company_merchant_status", "company_id", "merchant_uid", "status"),
+        # Не больше одной активной задачи на мерчанта: гонку двух POST решает БД, а не check-then-insert.
+        Index(
+            "uq_kaspi_sync_now_jobs_active",
+            "company_id",
+            "merchant_uid",
+            unique=True,
+            postgresql_where=text("status IN ('PENDING', 'RUNNING')"),
+        ),
+    )
+
+
+__all__ = [
+    "KaspiSyncNowJob",
+    "SYNC_NOW_JOB_ACTIVE_STATUSES",
+    "SYNC_NOW_JOB_DONE",
+    "SYNC_NOW_JOB_FAILED",
+    "SYNC_NOW_JOB_PENDING",
+    "SYNC_NOW_JOB_RUNNING",
+]
@@ -12,6 +12,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 
+import app.core.kaspi_token_cache as token_cache
 from app.core.config import settings
 from app.core.db import Base
 
@@ -40,6 +41,11 @@ class KaspiStoreToken(Base):
     last_selftest_error_code: Mapped[str | None] = mapped_column(String(64), nullable=True)
     last_selftest_error_message: Mapped[str | None] = mapped_column(String(500), nullable=True)
 
+    __table_args__ = (
+        # Все выборки идут по lower(trim(store_name)) = lower(trim(:name)) — индекс по тому же выражению.
+        sa.Index("ix_kaspi_store_tokens_store_name_norm", sa.func.lower(sa.func.trim(store_name))),
+    )
+
     @classmethod
     async def upsert_token(
         cls,
@@ -74,6 +80,8 @@ class KaspiStoreToken(Base):
         except Exception:
             await session.rollback()
             raise
+        finally:
+            token_cache.kaspi_token_cache.invalidate(store_name)
 
         obj = cls()
         obj.id, obj.store_name, obj.token_ciphertext, obj.created_at, obj.updated_at = row
@@ -81,6 +89,12 @@ class KaspiStoreToken(Base):
 
     @classmethod
     async def get_token(cls, session: AsyncSession, store_name: str) -> Optional[str]:
+        cache = token_cache.kaspi_token_cache
+        cached = cache.get(store_name)
+        if cached is not None:
+            return cached
+        generation = cache.generation()
+
         enc_key = settings.get_kaspi_enc_key()
         sql = sa.text(
             """
@@ -95,9 +109,9 @@ class KaspiStoreToken(Base):
         if not row:
             return None
         token = row[0]
-        if isinstance(token, bytes | bytearray):
-            return token.decode("utf-8")
-        return str(token)
+        token = token.decode("utf-8") if isinstance(token, bytes | bytearray) else str(token)
+        cache.put(store_name, token, generation=generation)
+        return token
 
     @classmethod
     async def list_stores(cls, session: AsyncSession) -> list[str]:
@@ -199,6 +213,8 @@ class KaspiStoreToken(Base):
         except Exception:
             await session.rollback()
             raise
+        finally:
+            token_cache.kaspi_token_cache.invalidate(store_name)
 
     @classmethod
     async def exists(cls, session: AsyncSession, store_name: str) -> bool:
@@ -250,6 +266,9 @@ class KaspiStoreToken(Base):
         except Exception:
             await session.rollback()
             raise
+        finally:
+            token_cache.kaspi_token_cache.invalidate(old_name)
+            token_cache.kaspi_token_cache.invalidate(target_name)
 
     @classmethod
     async def rotate_token(
@@ -277,13 +296,8 @@ class KaspiStoreToken(Base):
         except Exception:
             await session.rollback()
             raise
-
-    @staticmethod
-    def create_normalized_index_sql() -> str:
-        return (
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_kaspi_store_tokens_store_name_norm "
-            "ON kaspi_store_tokens ((lower(trim(store_name))));"
-        )
+        finally:
+            token_cache.kaspi_token_cache.invalidate(store_name)
 
 
 class ProductMarketplacePrice(Base):
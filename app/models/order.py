@@ -140,6 +140,8 @@ class Order(Base):
 
     order_number = Column(String(64), nullable=False, unique=True, index=True)
     external_id = Column(String(128), nullable=True, index=True)
+    # sha256 нормализованного payload Kaspi — неизменённые заказы синк пропускает без записи
+    kaspi_fingerprint = Column(String(64), nullable=True)
     source = Column(
         SQLEnum(
             OrderSource,
@@ -704,6 +706,11 @@ class Order(Base):
         )
         count = int(res.rowcount or 0)
 
+        # Core UPDATE не проходит через after_flush — пересчитываем sales rollups явно.
+        from app.models.sales_rollup import refresh_rollups_for_orders_async
+
+        await refresh_rollups_for_orders_async(session, order_ids)
+
         # Ленивый аудит
         try:
             from app.models.audit_log import AuditLog
@@ -1109,3 +1116,7 @@ class OrderStatusHistory(Base):
 
     def __repr__(self):
         return f"<OrderStatusHistory(order_id={self.order_id}, {self.old_status}->{self.new_status})>"
+
+
+# Регистрация listener'а sales rollups вместе с моделью заказа (см. app.models.sales_rollup).
+from app.models import sales_rollup as _sales_rollup  # noqa: E402,F401
@@ -746,6 +746,14 @@ class Product(LenientInitMixin, VersionedMixin, BaseModel):
         res = session.execute(stmt)
         if res.rowcount == 0:
             raise ValueError("Version conflict")
+        from app.models.repricing import PRODUCT_REPRICING_ATTRS, mark_repricing_dirty_stmt  # локально
+
+        if (
+            self.company_id is not None
+            and PRODUCT_REPRICING_ATTRS.intersection(fields)
+            and session.get_bind().dialect.name == "postgresql"
+        ):
+            session.execute(mark_repricing_dirty_stmt([self.company_id], reason="product"))
         session.flush()
         session.refresh(self)
         return self
@@ -2,14 +2,21 @@
 
 from __future__ import annotations
 
+import logging
+from collections.abc import Iterable
 from datetime import datetime
+from itertools import chain
 from typing import Any
 
 from sqlalchemy import JSON as SAJSON
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, Numeric, String, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, Numeric, String, Text, event
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, relationship
 
-from app.models.base import BaseModel
+from app.models.base import Base, BaseModel
+
+logger = logging.getLogger(__name__)
 
 
 class RepricingRule(BaseModel):
@@ -124,3 +131,82 @@ def repricing_run_stats(
         "errors": int(errors or 0),
         "timestamp": datetime.utcnow().isoformat(),
     }
+
+
+class RepricingDirtyCompany(Base):
+    """
+    Очередь компаний с несведённым репрайсингом: товары/правила менялись после
+    последнего запуска или прошлый запуск ещё двигал цены. Autorun берёт только их.
+    """
+
+    __tablename__ = "repricing_dirty_companies"
+
+    company_id = Column(ForeignKey("companies.id", ondelete="CASCADE"), primary_key=True, autoincrement=False)
+    dirty_since = Column(DateTime, nullable=False, default=datetime.utcnow)
+    reason = Column(String(32), nullable=True)
+
+    __table_args__ = (Index("ix_repricing_dirty_companies_since", "dirty_since"),)
+
+
+# Флаг сессии: изменения цен делает сам репрайсинг — компанию грязной не помечаем
+REPRICING_RUN_SESSION_FLAG = "repricing_run"
+
+# Поля товара, от которых зависит результат run_reprcing_for_company
+PRODUCT_REPRICING_ATTRS = frozenset(
+    {"price", "min_price", "max_price", "category_id", "extra", "deleted_at", "company_id"}
+)
+
+
+def mark_repricing_dirty_stmt(company_ids: Iterable[int], *, reason: str, now: datetime | None = None):
+    """
+    INSERT .. ON CONFLICT DO NOTHING: уже грязная компания сохраняет место в очереди,
+    а существующая строка не блокируется конкурентными писателями.
+    """
+    now = now or datetime.utcnow()
+    rows = [{"company_id": int(cid), "dirty_since": now, "reason": reason} for cid in sorted(set(company_ids))]
+    return (
+        pg_insert(RepricingDirtyCompany)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[RepricingDirtyCompany.company_id])
+    )
+
+
+def _product_changed(product: Any) -> bool:
+    state = sa_inspect(product)
+    return any(state.attrs[attr].history.has_changes() for attr in PRODUCT_REPRICING_ATTRS)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_repricing_dirty_on_flush(session, flush_context):  # pragma: no cover - exercised via integration tests
+    if session.info.get(REPRICING_RUN_SESSION_FLAG):
+        return
+    from app.models.product import Product
+
+    company_ids: set[int] = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, RepricingRule):
+            if obj.company_id is not None:
+                company_ids.add(int(obj.company_id))
+        elif isinstance(obj, Product):
+            if obj in session.dirty and not _product_changed(obj):
+                continue
+            try:
+                # перенос товара между компаниями — помечаем и прежнюю
+                previous = sa_inspect(obj).attrs["company_id"].history.deleted
+            except Exception:
+                continue
+            company_ids.update(int(cid) for cid in (obj.company_id, *previous) if cid is not None)
+    if not company_ids:
+        return
+
+    connection = session.connection()
+    if connection.dialect.name != "postgresql":
+        return
+    # SAVEPOINT: сбой отметки не должен ронять транзакцию товара/правила.
+    savepoint = connection.begin_nested()
+    try:
+        connection.execute(mark_repricing_dirty_stmt(company_ids, reason="changed"))
+        savepoint.commit()
+    except Exception as exc:
+        savepoint.rollback()
+        logger.warning("repricing dirty mark failed: %s", exc)
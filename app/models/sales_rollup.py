@@ -0,0 +1,277 @@
+"""
+Per-company sales rollups (hourly + daily buckets).
+
+Buckets are recomputed from raw orders for every (company, day) touched in a
+flush, so the rollup stays consistent with Order/OrderItem without delta
+bookkeeping. Incremental refreshes take ``pg_advisory_xact_lock(company_id,
+day)`` first, so overlapping transactions recompute a day one after another
+(the later one sees the earlier commit) instead of racing on stale snapshots;
+the full rebuild (app/services/sales_rollups.py) recomputes without locks.
+Core writers that bypass the ORM flush (Kaspi sync upserts, bulk
+status updates) call ``refresh_rollups_for_orders_async`` explicitly.
+Timestamps are naive UTC, like Order.created_at.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    UniqueConstraint,
+    and_,
+    case,
+    delete,
+    event,
+    exists,
+    func,
+    literal,
+    literal_column,
+    select,
+)
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models.base import Base
+from app.models.order import Order, OrderItem, OrderStatus
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_GRANULARITIES: tuple[str, ...] = ("hour", "day")
+PAID_ORDER_STATUSES: tuple[OrderStatus, ...] = (OrderStatus.COMPLETED, OrderStatus.PAID)
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+class SalesRollup(Base):
+    __tablename__ = "sales_rollups"
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(ForeignKey("companies.id", ondelete="CASCADE"), nullable=False)
+    granularity = Column(String(8), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    orders_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(16, 2), nullable=False, default=0)
+    paid_orders_count = Column(Integer, nullable=False, default=0)
+    paid_revenue = Column(Numeric(16, 2), nullable=False, default=0)
+    items_sold = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=_utcnow, onupdate=_utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("company_id", "granularity", "bucket_start", name="uq_sales_rollups_company_bucket"),
+        Index("ix_sales_rollups_company_gran_bucket", "company_id", "granularity", "bucket_start"),
+    )
+
+
+def _rollup_select(granularity: str, *conds):
+    """INSERT ... SELECT source: raw orders aggregated into ``granularity`` buckets."""
+    is_paid = Order.status.in_(PAID_ORDER_STATUSES)
+    items_per_order = (
+        select(func.coalesce(func.sum(OrderItem.quantity), 0))
+        .where(OrderItem.order_id == Order.id)
+        .correlate(Order)
+        .scalar_subquery()
+    )
+    bucket = func.date_trunc(literal_column(f"'{granularity}'"), Order.created_at)
+    return (
+        select(
+            Order.company_id,
+            literal(granularity),
+            bucket,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_amount), 0),
+            func.coalesce(func.sum(case((is_paid, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((is_paid, Order.total_amount), else_=0)), 0),
+            func.coalesce(func.sum(items_per_order), 0),
+            func.now(),
+        )
+        .where(and_(*conds))
+        .group_by(Order.company_id, bucket)
+    )
+
+
+_ROLLUP_COLUMNS = (
+    "company_id",
+    "granularity",
+    "bucket_start",
+    "orders_count",
+    "revenue",
+    "paid_orders_count",
+    "paid_revenue",
+    "items_sold",
+    "updated_at",
+)
+
+
+def rollup_refresh_statements(*, company_id: int | None, date_from: datetime | None, date_to: datetime | None) -> list:
+    """
+    INSERT..SELECT ON CONFLICT DO UPDATE + DELETE of emptied buckets, both granularities, [date_from, date_to).
+
+    Upsert вместо DELETE+INSERT: параллельные пересчёты одного дня не упираются
+    в uq_sales_rollups_company_bucket и не оставляют окна с пустым бакетом.
+    """
+    stmts = []
+    for granularity in ROLLUP_GRANULARITIES:
+        del_conds = [SalesRollup.granularity == granularity]
+        src_conds = []
+        if company_id is not None:
+            del_conds.append(SalesRollup.company_id == company_id)
+            src_conds.append(Order.company_id == company_id)
+        if date_from is not None:
+            del_conds.append(SalesRollup.bucket_start >= date_from)
+            src_conds.append(Order.created_at >= date_from)
+        if date_to is not None:
+            del_conds.append(SalesRollup.bucket_start < date_to)
+            src_conds.append(Order.created_at < date_to)
+
+        upsert = pg_insert(SalesRollup).from_select(list(_ROLLUP_COLUMNS), _rollup_select(granularity, *src_conds))
+        stmts.append(
+            upsert.on_conflict_do_update(
+                constraint="uq_sales_rollups_company_bucket",
+                set_={col: upsert.excluded[col] for col in _ROLLUP_COLUMNS[3:]},
+            )
+        )
+        # Бакеты, из которых ушли все заказы (перенос/удаление), upsert не затрагивает.
+        has_orders = exists().where(
+            Order.company_id == SalesRollup.company_id,
+            func.date_trunc(literal_column(f"'{granularity}'"), Order.created_at) == SalesRollup.bucket_start,
+        )
+        stmts.append(delete(SalesRollup).where(and_(*del_conds), ~has_orders))
+    return stmts
+
+
+def _lock_rollup_day(connection, company_id: int, day: datetime) -> None:
+    # Двухключевая форма advisory lock: держится до конца транзакции записи заказа.
+    connection.execute(select(func.pg_advisory_xact_lock(int(company_id), day.toordinal())))
+
+
+def refresh_rollup_days(connection, days: Iterable[tuple[int, datetime]]) -> int:
+    """
+    Recompute hourly/daily buckets of the given (company_id, day_start) pairs on ``connection``.
+
+    Каждый день пересчитывается под advisory-локом (company_id, day); дни
+    обходятся в отсортированном порядке, чтобы параллельные транзакции не
+    взаимоблокировались.
+    """
+    count = 0
+    for company_id, day in sorted(set(days)):
+        _lock_rollup_day(connection, company_id, day)
+        for stmt in rollup_refresh_statements(company_id=company_id, date_from=day, date_to=day + timedelta(days=1)):
+            connection.execute(stmt)
+        count += 1
+    return count
+
+
+def _refresh_days_guarded(connection, days: set[tuple[int, datetime]]) -> None:
+    # SAVEPOINT: ошибка пересчёта (например, таблица ещё не смигрирована) не должна ронять транзакцию заказа.
+    savepoint = connection.begin_nested()
+    try:
+        refresh_rollup_days(connection, days)
+        savepoint.commit()
+    except Exception as exc:
+        savepoint.rollback()
+        logger.warning("sales rollup refresh failed: %s", exc)
+
+
+def _order_days(connection, order_ids: Iterable[int]) -> set[tuple[int, datetime]]:
+    ids = sorted({int(i) for i in order_ids})
+    if not ids:
+        return set()
+    rows = connection.execute(select(Order.company_id, Order.created_at).where(Order.id.in_(ids))).all()
+    return {(int(cid), _day_start(created)) for cid, created in rows if created is not None}
+
+
+def refresh_rollups_for_orders(connection, order_ids: Iterable[int]) -> None:
+    """Recompute the (company, day) buckets of ``order_ids`` after Core writes that skip the ORM flush."""
+    if not _rollups_enabled():
+        return
+    days = _order_days(connection, order_ids)
+    if days:
+        _refresh_days_guarded(connection, days)
+
+
+async def refresh_rollups_for_orders_async(session, order_ids: Iterable[int]) -> None:
+    """AsyncSession twin of ``refresh_rollups_for_orders`` (same transaction as the write)."""
+    ids = [int(i) for i in order_ids]
+    if not ids or not _rollups_enabled():
+        return
+    await session.run_sync(lambda sync_session: refresh_rollups_for_orders(sync_session.connection(), ids))
+
+
+def _day_start(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _order_changed(order: Order) -> bool:
+    state = sa_inspect(order)
+    for attr in ("status", "total_amount", "created_at", "company_id"):
+        if state.attrs[attr].history.has_changes():
+            return True
+    return False
+
+
+def _rollups_enabled() -> bool:
+    try:
+        from app.core.config import settings
+
+        return bool(getattr(settings, "SALES_ROLLUPS_ENABLED", False))
+    except Exception:  # pragma: no cover
+        return False
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_rollup_days(session, flush_context):  # pragma: no cover - exercised via integration tests
+    if not _rollups_enabled():
+        return
+    days: set[tuple[int, datetime]] = set()
+    order_ids: set[int] = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Order):
+            if obj in session.dirty and not _order_changed(obj):
+                continue
+            try:
+                if obj.company_id is not None and obj.created_at is not None:
+                    days.add((int(obj.company_id), _day_start(obj.created_at)))
+                # Перенос заказа между днями/компаниями — пересчитываем и старый бакет.
+                state = sa_inspect(obj)
+                old_created = state.attrs["created_at"].history.deleted
+                old_company = state.attrs["company_id"].history.deleted
+            except Exception:
+                continue
+            if old_created or old_company:
+                company = int((old_company or [obj.company_id])[0])
+                created = (old_created or [obj.created_at])[0]
+                if created is not None:
+                    days.add((company, _day_start(created)))
+        elif isinstance(obj, OrderItem) and obj.order_id is not None:
+            order_ids.add(int(obj.order_id))
+    if not days and not order_ids:
+        return
+
+    connection = session.connection()
+    days.update(_order_days(connection, order_ids))
+    if not days:
+        return
+    _refresh_days_guarded(connection, days)
+
+
+__all__ = [
+    "PAID_ORDER_STATUSES",
+    "ROLLUP_GRANULARITIES",
+    "SalesRollup",
+    "refresh_rollup_days",
+    "refresh_rollups_for_orders",
+    "refresh_rollups_for_orders_async",
+    "rollup_refresh_statements",
+]
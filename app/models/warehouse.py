@@ -47,8 +47,10 @@ from sqlalchemy import (
     and_,
     event,
     func,
+    insert,
     select,
     text,
+    update,
 )
 from sqlalchemy import JSON as SAJSON  # кросс-СУБД JSON
 from sqlalchemy import inspect as sa_inspect
@@ -66,6 +68,10 @@ __all__ = [
     "movements_analytics",
     "movements_timeseries",
     "low_stock_report",
+    "claim_low_stock_alerts_stmt",
+    "low_stock_alert_companies_stmt",
+    "reset_low_stock_alerts_stmt",
+    "reorder_outbox_rows",
     "scan_and_enqueue_reorder_alerts",
     "cogs_by_period",
     "margin_report",
@@ -304,6 +310,8 @@ class ProductStock(BaseModel):
     location = Column(String(100), nullable=True)
     cost_price = Column(Numeric(14, 2), nullable=True)
     last_restocked_at = Column(DateTime, nullable=True)
+    # Остаток, на котором уже поднят low-stock алерт (дедупликация); NULL — алерта нет
+    low_stock_alerted_qty = Column(Integer, nullable=True)
 
     # Soft-archive
     is_archived = Column(Boolean, default=False, nullable=False, index=True)
@@ -324,6 +332,13 @@ class ProductStock(BaseModel):
         CheckConstraint("(max_quantity IS NULL) OR (min_quantity <= max_quantity)", name="ck_stock_min_le_max"),
         Index("ix_stock_product_warehouse_qty", "product_id", "warehouse_id", "quantity"),
         Index("ix_stock_low", "warehouse_id", "min_quantity"),
+        # Low-stock скан читает только позиции ниже порога — частичный индекс держит их отдельно
+        Index(
+            "ix_stock_low_partial",
+            "warehouse_id",
+            "product_id",
+            postgresql_where=text("quantity <= min_quantity AND min_quantity > 0"),
+        ),
         {"extend_existing": True},
     )
 
@@ -1061,13 +1076,163 @@ def movements_timeseries(
     return [{"bucket": str(b), "qty_sum": int(qty or 0)} for b, qty in rows]
 
 
-def low_stock_report(session: Session, *, warehouse_id: int | None = None) -> list[dict[str, Any]]:
-    """Список низких остатков."""
-    q = select(ProductStock).where(ProductStock.quantity <= ProductStock.min_quantity)
-    if warehouse_id is not None:
-        q = q.where(ProductStock.warehouse_id == warehouse_id)
-    rows = session.execute(q).scalars().all()
-    return [s.to_public_dict() for s in rows]
+def _low_stock_conditions(*, company_id: int | None = None, warehouse_ids: Iterable[int] | None = None) -> list[Any]:
+    """
+    Предикат «низкого остатка» для set-based сканов. ``min_quantity > 0`` обязателен:
+    без порога позиция не отслеживается, и именно так предикат совпадает с
+    частичным индексом ix_stock_low_partial.
+    """
+    conds: list[Any] = [
+        Warehouse.id == ProductStock.warehouse_id,
+        ProductStock.quantity <= ProductStock.min_quantity,
+        ProductStock.min_quantity > 0,
+        ProductStock.is_archived.is_(False),
+        Warehouse.is_archived.is_(False),
+    ]
+    if company_id is not None:
+        conds.append(Warehouse.company_id == company_id)
+    if warehouse_ids:
+        conds.append(ProductStock.warehouse_id.in_(list(warehouse_ids)))
+    return conds
+
+
+def claim_low_stock_alerts_stmt(
+    *,
+    company_id: int | None = None,
+    warehouse_ids: Iterable[int] | None = None,
+    where: Iterable[Any] = (),
+    returning: Iterable[Any] = (),
+):
+    """
+    Один UPDATE … FROM warehouses по всем арендаторам: отмечает низкие остатки, по
+    которым на текущем уровне алерт ещё не поднимался (low_stock_alerted_qty),
+    и возвращает их. Повторный скан на том же остатке ничего не вернёт.
+    """
+    # Core-таблица: RETURNING колонок присоединённых таблиц ORM-update не сопоставляет
+    return (
+        update(ProductStock.__table__)
+        .where(
+            *_low_stock_conditions(company_id=company_id, warehouse_ids=warehouse_ids),
+            ProductStock.low_stock_alerted_qty.is_distinct_from(ProductStock.quantity),
+            *where,
+        )
+        .values(low_stock_alerted_qty=ProductStock.quantity)
+        .returning(
+            ProductStock.id,
+            ProductStock.product_id,
+            ProductStock.warehouse_id,
+            ProductStock.quantity,
+            ProductStock.reserved_quantity,
+            ProductStock.min_quantity,
+            ProductStock.max_quantity,
+            Warehouse.company_id,
+            Warehouse.name.label("warehouse_name"),
+            *returning,
+        )
+    )
+
+
+def low_stock_alert_companies_stmt(*, where: Iterable[Any] = ()):
+    """Компании, у которых есть низкие остатки без алерта на текущем уровне (тот же предикат, что у claim)."""
+    return (
+        select(Warehouse.company_id)
+        .select_from(ProductStock)
+        .where(
+            *_low_stock_conditions(),
+            ProductStock.low_stock_alerted_qty.is_distinct_from(ProductStock.quantity),
+            *where,
+        )
+        .distinct()
+        .order_by(Warehouse.company_id)
+    )
+
+
+def reset_low_stock_alerts_stmt(*, company_id: int | None = None):
+    """Снять отметку алерта с пополненных позиций: следующее падение ниже порога снова алертится."""
+    stmt = (
+        update(ProductStock)
+        .where(
+            ProductStock.low_stock_alerted_qty.isnot(None),
+            ProductStock.quantity > ProductStock.min_quantity,
+        )
+        .values(low_stock_alerted_qty=None)
+        .execution_options(synchronize_session=False)
+    )
+    if company_id is not None:
+        stmt = stmt.where(ProductStock.warehouse_id.in_(select(Warehouse.id).where(Warehouse.company_id == company_id)))
+    return stmt
+
+
+def reorder_alert_payload(row: Any) -> dict[str, Any]:
+    target = (row.max_quantity or (row.min_quantity * 2)) or 0
+    return {
+        "product_id": row.product_id,
+        "warehouse_id": row.warehouse_id,
+        "current_qty": int(row.quantity),
+        "reserved_qty": int(row.reserved_quantity),
+        "min_qty": int(row.min_quantity),
+        "max_qty": row.max_quantity,
+        "suggested_purchase_qty": int(max(0, target - row.quantity)),
+        "warehouse_name": row.warehouse_name,
+    }
+
+
+def reorder_outbox_rows(rows: Iterable[Any], *, channel: str = "task") -> list[dict[str, Any]]:
+    """Параметры bulk INSERT в inventory_outbox для строк claim_low_stock_alerts_stmt."""
+    now = datetime.utcnow()
+    return [
+        {
+            "aggregate_type": "product_stock",
+            "aggregate_id": str(row.id),
+            "event_type": "reorder.alert",
+            "payload": reorder_alert_payload(row),
+            "channel": channel,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for row in rows
+    ]
+
+
+def low_stock_report(
+    session: Session,
+    *,
+    company_id: int | None = None,
+    warehouse_id: int | None = None,
+) -> list[dict[str, Any]]:
+    """Список низких остатков (колонками, без загрузки ORM-объектов)."""
+    q = (
+        select(
+            ProductStock.id,
+            ProductStock.product_id,
+            ProductStock.warehouse_id,
+            ProductStock.quantity,
+            ProductStock.reserved_quantity,
+            ProductStock.min_quantity,
+            ProductStock.max_quantity,
+            ProductStock.location,
+        )
+        .select_from(ProductStock)
+        .join(Warehouse, Warehouse.id == ProductStock.warehouse_id)
+        .where(*_low_stock_conditions(company_id=company_id, warehouse_ids=[warehouse_id] if warehouse_id else None))
+        .order_by(ProductStock.warehouse_id, ProductStock.product_id)
+    )
+    return [
+        {
+            "id": r.id,
+            "product_id": r.product_id,
+            "warehouse_id": r.warehouse_id,
+            "quantity": int(r.quantity),
+            "reserved_quantity": int(r.reserved_quantity),
+            "available_quantity": int(r.quantity) - int(r.reserved_quantity),
+            "min_quantity": int(r.min_quantity),
+            "max_quantity": r.max_quantity,
+            "location": r.location,
+        }
+        for r in session.execute(q).all()
+    ]
 
 
 # =========================
@@ -1082,45 +1247,40 @@ def scan_and_enqueue_reorder_alerts(
     channel: str = "task",
 ) -> list[InventoryOutbox]:
     """
-    Ищет позиции, требующие дозаказа, и ставит задачи/алерты в Outbox.
-    Возвращает список созданных событий (или пустой, если Outbox недоступен).
+    Ищет позиции, требующие дозаказа, и ставит задачи/алерты в Outbox одним bulk INSERT.
+    При only_when_low алерт на уже оповещённом уровне остатка не дублируется.
+    Возвращает список созданных событий.
     """
-    q = select(ProductStock, Warehouse).join(Warehouse, Warehouse.id == ProductStock.warehouse_id)
-    q = q.where(ProductStock.is_archived.is_(False), Warehouse.is_archived.is_(False))
-    if company_id is not None:
-        q = q.where(Warehouse.company_id == company_id)
-    if warehouse_ids:
-        q = q.where(ProductStock.warehouse_id.in_(list(warehouse_ids)))
     if only_when_low:
-        q = q.where(ProductStock.quantity <= ProductStock.min_quantity)
-
-    rows = session.execute(q).all()
-    events: list[InventoryOutbox] = []
-    for stock, wh in rows:
-        target = (stock.max_quantity or (stock.min_quantity * 2)) or 0
-        need = max(0, target - stock.quantity)
-        payload = {
-            "product_id": stock.product_id,
-            "warehouse_id": stock.warehouse_id,
-            "current_qty": int(stock.quantity),
-            "reserved_qty": int(stock.reserved_quantity),
-            "min_qty": int(stock.min_quantity),
-            "max_qty": stock.max_quantity,
-            "suggested_purchase_qty": int(need),
-            "warehouse_name": wh.name,
-        }
-        ev = _outbox_enqueue_safe(
-            session,
-            aggregate_type="product_stock",
-            aggregate_id=stock.id,
-            event_type="reorder.alert",
-            payload=payload,
-            channel=channel,
-            log_prefix="stock.reorder_scan",
+        session.execute(reset_low_stock_alerts_stmt(company_id=company_id))
+        rows = session.execute(claim_low_stock_alerts_stmt(company_id=company_id, warehouse_ids=warehouse_ids)).all()
+    else:
+        q = (
+            select(
+                ProductStock.id,
+                ProductStock.product_id,
+                ProductStock.warehouse_id,
+                ProductStock.quantity,
+                ProductStock.reserved_quantity,
+                ProductStock.min_quantity,
+                ProductStock.max_quantity,
+                Warehouse.name.label("warehouse_name"),
+            )
+            .join(Warehouse, Warehouse.id == ProductStock.warehouse_id)
+            .where(ProductStock.is_archived.is_(False), Warehouse.is_archived.is_(False))
         )
-        if ev is not None:
-            events.append(ev)
-    return events
+        if company_id is not None:
+            q = q.where(Warehouse.company_id == company_id)
+        if warehouse_ids:
+            q = q.where(ProductStock.warehouse_id.in_(list(warehouse_ids)))
+        rows = session.execute(q).all()
+
+    if not rows:
+        return []
+    events = session.scalars(
+        insert(InventoryOutbox).returning(InventoryOutbox), reorder_outbox_rows(rows, channel=channel)
+    )
+    return list(events)
 
 
 # =========================
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Index, Integer, String
+
+from app.models.base import Base
+
+
+class WorkerShardLease(Base):
+    """Аренда шарда тенантов (company_id % shard_count) воркером на время lease_expires_at."""
+
+    __tablename__ = "worker_shard_leases"
+
+    job = Column(String(64), primary_key=True)
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String(128), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_worker_shard_leases_job_owner", "job", "owner"),)
+
+
+class WorkerShardMember(Base):
+    """Живой участник пула воркеров задачи: по числу участников считается справедливая доля шардов."""
+
+    __tablename__ = "worker_shard_members"
+
+    job = Column(String(64), primary_key=True)
+    owner = Column(String(128), primary_key=True)
+    heartbeat_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+
+__all__ = ["WorkerShardLease", "WorkerShardMember"]
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from typing import Any
+
+from app.services.exports.xlsx_stream import build_xlsx
+
+ORDERS_SHEET_TITLE = "orders"
+ORDERS_HEADERS = [
+    "order_id",
+    "created_at",
+    "status",
+    "total_price",
+    "customer_name",
+    "customer_phone",
+    "items_count",
+]
+
+
+def build_orders_xlsx(rows: list[dict[str, Any]]) -> bytes:
+    return build_xlsx(
+        sheet_title=ORDERS_SHEET_TITLE,
+        headers=ORDERS_HEADERS,
+        rows=([row.get(h) for h in ORDERS_HEADERS] for row in rows),
+    )
@@ -1,22 +1,16 @@
 from __future__ import annotations
 
-from io import BytesIO
 from typing import Any
 
-from openpyxl import Workbook
+from app.services.exports.xlsx_stream import build_xlsx
 
+PRODUCTS_SHEET_TITLE = "products"
+PRODUCTS_HEADERS = ["product_id", "sku", "name", "price", "created_at"]
 
-def build_products_xlsx(rows: list[dict[str, Any]]) -> bytes:
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = "products"
-
-    headers = ["product_id", "sku", "name", "price", "created_at"]
-    sheet.append(headers)
-    for row in rows:
-        sheet.append([row.get(h) for h in headers])
 
-    buffer = BytesIO()
-    workbook.save(buffer)
-    buffer.seek(0)
-    return buffer.getvalue()
+def build_products_xlsx(rows: list[dict[str, Any]]) -> bytes:
+    return build_xlsx(
+        sheet_title=PRODUCTS_SHEET_TITLE,
+        headers=PRODUCTS_HEADERS,
+        rows=([row.get(h) for h in PRODUCTS_HEADERS] for row in rows),
+    )
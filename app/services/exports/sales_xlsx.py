@@ -1,22 +1,16 @@
 from __future__ import annotations
 
-from io import BytesIO
 from typing import Any
 
-from openpyxl import Workbook
+from app.services.exports.xlsx_stream import build_xlsx
 
+SALES_SHEET_TITLE = "sales"
+SALES_HEADERS = ["order_id", "created_at", "total_amount", "items_count"]
 
-def build_sales_xlsx(rows: list[dict[str, Any]]) -> bytes:
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = "sales"
-
-    headers = ["order_id", "created_at", "total_amount", "items_count"]
-    sheet.append(headers)
-    for row in rows:
-        sheet.append([row.get(h) for h in headers])
 
-    buffer = BytesIO()
-    workbook.save(buffer)
-    buffer.seek(0)
-    return buffer.getvalue()
+def build_sales_xlsx(rows: list[dict[str, Any]]) -> bytes:
+    return build_xlsx(
+        sheet_title=SALES_SHEET_TITLE,
+        headers=SALES_HEADERS,
+        rows=([row.get(h) for h in SALES_HEADERS] for row in rows),
+    )
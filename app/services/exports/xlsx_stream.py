@@ -0,0 +1,261 @@
+"""
+Streaming XLSX writer.
+
+Writes a single-sheet SpreadsheetML package directly into a zip stream (inline
+strings, no shared-strings table), so memory stays flat regardless of row count.
+``stream_xlsx`` runs the writer in a worker thread and yields zip chunks to the
+event loop as soon as they are produced; rows are pulled lazily from an async
+iterator (typically a server-side cursor).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+import zipfile
+from collections.abc import AsyncIterator, Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from io import BytesIO
+from typing import Any, BinaryIO
+from xml.sax.saxutils import escape
+
+from openpyxl.utils import get_column_letter
+
+from app.core.config import settings
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    "</Types>"
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    "</Relationships>"
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    "</Relationships>"
+)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    "</styleSheet>"
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = "</sheetData></worksheet>"
+
+# XML 1.0 запрещает управляющие символы — вычищаем их из значений ячеек.
+_ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_SHEET_TITLE_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _workbook_xml(sheet_title: str) -> str:
+    title = _SHEET_TITLE_CHARS.sub("_", sheet_title)[:31] or "Sheet1"
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(title, {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    )
+
+
+def _cell(ref: str, value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, int | float | Decimal):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime | date):
+        value = value.isoformat()
+    text = _ILLEGAL_XML_CHARS.sub("", str(value))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _row_xml(index: int, values: Sequence[Any], columns: list[str]) -> str:
+    cells = "".join(_cell(f"{col}{index}", value) for col, value in zip(columns, values, strict=False))
+    return f'<row r="{index}">{cells}</row>'
+
+
+def write_xlsx(
+    fp: BinaryIO,
+    *,
+    sheet_title: str,
+    headers: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+) -> int:
+    """Writes an XLSX package to ``fp`` (seekable or not). Returns the number of data rows."""
+    columns = [get_column_letter(i) for i in range(1, len(headers) + 1)]
+    written = 0
+    with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=5) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        zf.writestr("xl/workbook.xml", _workbook_xml(sheet_title))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_SHEET_HEAD.encode())
+            sheet.write(_row_xml(1, headers, columns).encode())
+            for values in rows:
+                written += 1
+                sheet.write(_row_xml(written + 1, values, columns).encode())
+            sheet.write(_SHEET_TAIL.encode())
+    return written
+
+
+def build_xlsx(*, sheet_title: str, headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> bytes:
+    buffer = BytesIO()
+    write_xlsx(buffer, sheet_title=sheet_title, headers=headers, rows=rows)
+    return buffer.getvalue()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = max(1, int(getattr(settings, "EXPORT_XLSX_WORKERS", 4) or 4))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="xlsx-export")
+        return _executor
+
+
+class _ExportCancelled(Exception):
+    pass
+
+
+class _ChunkSink:
+    """Non-seekable binary sink: buffers zip output and hands chunks to the event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, stop: threading.Event, chunk_size: int):
+        self._loop = loop
+        self._queue = queue
+        self._stop = stop
+        self._chunk_size = chunk_size
+        self._buf = bytearray()
+
+    def _emit(self, item: bytes | None) -> None:
+        if self._stop.is_set():
+            raise _ExportCancelled()
+        asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+
+    def write(self, data: bytes) -> int:
+        self._buf += data
+        if len(self._buf) >= self._chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self) -> None:
+        if self._buf:
+            chunk = bytes(self._buf)
+            self._buf.clear()
+            self._emit(chunk)
+
+    def finish(self) -> None:
+        self.flush()
+        self._emit(None)
+
+
+async def stream_xlsx(
+    *,
+    sheet_title: str,
+    headers: Sequence[str],
+    batches: AsyncIterator[Sequence[Sequence[Any]]],
+    chunk_size: int = 64 * 1024,
+) -> AsyncIterator[bytes]:
+    """
+    Async generator of XLSX bytes. ``batches`` is consumed on the event loop
+    (so it may use the request's AsyncSession), XML/zip encoding happens in the
+    export thread pool, and at most a few chunks are buffered between the two.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=4)
+    stop = threading.Event()
+    sink = _ChunkSink(loop, queue, stop, chunk_size)
+
+    def _rows() -> Iterable[Sequence[Any]]:
+        while True:
+            try:
+                batch = asyncio.run_coroutine_threadsafe(batches.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+            if stop.is_set():
+                raise _ExportCancelled()
+            yield from batch
+
+    def _run() -> None:
+        write_xlsx(sink, sheet_title=sheet_title, headers=headers, rows=_rows())
+        sink.finish()
+
+    future = loop.run_in_executor(_get_executor(), _run)
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, future}, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done and future.exception() is not None:
+                # Поток упал, не отдав финальный маркер, — пробрасываем его ошибку.
+                getter.cancel()
+                future.result()
+            chunk = await getter
+            if chunk is None:
+                break
+            yield chunk
+        await future
+    finally:
+        if not future.done():
+            stop.set()
+            while not future.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait({future}, timeout=0.05)
+            try:
+                future.result()
+            except _ExportCancelled:
+                pass
+        aclose = getattr(batches, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+__all__ = [
+    "XLSX_MEDIA_TYPE",
+    "build_xlsx",
+    "stream_xlsx",
+    "write_xlsx",
+]
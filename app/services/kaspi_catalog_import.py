@@ -0,0 +1,351 @@
+"""
+Kaspi catalog import pipeline.
+
+Normalized rows (produced by a synchronous parser, advanced in a worker thread)
+are bulk-loaded chunk by chunk into a per-transaction staging table via COPY,
+then merged set-wise into ``catalog_import_rows`` and ``kaspi_offers``. Batch
+counters are published after every chunk so the existing CatalogImportBatch
+endpoints double as a progress feed for background imports. Batches whose
+``updated_at`` stops moving (the process running the job died) are marked
+FAILED by ``fail_stale_catalog_imports``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.db import copy_records
+from app.core.logging import get_logger
+from app.models.catalog_import import CatalogImportBatch
+
+logger = get_logger(__name__)
+
+STATUS_PENDING = "PENDING"
+STATUS_RUNNING = "RUNNING"
+STATUS_DONE = "DONE"
+STATUS_FAILED = "FAILED"
+
+STALE_IMPORT_ERROR = "stale: import job stopped reporting progress"
+
+_STAGE_TABLE = "catalog_import_stage"
+_STAGE_COLUMNS = (
+    "row_num",
+    "raw",
+    "sku",
+    "master_sku",
+    "title",
+    "price",
+    "old_price",
+    "stock_count",
+    "pre_order",
+    "stock_specified",
+    "updated_at",
+    "error",
+)
+_CREATE_STAGE_SQL = f"""
+CREATE TEMP TABLE IF NOT EXISTS {_STAGE_TABLE} (
+    row_num integer NOT NULL,
+    raw text NOT NULL,
+    sku varchar(128),
+    master_sku varchar(128),
+    title varchar(255),
+    price integer,
+    old_price integer,
+    stock_count integer,
+    pre_order boolean,
+    stock_specified boolean,
+    updated_at timestamp,
+    error text
+) ON COMMIT DROP
+"""
+_MERGE_ROWS_SQL = f"""
+INSERT INTO catalog_import_rows (
+    batch_id, company_id, row_num, raw, sku, master_sku, title, price, old_price,
+    stock_count, pre_order, stock_specified, updated_at, error
+)
+SELECT
+    CAST(:batch_id AS uuid), CAST(:company_id AS integer), row_num, raw::jsonb, sku, master_sku, title,
+    price, old_price, stock_count, pre_order, stock_specified, updated_at, error
+FROM {_STAGE_TABLE}
+"""
+# Последняя строка файла для SKU выигрывает (как и при построчной дедупликации раньше).
+_MERGE_OFFERS_SQL = f"""
+INSERT INTO kaspi_offers AS o (
+    company_id, merchant_uid, sku, master_sku, title, price, old_price, stock_count,
+    pre_order, stock_specified, raw, created_at, updated_at
+)
+SELECT DISTINCT ON (s.sku)
+    CAST(:company_id AS integer), CAST(:merchant_uid AS varchar), s.sku, s.master_sku, s.title, s.price,
+    s.old_price, s.stock_count, s.pre_order, s.stock_specified, s.raw::jsonb,
+    CAST(:now AS timestamp), CAST(:now AS timestamp)
+FROM {_STAGE_TABLE} AS s
+WHERE s.error IS NULL
+ORDER BY s.sku, s.row_num DESC
+ON CONFLICT (company_id, merchant_uid, sku) DO UPDATE SET
+    master_sku = COALESCE(NULLIF(EXCLUDED.master_sku, ''), o.master_sku),
+    title = COALESCE(NULLIF(EXCLUDED.title, ''), o.title),
+    price = COALESCE(EXCLUDED.price, o.price),
+    old_price = COALESCE(EXCLUDED.old_price, o.old_price),
+    stock_count = COALESCE(EXCLUDED.stock_count, o.stock_count),
+    pre_order = COALESCE(EXCLUDED.pre_order, o.pre_order),
+    stock_specified = COALESCE(EXCLUDED.stock_specified, o.stock_specified),
+    raw = COALESCE(EXCLUDED.raw, o.raw),
+    updated_at = EXCLUDED.updated_at
+"""
+
+
+@dataclass
+class CatalogImportStats:
+    rows_total: int = 0
+    rows_ok: int = 0
+    rows_skipped: int = 0
+    error_counts: dict[str, int] = field(default_factory=dict)
+
+    def top_errors(self, limit: int = 5) -> list[dict[str, Any]]:
+        return [
+            {"error": key, "count": count}
+            for key, count in sorted(self.error_counts.items(), key=lambda item: (-item[1], item[0]))
+        ][:limit]
+
+
+def chunk_size() -> int:
+    return max(1, int(getattr(settings, "KASPI_CATALOG_IMPORT_CHUNK_SIZE", 5000) or 5000))
+
+
+def _row_error(row: dict[str, Any]) -> str | None:
+    if not row.get("sku"):
+        return "missing_sku"
+    return None
+
+
+def _stage_record(row_num: int, row: dict[str, Any], error: str | None) -> tuple:
+    return (
+        row_num,
+        json.dumps(row.get("raw") or {}, ensure_ascii=False, default=str),
+        row.get("sku"),
+        row.get("master_sku"),
+        row.get("title"),
+        row.get("price"),
+        row.get("old_price"),
+        row.get("stock_count"),
+        row.get("pre_order"),
+        row.get("stock_specified"),
+        row.get("updated_at"),
+        error,
+    )
+
+
+def _tally(stats: CatalogImportStats, row: dict[str, Any]) -> str | None:
+    stats.rows_total += 1
+    error = _row_error(row)
+    if error:
+        stats.rows_skipped += 1
+        stats.error_counts[error] = stats.error_counts.get(error, 0) + 1
+    else:
+        stats.rows_ok += 1
+    return error
+
+
+def _next_chunk(rows: Iterator[dict[str, Any]], size: int) -> list[dict[str, Any]]:
+    chunk: list[dict[str, Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+async def count_catalog_rows(rows: Iterator[dict[str, Any]]) -> CatalogImportStats:
+    """Dry run: validation counters only, nothing is written."""
+    stats = CatalogImportStats()
+    size = chunk_size()
+    while True:
+        chunk = await asyncio.to_thread(_next_chunk, rows, size)
+        if not chunk:
+            return stats
+        for row in chunk:
+            _tally(stats, row)
+
+
+async def import_catalog_rows(
+    session: AsyncSession,
+    *,
+    batch_id: Any,
+    company_id: int,
+    merchant_uid: str,
+    rows: Iterator[dict[str, Any]],
+    on_progress: Callable[[CatalogImportStats], Any] | None = None,
+) -> CatalogImportStats:
+    """
+    Stages and merges ``rows`` inside the session's current transaction.
+    The caller commits (the staging table is dropped on commit).
+    """
+    stats = CatalogImportStats()
+    size = chunk_size()
+    await session.execute(sa.text(_CREATE_STAGE_SQL))
+
+    while True:
+        chunk = await asyncio.to_thread(_next_chunk, rows, size)
+        if not chunk:
+            break
+        records = []
+        for row in chunk:
+            error = _tally(stats, row)
+            records.append(_stage_record(stats.rows_total, row, error))
+        await copy_records(session, _STAGE_TABLE, _STAGE_COLUMNS, records)
+        if on_progress is not None:
+            result = on_progress(stats)
+            if asyncio.iscoroutine(result):
+                await result
+
+    params = {"batch_id": batch_id, "company_id": company_id}
+    await session.execute(sa.text(_MERGE_ROWS_SQL), params)
+    await session.execute(
+        sa.text(_MERGE_OFFERS_SQL),
+        {**params, "merchant_uid": merchant_uid, "now": datetime.utcnow()},
+    )
+    return stats
+
+
+def apply_batch_result(batch: CatalogImportBatch, stats: CatalogImportStats) -> None:
+    batch.rows_total = stats.rows_total
+    batch.rows_ok = stats.rows_ok
+    batch.rows_failed = stats.rows_skipped
+    batch.status = STATUS_DONE
+    batch.finished_at = datetime.utcnow()
+    if stats.rows_skipped:
+        batch.error_summary = "; ".join({e["error"] for e in stats.top_errors()})
+
+
+async def _mark_failed(session: AsyncSession, batch_id: Any, error: str) -> None:
+    batch = await session.get(CatalogImportBatch, batch_id)
+    if batch is not None:
+        batch.status = STATUS_FAILED
+        batch.finished_at = datetime.utcnow()
+        batch.error_summary = error[:500]
+        await session.commit()
+
+
+def stale_after_seconds() -> int:
+    return max(60, int(getattr(settings, "KASPI_CATALOG_IMPORT_STALE_SECONDS", 900) or 900))
+
+
+async def fail_stale_catalog_imports(
+    session: AsyncSession,
+    *,
+    company_id: int | None = None,
+    now: datetime | None = None,
+) -> int:
+    """
+    PENDING/RUNNING батчи без движения ``updated_at`` дольше порога → FAILED.
+
+    Фоновый импорт идёт in-process (BackgroundTasks): рестарт/падение процесса
+    оставляет батч в RUNNING навсегда. Прогресс обновляет ``updated_at`` после
+    каждого чанка, так что живой импорт под условие не попадает. Коммит — на
+    вызывающем.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=stale_after_seconds())
+    stmt = sa.update(CatalogImportBatch).where(
+        CatalogImportBatch.status.in_((STATUS_PENDING, STATUS_RUNNING)),
+        CatalogImportBatch.updated_at < cutoff,
+    )
+    if company_id is not None:
+        stmt = stmt.where(CatalogImportBatch.company_id == company_id)
+    res = await session.execute(
+        stmt.values(
+            status=STATUS_FAILED, finished_at=now, error_summary=STALE_IMPORT_ERROR, updated_at=now
+        ).execution_options(synchronize_session=False)
+    )
+    swept = int(res.rowcount or 0)
+    if swept:
+        logger.warning("catalog_import_stale_failed", extra={"company_id": company_id, "batches": swept})
+    return swept
+
+
+async def run_catalog_import_job(
+    *,
+    batch_id: Any,
+    company_id: int,
+    merchant_uid: str,
+    path: str,
+    rows_factory: Callable[[], Iterator[dict[str, Any]]],
+    session_factory: async_sessionmaker[AsyncSession] | None = None,
+) -> None:
+    """Background import of a spooled upload; always removes the spool file."""
+    if session_factory is None:
+        from app.core.db import get_async_session_maker
+
+        session_factory = get_async_session_maker()
+
+    async def _publish(stats: CatalogImportStats) -> None:
+        # Прогресс пишется отдельной короткой транзакцией: основная держит staging до конца.
+        async with session_factory() as progress:
+            await progress.execute(
+                sa.update(CatalogImportBatch)
+                .where(CatalogImportBatch.id == batch_id)
+                .values(rows_total=stats.rows_total, rows_ok=stats.rows_ok, rows_failed=stats.rows_skipped)
+            )
+            await progress.commit()
+
+    try:
+        async with session_factory() as session:
+            try:
+                batch = await session.get(CatalogImportBatch, batch_id)
+                if batch is None:
+                    return
+                batch.status = STATUS_RUNNING
+                batch.started_at = datetime.utcnow()
+                await session.commit()
+
+                stats = await import_catalog_rows(
+                    session,
+                    batch_id=batch_id,
+                    company_id=company_id,
+                    merchant_uid=merchant_uid,
+                    rows=rows_factory(),
+                    on_progress=_publish,
+                )
+                batch = await session.get(CatalogImportBatch, batch_id)
+                apply_batch_result(batch, stats)
+                await session.commit()
+                logger.info(
+                    "catalog_import_done",
+                    extra={"batch_id": str(batch_id), "company_id": company_id, "rows_total": stats.rows_total},
+                )
+            except Exception as exc:
+                await session.rollback()
+                error = str(getattr(exc, "detail", None) or exc)
+                logger.warning("catalog_import_failed", extra={"batch_id": str(batch_id), "error": error})
+                await _mark_failed(session, batch_id, error)
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+__all__ = [
+    "STALE_IMPORT_ERROR",
+    "STATUS_DONE",
+    "STATUS_FAILED",
+    "STATUS_PENDING",
+    "STATUS_RUNNING",
+    "CatalogImportStats",
+    "apply_batch_result",
+    "count_catalog_rows",
+    "fail_stale_catalog_imports",
+    "import_catalog_rows",
+    "run_catalog_import_job",
+    "stale_after_seconds",
+]
@@ -5,9 +5,9 @@ from typing import Any
 
 import httpx
 import sqlalchemy as sa
-from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.db import bulk_upsert
 from app.models.kaspi_mc_session import KaspiMcSession
 from app.models.kaspi_offer import KaspiOffer
 
@@ -15,6 +15,22 @@ MC_BASE_URL = "https://mc.shop.kaspi.kz"
 MC_OFFERS_PATH = "/bff/offer-view/list"
 MC_CITY_ID_ALMATY = "750000000"
 
+_OFFER_COLUMNS = (
+    "company_id",
+    "merchant_uid",
+    "sku",
+    "master_sku",
+    "title",
+    "price",
+    "old_price",
+    "stock_count",
+    "pre_order",
+    "stock_specified",
+    "raw",
+    "updated_at",
+    "created_at",
+)
+
 
 def _to_float(value: Any) -> float | None:
     if value is None:
@@ -136,72 +152,65 @@ async def sync_kaspi_mc_offers(
         "Cookie": cookies,
     }
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        for page in range(0, max_pages):
-            resp = await client.get(
-                f"{MC_BASE_URL}{MC_OFFERS_PATH}",
-                headers=headers,
-                params={"m": merchant_uid, "p": page, "l": page_limit, "a": "true"},
-            )
-            resp.raise_for_status()
-            payload = resp.json() if resp.content else {}
-            items = _extract_items(payload)
-            if total_hint is None:
-                total_hint = _extract_total(payload)
-            if not items:
-                break
-
-            for item in items:
-                try:
-                    normalized = normalize_mc_offer(item)
+    async def _offer_rows():
+        nonlocal rows_ok, rows_failed, rows_total, total_hint
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            for page in range(0, max_pages):
+                resp = await client.get(
+                    f"{MC_BASE_URL}{MC_OFFERS_PATH}",
+                    headers=headers,
+                    params={"m": merchant_uid, "p": page, "l": page_limit, "a": "true"},
+                )
+                resp.raise_for_status()
+                payload = resp.json() if resp.content else {}
+                items = _extract_items(payload)
+                if total_hint is None:
+                    total_hint = _extract_total(payload)
+                if not items:
+                    break
+
+                for item in items:
+                    try:
+                        normalized = normalize_mc_offer(item)
+                    except Exception as exc:  # pragma: no cover - defensive
+                        rows_failed += 1
+                        errors.append({"sku": item.get("sku"), "error": str(exc)})
+                        continue
                     sku = normalized.get("sku")
                     if not sku:
                         rows_failed += 1
                         errors.append({"error": "missing_sku"})
                         continue
-
-                    stmt = (
-                        insert(KaspiOffer)
-                        .values(
-                            company_id=company_id,
-                            merchant_uid=merchant_uid,
-                            sku=str(sku),
-                            master_sku=normalized.get("master_sku"),
-                            title=normalized.get("title"),
-                            price=normalized.get("price"),
-                            old_price=normalized.get("old_price"),
-                            stock_count=normalized.get("stock_count"),
-                            pre_order=normalized.get("pre_order"),
-                            stock_specified=normalized.get("stock_specified"),
-                            raw=normalized.get("raw") or {},
-                            updated_at=now,
-                            created_at=now,
-                        )
-                        .on_conflict_do_update(
-                            index_elements=["company_id", "merchant_uid", "sku"],
-                            set_={
-                                "master_sku": normalized.get("master_sku"),
-                                "title": normalized.get("title"),
-                                "price": normalized.get("price"),
-                                "old_price": normalized.get("old_price"),
-                                "stock_count": normalized.get("stock_count"),
-                                "pre_order": normalized.get("pre_order"),
-                                "stock_specified": normalized.get("stock_specified"),
-                                "raw": normalized.get("raw") or {},
-                                "updated_at": now,
-                            },
-                        )
-                    )
-                    await session.execute(stmt)
                     rows_ok += 1
-                except Exception as exc:  # pragma: no cover - defensive
-                    rows_failed += 1
-                    errors.append({"sku": item.get("sku"), "error": str(exc)})
-
-            rows_total += len(items)
-            if len(items) < page_limit and (total_hint is None or rows_total >= total_hint):
-                break
+                    yield (
+                        company_id,
+                        merchant_uid,
+                        str(sku),
+                        normalized.get("master_sku"),
+                        normalized.get("title"),
+                        normalized.get("price"),
+                        normalized.get("old_price"),
+                        normalized.get("stock_count"),
+                        normalized.get("pre_order"),
+                        normalized.get("stock_specified"),
+                        normalized.get("raw") or {},
+                        now,
+                        now,
+                    )
 
+                rows_total += len(items)
+                if len(items) < page_limit and (total_hint is None or rows_total >= total_hint):
+                    break
+
+    # Страницы MC стримятся прямо в COPY; одна merge-операция вместо INSERT на каждую строку.
+    await bulk_upsert(
+        session,
+        KaspiOffer,
+        _offer_rows(),
+        columns=_OFFER_COLUMNS,
+        conflict_columns=["company_id", "merchant_uid", "sku"],
+        update_columns=[c for c in _OFFER_COLUMNS if c not in ("company_id", "merchant_uid", "sku", "created_at")],
+    )
     await session.commit()
 
     mc_row = (
@@ -3,10 +3,13 @@ Kaspi Orders Sync Runner - Production-safe periodic sync orchestrator.
 
 This module provides a runner that iterates over all active companies and
 triggers sync_orders for each, with proper isolation, logging, and backoff.
+run_kaspi_orders_sync_due() is the adaptive variant driven by per-merchant
+schedules in KaspiOrderSyncState.
 """
 
 import asyncio
 import random
+from datetime import datetime
 from typing import Any
 
 import structlog
@@ -15,12 +18,207 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from app.core.db import _get_async_engine
 from app.models.company import Company
+from app.services import kaspi_orders_sync_scheduler as sync_scheduler
 from app.services.integration_events import record_integration_event
+from app.services.kaspi_orders_sync_scheduler import lease_owner_token
 from app.services.kaspi_service import KaspiService, KaspiSyncAlreadyRunning
 
 logger = structlog.get_logger(__name__)
 
 
+async def _sync_company(
+    session_maker: async_sessionmaker[AsyncSession],
+    company_id: int,
+    company_name: str | None,
+    merchant_uid: str | None,
+    *,
+    base_delay_seconds: float = 1.0,
+    max_delay_seconds: float = 60.0,
+    backoff_on_rate_limit: bool = True,
+) -> tuple[str, dict[str, Any] | None]:
+    """
+    Sync one company and record an integration event.
+
+    Returns (outcome, sync_orders result) where outcome is one of
+    success / failed / locked / rate_limited.
+    """
+    # Add jitter to spread load
+    jitter = random.uniform(0, min(base_delay_seconds, max_delay_seconds))
+    if jitter > 0:
+        await asyncio.sleep(jitter)
+
+    async with session_maker() as session:
+        svc = KaspiService()
+        try:
+            merchant_uid_value = (merchant_uid or "").strip()
+            if not merchant_uid_value:
+                logger.warning(
+                    "kaspi_sync_runner: missing merchant_uid",
+                    company_id=company_id,
+                    company_name=company_name,
+                )
+                await record_integration_event(
+                    session,
+                    company_id=company_id,
+                    merchant_uid=None,
+                    kind="kaspi_orders_sync",
+                    status="skipped",
+                    error_code="missing_merchant_uid",
+                    error_message="missing_merchant_uid",
+                )
+                return "failed", None
+            result = await svc.sync_orders(
+                db=session,
+                company_id=company_id,
+                merchant_uid=merchant_uid_value,
+                request_id=f"kaspi-sync-runner-{company_id}",
+            )
+            result_ok = result.get("ok", True)
+            status_value = str(result.get("status") or "").lower()
+            code_value = str(result.get("code") or "").lower()
+
+            if result_ok:
+                logger.info(
+                    "kaspi_sync_runner: sync success",
+                    company_id=company_id,
+                    company_name=company_name,
+                    merchant_uid=merchant_uid_value,
+                    fetched=result.get("fetched", 0),
+                    inserted=result.get("inserted", 0),
+                    updated=result.get("updated", 0),
+                    unchanged=result.get("unchanged", 0),
+                )
+                await record_integration_event(
+                    session,
+                    company_id=company_id,
+                    merchant_uid=merchant_uid_value,
+                    kind="kaspi_orders_sync",
+                    status="success",
+                    meta_json={
+                        "fetched": result.get("fetched", 0),
+                        "inserted": result.get("inserted", 0),
+                        "updated": result.get("updated", 0),
+                        "unchanged": result.get("unchanged", 0),
+                        "watermark": result.get("watermark"),
+                        "page_limit_hit": result.get("page_limit_hit"),
+                        "window_truncated": result.get("window_truncated"),
+                    },
+                )
+                return "success", result
+
+            if status_value == "locked" or code_value in {"locked", "sync_locked"}:
+                logger.info(
+                    "kaspi_sync_runner: sync locked",
+                    company_id=company_id,
+                    company_name=company_name,
+                    merchant_uid=merchant_uid_value,
+                )
+                await record_integration_event(
+                    session,
+                    company_id=company_id,
+                    merchant_uid=merchant_uid_value,
+                    kind="kaspi_orders_sync",
+                    status="skipped",
+                    error_code="locked",
+                    error_message="kaspi sync already running",
+                )
+                return "locked", result
+
+            if status_value == "rate_limited" or code_value == "rate_limited":
+                retry_after = result.get("retry_after")
+                delay = max(base_delay_seconds, float(retry_after or base_delay_seconds))
+                delay = min(delay, max_delay_seconds)
+                logger.warning(
+                    "kaspi_sync_runner: rate limited",
+                    company_id=company_id,
+                    company_name=company_name,
+                    merchant_uid=merchant_uid_value,
+                    retry_after=retry_after,
+                    backoff_seconds=delay,
+                )
+                await record_integration_event(
+                    session,
+                    company_id=company_id,
+                    merchant_uid=merchant_uid_value,
+                    kind="kaspi_orders_sync",
+                    status="failed",
+                    error_code="rate_limited",
+                    error_message="kaspi rate limited",
+                )
+                if backoff_on_rate_limit and delay > 0:
+                    await asyncio.sleep(delay)
+                return "rate_limited", result
+
+            logger.warning(
+                "kaspi_sync_runner: sync failed",
+                company_id=company_id,
+                company_name=company_name,
+                merchant_uid=merchant_uid_value,
+                status=status_value or None,
+                code=code_value or None,
+            )
+            await record_integration_event(
+                session,
+                company_id=company_id,
+                merchant_uid=merchant_uid_value,
+                kind="kaspi_orders_sync",
+                status="failed",
+                error_code=code_value or "failed",
+                error_message="kaspi orders sync failed",
+            )
+            return "failed", result
+        except KaspiSyncAlreadyRunning:
+            logger.info(
+                "kaspi_sync_runner: sync locked (concurrent run)",
+                company_id=company_id,
+                company_name=company_name,
+            )
+            await record_integration_event(
+                session,
+                company_id=company_id,
+                merchant_uid=merchant_uid_value,
+                kind="kaspi_orders_sync",
+                status="skipped",
+                error_code="locked",
+                error_message="kaspi sync already running",
+            )
+            return "locked", None
+        except asyncio.TimeoutError:
+            logger.warning(
+                "kaspi_sync_runner: sync timeout",
+                company_id=company_id,
+                company_name=company_name,
+            )
+            await record_integration_event(
+                session,
+                company_id=company_id,
+                merchant_uid=merchant_uid_value,
+                kind="kaspi_orders_sync",
+                status="failed",
+                error_code="timeout",
+                error_message="kaspi orders sync timeout",
+            )
+            return "failed", None
+        except Exception as exc:
+            logger.error(
+                "kaspi_sync_runner: sync failed",
+                company_id=company_id,
+                company_name=company_name,
+                error=str(exc),
+                exc_info=True,
+            )
+            await record_integration_event(
+                session,
+                company_id=company_id,
+                merchant_uid=merchant_uid_value,
+                kind="kaspi_orders_sync",
+                status="failed",
+                error_code="internal_error",
+                error_message=str(exc),
+            )
+            return "failed", None
+
+
 async def run_kaspi_orders_sync_once(
     *,
     max_concurrent: int = 3,
@@ -44,11 +242,6 @@ async def run_kaspi_orders_sync_once(
     engine = _get_async_engine()
     session_maker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
-    success_count = 0
-    failed_count = 0
-    locked_count = 0
-    total_count = 0
-
     logger.info("kaspi_sync_runner: starting sync run")
 
     async with session_maker() as db:
@@ -65,206 +258,96 @@ async def run_kaspi_orders_sync_once(
             logger.info("kaspi_sync_runner: no active companies found")
             return {"success": 0, "failed": 0, "locked": 0, "total": 0}
 
-        total_count = len(companies)
-        logger.info("kaspi_sync_runner: found companies", count=total_count)
+        logger.info("kaspi_sync_runner: found companies", count=len(companies))
 
     # Process companies with concurrency limit
     semaphore = asyncio.Semaphore(max_concurrent)
 
-    async def _sync_company(company_id: int, company_name: str, merchant_uid: str | None) -> None:
-        nonlocal success_count, failed_count, locked_count
-
+    async def _limited(company_id: int, company_name: str, merchant_uid: str | None) -> str:
         async with semaphore:
-            # Add jitter to spread load
-            jitter = random.uniform(0, min(base_delay_seconds, max_delay_seconds))
-            if jitter > 0:
-                await asyncio.sleep(jitter)
-
-            async with session_maker() as session:
-                svc = KaspiService()
-                try:
-                    merchant_uid_value = (merchant_uid or "").strip()
-                    if not merchant_uid_value:
-                        logger.warning(
-                            "kaspi_sync_runner: missing merchant_uid",
-                            company_id=company_id,
-                            company_name=company_name,
-                        )
-                        await record_integration_event(
-                            session,
-                            company_id=company_id,
-                            merchant_uid=None,
-                            kind="kaspi_orders_sync",
-                            status="skipped",
-                            error_code="missing_merchant_uid",
-                            error_message="missing_merchant_uid",
-                        )
-                        failed_count += 1
-                        return
-                    result = await svc.sync_orders(
-                        db=session,
-                        company_id=company_id,
-                        merchant_uid=merchant_uid_value,
-                        request_id=f"kaspi-sync-runner-{company_id}",
-                    )
-                    result_ok = result.get("ok", True)
-                    status_value = str(result.get("status") or "").lower()
-                    code_value = str(result.get("code") or "").lower()
-
-                    if result_ok:
-                        logger.info(
-                            "kaspi_sync_runner: sync success",
-                            company_id=company_id,
-                            company_name=company_name,
-                            merchant_uid=merchant_uid_value,
-                            fetched=result.get("fetched", 0),
-                            inserted=result.get("inserted", 0),
-                            updated=result.get("updated", 0),
-                        )
-                        await record_integration_event(
-                            session,
-                            company_id=company_id,
-                            merchant_uid=merchant_uid_value,
-                            kind="kaspi_orders_sync",
-                            status="success",
-                            meta_json={
-                                "fetched": result.get("fetched", 0),
-                                "inserted": result.get("inserted", 0),
-                                "updated": result.get("updated", 0),
-                                "watermark": result.get("watermark"),
-                                "page_limit_hit": result.get("page_limit_hit"),
-                                "window_truncated": result.get("window_truncated"),
-                            },
-                        )
-                        success_count += 1
-                        return
-
-                    if status_value == "locked" or code_value in {"locked", "sync_locked"}:
-                        logger.info(
-                            "kaspi_sync_runner: sync locked",
-                            company_id=company_id,
-                            company_name=company_name,
-                            merchant_uid=merchant_uid_value,
-                        )
-                        await record_integration_event(
-                            session,
-                            company_id=company_id,
-                            merchant_uid=merchant_uid_value,
-                            kind="kaspi_orders_sync",
-                            status="skipped",
-                            error_code="locked",
-                            error_message="kaspi sync already running",
-                        )
-                        locked_count += 1
-                        return
-
-                    if status_value == "rate_limited" or code_value == "rate_limited":
-                        retry_after = result.get("retry_after")
-                        delay = max(base_delay_seconds, float(retry_after or base_delay_seconds))
-                        delay = min(delay, max_delay_seconds)
-                        logger.warning(
-                            "kaspi_sync_runner: rate limited",
-                            company_id=company_id,
-                            company_name=company_name,
-                            merchant_uid=merchant_uid_value,
-                            retry_after=retry_after,
-                            backoff_seconds=delay,
-                        )
-                        await record_integration_event(
-                            session,
-                            company_id=company_id,
-                            merchant_uid=merchant_uid_value,
-                            kind="kaspi_orders_sync",
-                            status="failed",
-                            error_code="rate_limited",
-                            error_message="kaspi rate limited",
-                        )
-                        failed_count += 1
-                        if delay > 0:
-                            await asyncio.sleep(delay)
-                        return
-
-                    logger.warning(
-                        "kaspi_sync_runner: sync failed",
-                        company_id=company_id,
-                        company_name=company_name,
-                        merchant_uid=merchant_uid_value,
-                        status=status_value or None,
-                        code=code_value or None,
-                    )
-                    await record_integration_event(
-                        session,
-                        company_id=company_id,
-                        merchant_uid=merchant_uid_value,
-                        kind="kaspi_orders_sync",
-                        status="failed",
-                        error_code=code_value or "failed",
-                        error_message="kaspi orders sync failed",
-                    )
-                    failed_count += 1
-                except KaspiSyncAlreadyRunning:
-                    logger.info(
-                        "kaspi_sync_runner: sync locked (concurrent run)",
-                        company_id=company_id,
-                        company_name=company_name,
-                    )
-                    await record_integration_event(
-                        session,
-                        company_id=company_id,
-                        merchant_uid=merchant_uid_value,
-                        kind="kaspi_orders_sync",
-                        status="skipped",
-                        error_code="locked",
-                        error_message="kaspi sync already running",
-                    )
-                    locked_count += 1
-                except asyncio.TimeoutError:
-                    logger.warning(
-                        "kaspi_sync_runner: sync timeout",
-                        company_id=company_id,
-                        company_name=company_name,
-                    )
-                    await record_integration_event(
-                        session,
-                        company_id=company_id,
-                        merchant_uid=merchant_uid_value,
-                        kind="kaspi_orders_sync",
-                        status="failed",
-                        error_code="timeout",
-                        error_message="kaspi orders sync timeout",
-                    )
-                    failed_count += 1
-                except Exception as exc:
-                    logger.error(
-                        "kaspi_sync_runner: sync failed",
-                        company_id=company_id,
-                        company_name=company_name,
-                        error=str(exc),
-                        exc_info=True,
-                    )
-                    await record_integration_event(
-                        session,
-                        company_id=company_id,
-                        merchant_uid=merchant_uid_value,
-                        kind="kaspi_orders_sync",
-                        status="failed",
-                        error_code="internal_error",
-                        error_message=str(exc),
-                    )
-                    failed_count += 1
+            outcome, _ = await _sync_company(
+                session_maker,
+                company_id,
+                company_name,
+                merchant_uid,
+                base_delay_seconds=base_delay_seconds,
+                max_delay_seconds=max_delay_seconds,
+            )
+            return outcome
 
     # Launch all company syncs concurrently (semaphore limits actual concurrency)
-    tasks = [
-        _sync_company(company_id, company_name, merchant_uid) for company_id, company_name, merchant_uid in companies
-    ]
-    await asyncio.gather(*tasks, return_exceptions=True)
-
-    summary = {
-        "success": success_count,
-        "failed": failed_count,
-        "locked": locked_count,
-        "total": total_count,
-    }
+    outcomes = await asyncio.gather(
+        *(_limited(company_id, company_name, merchant_uid) for company_id, company_name, merchant_uid in companies),
+        return_exceptions=True,
+    )
+
+    summary = _summarize(outcomes)
+    summary["total"] = len(companies)
 
     logger.info("kaspi_sync_runner: sync run complete", **summary)
     return summary
+
+
+def _summarize(outcomes: list[Any]) -> dict[str, int]:
+    summary = {"success": 0, "failed": 0, "locked": 0}
+    for outcome in outcomes:
+        if outcome == "success":
+            summary["success"] += 1
+        elif outcome == "locked":
+            summary["locked"] += 1
+        else:
+            summary["failed"] += 1
+    return summary
+
+
+async def run_kaspi_orders_sync_due(
+    *,
+    max_concurrent: int | None = None,
+    owner: str | None = None,
+    now: datetime | None = None,
+) -> dict[str, Any]:
+    """
+    Adaptive variant: sync only merchants whose ``next_run_at`` is due.
+
+    Due merchants are leased through KaspiOrderSyncState (shared by all worker
+    processes, bounded by the global concurrency budget), synced, and
+    rescheduled from the outcome (see kaspi_orders_sync_scheduler).
+    """
+    engine = _get_async_engine()
+    session_maker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    owner = owner or lease_owner_token()
+    now = now or sync_scheduler.utcnow()
+    limit = max_concurrent or sync_scheduler.global_concurrency()
+
+    async with session_maker() as db:
+        claimed = await sync_scheduler.claim_due_companies(db, owner=owner, now=now, limit=limit)
+    if not claimed:
+        return {"success": 0, "failed": 0, "locked": 0, "total": 0}
+
+    async def _run(company_id: int, company_name: str | None, merchant_uid: str | None) -> str:
+        outcome = "failed"
+        result: dict[str, Any] | None = None
+        try:
+            outcome, result = await _sync_company(
+                session_maker,
+                company_id,
+                company_name,
+                merchant_uid,
+                base_delay_seconds=0.0,
+                backoff_on_rate_limit=False,
+            )
+        finally:
+            try:
+                async with session_maker() as db:
+                    await sync_scheduler.record_sync_outcome(
+                        db, company_id=company_id, owner=owner, outcome=outcome, result=result
+                    )
+            except Exception as exc:
+                logger.warning("kaspi_sync_runner: reschedule failed", company_id=company_id, error=str(exc))
+        return outcome
+
+    outcomes = await asyncio.gather(*(_run(*row) for row in claimed), return_exceptions=True)
+    summary = _summarize(outcomes)
+    summary["total"] = len(claimed)
+    logger.info("kaspi_sync_runner: due sync run complete", **summary)
+    return summary
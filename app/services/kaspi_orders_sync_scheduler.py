@@ -0,0 +1,258 @@
+"""
+Adaptive per-merchant schedule for Kaspi orders sync.
+
+Every merchant has a ``next_run_at`` in KaspiOrderSyncState. After each run the
+interval shrinks for busy merchants, grows for quiet ones and backs off on
+errors / rate limits (honouring Retry-After). Worker processes lease due rows
+with ``FOR UPDATE SKIP LOCKED``; the number of live leases across all workers is
+capped by a global concurrency budget, so the plan can be shared without
+double-syncing (the per-company advisory lock in sync_orders stays as a backstop).
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import socket
+from datetime import datetime, timedelta
+from typing import Any
+from uuid import uuid4
+
+from sqlalchemy import DateTime, func, literal, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.company import Company
+from app.models.kaspi_order_sync_state import KaspiOrderSyncState
+
+OUTCOME_SUCCESS = "success"
+OUTCOME_FAILED = "failed"
+OUTCOME_LOCKED = "locked"
+OUTCOME_RATE_LIMITED = "rate_limited"
+
+# Сериализует подсчёт активных лизингов и захват между процессами (pg_advisory_xact_lock).
+_CLAIM_LOCK_KEY = 0x4B535943  # "KSYC"
+_MAX_BACKOFF_EXPONENT = 10
+
+
+def utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+def lease_owner_token() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:12]}"
+
+
+def _setting_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(getattr(settings, name, default) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+def min_interval_seconds() -> int:
+    return _setting_int("KASPI_SYNC_MIN_INTERVAL_SECONDS", 60)
+
+
+def max_interval_seconds() -> int:
+    return max(min_interval_seconds(), _setting_int("KASPI_SYNC_MAX_INTERVAL_SECONDS", 1800))
+
+
+def base_interval_seconds() -> int:
+    value = _setting_int("KASPI_SYNC_BASE_INTERVAL_SECONDS", 300)
+    return min(max(value, min_interval_seconds()), max_interval_seconds())
+
+
+def global_concurrency() -> int:
+    return _setting_int("KASPI_SYNC_GLOBAL_CONCURRENCY", 8)
+
+
+def lease_seconds() -> int:
+    return _setting_int("KASPI_SYNC_LEASE_SECONDS", 600)
+
+
+def next_sync_interval(
+    *,
+    outcome: str,
+    previous: int | None = None,
+    fetched: int = 0,
+    partial: bool = False,
+    retry_after: int | None = None,
+    failures: int = 0,
+) -> int:
+    """Seconds until the next sync of a merchant, from the outcome of the last one."""
+    lo, hi, base = min_interval_seconds(), max_interval_seconds(), base_interval_seconds()
+    prev = min(max(int(previous or base), lo), hi)
+    if outcome == OUTCOME_SUCCESS:
+        busy = _setting_int("KASPI_SYNC_BUSY_ORDERS_THRESHOLD", 50)
+        if partial or fetched >= busy:
+            return lo
+        if fetched > 0:
+            return max(lo, prev // 2)
+        return min(hi, int(prev * 1.5))
+    if outcome == OUTCOME_LOCKED:
+        # Синхронизацию уже кто-то выполняет — перепроверяем скоро, интервал не трогаем.
+        return lo
+    if outcome == OUTCOME_RATE_LIMITED:
+        return min(hi, max(int(retry_after or 0), prev * 2, lo))
+    return min(hi, base * 2 ** min(max(failures - 1, 0), _MAX_BACKOFF_EXPONENT))
+
+
+def _jittered(now: datetime, interval: int) -> datetime:
+    # До 10% джиттера, чтобы мерчанты с одинаковым интервалом не синхронизировались в одну секунду.
+    return now + timedelta(seconds=interval + random.uniform(0, interval * 0.1))
+
+
+def _lease_available(now: datetime):
+    return or_(KaspiOrderSyncState.lease_expires_at.is_(None), KaspiOrderSyncState.lease_expires_at <= now)
+
+
+def _eligible_company():
+    return (
+        Company.is_active.is_(True),
+        Company.kaspi_store_id.is_not(None),
+        func.trim(Company.kaspi_store_id) != "",
+    )
+
+
+async def _ensure_states(db: AsyncSession, now: datetime) -> None:
+    """New merchants get a state row due immediately."""
+    source = select(Company.id, literal(0), literal(now, DateTime())).where(*_eligible_company())
+    stmt = (
+        insert(KaspiOrderSyncState)
+        .from_select(["company_id", "consecutive_failures", "updated_at"], source)
+        .on_conflict_do_nothing(constraint="uq_kaspi_sync_state_company")
+    )
+    await db.execute(stmt)
+
+
+async def claim_due_companies(
+    db: AsyncSession,
+    *,
+    owner: str,
+    now: datetime | None = None,
+    limit: int | None = None,
+) -> list[tuple[int, str | None, str | None]]:
+    """
+    Lease due merchants to ``owner`` within the global concurrency budget.
+    Returns (company_id, company_name, merchant_uid) rows; commits the claim.
+    """
+    now = now or utcnow()
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _CLAIM_LOCK_KEY})
+    await _ensure_states(db, now)
+
+    in_flight = (
+        await db.execute(select(func.count(KaspiOrderSyncState.id)).where(KaspiOrderSyncState.lease_expires_at > now))
+    ).scalar_one()
+    budget = min(int(limit or global_concurrency()), global_concurrency() - int(in_flight or 0))
+    if budget <= 0:
+        await db.commit()
+        return []
+
+    candidates = (
+        select(KaspiOrderSyncState.id)
+        .join(Company, Company.id == KaspiOrderSyncState.company_id)
+        .where(
+            *_eligible_company(),
+            or_(KaspiOrderSyncState.next_run_at.is_(None), KaspiOrderSyncState.next_run_at <= now),
+            _lease_available(now),
+        )
+        .order_by(KaspiOrderSyncState.next_run_at.asc().nullsfirst(), KaspiOrderSyncState.id.asc())
+        .limit(budget)
+        .with_for_update(of=KaspiOrderSyncState, skip_locked=True)
+    )
+    claimed_ids = (
+        (
+            await db.execute(
+                update(KaspiOrderSyncState)
+                .where(KaspiOrderSyncState.id.in_(candidates.scalar_subquery()))
+                .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds()))
+                .returning(KaspiOrderSyncState.company_id)
+                .execution_options(synchronize_session=False)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    rows: list[tuple[int, str | None, str | None]] = []
+    if claimed_ids:
+        res = await db.execute(
+            select(Company.id, Company.name, Company.kaspi_store_id)
+            .where(Company.id.in_(claimed_ids))
+            .order_by(Company.id)
+        )
+        rows = [(int(cid), name, store_id) for cid, name, store_id in res.all()]
+    await db.commit()
+    return rows
+
+
+async def record_sync_outcome(
+    db: AsyncSession,
+    *,
+    company_id: int,
+    owner: str | None,
+    outcome: str,
+    result: dict[str, Any] | None = None,
+    now: datetime | None = None,
+) -> datetime | None:
+    """Reschedule the merchant from its last outcome and release the lease. Returns next_run_at."""
+    now = now or utcnow()
+    state = (
+        await db.execute(
+            select(KaspiOrderSyncState).where(KaspiOrderSyncState.company_id == company_id).with_for_update()
+        )
+    ).scalar_one_or_none()
+    if state is None:
+        return None
+
+    result = result or {}
+    failures = int(state.consecutive_failures or 0)
+    if outcome == OUTCOME_SUCCESS:
+        failures = 0
+    elif outcome != OUTCOME_LOCKED:
+        failures += 1
+    interval = next_sync_interval(
+        outcome=outcome,
+        previous=state.sync_interval_seconds,
+        fetched=int(result.get("fetched") or 0),
+        partial=bool(result.get("page_limit_hit") or result.get("status") == "partial"),
+        retry_after=result.get("retry_after"),
+        failures=failures,
+    )
+    if outcome != OUTCOME_LOCKED:
+        state.sync_interval_seconds = interval
+    state.consecutive_failures = failures
+    state.next_run_at = _jittered(now, interval)
+    if owner is None or state.lease_owner in (None, owner):
+        state.lease_owner = None
+        state.lease_expires_at = None
+    await db.commit()
+    return state.next_run_at
+
+
+def schedule_snapshot(state: KaspiOrderSyncState | None, *, now: datetime | None = None) -> dict[str, Any]:
+    """Schedule fields for the sync-ops endpoint."""
+    now = now or utcnow()
+    lease_expires_at = getattr(state, "lease_expires_at", None) if state else None
+    return {
+        "next_run_at": getattr(state, "next_run_at", None) if state else None,
+        "sync_interval_seconds": getattr(state, "sync_interval_seconds", None) if state else None,
+        "consecutive_failures": int(getattr(state, "consecutive_failures", 0) or 0) if state else 0,
+        "leased": bool(lease_expires_at and lease_expires_at > now),
+        "lease_expires_at": lease_expires_at,
+    }
+
+
+__all__ = [
+    "OUTCOME_FAILED",
+    "OUTCOME_LOCKED",
+    "OUTCOME_RATE_LIMITED",
+    "OUTCOME_SUCCESS",
+    "claim_due_companies",
+    "global_concurrency",
+    "lease_owner_token",
+    "next_sync_interval",
+    "record_sync_outcome",
+    "schedule_snapshot",
+]
@@ -6,7 +6,7 @@ import inspect
 import json
 import os
 import random
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Callable, Iterable
 from contextlib import asynccontextmanager, nullcontext
 from datetime import UTC, datetime, timedelta
 from decimal import Decimal
@@ -14,12 +14,13 @@ from time import perf_counter
 from typing import Any
 
 import httpx
-from sqlalchemy import and_, literal_column, select, text, update
+from sqlalchemy import and_, func, literal_column, select, text, update
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import selectinload
 
-from app.core.db import _get_async_engine
+from app.core.config import settings
+from app.core.db import _get_async_engine, bulk_copy_min_rows, bulk_upsert
 from app.core.errors import safe_error_message
 from app.core.logging import get_logger
 from app.integrations.kaspi_adapter import KaspiAdapterError
@@ -28,6 +29,7 @@ from app.models.kaspi_catalog_item import KaspiCatalogItem
 from app.models.kaspi_order_sync_state import KaspiOrderSyncState
 from app.models.order import OrderSource, OrderStatus, OrderStatusHistory
 from app.models.preorder import Preorder, PreorderItem, PreorderStatus
+from app.models.sales_rollup import refresh_rollups_for_orders_async
 from app.services.kaspi_service_transport import _safe_httpx_request, _safe_httpx_response
 from app.services.kaspi_service_utils import (
     DEFAULT_KASPI_ORDER_STATES,
@@ -38,6 +40,7 @@ from app.services.kaspi_service_utils import (
     _first_present,
     _merge_kaspi_internal_notes,
     _normalize_address,
+    _order_payload_fingerprint,
     _parse_kaspi_states,
     _utcnow,
 )
@@ -49,6 +52,15 @@ KASPI_MAX_CREATION_WINDOW_DAYS = 14
 KASPI_MAX_CREATION_WINDOW = timedelta(days=KASPI_MAX_CREATION_WINDOW_DAYS)
 
 
+async def _report_sync_progress(on_progress: Callable[[dict[str, Any]], Any], progress: dict[str, Any]) -> None:
+    try:
+        result = on_progress(progress)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as exc:
+        logger.warning("Kaspi orders sync progress callback failed: %s", exc)
+
+
 def _clamp_creation_window(date_from: datetime, date_to: datetime) -> tuple[datetime, bool]:
     """Clamp outbound Kaspi orders creation window to provider hard limit (14 days)."""
     if date_from > date_to:
@@ -61,6 +73,165 @@ def _clamp_creation_window(date_from: datetime, date_to: datetime) -> tuple[date
     return date_from, False
 
 
+_STREAM_DONE = object()
+
+_CATALOG_ITEM_COLUMNS = (
+    "company_id",
+    "merchant_uid",
+    "sku",
+    "offer_code",
+    "product_code",
+    "last_seen_name",
+    "last_seen_price",
+    "last_seen_qty",
+    "last_seen_at",
+    "raw",
+    "created_at",
+    "updated_at",
+)
+_CATALOG_ITEM_INSERT_ONLY = ("company_id", "merchant_uid", "sku", "created_at")
+
+
+def _split_creation_window(date_from: datetime, date_to: datetime, slice_hours: int) -> list[tuple[datetime, datetime]]:
+    """Contiguous sub-windows of [date_from, date_to], oldest first."""
+    if slice_hours <= 0 or date_to <= date_from:
+        return [(date_from, date_to)]
+    step = timedelta(hours=slice_hours)
+    slices: list[tuple[datetime, datetime]] = []
+    start = date_from
+    while start < date_to:
+        end = min(start + step, date_to)
+        slices.append((start, end))
+        start = end
+    return slices
+
+
+class _OrdersFetchPlan:
+    """
+    Order pages for sync_orders, state by state.
+
+    Serial mode walks ``_iter_orders_pages`` once per state with the shared
+    pagination state (page limits need a single ordered budget). Fan-out mode
+    pages every (state, window slice) stream in its own producer task, at most
+    ``concurrency`` at a time, into a small bounded queue; batches are handed
+    back strictly in plan order (state order, oldest slice first), so the
+    persistence stage and watermark bookkeeping see the same sequence as a
+    serial walk.
+    """
+
+    def __init__(
+        self,
+        iter_pages: Any,
+        *,
+        states: list[str | None],
+        date_from: datetime,
+        date_to: datetime,
+        concurrency: int,
+        slice_hours: int,
+        prefetch_pages: int,
+        pagination_state: dict[str, Any],
+        page_kwargs: dict[str, Any],
+    ):
+        self._iter_pages = iter_pages
+        self._states = list(states)
+        self._window = (date_from, date_to)
+        self._pagination_state = pagination_state
+        self._page_kwargs = page_kwargs
+        self._prefetch_pages = max(1, int(prefetch_pages))
+        self._slices = _split_creation_window(date_from, date_to, slice_hours)
+        self.concurrency = max(1, int(concurrency))
+        self.fanout = (
+            self.concurrency > 1 and page_kwargs.get("max_pages") is None and len(self._states) * len(self._slices) > 1
+        )
+        self._streams: dict[tuple[int, int], tuple[asyncio.Queue, dict[str, Any]]] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._cursor = 0
+
+    @property
+    def streams(self) -> int:
+        return len(self._states) * len(self._slices) if self.fanout else len(self._states)
+
+    def _start(self) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        # Задачи создаются в порядке плана, семафор FIFO — слоты получают самые ранние потоки,
+        # поэтому потребитель никогда не ждёт поток, который не может стартовать.
+        for state_index, state in enumerate(self._states):
+            for slice_index, window in enumerate(self._slices):
+                queue: asyncio.Queue = asyncio.Queue(maxsize=self._prefetch_pages)
+                local_state: dict[str, Any] = {"pages_processed": 0, "last_page": 0}
+                self._streams[(state_index, slice_index)] = (queue, local_state)
+                self._tasks.append(asyncio.create_task(self._produce(slots, state, window, queue, local_state)))
+
+    async def _produce(
+        self,
+        slots: asyncio.Semaphore,
+        state: str | None,
+        window: tuple[datetime, datetime],
+        queue: asyncio.Queue,
+        local_state: dict[str, Any],
+    ) -> None:
+        async with slots:
+            try:
+                async for batch in self._iter_pages(
+                    date_from=window[0],
+                    date_to=window[1],
+                    state=state,
+                    pagination_state=local_state,
+                    **self._page_kwargs,
+                ):
+                    await queue.put(batch)
+            except Exception as exc:
+                await queue.put(exc)
+                return
+            await queue.put(_STREAM_DONE)
+
+    async def state_batches(self, state: str | None) -> AsyncIterator[list[dict[str, Any]]]:
+        if not self.fanout:
+            async for batch in self._iter_pages(
+                date_from=self._window[0],
+                date_to=self._window[1],
+                state=state,
+                pagination_state=self._pagination_state,
+                **self._page_kwargs,
+            ):
+                yield batch
+            return
+
+        if not self._tasks:
+            self._start()
+        state_index = self._states.index(state, self._cursor)
+        self._cursor = state_index + 1
+        shared = self._pagination_state
+        empty_slices = 0
+        for slice_index in range(len(self._slices)):
+            queue, local_state = self._streams[(state_index, slice_index)]
+            while True:
+                item = await queue.get()
+                if item is _STREAM_DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+            shared["pages_processed"] = int(shared.get("pages_processed", 0)) + int(
+                local_state.get("pages_processed", 0)
+            )
+            shared["last_page"] = local_state.get("last_page", 0)
+            if local_state.get("no_orders"):
+                empty_slices += 1
+        # «Заказов нет» — только если пусты все срезы окна (как один пустой ответ при серийном обходе).
+        if empty_slices == len(self._slices):
+            shared["no_orders"] = True
+            shared["stopped_early"] = False
+
+    async def aclose(self) -> None:
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
 class KaspiSyncAlreadyRunning(RuntimeError):
     pass
 
@@ -95,15 +266,23 @@ class KaspiServiceSyncMixin:
         backfill_days: int | None = None,
         orders_max_attempts: int | None = None,
         client_retries: int | None = None,
+        on_progress: Callable[[dict[str, Any]], Any] | None = None,
     ) -> dict[str, Any]:
-        """Инкрементальная и идемпотентная синхронизация заказов Kaspi."""
+        """
+        Инкрементальная и идемпотентная синхронизация заказов Kaspi.
+        ``on_progress`` вызывается после каждой обработанной страницы со счётчиками
+        (pages_fetched/orders_fetched/orders_upserted); сбой колбэка синк не прерывает.
+        """
         attempt_at = _utcnow()
         effective_to = date_to or attempt_at
         overlap = timedelta(minutes=2)
         fetched = 0
         inserted = 0
         updated = 0
+        unchanged = 0
+        pages_fetched = 0
         started_at = perf_counter()
+        fetch_plan: _OrdersFetchPlan | None = None
         timeout_seconds = float(timeout_seconds or self._sync_timeout_seconds or 30)
         max_pages = None if max_pages is None else max(1, int(max_pages))
         max_window_minutes = None if max_window_minutes is None else max(1, int(max_window_minutes))
@@ -199,28 +378,48 @@ class KaspiServiceSyncMixin:
                         made_progress = False
 
                         state_filters = self._resolve_order_states(statuses)
+                        fetch_plan = self._plan_orders_fetch(
+                            # Усечённое окно обрабатывает только первый статус (break ниже) — остальные не префетчим.
+                            states=state_filters[:1] if pagination_state.get("stopped_early") else state_filters,
+                            date_from=effective_from,
+                            date_to=effective_to,
+                            sync_state=sync_state,
+                            pagination_state=pagination_state,
+                            page_kwargs={
+                                "page_size": 100,
+                                "company_id": company_id,
+                                "merchant_uid": merchant_uid,
+                                "request_id": request_id,
+                                "max_pages": max_pages,
+                                "orders_timeout_sec": timeout_seconds,
+                                "max_attempts": orders_max_attempts,
+                                "client_retries": client_retries,
+                            },
+                        )
                         for order_state in state_filters:
-                            async for batch in self._iter_orders_pages(
-                                date_from=effective_from,
-                                date_to=effective_to,
-                                state=order_state,
-                                page_size=100,
-                                company_id=company_id,
-                                merchant_uid=merchant_uid,
-                                request_id=request_id,
-                                max_pages=max_pages,
-                                pagination_state=pagination_state,
-                                orders_timeout_sec=timeout_seconds,
-                                max_attempts=orders_max_attempts,
-                                client_retries=client_retries,
-                            ):
+                            async for batch in fetch_plan.state_batches(order_state):
                                 catalog_rows_map: dict[tuple[str, str], dict[str, Any]] = {}
+                                recalc_order_ids: set[int] = set()
+                                # Core upsert заказов/позиций мимо ORM flush — rollups пересчитываем явно.
+                                rollup_order_ids: set[int] = set()
                                 fetched += len(batch)
+                                known_fingerprints, known_statuses, known_order_ids = await self._load_order_snapshots(
+                                    db, company_id=company_id, batch=batch
+                                )
+                                history_rows: dict[tuple[int, OrderStatus, datetime], dict[str, Any]] = {}
                                 for payload in batch:
                                     ext_id = _as_str(payload.get("id")).strip()
                                     if not ext_id:
                                         continue
 
+                                    fingerprint = _order_payload_fingerprint(payload)
+                                    # Payload не изменился с прошлого прогона: заказ, позиции и история
+                                    # не переписываются; привязка каталога и переходы предзаказа — выполняются.
+                                    payload_unchanged = (
+                                        known_fingerprints.get(ext_id) == fingerprint and ext_id in known_order_ids
+                                    )
+                                    known_fingerprints[ext_id] = fingerprint
+
                                     mapped_status = self._map_kaspi_status(_as_str(payload.get("status")))
                                     order_number = self._order_number_from_payload(company_id, ext_id, payload)
                                     customer = payload.get("customer") or {}
@@ -260,81 +459,107 @@ class KaspiServiceSyncMixin:
                                             if not existing or row["last_seen_at"] >= existing.get("last_seen_at"):
                                                 catalog_rows_map[key] = row
 
-                                    update_values = {
-                                        "status": mapped_status,
-                                        "source": OrderSource.KASPI,
-                                        "order_number": order_number,
-                                        "customer_phone": customer.get("phone") or None,
-                                        "customer_name": customer.get("name") or None,
-                                        "customer_address": delivery_address,
-                                        "delivery_method": payload.get("deliveryMode")
-                                        or payload.get("delivery_mode")
-                                        or None,
-                                        "total_amount": total_amount,
-                                        "currency": currency,
-                                        "updated_at": effective_updated,
-                                    }
-                                    if delivery_date is not None:
-                                        update_values["delivery_date"] = delivery_date
-
-                                    stmt = (
-                                        insert(Order)
-                                        .values(
-                                            company_id=company_id,
-                                            order_number=order_number,
-                                            external_id=ext_id,
-                                            source=OrderSource.KASPI,
-                                            status=mapped_status,
-                                            customer_phone=customer.get("phone") or None,
-                                            customer_name=customer.get("name") or None,
-                                            customer_address=delivery_address,
-                                            delivery_method=payload.get("deliveryMode")
+                                    if payload_unchanged:
+                                        unchanged += 1
+                                        order_pk = known_order_ids[ext_id]
+                                    else:
+                                        update_values = {
+                                            "status": mapped_status,
+                                            "source": OrderSource.KASPI,
+                                            "order_number": order_number,
+                                            "customer_phone": customer.get("phone") or None,
+                                            "customer_name": customer.get("name") or None,
+                                            "customer_address": delivery_address,
+                                            "delivery_method": payload.get("deliveryMode")
                                             or payload.get("delivery_mode")
                                             or None,
-                                            delivery_date=delivery_date,
-                                            total_amount=total_amount,
-                                            currency=currency,
-                                            updated_at=effective_updated,
-                                        )
-                                        .on_conflict_do_update(
-                                            index_elements=[Order.company_id, Order.external_id],
-                                            set_=update_values,
+                                            "total_amount": total_amount,
+                                            "currency": currency,
+                                            "updated_at": effective_updated,
+                                            "kaspi_fingerprint": fingerprint,
+                                        }
+                                        if delivery_date is not None:
+                                            update_values["delivery_date"] = delivery_date
+
+                                        stmt = (
+                                            insert(Order)
+                                            .values(
+                                                company_id=company_id,
+                                                order_number=order_number,
+                                                external_id=ext_id,
+                                                source=OrderSource.KASPI,
+                                                status=mapped_status,
+                                                customer_phone=customer.get("phone") or None,
+                                                customer_name=customer.get("name") or None,
+                                                customer_address=delivery_address,
+                                                delivery_method=payload.get("deliveryMode")
+                                                or payload.get("delivery_mode")
+                                                or None,
+                                                delivery_date=delivery_date,
+                                                total_amount=total_amount,
+                                                currency=currency,
+                                                updated_at=effective_updated,
+                                                kaspi_fingerprint=fingerprint,
+                                            )
+                                            .on_conflict_do_update(
+                                                index_elements=[Order.company_id, Order.external_id],
+                                                set_=update_values,
+                                            )
+                                            .returning(Order.id, literal_column("xmax = 0").label("inserted"))
                                         )
-                                        .returning(Order.id, literal_column("xmax = 0").label("inserted"))
-                                    )
 
-                                    async with db.begin_nested():
-                                        res = await db.execute(stmt)
+                                        async with db.begin_nested():
+                                            res = await db.execute(stmt)
 
-                                    row = res.one()
-                                    inserted_flag: bool = bool(row.inserted)
-                                    if inserted_flag:
-                                        inserted += 1
-                                    else:
-                                        updated += 1
+                                        row = res.one()
+                                        inserted_flag: bool = bool(row.inserted)
+                                        if inserted_flag:
+                                            inserted += 1
+                                        else:
+                                            updated += 1
 
-                                    order_pk = row.id
+                                        order_pk = row.id
+                                        known_order_ids[ext_id] = order_pk
+                                        rollup_order_ids.add(order_pk)
 
-                                    if kaspi_attrs:
-                                        notes_row = await db.execute(
-                                            select(Order.internal_notes).where(Order.id == order_pk)
-                                        )
-                                        merged_notes = _merge_kaspi_internal_notes(
-                                            notes_row.scalar_one_or_none(),
-                                            kaspi_attrs,
-                                        )
-                                        await db.execute(
-                                            update(Order)
-                                            .where(Order.id == order_pk)
-                                            .values(
-                                                internal_notes=json.dumps(
-                                                    merged_notes,
-                                                    separators=(",", ":"),
-                                                    sort_keys=True,
+                                        if kaspi_attrs:
+                                            notes_row = await db.execute(
+                                                select(Order.internal_notes).where(Order.id == order_pk)
+                                            )
+                                            merged_notes = _merge_kaspi_internal_notes(
+                                                notes_row.scalar_one_or_none(),
+                                                kaspi_attrs,
+                                            )
+                                            await db.execute(
+                                                update(Order)
+                                                .where(Order.id == order_pk)
+                                                .values(
+                                                    internal_notes=json.dumps(
+                                                        merged_notes,
+                                                        separators=(",", ":"),
+                                                        sort_keys=True,
+                                                    )
                                                 )
                                             )
+
+                                        items_updated = await self._upsert_order_items(
+                                            db, order_id=order_pk, company_id=company_id, payload=payload
                                         )
 
+                                        if items_updated:
+                                            recalc_order_ids.add(order_pk)
+
+                                        new_status = self._status_enum(mapped_status)
+                                        if status_changed_at and known_statuses.get(ext_id) != new_status:
+                                            key = (order_pk, new_status, status_changed_at)
+                                            history_rows[key] = {
+                                                "order_id": order_pk,
+                                                "old_status": known_statuses.get(ext_id) or new_status,
+                                                "new_status": new_status,
+                                                "changed_at": status_changed_at,
+                                            }
+                                        known_statuses[ext_id] = new_status
+
                                     if updated_ts > watermark or (
                                         updated_ts == watermark and ext_id and ext_id > (last_ext or "")
                                     ):
@@ -342,20 +567,6 @@ class KaspiServiceSyncMixin:
                                         last_ext = ext_id
                                     made_progress = True
 
-                                    items_updated = await self._upsert_order_items(
-                                        db, order_id=order_pk, company_id=company_id, payload=payload
-                                    )
-
-                                    if items_updated:
-                                        await self._recalculate_order_totals(db, order_id=order_pk)
-
-                                    await self._upsert_status_history(
-                                        db,
-                                        order_id=order_pk,
-                                        new_status=mapped_status,
-                                        changed_at=status_changed_at,
-                                    )
-
                                     preorder = await self._get_or_create_kaspi_preorder(
                                         db,
                                         company_id=company_id,
@@ -370,8 +581,25 @@ class KaspiServiceSyncMixin:
                                             order_id=order_pk,
                                         )
 
+                                if recalc_order_ids:
+                                    await self._recalculate_order_totals(db, order_ids=recalc_order_ids)
+                                if rollup_order_ids:
+                                    await refresh_rollups_for_orders_async(db, rollup_order_ids)
+                                if history_rows:
+                                    await self._append_status_history(db, list(history_rows.values()))
                                 if catalog_rows_map:
                                     await self._upsert_catalog_items(db, list(catalog_rows_map.values()))
+                                pages_fetched += 1
+                                if on_progress is not None:
+                                    await _report_sync_progress(
+                                        on_progress,
+                                        {
+                                            "pages_fetched": pages_fetched,
+                                            "orders_fetched": fetched,
+                                            "orders_upserted": inserted + updated,
+                                            "orders_unchanged": unchanged,
+                                        },
+                                    )
 
                             page_limit_hit = bool(pagination_state.get("page_limit_hit"))
                             if (made_progress or is_new_state) and not page_limit_hit:
@@ -611,6 +839,9 @@ class KaspiServiceSyncMixin:
                 "company_id": company_id,
                 "duration_ms": duration_ms,
             }
+        finally:
+            if fetch_plan is not None:
+                await fetch_plan.aclose()
 
         no_orders = bool(pagination_state.get("no_orders")) if pagination_state is not None else False
         summary_status = "success" if no_orders else "partial" if pagination_state.get("stopped_early") else "success"
@@ -621,6 +852,7 @@ class KaspiServiceSyncMixin:
             "fetched": fetched,
             "inserted": inserted,
             "updated": updated,
+            "unchanged": unchanged,
             "from": effective_from.isoformat(),
             "to": effective_to.isoformat(),
             "watermark": (sync_state.last_synced_at or final_wm).isoformat()
@@ -640,13 +872,14 @@ class KaspiServiceSyncMixin:
             summary["window_truncated"] = True
 
         logger.info(
-            "Kaspi orders sync done: company_id=%s request_id=%s duration_ms=%s fetched=%s inserted=%s updated=%s",
+            "Kaspi orders sync done: company_id=%s request_id=%s duration_ms=%s fetched=%s inserted=%s updated=%s unchanged=%s",
             company_id,
             request_id,
             int((perf_counter() - started_at) * 1000),
             fetched,
             inserted,
             updated,
+            unchanged,
         )
         if _diag_enabled():
             logger.info(
@@ -660,6 +893,36 @@ class KaspiServiceSyncMixin:
             )
         return summary
 
+    async def _load_order_snapshots(
+        self,
+        db: AsyncSession,
+        *,
+        company_id: int,
+        batch: list[dict[str, Any]],
+    ) -> tuple[dict[str, str], dict[str, OrderStatus], dict[str, int]]:
+        """
+        Stored state of the orders of one page (single query):
+        external_id -> kaspi_fingerprint, external_id -> status and external_id -> order id.
+        """
+        ext_ids = {_as_str(payload.get("id")).strip() for payload in batch} - {""}
+        if not ext_ids:
+            return {}, {}, {}
+        rows = await db.execute(
+            select(Order.external_id, Order.kaspi_fingerprint, Order.status, Order.id).where(
+                Order.company_id == company_id,
+                Order.external_id.in_(ext_ids),
+            )
+        )
+        fingerprints: dict[str, str] = {}
+        statuses: dict[str, OrderStatus] = {}
+        order_ids: dict[str, int] = {}
+        for ext_id, fingerprint, status, order_id in rows.all():
+            if fingerprint is not None:
+                fingerprints[ext_id] = fingerprint
+            statuses[ext_id] = self._status_enum(status)
+            order_ids[ext_id] = int(order_id)
+        return fingerprints, statuses, order_ids
+
     async def _upsert_order_items(
         self,
         db: AsyncSession,
@@ -837,6 +1100,17 @@ class KaspiServiceSyncMixin:
             row.setdefault("created_at", now)
             row["updated_at"] = now
 
+        if len(rows) >= bulk_copy_min_rows():
+            await bulk_upsert(
+                db,
+                KaspiCatalogItem,
+                rows,
+                columns=list(_CATALOG_ITEM_COLUMNS),
+                conflict_columns=["company_id", "merchant_uid", "sku"],
+                update_columns=[c for c in _CATALOG_ITEM_COLUMNS if c not in _CATALOG_ITEM_INSERT_ONLY],
+            )
+            return
+
         stmt = insert(KaspiCatalogItem).values(rows)
         update_values = {
             "offer_code": stmt.excluded.offer_code,
@@ -1016,40 +1290,68 @@ class KaspiServiceSyncMixin:
 
         return preorder
 
-    async def _recalculate_order_totals(self, db: AsyncSession, *, order_id: int) -> None:
-        res = await db.execute(select(Order).options(selectinload(Order.items)).where(Order.id == order_id))
-        order = res.scalar_one_or_none()
-        if not order:
+    async def _recalculate_order_totals(self, db: AsyncSession, *, order_ids: Iterable[int]) -> None:
+        """
+        Set-based Order.calculate_totals() для всех заказов страницы.
+
+        Позиции: total_price = round(unit_price * quantity, 2) (UPDATE только расходящихся строк).
+        Заказы: один UPDATE … FROM (SELECT order_id, sum(...) GROUP BY order_id) —
+        subtotal = сумма позиций, total_amount = max(0, round(subtotal + tax + shipping - discount, 2)).
+        Операнды — numeric(14,2) и целые количества, поэтому round() в Postgres (half away
+        from zero) и Decimal.quantize (half even) дают одинаковый результат.
+        """
+        ids = sorted({int(i) for i in order_ids})
+        if not ids:
             return
 
-        try:
-            order.calculate_totals()
-        except Exception:
-            logger.exception("Kaspi: failed to recalc totals for order_id=%s", order_id)
-
-    async def _upsert_status_history(
-        self,
-        db: AsyncSession,
-        *,
-        order_id: int,
-        new_status: str | OrderStatus,
-        changed_at: datetime | None,
-    ) -> None:
-        if not changed_at:
-            return
+        line_total = func.round(OrderItem.unit_price * func.coalesce(OrderItem.quantity, 0), 2)
+        await db.execute(
+            update(OrderItem)
+            .where(OrderItem.order_id.in_(ids), OrderItem.total_price.is_distinct_from(line_total))
+            .values(total_price=line_total)
+            .execution_options(synchronize_session=False)
+        )
 
-        status_enum: OrderStatus
-        if isinstance(new_status, OrderStatus):
-            status_enum = new_status
-        else:
-            try:
-                status_enum = OrderStatus(new_status)
-            except Exception:
-                status_enum = OrderStatus.PENDING
+        sums = (
+            select(Order.id.label("order_id"), func.coalesce(func.sum(line_total), 0).label("subtotal"))
+            .select_from(Order)
+            .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+            .where(Order.id.in_(ids))
+            .group_by(Order.id)
+            .subquery()
+        )
+        total = func.round(
+            sums.c.subtotal
+            + func.coalesce(Order.tax_amount, 0)
+            + func.coalesce(Order.shipping_amount, 0)
+            - func.coalesce(Order.discount_amount, 0),
+            2,
+        )
+        await db.execute(
+            update(Order)
+            .where(Order.id == sums.c.order_id)
+            .values(subtotal=sums.c.subtotal, total_amount=func.greatest(total, 0))
+            .execution_options(synchronize_session=False)
+        )
 
+    @staticmethod
+    def _status_enum(value: str | OrderStatus) -> OrderStatus:
+        if isinstance(value, OrderStatus):
+            return value
+        try:
+            return OrderStatus(value)
+        except Exception:
+            return OrderStatus.PENDING
+
+    async def _append_status_history(self, db: AsyncSession, rows: list[dict[str, Any]]) -> None:
+        """
+        Append status transitions of one page with a single multi-row INSERT.
+        Rows are built only for orders whose status differs from the stored one
+        (a new order gets old_status == new_status); ON CONFLICT keeps re-syncs idempotent.
+        """
         stmt = (
             insert(OrderStatusHistory)
-            .values(order_id=order_id, old_status=status_enum, new_status=status_enum, changed_at=changed_at)
+            .values(rows)
             .on_conflict_do_nothing(
                 index_elements=[
                     OrderStatusHistory.order_id,
@@ -1058,7 +1360,6 @@ class KaspiServiceSyncMixin:
                 ]
             )
         )
-
         await db.execute(stmt)
 
     async def _iter_orders_pages(
@@ -1727,6 +2028,52 @@ class KaspiServiceSyncMixin:
 
         return filtered
 
+    def _orders_fetch_concurrency(self, sync_state: KaspiOrderSyncState | None) -> int:
+        try:
+            configured = max(1, int(getattr(settings, "KASPI_ORDERS_FETCH_CONCURRENCY", 4) or 1))
+        except (TypeError, ValueError):
+            configured = 1
+        # После ошибок/429 мерчант опрашивается последовательно, пока не пройдёт успешный прогон.
+        if int(getattr(sync_state, "consecutive_failures", 0) or 0) > 0:
+            return 1
+        return configured
+
+    def _plan_orders_fetch(
+        self,
+        *,
+        states: list[str | None],
+        date_from: datetime,
+        date_to: datetime,
+        sync_state: KaspiOrderSyncState | None,
+        pagination_state: dict[str, Any],
+        page_kwargs: dict[str, Any],
+    ) -> _OrdersFetchPlan:
+        try:
+            slice_hours = max(0, int(getattr(settings, "KASPI_ORDERS_FETCH_SLICE_HOURS", 24) or 0))
+            prefetch_pages = max(1, int(getattr(settings, "KASPI_ORDERS_FETCH_PREFETCH_PAGES", 2) or 1))
+        except (TypeError, ValueError):
+            slice_hours, prefetch_pages = 0, 1
+        plan = _OrdersFetchPlan(
+            self._iter_orders_pages,
+            states=states,
+            date_from=date_from,
+            date_to=date_to,
+            concurrency=self._orders_fetch_concurrency(sync_state),
+            slice_hours=slice_hours,
+            prefetch_pages=prefetch_pages,
+            pagination_state=pagination_state,
+            page_kwargs=page_kwargs,
+        )
+        if plan.fanout:
+            logger.info(
+                "Kaspi orders fetch fan-out: company_id=%s request_id=%s streams=%s concurrency=%s",
+                page_kwargs.get("company_id"),
+                page_kwargs.get("request_id"),
+                plan.streams,
+                plan.concurrency,
+            )
+        return plan
+
     def _resolve_order_states(self, statuses: list[str] | None) -> list[str | None]:
         if statuses:
             resolved = _parse_kaspi_states(statuses)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
 from collections.abc import Mapping
@@ -77,6 +78,16 @@ def _extract_kaspi_order_attrs(payload: dict[str, Any]) -> dict[str, Any]:
     return {key: payload[key] for key in keys if key in payload}
 
 
+# Версия нормализации: при её смене все заказы один раз перезапишутся с новым отпечатком.
+_ORDER_FINGERPRINT_VERSION = "1"
+
+
+def _order_payload_fingerprint(payload: dict[str, Any]) -> str:
+    """sha256 of the canonical JSON form of a Kaspi order payload (key order / whitespace insensitive)."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{_ORDER_FINGERPRINT_VERSION}:{canonical}".encode()).hexdigest()
+
+
 def _epoch_ms_to_utc_iso(value: Any) -> str | None:
     if isinstance(value, bool) or not isinstance(value, int | float):
         return None
@@ -0,0 +1,117 @@
+"""
+Set-based low-stock alerting across all tenants.
+
+The number of statements in one run depends on how many companies have new
+alerts, not on catalogue size:
+  1. reset the alert mark on restocked positions;
+  2. one SELECT DISTINCT of the companies that have not-yet-alerted low positions;
+  3. per such company, in its own transaction: an UPDATE … FROM (product_stocks ⨝
+     warehouses ⨝ products ⨝ companies) that marks the positions and returns
+     them, then one bulk INSERT of ``reorder.alert`` rows into inventory_outbox.
+     Both are served by the partial index ix_stock_low_partial, and the row locks
+     keep concurrent runs dedup-safe.
+The caller's ``notify`` runs before that transaction commits. If it fails, the
+mark and the outbox rows are rolled back, so the alert is raised again on the
+next run instead of being lost.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.company import Company
+from app.models.inventory_outbox import InventoryOutbox
+from app.models.product import Product
+from app.models.warehouse import (
+    ProductStock,
+    Warehouse,
+    claim_low_stock_alerts_stmt,
+    low_stock_alert_companies_stmt,
+    reorder_outbox_rows,
+    reset_low_stock_alerts_stmt,
+)
+
+logger = logging.getLogger(__name__)
+
+# notify(company_id, alerts): исключение = оповещение не доставлено
+LowStockNotifier = Callable[[int, list[dict[str, Any]]], Awaitable[None]]
+
+
+def _alert_filters() -> tuple[Any, ...]:
+    return (
+        Product.id == ProductStock.product_id,
+        Product.is_active.is_(True),
+        Company.id == Warehouse.company_id,
+        Company.is_active.is_(True),
+    )
+
+
+async def _companies_with_new_alerts(db: AsyncSession) -> list[int]:
+    result = await db.execute(low_stock_alert_companies_stmt(where=_alert_filters()))
+    return [int(cid) for cid in result.scalars().all()]
+
+
+async def _claim_company_alerts(db: AsyncSession, company_id: int, channel: str) -> list[dict[str, Any]]:
+    result = await db.execute(
+        claim_low_stock_alerts_stmt(
+            company_id=company_id,
+            where=_alert_filters(),
+            returning=(Product.name.label("product_name"), Product.sku, Company.name.label("company_name")),
+        )
+    )
+    rows = result.all()
+    if rows:
+        await db.execute(insert(InventoryOutbox), reorder_outbox_rows(rows, channel=channel))
+    return [
+        {
+            "name": row.product_name,
+            "sku": row.sku,
+            "stock": int(row.quantity),
+            "min_stock": int(row.min_quantity),
+            "warehouse": row.warehouse_name,
+            "company_name": row.company_name,
+        }
+        for row in sorted(rows, key=lambda r: (r.product_name or "", r.warehouse_id))
+    ]
+
+
+async def raise_low_stock_alerts(
+    db: AsyncSession,
+    *,
+    company_id: int | None = None,
+    channel: str = "task",
+    notify: LowStockNotifier | None = None,
+) -> dict[int, list[dict[str, Any]]]:
+    """
+    Поднять алерты по новым низким остаткам и поставить reorder-события в Outbox.
+    Возвращает ``{company_id: [{"name", "sku", "stock", "min_stock", ...}]}`` только
+    по позициям, чей уровень остатка ещё не алертился. Каждая компания — своя
+    транзакция: отметка фиксируется только после успешного ``notify``, при ошибке
+    оповещения транзакция компании откатывается и компания в результат не попадает.
+    """
+    await db.execute(reset_low_stock_alerts_stmt(company_id=company_id))
+    await db.commit()
+
+    company_ids = [company_id] if company_id is not None else await _companies_with_new_alerts(db)
+    by_company: dict[int, list[dict[str, Any]]] = {}
+    for cid in company_ids:
+        alerts = await _claim_company_alerts(db, cid, channel)
+        if alerts and notify is not None:
+            try:
+                await notify(cid, alerts)
+            except Exception as exc:
+                await db.rollback()
+                logger.warning("Low stock alert not delivered for company %s, will retry: %s", cid, exc)
+                continue
+        await db.commit()
+        if alerts:
+            by_company[cid] = alerts
+    return by_company
+
+
+__all__ = ["LowStockNotifier", "raise_low_stock_alerts"]
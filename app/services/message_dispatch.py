@@ -0,0 +1,362 @@
+"""
+In-process dispatch queue for transactional messages (OTP SMS, password reset email).
+
+Request handlers resolve the provider (so configuration errors still surface as
+503), enqueue the send and return immediately. A few delivery tasks on the
+event loop drain the queue with a per-provider token bucket, retry transient
+provider failures with exponential backoff and record enqueue-to-ack latency.
+
+No-op providers (``deliver_inline = True``) are called inline: they do no I/O
+and dev responses rely on their result. When the queue is full the handler gets
+503 with Retry-After instead of piling up unbounded work.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.core.config import settings
+from app.core.exceptions import ExternalServiceError
+from app.core.logging import audit_logger, get_logger
+from app.integrations.errors import ProviderNotConfiguredError
+
+log = get_logger(__name__)
+
+try:
+    from prometheus_client import Counter, Histogram
+
+    _DISPATCH_TOTAL = Counter(
+        "smartsell_message_dispatch_total",
+        "Transactional messages processed by the dispatch queue",
+        ["channel", "provider", "status"],
+    )
+    _DELIVERY_LATENCY = Histogram(
+        "smartsell_message_delivery_latency_seconds",
+        "Enqueue-to-provider-ack latency of transactional messages",
+        ["channel", "provider"],
+        buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+    )
+except Exception:  # pragma: no cover - optional metrics dependency
+    _DISPATCH_TOTAL = None
+    _DELIVERY_LATENCY = None
+
+CHANNEL_OTP = "otp"
+CHANNEL_EMAIL = "email"
+
+# Ошибки конфигурации/авторизации повторять бессмысленно.
+_PERMANENT_PROVIDER_ERRORS = {
+    "otp_provider_not_configured",
+    "otp_provider_auth_failed",
+    "email_provider_not_configured",
+    "messaging_provider_not_configured",
+}
+
+
+class MessageQueueFull(ExternalServiceError):
+    """Dispatch queue is saturated (maps to 503)."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            "Message delivery is temporarily overloaded, retry shortly",
+            "MESSAGE_QUEUE_FULL",
+            headers={"Retry-After": "1"},
+            http_status=503,
+        )
+
+
+def _setting(name: str, default: float) -> float:
+    try:
+        return float(getattr(settings, name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def dispatch_enabled() -> bool:
+    return bool(getattr(settings, "MESSAGE_DISPATCH_ENABLED", False))
+
+
+def _count(channel: str, provider: str, status: str) -> None:
+    if _DISPATCH_TOTAL is not None:
+        _DISPATCH_TOTAL.labels(channel=channel, provider=provider, status=status).inc()
+
+
+class _AsyncTokenBucket:
+    """Token bucket для event loop: ``rate`` сообщений в секунду на провайдера."""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = float(rate)
+        self.capacity = max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+@dataclass
+class _Job:
+    channel: str
+    provider: str
+    send: Callable[[], Awaitable[dict[str, Any] | None]]
+    meta: dict[str, Any] = field(default_factory=dict)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    attempt: int = 0
+
+
+def _is_retryable_error(exc: BaseException) -> bool:
+    if isinstance(exc, ProviderNotConfiguredError):
+        return exc.code not in _PERMANENT_PROVIDER_ERRORS
+    return True
+
+
+def _is_retryable_result(result: dict[str, Any] | None) -> bool:
+    if not result or result.get("status") != "error":
+        return False
+    try:
+        status_code = int(result.get("provider_status") or 0)
+    except (TypeError, ValueError):
+        return False
+    return status_code == 429 or status_code >= 500
+
+
+class MessageDispatcher:
+    """
+    Bounded asyncio queue drained by on-demand delivery tasks (they exit once the
+    queue is empty). Bound to the loop of the first submit; a new loop gets a fresh queue.
+    """
+
+    def __init__(self) -> None:
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue[_Job] | None = None
+        self._workers: set[asyncio.Task] = set()
+        self._retries: set[asyncio.Task] = set()
+        self._buckets: dict[str, _AsyncTokenBucket] = {}
+
+    def _ensure_queue(self) -> asyncio.Queue[_Job]:
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=max(1, int(_setting("MESSAGE_DISPATCH_QUEUE_SIZE", 1000))))
+            self._workers = set()
+            self._retries = set()
+            self._buckets = {}
+        return self._queue
+
+    def _spawn_workers(self) -> None:
+        assert self._queue is not None and self._loop is not None
+        limit = max(1, int(_setting("MESSAGE_DISPATCH_WORKERS", 4)))
+        while len(self._workers) < min(limit, self._queue.qsize()):
+            task = self._loop.create_task(self._worker(self._queue))
+            self._workers.add(task)
+            task.add_done_callback(self._workers.discard)
+
+    def _bucket(self, provider: str) -> _AsyncTokenBucket:
+        rate = _setting("MESSAGE_DISPATCH_RATE_PER_SECOND", 10.0)
+        bucket = self._buckets.get(provider)
+        if bucket is None or bucket.rate != rate:
+            bucket = _AsyncTokenBucket(rate)
+            self._buckets[provider] = bucket
+        return bucket
+
+    def submit(
+        self,
+        *,
+        channel: str,
+        provider: str,
+        send: Callable[[], Awaitable[dict[str, Any] | None]],
+        meta: dict[str, Any] | None = None,
+    ) -> None:
+        queue = self._ensure_queue()
+        try:
+            queue.put_nowait(_Job(channel=channel, provider=provider, send=send, meta=meta or {}))
+        except asyncio.QueueFull:
+            _count(channel, provider, "rejected")
+            raise MessageQueueFull() from None
+        _count(channel, provider, "queued")
+        self._spawn_workers()
+
+    async def _worker(self, queue: asyncio.Queue[_Job]) -> None:
+        while True:
+            try:
+                job = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await self._deliver(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # pragma: no cover - defensive: воркер не должен умирать
+                log.exception("message_dispatch_worker_error")
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, job: _Job) -> None:
+        job.attempt += 1
+        await self._bucket(job.provider).acquire()
+        error: BaseException | None = None
+        result: dict[str, Any] | None = None
+        try:
+            result = await job.send()
+        except Exception as exc:
+            error = exc
+
+        retryable = _is_retryable_error(error) if error is not None else _is_retryable_result(result)
+        if error is None and not retryable:
+            if _DELIVERY_LATENCY is not None:
+                _DELIVERY_LATENCY.labels(channel=job.channel, provider=job.provider).observe(
+                    time.perf_counter() - job.enqueued_at
+                )
+            _count(job.channel, job.provider, "sent" if (result or {}).get("status") != "error" else "failed")
+            return
+
+        max_attempts = max(1, int(_setting("MESSAGE_DISPATCH_MAX_ATTEMPTS", 3)))
+        if retryable and job.attempt < max_attempts:
+            _count(job.channel, job.provider, "retried")
+            delay = _setting("MESSAGE_DISPATCH_RETRY_BASE_SECONDS", 1.0) * 2 ** (job.attempt - 1)
+            task = asyncio.get_running_loop().create_task(self._requeue(job, delay))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+            return
+
+        _count(job.channel, job.provider, "failed")
+        audit_logger.log_system_event(
+            level="warning",
+            event=f"{job.channel}_send_failed",
+            message=str(error) if error is not None else f"provider_status={(result or {}).get('provider_status')}",
+            meta={**job.meta, "provider": job.provider, "attempts": job.attempt},
+        )
+
+    async def _requeue(self, job: _Job, delay: float) -> None:
+        await asyncio.sleep(delay)
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            await self._deliver(job)
+            return
+        self._spawn_workers()
+
+    def stats(self) -> dict[str, int]:
+        queue = self._queue
+        return {
+            "queued": queue.qsize() if queue is not None else 0,
+            "retrying": len(self._retries),
+            "workers": len(self._workers),
+        }
+
+    async def drain(self, timeout: float | None = None) -> bool:
+        """Wait until queued and retrying messages are delivered. False on timeout."""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return True
+
+        async def _wait() -> None:
+            while True:
+                await self._queue.join()
+                if not self._retries:
+                    return
+                await asyncio.gather(*list(self._retries), return_exceptions=True)
+
+        try:
+            await asyncio.wait_for(_wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def shutdown(self, timeout: float = 5.0) -> None:
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        if not await self.drain(timeout):
+            log.warning("message_dispatch_shutdown_pending", extra=self.stats())
+        tasks = [*self._workers, *self._retries]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queue = None
+        self._loop = None
+        self._workers = set()
+        self._retries = set()
+
+
+dispatcher = MessageDispatcher()
+
+
+def _provider_name(provider: Any) -> str:
+    return str(getattr(provider, "name", None) or type(provider).__name__)
+
+
+def _delivers_inline(provider: Any) -> bool:
+    return not dispatch_enabled() or bool(getattr(provider, "deliver_inline", False))
+
+
+async def dispatch_otp(
+    provider: Any,
+    *,
+    phone: str,
+    code: str,
+    ttl_seconds: int,
+    metadata: dict[str, Any] | None = None,
+) -> dict[str, Any] | None:
+    """
+    Sends an OTP through ``provider`` off the request path.
+    Returns the provider result for inline providers, otherwise a ``queued`` stub.
+    """
+    if _delivers_inline(provider):
+        return await provider.send_otp(phone=phone, code=code, ttl_seconds=ttl_seconds, metadata=metadata)
+
+    name = _provider_name(provider)
+    dispatcher.submit(
+        channel=CHANNEL_OTP,
+        provider=name,
+        send=lambda: provider.send_otp(phone=phone, code=code, ttl_seconds=ttl_seconds, metadata=metadata),
+        meta={"phone": phone, "purpose": (metadata or {}).get("purpose")},
+    )
+    return {"status": "queued", "provider": name, "version": getattr(provider, "version", None), "success": None}
+
+
+async def dispatch_message(
+    provider: Any,
+    *,
+    to: str,
+    text: str,
+    metadata: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """MessagingProvider.send_message() off the request path (same rules as dispatch_otp)."""
+    if _delivers_inline(provider):
+        return await provider.send_message(to=to, text=text, metadata=metadata)
+
+    name = _provider_name(provider)
+    dispatcher.submit(
+        channel=CHANNEL_EMAIL,
+        provider=name,
+        send=lambda: provider.send_message(to=to, text=text, metadata=metadata),
+        meta=dict((metadata or {}).get("meta") or {}),
+    )
+    return {"status": "queued", "provider": name, "success": None}
+
+
+__all__ = [
+    "CHANNEL_EMAIL",
+    "CHANNEL_OTP",
+    "MessageDispatcher",
+    "MessageQueueFull",
+    "dispatch_enabled",
+    "dispatch_message",
+    "dispatch_otp",
+    "dispatcher",
+]
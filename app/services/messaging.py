@@ -64,8 +64,12 @@ async def send_email(
     from_email: str | None = None,
     meta: dict[str, Any] | None = None,
     db=None,
+    queued: bool = False,
 ) -> dict[str, Any]:
-    """Send email via configured provider. In dev/test, noop is allowed."""
+    """
+    Send email via configured provider. In dev/test, noop is allowed.
+    ``queued=True`` hands the send to the in-process dispatch queue (status "queued").
+    """
 
     try:
         provider = await _resolve_provider(db)
@@ -84,7 +88,12 @@ async def send_email(
     if meta:
         metadata["meta"] = meta
 
-    result = await provider.send_message(to=to, text=body, metadata=metadata)
+    if queued:
+        from app.services.message_dispatch import dispatch_message
+
+        result = await dispatch_message(provider, to=to, text=body, metadata=metadata)
+    else:
+        result = await provider.send_message(to=to, text=body, metadata=metadata)
     provider_name = result.get("provider") or getattr(provider, "name", "unknown")
     status = result.get("status")
     success = bool(result.get("success")) or status in {"ok", "sent", "noop"}
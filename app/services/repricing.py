@@ -14,7 +14,7 @@ from sqlalchemy.orm import selectinload
 from app.core.exceptions import NotFoundError, SmartSellValidationError
 from app.models.company import Company
 from app.models.product import Product
-from app.models.repricing import RepricingRule, RepricingRun, RepricingRunItem
+from app.models.repricing import REPRICING_RUN_SESSION_FLAG, RepricingRule, RepricingRun, RepricingRunItem
 
 _ALLOWED_SCOPE_TYPES = {"all", "product", "category", "brand"}
 _ALLOWED_ROUNDING = {"nearest", "floor", "ceil"}
@@ -242,6 +242,34 @@ async def run_reprcing_for_company(
     dry_run: bool = False,
     request_id: str | None = None,
     rule_id: int | None = None,
+) -> RepricingRun:
+    # Свои изменения цен не делают компанию «грязной» для autorun (см. RepricingDirtyCompany)
+    previous = db.info.get(REPRICING_RUN_SESSION_FLAG)
+    db.info[REPRICING_RUN_SESSION_FLAG] = True
+    try:
+        return await _reprice_company(
+            db,
+            company_id,
+            triggered_by_user_id=triggered_by_user_id,
+            dry_run=dry_run,
+            request_id=request_id,
+            rule_id=rule_id,
+        )
+    finally:
+        if previous is None:
+            db.info.pop(REPRICING_RUN_SESSION_FLAG, None)
+        else:
+            db.info[REPRICING_RUN_SESSION_FLAG] = previous
+
+
+async def _reprice_company(
+    db: AsyncSession,
+    company_id: int,
+    *,
+    triggered_by_user_id: int | None,
+    dry_run: bool,
+    request_id: str | None,
+    rule_id: int | None,
 ) -> RepricingRun:
     now = datetime.utcnow()
     run = RepricingRun(
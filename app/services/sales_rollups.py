@@ -0,0 +1,215 @@
+"""
+Sales time-series reads on top of ``sales_rollups``.
+
+A requested range is split into: daily rollups for whole closed days, hourly
+rollups for whole closed hours at the edges, and raw Order rows only for the
+sub-hour edges and the still-open current hour. Results are hourly/daily
+buckets that callers regroup (day/week/month) or sum.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import and_, case, func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.order import Order, OrderItem
+from app.models.sales_rollup import PAID_ORDER_STATUSES, SalesRollup, rollup_refresh_statements
+
+logger = logging.getLogger(__name__)
+
+_HOUR = timedelta(hours=1)
+_DAY = timedelta(days=1)
+
+# (lo, hi) half-open rollup range; (lo, hi, hi_inclusive) raw range. None = unbounded.
+_RollupRange = tuple[datetime | None, datetime]
+_RawRange = tuple[datetime | None, datetime | None, bool]
+
+
+@dataclass
+class SalesBucket:
+    bucket_start: datetime
+    orders_count: int = 0
+    revenue: Decimal = Decimal("0")
+    paid_orders_count: int = 0
+    paid_revenue: Decimal = Decimal("0")
+    items_sold: int = 0
+
+
+def rollups_enabled() -> bool:
+    return bool(getattr(settings, "SALES_ROLLUPS_ENABLED", False))
+
+
+def _naive_utc(value: datetime | None) -> datetime | None:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(UTC).replace(tzinfo=None)
+
+
+def _floor(value: datetime, step: timedelta) -> datetime:
+    if step == _DAY:
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil(value: datetime, step: timedelta) -> datetime:
+    floored = _floor(value, step)
+    return floored if floored == value else floored + step
+
+
+def _plan_segments(
+    start: datetime | None, end: datetime | None, now: datetime
+) -> tuple[list[_RollupRange], list[_RollupRange], list[_RawRange]]:
+    """Returns (daily ranges, hourly ranges, raw ranges) covering [start, end]."""
+    open_from = _floor(now, _HOUR)
+    covered_end = open_from if end is None or end >= open_from else _floor(end, _HOUR)
+    covered_start = None if start is None else _ceil(start, _HOUR)
+
+    raw: list[_RawRange] = []
+    if covered_start is not None and covered_start >= covered_end:
+        return [], [], [(start, end, True)]
+
+    if start is not None and start < covered_start:
+        raw.append((start, covered_start, False))
+    raw.append((covered_end, end, True))
+
+    day_start = None if covered_start is None else _ceil(covered_start, _DAY)
+    day_end = _floor(covered_end, _DAY)
+    daily: list[_RollupRange] = []
+    hourly: list[_RollupRange] = []
+    if day_start is None or day_start < day_end:
+        daily.append((day_start, day_end))
+        if covered_start is not None and covered_start < day_start:
+            hourly.append((covered_start, day_start))
+        if day_end < covered_end:
+            hourly.append((day_end, covered_end))
+    elif covered_start is not None:
+        hourly.append((covered_start, covered_end))
+    return daily, hourly, raw
+
+
+async def _read_rollups(
+    db: AsyncSession, company_id: int, granularity: str, ranges: list[_RollupRange]
+) -> list[SalesBucket]:
+    if not ranges:
+        return []
+    conds = []
+    for lo, hi in ranges:
+        cond = SalesRollup.bucket_start < hi
+        if lo is not None:
+            cond = and_(SalesRollup.bucket_start >= lo, cond)
+        conds.append(cond)
+    res = await db.execute(
+        select(
+            SalesRollup.bucket_start,
+            SalesRollup.orders_count,
+            SalesRollup.revenue,
+            SalesRollup.paid_orders_count,
+            SalesRollup.paid_revenue,
+            SalesRollup.items_sold,
+        ).where(
+            SalesRollup.company_id == company_id,
+            SalesRollup.granularity == granularity,
+            or_(*conds),
+        )
+    )
+    return [SalesBucket(*row) for row in res.all()]
+
+
+async def _read_raw(db: AsyncSession, company_id: int, ranges: list[_RawRange]) -> list[SalesBucket]:
+    conds = []
+    for lo, hi, hi_inclusive in ranges:
+        parts = []
+        if lo is not None:
+            parts.append(Order.created_at >= lo)
+        if hi is not None:
+            parts.append(Order.created_at <= hi if hi_inclusive else Order.created_at < hi)
+        conds.append(and_(*parts) if parts else Order.id.isnot(None))
+    if not conds:
+        return []
+    is_paid = Order.status.in_(PAID_ORDER_STATUSES)
+    items_per_order = (
+        select(func.coalesce(func.sum(OrderItem.quantity), 0))
+        .where(OrderItem.order_id == Order.id)
+        .correlate(Order)
+        .scalar_subquery()
+    )
+    bucket = func.date_trunc(literal_column("'hour'"), Order.created_at).label("bucket")
+    res = await db.execute(
+        select(
+            bucket,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_amount), 0),
+            func.coalesce(func.sum(case((is_paid, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((is_paid, Order.total_amount), else_=0)), 0),
+            func.coalesce(func.sum(items_per_order), 0),
+        )
+        .where(Order.company_id == company_id, or_(*conds))
+        .group_by(bucket)
+    )
+    return [SalesBucket(*row) for row in res.all()]
+
+
+async def read_sales_buckets(
+    db: AsyncSession,
+    *,
+    company_id: int,
+    date_from: datetime | None,
+    date_to: datetime | None,
+    now: datetime | None = None,
+) -> list[SalesBucket]:
+    """Sales buckets for ``date_from <= created_at <= date_to`` (either bound may be None)."""
+    start = _naive_utc(date_from)
+    end = _naive_utc(date_to)
+    current = _naive_utc(now) or datetime.utcnow()
+    daily, hourly, raw = _plan_segments(start, end, current)
+
+    buckets: list[SalesBucket] = []
+    buckets.extend(await _read_rollups(db, company_id, "day", daily))
+    buckets.extend(await _read_rollups(db, company_id, "hour", hourly))
+    buckets.extend(await _read_raw(db, company_id, raw))
+    buckets.sort(key=lambda b: b.bucket_start)
+    return buckets
+
+
+def truncate_period(value: datetime, interval: str) -> datetime:
+    """Python twin of PostgreSQL date_trunc for day/week/month."""
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+async def rebuild_sales_rollups(
+    db: AsyncSession,
+    *,
+    company_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+) -> None:
+    """Backfill: recompute rollups for a company and/or day range (whole days)."""
+    start = _floor(_naive_utc(date_from), _DAY) if date_from else None
+    end = _ceil(_naive_utc(date_to), _DAY) if date_to else None
+    for stmt in rollup_refresh_statements(company_id=company_id, date_from=start, date_to=end):
+        await db.execute(stmt)
+    await db.commit()
+    logger.info(
+        "sales_rollups_rebuilt",
+        extra={"company_id": company_id, "date_from": str(start), "date_to": str(end)},
+    )
+
+
+__all__ = [
+    "SalesBucket",
+    "read_sales_buckets",
+    "rebuild_sales_rollups",
+    "rollups_enabled",
+    "truncate_period",
+]
@@ -1,18 +1,43 @@
 from __future__ import annotations
 
+import logging
+import time
 from calendar import monthrange
+from dataclasses import dataclass, field
 from datetime import UTC, datetime, timedelta
 from decimal import Decimal
+from typing import Any
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.subscriptions.catalog import get_plan_by_code
 from app.core.subscriptions.plan_catalog import get_plan as get_plan_legacy
 from app.core.subscriptions.plan_catalog import normalize_plan_id
 from app.core.subscriptions.state import get_company_subscription, is_subscription_active
 from app.models.billing import Subscription, WalletBalance, WalletTransaction
 
+logger = logging.getLogger(__name__)
+
+_MAX_REPORTED_FAILURES = 20
+
+try:
+    from prometheus_client import Counter, Histogram
+
+    _RENEWALS_TOTAL = Counter(
+        "smartsell_subscription_renewals_total",
+        "Subscriptions processed by the renewal engine",
+        ["outcome"],
+    )
+    _RENEWAL_CHUNK_DURATION = Histogram(
+        "smartsell_subscription_renewal_chunk_duration_seconds",
+        "Renewal engine: claim-to-commit duration per chunk",
+    )
+except Exception:  # pragma: no cover - optional metrics dependency
+    _RENEWALS_TOTAL = None
+    _RENEWAL_CHUNK_DURATION = None
+
 
 def _anchor_day_from_subscription(subscription: Subscription, *, fallback: datetime) -> int:
     anchor = getattr(subscription, "billing_anchor_day", None)
@@ -112,78 +137,232 @@ async def activate_plan(
     return sub
 
 
-async def renew_if_due(
-    db: AsyncSession,
-    *,
-    now: datetime | None = None,
-    grace_days: int = 3,
-) -> int:
-    now = now or datetime.now(UTC)
-    due_stmt = (
+@dataclass
+class RenewalRunStats:
+    processed: int = 0
+    renewed: int = 0
+    past_due: int = 0
+    failed: int = 0
+    chunks: int = 0
+    duration_s: float = 0.0
+    failures: list[dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Processed subscriptions per second."""
+        return self.processed / self.duration_s if self.duration_s > 0 else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "processed": self.processed,
+            "renewed": self.renewed,
+            "past_due": self.past_due,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "duration_s": round(self.duration_s, 3),
+            "throughput_per_s": round(self.throughput, 2),
+            "failures": self.failures[:_MAX_REPORTED_FAILURES],
+        }
+
+
+def _renewal_chunk_size(chunk_size: int | None) -> int:
+    value = chunk_size or getattr(settings, "SUBSCRIPTION_RENEWAL_CHUNK_SIZE", 500) or 500
+    return max(1, int(value))
+
+
+def _due_chunk_stmt(now: datetime, after_id: int, limit: int):
+    # Keyset по id: past_due-подписки остаются "due", поэтому offset/повторная выборка зациклились бы.
+    return (
         select(Subscription)
         .where(Subscription.deleted_at.is_(None))
         .where(Subscription.period_end.is_not(None))
         .where(Subscription.period_end <= now)
         .where(Subscription.status.in_(["active", "past_due", "trialing"]))
+        .where(Subscription.id > after_id)
+        .order_by(Subscription.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
     )
-    rows = (await db.execute(due_stmt)).scalars().all()
-    processed = 0
-    for sub in rows:
-        processed += 1
-        anchor_day = _anchor_day_from_subscription(sub, fallback=now)
-        if not sub.billing_anchor_day:
-            sub.billing_anchor_day = anchor_day
-
-        base_period_end = sub.period_end or now
-        plan = await get_plan_by_code(db, normalize_plan_id(sub.plan, default=sub.plan) or sub.plan)
-        price = Decimal(str(plan.price)) if plan else Decimal(sub.price or 0)
-        currency = plan.currency if plan else (sub.currency or "KZT")
-
-        wallet = (
-            await db.execute(select(WalletBalance).where(WalletBalance.company_id == sub.company_id).limit(1))
-        ).scalar_one_or_none()
-
-        if wallet is None or (wallet.currency or "").upper() != (currency or "").upper():
-            sub.status = "past_due"
-            sub.grace_until = _ceil_to_midnight_utc(base_period_end + timedelta(days=grace_days))
-            continue
 
+
+async def _plan_terms(db: AsyncSession, plan_code: str | None, cache: dict[str, tuple[Decimal, str] | None]):
+    """(price, currency) of a catalog plan, memoized for the run (plain values survive per-chunk commits)."""
+    code = normalize_plan_id(plan_code, default=plan_code) or plan_code or ""
+    if code not in cache:
+        plan = await get_plan_by_code(db, code)
+        cache[code] = (Decimal(str(plan.price)), plan.currency) if plan else None
+    return cache[code]
+
+
+async def _prefetch_wallets(db: AsyncSession, company_ids: set[int]) -> dict[int, WalletBalance]:
+    if not company_ids:
+        return {}
+    rows = (
+        (
+            await db.execute(
+                select(WalletBalance)
+                .where(WalletBalance.company_id.in_(company_ids))
+                .order_by(WalletBalance.company_id, WalletBalance.id)
+                .with_for_update()
+            )
+        )
+        .scalars()
+        .all()
+    )
+    wallets: dict[int, WalletBalance] = {}
+    for wallet in rows:
+        wallets.setdefault(wallet.company_id, wallet)
+    return wallets
+
+
+def _mark_past_due(sub: Subscription, base_period_end: datetime, grace_days: int) -> None:
+    sub.status = "past_due"
+    sub.grace_until = _ceil_to_midnight_utc(base_period_end + timedelta(days=grace_days))
+
+
+def _renew_one(
+    db: AsyncSession,
+    sub: Subscription,
+    wallet: WalletBalance | None,
+    terms: tuple[Decimal, str] | None,
+    *,
+    now: datetime,
+    grace_days: int,
+) -> bool:
+    """Applies renewal to ``sub`` in memory. Returns True if renewed, False if moved to past_due."""
+    anchor_day = _anchor_day_from_subscription(sub, fallback=now)
+    if not sub.billing_anchor_day:
+        sub.billing_anchor_day = anchor_day
+
+    base_period_end = sub.period_end or now
+    price, currency = terms if terms else (Decimal(sub.price or 0), sub.currency or "KZT")
+
+    if wallet is None or (wallet.currency or "").upper() != (currency or "").upper():
+        _mark_past_due(sub, base_period_end, grace_days)
+        return False
+
+    if price > 0:
+        before = wallet.balance or Decimal("0")
+        if before < price:
+            _mark_past_due(sub, base_period_end, grace_days)
+            return False
+        after = before - price
+        wallet.balance = after
+        db.add(
+            WalletTransaction(
+                wallet_id=wallet.id,
+                transaction_type="debit",
+                amount=price,
+                balance_before=before,
+                balance_after=after,
+                description="subscription_renewal",
+                reference_type="subscription",
+                reference_id=sub.id,
+            )
+        )
+
+    sub.status = "active"
+    sub.grace_until = None
+    sub.period_start = base_period_end
+    sub.period_end = _add_months_anchor(base_period_end, anchor_day, 1)
+    sub.next_billing_date = sub.period_end
+    return True
+
+
+async def renew_due_subscriptions(
+    db: AsyncSession,
+    *,
+    now: datetime | None = None,
+    grace_days: int = 3,
+    chunk_size: int | None = None,
+    commit_per_chunk: bool = False,
+) -> RenewalRunStats:
+    """
+    Renewal engine: due subscriptions are claimed in id-ordered chunks with
+    ``FOR UPDATE SKIP LOCKED`` (parallel runs never block each other), plans are
+    resolved once per run and wallets once per chunk.
+
+    With ``commit_per_chunk`` every chunk is its own transaction and a failing chunk
+    is rolled back and reported without stopping the run; otherwise the caller
+    commits and errors propagate.
+    """
+    now = now or datetime.now(UTC)
+    limit = _renewal_chunk_size(chunk_size)
+    stats = RenewalRunStats()
+    plan_cache: dict[str, tuple[Decimal, str] | None] = {}
+    started = time.perf_counter()
+    after_id = 0
+
+    while True:
+        subs = (await db.execute(_due_chunk_stmt(now, after_id, limit))).scalars().all()
+        if not subs:
+            break
+        after_id = subs[-1].id
+        chunk_ids = [sub.id for sub in subs]
+        stats.chunks += 1
+        chunk_started = time.perf_counter()
         try:
-            if price > 0:
-                before = wallet.balance or Decimal("0")
-                if before < price:
-                    raise ValueError("Insufficient wallet balance")
-                after = before - price
-                wallet.balance = after
-                trx = WalletTransaction(
-                    wallet_id=wallet.id,
-                    transaction_type="debit",
-                    amount=price,
-                    balance_before=before,
-                    balance_after=after,
-                    description="subscription_renewal",
-                    reference_type="subscription",
-                    reference_id=sub.id,
-                )
-                db.add(trx)
+            wallets = await _prefetch_wallets(db, {sub.company_id for sub in subs})
+            renewed = past_due = 0
+            for sub in subs:
+                terms = await _plan_terms(db, sub.plan, plan_cache)
+                if _renew_one(db, sub, wallets.get(sub.company_id), terms, now=now, grace_days=grace_days):
+                    renewed += 1
+                else:
+                    past_due += 1
+            if commit_per_chunk:
+                await db.commit()
+            else:
                 await db.flush()
-        except ValueError:
-            sub.status = "past_due"
-            sub.grace_until = _ceil_to_midnight_utc(base_period_end + timedelta(days=grace_days))
+        except Exception as exc:
+            if not commit_per_chunk:
+                raise
+            await db.rollback()
+            stats.failed += len(chunk_ids)
+            stats.failures.append({"subscription_ids": [chunk_ids[0], chunk_ids[-1]], "error": str(exc)[:300]})
+            _observe_renewals("failed", len(chunk_ids))
+            logger.warning(
+                "subscription_renewal_chunk_failed",
+                extra={"first_id": chunk_ids[0], "last_id": chunk_ids[-1], "error": str(exc)},
+            )
             continue
+        finally:
+            if _RENEWAL_CHUNK_DURATION is not None:
+                _RENEWAL_CHUNK_DURATION.observe(time.perf_counter() - chunk_started)
+
+        stats.processed += len(subs)
+        stats.renewed += renewed
+        stats.past_due += past_due
+        _observe_renewals("renewed", renewed)
+        _observe_renewals("past_due", past_due)
+
+    stats.duration_s = time.perf_counter() - started
+    if stats.chunks:
+        logger.info("subscription_renewal_run", extra=stats.as_dict())
+    return stats
+
+
+def _observe_renewals(outcome: str, count: int) -> None:
+    if _RENEWALS_TOTAL is not None and count:
+        _RENEWALS_TOTAL.labels(outcome=outcome).inc(count)
 
-        sub.status = "active"
-        sub.grace_until = None
-        sub.period_start = base_period_end
-        sub.period_end = _add_months_anchor(base_period_end, anchor_day, 1)
-        sub.next_billing_date = sub.period_end
 
-    return processed
+async def renew_if_due(
+    db: AsyncSession,
+    *,
+    now: datetime | None = None,
+    grace_days: int = 3,
+) -> int:
+    """Legacy entry point: one transaction owned (and committed) by the caller."""
+    stats = await renew_due_subscriptions(db, now=now, grace_days=grace_days)
+    return stats.processed
 
 
 __all__ = [
+    "RenewalRunStats",
     "activate_plan",
     "get_company_subscription",
     "is_subscription_active",
+    "renew_due_subscriptions",
     "renew_if_due",
 ]
@@ -2,21 +2,29 @@
 Excel import/export utilities for products and analytics.
 """
 
+import asyncio
 import os
 from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
 from typing import Any
 
 import pandas as pd
 from fastapi import UploadFile
-from sqlalchemy import and_, select
+from sqlalchemy import and_, func, literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.models import Order, Product, ProductStock
+from app.models.repricing import mark_repricing_dirty_stmt
 
 logger = get_logger(__name__)
 
+# Строк на один INSERT .. ON CONFLICT (держимся далеко от лимита bind-параметров PostgreSQL).
+_IMPORT_CHUNK_SIZE = 1000
+
 
 class ExcelProcessor:
     """Excel processing service"""
@@ -31,7 +39,7 @@ class ExcelProcessor:
         try:
             # Read Excel file
             contents = await file.read()
-            df = pd.read_excel(contents)
+            df = await asyncio.to_thread(pd.read_excel, BytesIO(contents))
 
             # Validate required columns
             required_columns = ["sku", "name", "price"]
@@ -41,89 +49,230 @@ class ExcelProcessor:
                 raise Exception(f"Missing required columns: {', '.join(missing_columns)}")
 
             results = {"total_rows": len(df), "created": 0, "updated": 0, "errors": []}
-
-            for index, row in df.iterrows():
-                try:
-                    # Validate and clean data
-                    sku = str(row["sku"]).strip()
-                    name = str(row["name"]).strip()
-                    price = float(row["price"])
-
-                    if not sku or not name or price <= 0:
-                        results["errors"].append(f"Row {index + 2}: Invalid data")
-                        continue
-
-                    # Check if product exists
-                    result = await db.execute(
-                        select(Product).where(
-                            and_(
-                                Product.company_id == company_id,
-                                Product.sku == sku,
-                                not Product.is_deleted,
-                            )
-                        )
-                    )
-                    existing_product = result.scalar_one_or_none()
-
-                    if existing_product:
-                        # Update existing product
-                        existing_product.name = name
-                        existing_product.price = price
-
-                        # Update optional fields
-                        if "category" in row and pd.notna(row["category"]):
-                            existing_product.category = str(row["category"]).strip()
-
-                        if "brand" in row and pd.notna(row["brand"]):
-                            existing_product.brand = str(row["brand"]).strip()
-
-                        if "description" in row and pd.notna(row["description"]):
-                            existing_product.description = str(row["description"]).strip()
-
-                        results["updated"] += 1
-                    else:
-                        # Create new product
-                        product_data = {
-                            "company_id": company_id,
-                            "sku": sku,
-                            "name": name,
-                            "price": price,
-                        }
-
-                        # Add optional fields
-                        if "category" in row and pd.notna(row["category"]):
-                            product_data["category"] = str(row["category"]).strip()
-
-                        if "brand" in row and pd.notna(row["brand"]):
-                            product_data["brand"] = str(row["brand"]).strip()
-
-                        if "description" in row and pd.notna(row["description"]):
-                            product_data["description"] = str(row["description"]).strip()
-
-                        if "kaspi_product_id" in row and pd.notna(row["kaspi_product_id"]):
-                            product_data["kaspi_product_id"] = str(row["kaspi_product_id"]).strip()
-
-                        product = Product(**product_data)
-                        db.add(product)
-                        results["created"] += 1
-
-                    # Handle stock if quantity column exists
-                    if "quantity" in row and pd.notna(row["quantity"]):
-                        quantity = int(row["quantity"])
-                        await self._update_product_stock(db, existing_product or product, quantity, company_id)
-
-                except Exception as e:
-                    results["errors"].append(f"Row {index + 2}: {str(e)}")
+            frame, row_errors = self._prepare_import_frame(df)
+
+            if not frame.empty:
+                records = frame.to_dict("records")
+                product_ids, chunk_errors = await self._upsert_products(db, company_id, records, results)
+                row_errors.extend(chunk_errors)
+                if product_ids:
+                    # bulk upsert идёт мимо ORM-флаша — помечаем компанию для repricing autorun явно
+                    await db.execute(mark_repricing_dirty_stmt([company_id], reason="import"))
+
+                stock_rows = [
+                    (rec["row"], product_ids[rec["sku"]], int(rec["quantity"]))
+                    for rec in records
+                    if rec.get("quantity") is not None and rec["sku"] in product_ids
+                ]
+                if stock_rows:
+                    row_errors.extend(await self._update_product_stocks(db, company_id, stock_rows))
 
             await db.commit()
 
-            logger.info(f"Product import completed: {results}")
+            results["errors"] = [message for _, message in sorted(row_errors, key=lambda item: item[0])]
+            logger.info(
+                f"Product import completed: total={results['total_rows']} created={results['created']} "
+                f"updated={results['updated']} errors={len(results['errors'])}"
+            )
             return results
 
         except Exception as e:
             logger.error(f"Excel import error: {e}")
             raise Exception(f"Failed to import products: {e}")
 
+    @staticmethod
+    def _prepare_import_frame(df: pd.DataFrame) -> tuple[pd.DataFrame, list[tuple[int, str]]]:
+        """
+        Column-wise cleanup/validation. Returns valid rows (one per SKU, last row wins)
+        and (row_number, message) errors; row numbers are 1-based Excel rows. SKUs are
+        stripped and upper-cased like ``Product._norm_required``, so dedupe and the
+        ON CONFLICT (company_id, sku) match what the ORM would have stored.
+        """
+
+        def _text(column: str) -> pd.Series:
+            if column not in df.columns:
+                return pd.Series(pd.NA, index=df.index, dtype="string")
+            values = df[column].astype("string").str.strip()
+            return values.mask(values == "")
+
+        frame = pd.DataFrame(
+            {
+                "row": df.index + 2,
+                "sku": _text("sku").str.upper().str.slice(0, 100),
+                "name": _text("name"),
+                "price": pd.to_numeric(df["price"], errors="coerce"),
+                "description": _text("description"),
+                "kaspi_product_id": _text("kaspi_product_id"),
+            },
+            index=df.index,
+        )
+
+        invalid = frame["sku"].isna() | frame["name"].isna() | frame["price"].isna() | (frame["price"] <= 0)
+        errors = [(int(row), f"Row {int(row)}: Invalid data") for row in frame.loc[invalid, "row"]]
+
+        if "quantity" in df.columns:
+            raw_quantity = df["quantity"]
+            quantity = pd.to_numeric(raw_quantity, errors="coerce")
+            bad_quantity = ~invalid & raw_quantity.notna() & (quantity.isna() | (quantity < 0))
+            errors.extend((int(row), f"Row {int(row)}: Invalid quantity") for row in frame.loc[bad_quantity, "row"])
+            invalid |= bad_quantity
+            frame["quantity"] = quantity.floordiv(1).astype("Int64")
+        else:
+            frame["quantity"] = pd.Series(pd.NA, index=df.index, dtype="Int64")
+
+        frame = frame.loc[~invalid].drop_duplicates(subset="sku", keep="last")
+        frame["name"] = frame["name"].str.slice(0, 255)
+        frame["price"] = frame["price"].round(2).map(lambda value: Decimal(str(value)))
+        # NA -> None, чтобы значения уходили в БД как NULL.
+        frame = frame.astype(object).where(frame.notna(), None)
+        return frame, errors
+
+    async def _upsert_products(
+        self, db: AsyncSession, company_id: int, records: list[dict[str, Any]], results: dict[str, Any]
+    ) -> tuple[dict[str, int], list[tuple[int, str]]]:
+        """
+        INSERT .. ON CONFLICT (company_id, sku) per chunk; a failing chunk is retried row by row.
+        SKUs of soft-deleted products are not touched and are reported as row errors.
+        """
+        product_ids: dict[str, int] = {}
+        errors: list[tuple[int, str]] = []
+
+        async def _apply(chunk: list[dict[str, Any]]) -> None:
+            rows = (await db.execute(self._product_upsert_stmt(company_id, chunk))).all()
+            for product_id, sku, inserted in rows:
+                product_ids[sku] = product_id
+                results["created" if inserted else "updated"] += 1
+            # Конфликт с удалённым (deleted_at) товаром: upsert строку не вернул
+            errors.extend(
+                (rec["row"], f"Row {rec['row']}: Product {rec['sku']} is deleted")
+                for rec in chunk
+                if rec["sku"] not in product_ids
+            )
+
+        for start in range(0, len(records), _IMPORT_CHUNK_SIZE):
+            chunk = records[start : start + _IMPORT_CHUNK_SIZE]
+            try:
+                async with db.begin_nested():
+                    await _apply(chunk)
+            except Exception:
+                for record in chunk:
+                    try:
+                        async with db.begin_nested():
+                            await _apply([record])
+                    except Exception as e:
+                        errors.append((record["row"], f"Row {record['row']}: {str(e)}"))
+        return product_ids, errors
+
+    @staticmethod
+    def _product_upsert_stmt(company_id: int, chunk: list[dict[str, Any]]):
+        now = datetime.utcnow()
+        stmt = pg_insert(Product).values(
+            [
+                {
+                    "company_id": company_id,
+                    "sku": rec["sku"],
+                    "name": rec["name"],
+                    "price": rec["price"],
+                    "description": rec["description"],
+                    "kaspi_product_id": rec["kaspi_product_id"],
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for rec in chunk
+            ]
+        )
+        return stmt.on_conflict_do_update(
+            constraint="uq_product_company_sku",
+            set_={
+                "name": stmt.excluded.name,
+                "price": stmt.excluded.price,
+                "description": func.coalesce(stmt.excluded.description, Product.description),
+                "updated_at": now,
+                "version": Product.version + 1,
+            },
+            where=Product.deleted_at.is_(None),
+        ).returning(Product.id, Product.sku, literal_column("(xmax = 0)"))
+
+    async def _update_product_stocks(
+        self, db: AsyncSession, company_id: int, stock_rows: list[tuple[int, int, int]]
+    ) -> list[tuple[int, str]]:
+        """
+        Set main-warehouse stock for imported products in bulk.
+
+        ``stock_rows`` are (row, product_id, quantity). The bulk upsert skips the
+        ProductStock before_insert/before_update validators, so their checks are
+        repeated here: a quantity below the already reserved amount is reported
+        as a row error instead of being written.
+        """
+
+        from app.models import Warehouse
+
+        result = await db.execute(select(Warehouse).where(and_(Warehouse.company_id == company_id, Warehouse.is_main)))
+        warehouse = result.scalars().first()
+
+        if not warehouse:
+            # Create main warehouse
+            warehouse = Warehouse(company_id=company_id, name="Основной склад", is_main=True)
+            db.add(warehouse)
+            await db.flush()
+
+        frame = pd.DataFrame(stock_rows, columns=["row", "product_id", "quantity"])
+        reserved: dict[int, int] = {}
+        product_ids = frame["product_id"].tolist()
+        for start in range(0, len(product_ids), _IMPORT_CHUNK_SIZE):
+            res = await db.execute(
+                select(ProductStock.product_id, ProductStock.reserved_quantity).where(
+                    ProductStock.warehouse_id == warehouse.id,
+                    ProductStock.product_id.in_(product_ids[start : start + _IMPORT_CHUNK_SIZE]),
+                )
+            )
+            reserved.update((int(pid), int(qty or 0)) for pid, qty in res.all())
+        frame["reserved"] = frame["product_id"].map(reserved).fillna(0).astype(int)
+        over_reserved = frame["reserved"] > frame["quantity"]
+        errors = [
+            (int(row), f"Row {int(row)}: reserved_quantity cannot exceed quantity")
+            for row in frame.loc[over_reserved, "row"]
+        ]
+        valid = frame.loc[~over_reserved, ["row", "product_id", "quantity"]].itertuples(index=False, name=None)
+        valid_rows = list(valid)
+
+        for start in range(0, len(valid_rows), _IMPORT_CHUNK_SIZE):
+            chunk = valid_rows[start : start + _IMPORT_CHUNK_SIZE]
+            stmt = pg_insert(ProductStock).values(
+                [
+                    {
+                        "product_id": int(product_id),
+                        "warehouse_id": warehouse.id,
+                        "quantity": int(quantity),
+                        "reserved_quantity": 0,
+                        "min_quantity": 0,
+                        "is_archived": False,
+                    }
+                    for _row, product_id, quantity in chunk
+                ]
+            )
+            try:
+                async with db.begin_nested():
+                    written = await db.execute(
+                        stmt.on_conflict_do_update(
+                            constraint="uq_product_warehouse",
+                            set_={"quantity": stmt.excluded.quantity},
+                            # резерв мог вырасти после проверки выше
+                            where=ProductStock.reserved_quantity <= stmt.excluded.quantity,
+                        ).returning(ProductStock.product_id)
+                    )
+                    written_ids = {int(pid) for pid in written.scalars().all()}
+            except Exception as e:
+                logger.error(f"Stock update error: {e}")
+                errors.extend((int(row), f"Row {int(row)}: {str(e)}") for row, _pid, _qty in chunk)
+                continue
+            errors.extend(
+                (int(row), f"Row {int(row)}: reserved_quantity cannot exceed quantity")
+                for row, product_id, _quantity in chunk
+                if int(product_id) not in written_ids
+            )
+        return errors
+
     async def export_products_to_excel(self, products: list[Product], include_stock: bool = True) -> str:
         """Export products to Excel file"""
 
@@ -275,44 +424,6 @@ class ExcelProcessor:
             logger.error(f"Orders Excel export error: {e}")
             raise Exception(f"Failed to export orders: {e}")
 
-    async def _update_product_stock(self, db: AsyncSession, product: Product, quantity: int, company_id: int):
-        """Update product stock during import"""
-
-        try:
-            # Get main warehouse (or create if doesn't exist)
-            from app.models import Warehouse
-
-            result = await db.execute(
-                select(Warehouse).where(and_(Warehouse.company_id == company_id, Warehouse.is_main))
-            )
-            warehouse = result.scalar_one_or_none()
-
-            if not warehouse:
-                # Create main warehouse
-                warehouse = Warehouse(company_id=company_id, name="Основной склад", is_main=True)
-                db.add(warehouse)
-                await db.flush()
-
-            # Get or create stock record
-            result = await db.execute(
-                select(ProductStock).where(
-                    and_(
-                        ProductStock.product_id == product.id,
-                        ProductStock.warehouse_id == warehouse.id,
-                    )
-                )
-            )
-            stock = result.scalar_one_or_none()
-
-            if stock:
-                stock.quantity = quantity
-            else:
-                stock = ProductStock(product_id=product.id, warehouse_id=warehouse.id, quantity=quantity)
-                db.add(stock)
-
-        except Exception as e:
-            logger.error(f"Stock update error: {e}")
-
 
 # Global Excel processor instance
 excel_processor = ExcelProcessor()
@@ -1,17 +1,21 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import os
+import socket
+from collections.abc import Awaitable, Callable
 from datetime import UTC, datetime, timedelta
 from time import perf_counter
 from typing import Any
 from uuid import uuid4
 
-from sqlalchemy import or_, select, text
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, func, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.core.db import session_scope
+from app.core.db import get_async_session_maker, session_scope
 from app.models.campaign import Campaign, CampaignProcessingStatus, Message
 from app.services.campaign_events import log_campaign_event
 
@@ -20,6 +24,22 @@ _NO_MESSAGES_ERROR = "campaign_has_no_messages"
 _QUEUE_LOCK_KEY = 0x43505051  # "CPPQ"
 logger = logging.getLogger(__name__)
 
+try:
+    from prometheus_client import Gauge, Histogram
+
+    _CAMPAIGN_QUEUE_DEPTH = Gauge(
+        "smartsell_campaign_queue_depth",
+        "Due QUEUED campaigns observed at claim time",
+    )
+    _CAMPAIGN_CLAIM_TO_FINISH = Histogram(
+        "smartsell_campaign_claim_to_finish_seconds",
+        "Latency from lease claim to processing finish per campaign",
+        ["status"],
+    )
+except Exception:  # pragma: no cover - optional metrics dependency
+    _CAMPAIGN_QUEUE_DEPTH = None
+    _CAMPAIGN_CLAIM_TO_FINISH = None
+
 
 def _utcnow() -> datetime:
     return datetime.now(UTC)
@@ -75,6 +95,11 @@ def _perform_campaign_action_sync(db: Session, campaign: Campaign) -> None:
     raise RuntimeError(_NO_MESSAGES_ERROR)
 
 
+def _lease_available(now: datetime):
+    """Campaign is not leased by a concurrent worker (or its lease has expired)."""
+    return or_(Campaign.lease_expires_at.is_(None), Campaign.lease_expires_at <= now)
+
+
 def _compute_backoff_delay(attempts: int) -> int:
     base_seconds = 30
     multiplier = 2.0
@@ -84,6 +109,163 @@ def _compute_backoff_delay(attempts: int) -> int:
     return min(max_seconds, max(base_seconds, delay))
 
 
+async def _process_locked_campaign(
+    db: AsyncSession,
+    campaign: Campaign,
+    *,
+    now: datetime,
+    checkpoint: Callable[[], Awaitable[None]] | None = None,
+) -> dict[str, Any]:
+    """
+    Run one QUEUED campaign through the state machine; the caller holds its lock/lease.
+    ``checkpoint`` is awaited once PROCESSING is flushed (the leased path commits there,
+    so the campaign action runs without row/advisory locks).
+    """
+    if not campaign.request_id:
+        campaign.request_id = str(uuid4())
+    request_id = campaign.request_id
+
+    attempts = int(campaign.attempts or 0)
+    max_attempts = int(settings.CAMPAIGN_MAX_ATTEMPTS)
+    if max_attempts > 0 and attempts >= max_attempts:
+        status_before = campaign.processing_status.value
+        campaign.processing_status = CampaignProcessingStatus.FAILED
+        campaign.last_error = "max_attempts_exceeded"
+        campaign.finished_at = _utcnow()
+        campaign.failed_at = campaign.finished_at
+        campaign.next_attempt_at = None
+        log_campaign_event(
+            event="campaign_worker_failed",
+            message="Campaign failed: max attempts exceeded",
+            request_id=request_id,
+            company_id=campaign.company_id,
+            campaign_id=campaign.id,
+            run_id=None,
+            status_before=status_before,
+            status_after=campaign.processing_status.value,
+            attempt=attempts,
+            meta={"reason": "max_attempts_exceeded"},
+            level="warning",
+        )
+        logger.warning(
+            "campaign_processing_max_attempts",
+            extra={"campaign_id": campaign.id, "request_id": request_id},
+        )
+        return {"campaign_id": campaign.id, "status": campaign.processing_status.value}
+
+    status_before = campaign.processing_status.value
+    campaign.processing_status = CampaignProcessingStatus.PROCESSING
+    campaign.started_at = now
+    campaign.finished_at = None
+    campaign.failed_at = None
+    campaign.last_error = None
+    campaign.next_attempt_at = None
+    await db.flush()
+    if checkpoint is not None:
+        await checkpoint()
+
+    started_at = perf_counter()
+    log_campaign_event(
+        event="campaign_worker_start",
+        message="Campaign processing started",
+        request_id=request_id,
+        company_id=campaign.company_id,
+        campaign_id=campaign.id,
+        run_id=None,
+        status_before=status_before,
+        status_after=campaign.processing_status.value,
+        attempt=attempts,
+    )
+
+    try:
+        await _perform_campaign_action(db, campaign)
+        campaign.processing_status = CampaignProcessingStatus.DONE
+        campaign.finished_at = _utcnow()
+        campaign.failed_at = None
+        campaign.next_attempt_at = None
+        duration_ms = int((perf_counter() - started_at) * 1000)
+        log_campaign_event(
+            event="campaign_worker_success",
+            message="Campaign processing succeeded",
+            request_id=request_id,
+            company_id=campaign.company_id,
+            campaign_id=campaign.id,
+            run_id=None,
+            status_before=CampaignProcessingStatus.PROCESSING.value,
+            status_after=campaign.processing_status.value,
+            attempt=attempts,
+            meta={"duration_ms": duration_ms},
+        )
+        return {"campaign_id": campaign.id, "status": campaign.processing_status.value}
+    except Exception as exc:
+        error_message = _truncate_error(str(exc))
+        attempts = int(campaign.attempts or 0) + 1
+        campaign.attempts = attempts
+        campaign.finished_at = _utcnow()
+        campaign.failed_at = campaign.finished_at
+        campaign.last_error = error_message
+        duration_ms = int((perf_counter() - started_at) * 1000)
+        logger.error(
+            "campaign_processing_failed",
+            extra={
+                "campaign_id": campaign.id,
+                "request_id": request_id,
+                "attempts": attempts,
+                "error": error_message,
+            },
+        )
+        if max_attempts > 0 and attempts >= max_attempts:
+            campaign.processing_status = CampaignProcessingStatus.FAILED
+            campaign.last_error = "max_attempts_exceeded"
+            campaign.next_attempt_at = None
+            log_campaign_event(
+                event="campaign_worker_failed",
+                message="Campaign failed: max attempts exceeded",
+                request_id=request_id,
+                company_id=campaign.company_id,
+                campaign_id=campaign.id,
+                run_id=None,
+                status_before=CampaignProcessingStatus.PROCESSING.value,
+                status_after=campaign.processing_status.value,
+                attempt=attempts,
+                meta={"duration_ms": duration_ms, "error": error_message},
+                level="warning",
+            )
+        else:
+            campaign.processing_status = CampaignProcessingStatus.QUEUED
+            campaign.queued_at = _utcnow()
+            campaign.next_attempt_at = now + timedelta(seconds=_compute_backoff_delay(attempts))
+            log_campaign_event(
+                event="campaign_worker_failed",
+                message="Campaign processing failed",
+                request_id=request_id,
+                company_id=campaign.company_id,
+                campaign_id=campaign.id,
+                run_id=None,
+                status_before=CampaignProcessingStatus.PROCESSING.value,
+                status_after=campaign.processing_status.value,
+                attempt=attempts,
+                meta={"duration_ms": duration_ms, "error": error_message},
+                level="warning",
+            )
+            log_campaign_event(
+                event="campaign_worker_retry_scheduled",
+                message="Campaign retry scheduled",
+                request_id=request_id,
+                company_id=campaign.company_id,
+                campaign_id=campaign.id,
+                run_id=None,
+                status_before=CampaignProcessingStatus.PROCESSING.value,
+                status_after=campaign.processing_status.value,
+                attempt=attempts,
+                meta={
+                    "next_attempt_at": campaign.next_attempt_at.isoformat() if campaign.next_attempt_at else None,
+                    "duration_ms": duration_ms,
+                },
+            )
+        return {"campaign_id": campaign.id, "status": campaign.processing_status.value}
+
+
 async def process_campaign_queue_once(
     db: AsyncSession,
     *,
@@ -99,6 +281,7 @@ async def process_campaign_queue_once(
         .where(
             Campaign.processing_status == CampaignProcessingStatus.QUEUED,
             or_(Campaign.next_attempt_at.is_(None), Campaign.next_attempt_at <= now),
+            _lease_available(now),
             Campaign.deleted_at.is_(None),
         )
         .order_by(Campaign.queued_at.asc().nullsfirst(), Campaign.id.asc())
@@ -121,151 +304,229 @@ async def process_campaign_queue_once(
             if campaign.processing_status != CampaignProcessingStatus.QUEUED:
                 continue
 
-            if not campaign.request_id:
-                campaign.request_id = str(uuid4())
-            request_id = campaign.request_id
+            results.append(await _process_locked_campaign(db, campaign, now=now))
+    return results
 
-            attempts = int(campaign.attempts or 0)
-            max_attempts = int(settings.CAMPAIGN_MAX_ATTEMPTS)
-            if max_attempts > 0 and attempts >= max_attempts:
-                status_before = campaign.processing_status.value
-                campaign.processing_status = CampaignProcessingStatus.FAILED
-                campaign.last_error = "max_attempts_exceeded"
-                campaign.finished_at = _utcnow()
-                campaign.failed_at = campaign.finished_at
-                campaign.next_attempt_at = None
-                log_campaign_event(
-                    event="campaign_worker_failed",
-                    message="Campaign failed: max attempts exceeded",
-                    request_id=request_id,
-                    company_id=campaign.company_id,
-                    campaign_id=campaign.id,
-                    run_id=None,
-                    status_before=status_before,
-                    status_after=campaign.processing_status.value,
-                    attempt=attempts,
-                    meta={"reason": "max_attempts_exceeded"},
-                    level="warning",
-                )
-                logger.warning(
-                    "campaign_processing_max_attempts",
-                    extra={"campaign_id": campaign.id, "request_id": request_id},
+
+def _lease_owner_token() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:12]}"
+
+
+async def _count_due_campaigns(db: AsyncSession, *, now: datetime) -> int:
+    res = await db.execute(
+        select(func.count(Campaign.id)).where(
+            Campaign.processing_status == CampaignProcessingStatus.QUEUED,
+            or_(Campaign.next_attempt_at.is_(None), Campaign.next_attempt_at <= now),
+            Campaign.deleted_at.is_(None),
+        )
+    )
+    return int(res.scalar() or 0)
+
+
+async def _claim_campaign_leases(
+    db: AsyncSession,
+    *,
+    owner: str,
+    limit: int,
+    now: datetime,
+    lease_seconds: int,
+) -> list[int]:
+    """
+    Lease up to ``limit`` due campaigns to ``owner``; row locks are held only for this statement.
+    PROCESSING campaigns whose lease expired were abandoned by a crashed worker and are reclaimed.
+    """
+    candidates = (
+        select(Campaign.id)
+        .where(
+            or_(
+                and_(
+                    Campaign.processing_status == CampaignProcessingStatus.QUEUED,
+                    or_(Campaign.next_attempt_at.is_(None), Campaign.next_attempt_at <= now),
+                ),
+                Campaign.processing_status == CampaignProcessingStatus.PROCESSING,
+            ),
+            _lease_available(now),
+            Campaign.deleted_at.is_(None),
+        )
+        .order_by(Campaign.queued_at.asc().nullsfirst(), Campaign.id.asc())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(Campaign)
+        .where(Campaign.id.in_(candidates.scalar_subquery()))
+        .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .returning(Campaign.id, Campaign.queued_at)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(stmt)).all()
+    rows.sort(key=lambda row: (row[1] is not None, row[1] or now, row[0]))
+    return [int(row[0]) for row in rows]
+
+
+async def _release_campaign_lease(db: AsyncSession, campaign_id: int, owner: str) -> None:
+    await db.execute(
+        update(Campaign)
+        .where(Campaign.id == campaign_id, Campaign.lease_owner == owner)
+        .values(lease_owner=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _heartbeat_campaign_lease(
+    session_factory: async_sessionmaker[AsyncSession],
+    campaign_id: int,
+    *,
+    owner: str,
+    lease_seconds: int,
+) -> None:
+    """Продлевает аренду, пока идёт обработка: долгий прогон не отдаёт кампанию другому воркеру."""
+    interval = max(1.0, lease_seconds / 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                await db.execute(
+                    update(Campaign)
+                    .where(Campaign.id == campaign_id, Campaign.lease_owner == owner)
+                    .values(
+                        lease_expires_at=func.greatest(
+                            Campaign.lease_expires_at, _utcnow() + timedelta(seconds=lease_seconds)
+                        )
+                    )
+                    .execution_options(synchronize_session=False)
                 )
-                results.append({"campaign_id": campaign.id, "status": campaign.processing_status.value})
-                continue
+                await db.commit()
+        except Exception:
+            logger.warning("campaign_lease_heartbeat_failed", extra={"campaign_id": campaign_id}, exc_info=True)
 
-            status_before = campaign.processing_status.value
-            campaign.processing_status = CampaignProcessingStatus.PROCESSING
-            campaign.started_at = now
-            campaign.finished_at = None
-            campaign.failed_at = None
-            campaign.last_error = None
-            campaign.next_attempt_at = None
-            await db.flush()
 
-            started_at = perf_counter()
-            log_campaign_event(
-                event="campaign_worker_start",
-                message="Campaign processing started",
-                request_id=request_id,
-                company_id=campaign.company_id,
-                campaign_id=campaign.id,
-                run_id=None,
-                status_before=status_before,
-                status_after=campaign.processing_status.value,
-                attempt=attempts,
+async def _process_leased_campaign(
+    session_factory: async_sessionmaker[AsyncSession],
+    campaign_id: int,
+    *,
+    owner: str,
+    now: datetime,
+    lease_seconds: int,
+) -> dict[str, Any] | None:
+    claimed_at = perf_counter()
+    result: dict[str, Any] | None = None
+    heartbeat: asyncio.Task | None = None
+    async with session_factory() as db:
+        try:
+            # Короткая транзакция: advisory xact lock (против process_campaign_queue_once) и
+            # условный UPDATE подтверждают аренду; commit в checkpoint снимает все блокировки.
+            if not await _try_campaign_advisory_lock(db, campaign_id):
+                await _release_campaign_lease(db, campaign_id, owner)
+                await db.commit()
+                return None
+            owned = await db.execute(
+                update(Campaign)
+                .where(
+                    Campaign.id == campaign_id,
+                    Campaign.lease_owner == owner,
+                    Campaign.lease_expires_at > now,
+                    Campaign.processing_status.in_(
+                        (CampaignProcessingStatus.QUEUED, CampaignProcessingStatus.PROCESSING)
+                    ),
+                )
+                .values(lease_expires_at=now + timedelta(seconds=lease_seconds))
+                .returning(Campaign.id)
+                .execution_options(synchronize_session=False)
             )
+            if owned.scalar_one_or_none() is None:
+                await db.rollback()
+                return None
+            campaign = (
+                await db.execute(
+                    select(Campaign).where(Campaign.id == campaign_id).execution_options(populate_existing=True)
+                )
+            ).scalar_one()
 
+            heartbeat = asyncio.create_task(
+                _heartbeat_campaign_lease(session_factory, campaign_id, owner=owner, lease_seconds=lease_seconds)
+            )
+            result = await _process_locked_campaign(db, campaign, now=now, checkpoint=db.commit)
+            campaign.lease_owner = None
+            campaign.lease_expires_at = None
+            await db.commit()
+        except Exception:
+            logger.exception("campaign_processing_lease_failed", extra={"campaign_id": campaign_id})
             try:
-                await _perform_campaign_action(db, campaign)
-                campaign.processing_status = CampaignProcessingStatus.DONE
-                campaign.finished_at = _utcnow()
-                campaign.failed_at = None
-                campaign.next_attempt_at = None
-                duration_ms = int((perf_counter() - started_at) * 1000)
-                log_campaign_event(
-                    event="campaign_worker_success",
-                    message="Campaign processing succeeded",
-                    request_id=request_id,
-                    company_id=campaign.company_id,
-                    campaign_id=campaign.id,
-                    run_id=None,
-                    status_before=CampaignProcessingStatus.PROCESSING.value,
-                    status_after=campaign.processing_status.value,
-                    attempt=attempts,
-                    meta={"duration_ms": duration_ms},
-                )
-                results.append({"campaign_id": campaign.id, "status": campaign.processing_status.value})
-            except Exception as exc:
-                error_message = _truncate_error(str(exc))
-                attempts = int(campaign.attempts or 0) + 1
-                campaign.attempts = attempts
-                campaign.finished_at = _utcnow()
-                campaign.failed_at = campaign.finished_at
-                campaign.last_error = error_message
-                duration_ms = int((perf_counter() - started_at) * 1000)
-                logger.error(
-                    "campaign_processing_failed",
-                    extra={
-                        "campaign_id": campaign.id,
-                        "request_id": request_id,
-                        "attempts": attempts,
-                        "error": error_message,
-                    },
-                )
-                if max_attempts > 0 and attempts >= max_attempts:
-                    campaign.processing_status = CampaignProcessingStatus.FAILED
-                    campaign.last_error = "max_attempts_exceeded"
-                    campaign.next_attempt_at = None
-                    log_campaign_event(
-                        event="campaign_worker_failed",
-                        message="Campaign failed: max attempts exceeded",
-                        request_id=request_id,
-                        company_id=campaign.company_id,
-                        campaign_id=campaign.id,
-                        run_id=None,
-                        status_before=CampaignProcessingStatus.PROCESSING.value,
-                        status_after=campaign.processing_status.value,
-                        attempt=attempts,
-                        meta={"duration_ms": duration_ms, "error": error_message},
-                        level="warning",
-                    )
-                else:
-                    campaign.processing_status = CampaignProcessingStatus.QUEUED
-                    campaign.queued_at = _utcnow()
-                    campaign.next_attempt_at = now + timedelta(seconds=_compute_backoff_delay(attempts))
-                    log_campaign_event(
-                        event="campaign_worker_failed",
-                        message="Campaign processing failed",
-                        request_id=request_id,
-                        company_id=campaign.company_id,
-                        campaign_id=campaign.id,
-                        run_id=None,
-                        status_before=CampaignProcessingStatus.PROCESSING.value,
-                        status_after=campaign.processing_status.value,
-                        attempt=attempts,
-                        meta={"duration_ms": duration_ms, "error": error_message},
-                        level="warning",
-                    )
-                    log_campaign_event(
-                        event="campaign_worker_retry_scheduled",
-                        message="Campaign retry scheduled",
-                        request_id=request_id,
-                        company_id=campaign.company_id,
-                        campaign_id=campaign.id,
-                        run_id=None,
-                        status_before=CampaignProcessingStatus.PROCESSING.value,
-                        status_after=campaign.processing_status.value,
-                        attempt=attempts,
-                        meta={
-                            "next_attempt_at": campaign.next_attempt_at.isoformat()
-                            if campaign.next_attempt_at
-                            else None,
-                            "duration_ms": duration_ms,
-                        },
-                    )
-                results.append({"campaign_id": campaign.id, "status": campaign.processing_status.value})
+                await db.rollback()
+                await _release_campaign_lease(db, campaign_id, owner)
+                await db.commit()
+            except Exception:  # pragma: no cover - lease expires on its own
+                pass
+            return None
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+                await asyncio.gather(heartbeat, return_exceptions=True)
+
+    if result is not None and _CAMPAIGN_CLAIM_TO_FINISH is not None:
+        _CAMPAIGN_CLAIM_TO_FINISH.labels(status=str(result.get("status"))).observe(perf_counter() - claimed_at)
+    return result
+
+
+async def process_campaign_queue_concurrently(
+    *,
+    limit: int = 10,
+    now: datetime | None = None,
+    concurrency: int | None = None,
+    session_factory: async_sessionmaker[AsyncSession] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Process claimed campaigns in parallel, each on its own pooled session.
+
+    Campaigns are leased (lease_owner/lease_expires_at) in one short statement,
+    so a slow campaign no longer holds up the rest of the batch and several
+    workers can drain the queue without a queue-wide advisory lock. Processing
+    itself runs without row locks: ownership is re-checked by a conditional
+    UPDATE, committed, and the lease is extended by a heartbeat during long runs.
+    A lease left by a crashed worker becomes claimable again after
+    CAMPAIGN_PROCESS_LEASE_SECONDS.
+    """
+    now = now or _utcnow()
+    session_factory = session_factory or get_async_session_maker()
+    batch_limit = min(int(settings.CAMPAIGN_PROCESS_BATCH), max(1, int(limit)))
+    workers = max(1, int(concurrency or settings.CAMPAIGN_PROCESS_CONCURRENCY))
+    lease_seconds = max(1, int(settings.CAMPAIGN_PROCESS_LEASE_SECONDS))
+    owner = _lease_owner_token()
+
+    async with session_factory() as db:
+        queue_depth = await _count_due_campaigns(db, now=now)
+        campaign_ids = await _claim_campaign_leases(
+            db, owner=owner, limit=batch_limit, now=now, lease_seconds=lease_seconds
+        )
+        await db.commit()
+
+    if _CAMPAIGN_QUEUE_DEPTH is not None:
+        _CAMPAIGN_QUEUE_DEPTH.set(queue_depth)
+    if not campaign_ids:
+        return []
 
+    semaphore = asyncio.Semaphore(workers)
+
+    async def _run(campaign_id: int) -> dict[str, Any] | None:
+        async with semaphore:
+            return await _process_leased_campaign(
+                session_factory, campaign_id, owner=owner, now=now, lease_seconds=lease_seconds
+            )
+
+    started_at = perf_counter()
+    outcomes = await asyncio.gather(*(_run(campaign_id) for campaign_id in campaign_ids))
+    results = [item for item in outcomes if item is not None]
+    logger.info(
+        "campaign_queue_concurrent_tick",
+        extra={
+            "queue_depth": queue_depth,
+            "claimed": len(campaign_ids),
+            "processed": len(results),
+            "concurrency": workers,
+            "duration_ms": int((perf_counter() - started_at) * 1000),
+        },
+    )
     return results
 
 
@@ -284,6 +545,7 @@ def process_campaign_queue_once_sync(
             .where(
                 Campaign.processing_status == CampaignProcessingStatus.QUEUED,
                 or_(Campaign.next_attempt_at.is_(None), Campaign.next_attempt_at <= now),
+                _lease_available(now),
                 Campaign.deleted_at.is_(None),
             )
             .order_by(Campaign.queued_at.asc().nullsfirst(), Campaign.id.asc())
@@ -451,4 +713,8 @@ def process_campaign_queue_once_sync(
         return results
 
 
-__all__ = ["process_campaign_queue_once", "process_campaign_queue_once_sync"]
+__all__ = [
+    "process_campaign_queue_concurrently",
+    "process_campaign_queue_once",
+    "process_campaign_queue_once_sync",
+]
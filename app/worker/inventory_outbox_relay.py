@@ -0,0 +1,565 @@
+"""
+Relay of InventoryOutbox events to their channels.
+
+Producers (``_outbox_enqueue_safe`` in models/warehouse.py,
+``RepricingService._emit_outbox``) only insert rows; one relay run drains them:
+  - claims due rows in batches (``FOR UPDATE SKIP LOCKED``) and leases them by
+    pushing ``next_attempt_at`` forward, so replicas never deliver the same row
+    and a crashed run's rows come back after the lease;
+  - claims per aggregate: a row is held back while an older pending row of the
+    same aggregate is locked or leased by another claim, so a replica never
+    delivers a newer event ahead of an older one still in flight;
+  - coalesces the rows of one aggregate (channel + aggregate_type + aggregate_id)
+    into a single delivery carrying the latest payload and all event types;
+  - delivers concurrently with a per-channel concurrency limit;
+  - retries failures with exponential backoff via ``next_attempt_at`` and parks
+    rows as ``failed`` once INVENTORY_OUTBOX_MAX_ATTEMPTS is exhausted;
+  - closes failed rows superseded by a later delivered event of the same
+    aggregate, so a retry never re-sends a stale payload over a newer one;
+  - archives outcomes with bulk UPDATEs per batch; ``sent`` rows are kept unless
+    INVENTORY_OUTBOX_RETENTION_DAYS opts in to purging them.
+
+Only channels with a handler are claimed. The producer channels
+(``webhook``/``erp``/``marketplace``/``task``) are delivered over HTTP to
+INVENTORY_OUTBOX_CHANNEL_WEBHOOK_URLS[channel], falling back to
+INVENTORY_OUTBOX_WEBHOOK_URL; ``register_outbox_handler`` overrides the
+transport of a channel. Events of channels without a handler stay pending.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Any
+
+from sqlalchemy import and_, delete, func, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import aliased
+
+from app.core.config import resolve_async_database_url, settings
+from app.core.logging import get_logger
+from app.models.inventory_outbox import InventoryOutbox
+
+logger = get_logger(__name__)
+
+try:
+    from prometheus_client import Counter, Histogram
+
+    _RELAY_EVENTS = Counter(
+        "smartsell_inventory_outbox_events_total",
+        "InventoryOutbox events processed by the relay",
+        ["channel", "status"],
+    )
+    _RELAY_BATCH_DURATION = Histogram(
+        "smartsell_inventory_outbox_batch_duration_seconds",
+        "InventoryOutbox relay: claim-to-archive duration per batch",
+    )
+except Exception:  # pragma: no cover - optional metrics dependency
+    _RELAY_EVENTS = None
+    _RELAY_BATCH_DURATION = None
+
+
+# -------- Handlers -------- #
+
+
+@dataclass
+class OutboxDelivery:
+    """Одна доставка: все захваченные события агрегата, слитые в одно."""
+
+    channel: str
+    aggregate_type: str
+    aggregate_id: str
+    event_ids: list[int]
+    event_types: list[str]
+    payload: dict[str, Any] | None
+    attempts: int = 0
+
+    def as_message(self) -> dict[str, Any]:
+        return {
+            "channel": self.channel,
+            "aggregate_type": self.aggregate_type,
+            "aggregate_id": self.aggregate_id,
+            "event_types": list(self.event_types),
+            "event_ids": list(self.event_ids),
+            "payload": self.payload,
+        }
+
+
+OutboxHandler = Callable[[OutboxDelivery], Awaitable[None]]
+
+_handlers: dict[str, OutboxHandler] = {}
+
+
+def register_outbox_handler(channel: str, handler: OutboxHandler) -> None:
+    """Подключить доставщик канала. Handler сигнализирует ошибку исключением."""
+    _handlers[channel] = handler
+
+
+def unregister_outbox_handler(channel: str) -> None:
+    _handlers.pop(channel, None)
+
+
+# Каналы, в которые пишут продюсеры: warehouse (erp/webhook), repricing (marketplace), low stock (task).
+WEBHOOK_CHANNELS: tuple[str, ...] = ("webhook", "erp", "marketplace", "task")
+
+
+def _webhook_url() -> str:
+    return str(getattr(settings, "INVENTORY_OUTBOX_WEBHOOK_URL", "") or "").strip()
+
+
+def _channel_webhook_urls() -> dict[str, str]:
+    """INVENTORY_OUTBOX_CHANNEL_WEBHOOK_URLS: ``erp=https://…,task=https://…``; прочие — общий URL."""
+    default = _webhook_url()
+    urls = {channel: default for channel in WEBHOOK_CHANNELS if default}
+    raw = str(getattr(settings, "INVENTORY_OUTBOX_CHANNEL_WEBHOOK_URLS", "") or "")
+    for part in raw.split(","):
+        name, _, url = part.partition("=")
+        name, url = name.strip(), url.strip()
+        if name and url:
+            urls[name] = url
+    return urls
+
+
+async def _deliver_webhook(delivery: OutboxDelivery, *, url: str) -> None:
+    import httpx
+
+    timeout = float(getattr(settings, "INVENTORY_OUTBOX_WEBHOOK_TIMEOUT_SECONDS", 10) or 10)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        resp = await client.post(url, json=delivery.as_message())
+    resp.raise_for_status()
+
+
+def _active_handlers() -> dict[str, OutboxHandler]:
+    handlers = dict(_handlers)
+    for channel, url in _channel_webhook_urls().items():
+        handlers.setdefault(channel, functools.partial(_deliver_webhook, url=url))
+    return handlers
+
+
+# -------- Settings -------- #
+
+
+def _int_setting(name: str, default: int) -> int:
+    try:
+        return int(getattr(settings, name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _channel_limits(channels: Iterable[str]) -> dict[str, int]:
+    """INVENTORY_OUTBOX_CHANNEL_CONCURRENCY: ``marketplace=4,webhook=8``; прочие — default."""
+    default = max(1, _int_setting("INVENTORY_OUTBOX_CONCURRENCY", 4))
+    overrides: dict[str, int] = {}
+    raw = str(getattr(settings, "INVENTORY_OUTBOX_CHANNEL_CONCURRENCY", "") or "")
+    for part in raw.split(","):
+        name, _, value = part.partition("=")
+        try:
+            overrides[name.strip()] = max(1, int(value))
+        except ValueError:
+            continue
+    return {channel: overrides.get(channel, default) for channel in channels}
+
+
+def compute_backoff_seconds(attempts: int) -> int:
+    base = max(1, _int_setting("INVENTORY_OUTBOX_BACKOFF_BASE_SECONDS", 30))
+    cap = max(base, _int_setting("INVENTORY_OUTBOX_BACKOFF_MAX_SECONDS", 3600))
+    return min(cap, base * 2 ** max(0, attempts - 1))
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+# -------- Claim / archive -------- #
+
+SUPERSEDED_ERROR = "superseded by a later delivered event"
+
+
+def _due_clause(now: datetime):
+    return and_(
+        InventoryOutbox.deleted_at.is_(None),
+        or_(
+            InventoryOutbox.status == "pending",
+            # failed с next_attempt_at — ждёт ретрая; без него — попытки исчерпаны
+            and_(InventoryOutbox.status == "failed", InventoryOutbox.next_attempt_at.isnot(None)),
+        ),
+        or_(InventoryOutbox.next_attempt_at.is_(None), InventoryOutbox.next_attempt_at <= now),
+    )
+
+
+async def supersede_failed_events(
+    session: AsyncSession,
+    *,
+    channels: list[str],
+    now: datetime | None = None,
+) -> int:
+    """
+    Закрыть failed-строки, после которых по тому же агрегату уже доставлено
+    более позднее событие: оно несло актуальный payload, ретрай старой строки
+    откатил бы получателя к устаревшему состоянию.
+    """
+    later = aliased(InventoryOutbox)
+    newer_sent = (
+        select(later.id)
+        .where(
+            later.channel == InventoryOutbox.channel,
+            later.aggregate_type == InventoryOutbox.aggregate_type,
+            later.aggregate_id == InventoryOutbox.aggregate_id,
+            later.status == "sent",
+            later.id > InventoryOutbox.id,
+        )
+        .exists()
+    )
+    result = await session.execute(
+        update(InventoryOutbox)
+        .where(
+            InventoryOutbox.status == "failed",
+            InventoryOutbox.deleted_at.is_(None),
+            InventoryOutbox.channel.in_(channels),
+            newer_sent,
+        )
+        .values(status="sent", processed_at=now or _utcnow(), next_attempt_at=None, last_error=SUPERSEDED_ERROR)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return int(result.rowcount or 0)
+
+
+async def claim_due_events(
+    session: AsyncSession,
+    *,
+    channels: list[str],
+    limit: int,
+    lease_seconds: int,
+    now: datetime | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Захватить до ``limit`` готовых событий: строки под чужой блокировкой
+    пропускаются (SKIP LOCKED), захваченные получают lease через next_attempt_at.
+
+    Захват идёт по агрегатам: строка не берётся, пока более старая pending-строка
+    того же агрегата вне нашей выборки (заблокирована чужим захватом или уже в
+    lease) не доставлена. Захваченные строки переводятся в pending, поэтому
+    «pending в будущем» — это lease, а failed с next_attempt_at — только backoff
+    (такие строки не блокируют агрегат: их закрывает ``supersede_failed_events``).
+    """
+    now = now or _utcnow()
+    locked = (
+        await session.execute(
+            select(
+                InventoryOutbox.id,
+                InventoryOutbox.channel,
+                InventoryOutbox.aggregate_type,
+                InventoryOutbox.aggregate_id,
+            )
+            .where(_due_clause(now), InventoryOutbox.channel.in_(channels))
+            .order_by(InventoryOutbox.id.asc())
+            .limit(max(1, int(limit)))
+            .with_for_update(skip_locked=True)
+        )
+    ).all()
+    locked_ids = [row.id for row in locked]
+    aggregates = {(row.channel, row.aggregate_type, row.aggregate_id) for row in locked}
+    blocked_from: dict[tuple[str, str, str], int] = {}
+    if aggregates:
+        blockers = await session.execute(
+            select(
+                InventoryOutbox.channel,
+                InventoryOutbox.aggregate_type,
+                InventoryOutbox.aggregate_id,
+                func.min(InventoryOutbox.id),
+            )
+            .where(
+                tuple_(InventoryOutbox.channel, InventoryOutbox.aggregate_type, InventoryOutbox.aggregate_id).in_(
+                    list(aggregates)
+                ),
+                InventoryOutbox.status == "pending",
+                InventoryOutbox.deleted_at.is_(None),
+                InventoryOutbox.id.notin_(locked_ids),
+            )
+            .group_by(InventoryOutbox.channel, InventoryOutbox.aggregate_type, InventoryOutbox.aggregate_id)
+        )
+        blocked_from = {(channel, agg_type, agg_id): first_id for channel, agg_type, agg_id, first_id in blockers}
+    claim_ids = [
+        row.id
+        for row in locked
+        if row.id < blocked_from.get((row.channel, row.aggregate_type, row.aggregate_id), row.id + 1)
+    ]
+    if not claim_ids:
+        await session.commit()
+        return []
+
+    stmt = (
+        update(InventoryOutbox)
+        .where(InventoryOutbox.id.in_(claim_ids))
+        .values(status="pending", next_attempt_at=now + timedelta(seconds=max(1, int(lease_seconds))))
+        .returning(
+            InventoryOutbox.id,
+            InventoryOutbox.channel,
+            InventoryOutbox.aggregate_type,
+            InventoryOutbox.aggregate_id,
+            InventoryOutbox.event_type,
+            InventoryOutbox.payload,
+            InventoryOutbox.attempts,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await session.execute(stmt)).mappings().all()
+    await session.commit()
+    return sorted((dict(row) for row in rows), key=lambda r: r["id"])
+
+
+def coalesce_events(rows: list[dict[str, Any]]) -> list[OutboxDelivery]:
+    """Слить события одного агрегата: последний payload, все типы событий по порядку."""
+    grouped: dict[tuple[str, str, str], OutboxDelivery] = {}
+    for row in rows:
+        key = (row["channel"], row["aggregate_type"], row["aggregate_id"])
+        delivery = grouped.get(key)
+        if delivery is None:
+            delivery = grouped[key] = OutboxDelivery(
+                channel=row["channel"],
+                aggregate_type=row["aggregate_type"],
+                aggregate_id=row["aggregate_id"],
+                event_ids=[],
+                event_types=[],
+                payload=None,
+            )
+        delivery.event_ids.append(row["id"])
+        if row["event_type"] not in delivery.event_types:
+            delivery.event_types.append(row["event_type"])
+        delivery.payload = row["payload"]
+        delivery.attempts = max(delivery.attempts, int(row["attempts"] or 0))
+    return list(grouped.values())
+
+
+async def _archive(
+    session: AsyncSession,
+    *,
+    sent_ids: list[int],
+    failures: list[tuple[OutboxDelivery, str]],
+    now: datetime,
+) -> int:
+    """Записать итоги пачки: один UPDATE на отправленные, bulk UPDATE по PK на ошибки."""
+    exhausted = 0
+    if sent_ids:
+        await session.execute(
+            update(InventoryOutbox)
+            .where(InventoryOutbox.id.in_(sent_ids))
+            .values(status="sent", processed_at=now, next_attempt_at=None, last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+    if failures:
+        max_attempts = max(1, _int_setting("INVENTORY_OUTBOX_MAX_ATTEMPTS", 8))
+        params: list[dict[str, Any]] = []
+        for delivery, error in failures:
+            attempts = delivery.attempts + 1
+            retry_at = now + timedelta(seconds=compute_backoff_seconds(attempts)) if attempts < max_attempts else None
+            if retry_at is None:
+                exhausted += len(delivery.event_ids)
+            params.extend(
+                {
+                    "id": event_id,
+                    "status": "failed",
+                    "attempts": attempts,
+                    "next_attempt_at": retry_at,
+                    "last_error": error,
+                }
+                for event_id in delivery.event_ids
+            )
+        await session.execute(update(InventoryOutbox), params)
+    await session.commit()
+    return exhausted
+
+
+async def purge_sent_events(
+    session: AsyncSession,
+    *,
+    retention_days: int,
+    chunk_size: int = 5000,
+    now: datetime | None = None,
+) -> int:
+    """Удалить доставленные события старше ``retention_days`` чанками (opt-in; 0 — не удалять)."""
+    if retention_days <= 0:
+        return 0
+    cutoff = (now or _utcnow()) - timedelta(days=retention_days)
+    total = 0
+    while True:
+        chunk = (
+            select(InventoryOutbox.id)
+            .where(InventoryOutbox.status == "sent", InventoryOutbox.processed_at < cutoff)
+            .limit(max(1, int(chunk_size)))
+            .scalar_subquery()
+        )
+        result = await session.execute(
+            delete(InventoryOutbox).where(InventoryOutbox.id.in_(chunk)).execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        deleted = int(result.rowcount or 0)
+        total += deleted
+        if deleted < chunk_size:
+            return total
+
+
+# -------- Relay run -------- #
+
+
+@dataclass
+class RelayResult:
+    claimed: int = 0
+    deliveries: int = 0
+    sent: int = 0
+    failed: int = 0
+    exhausted: int = 0
+    superseded: int = 0
+    purged: int = 0
+    batches: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "claimed": self.claimed,
+            "deliveries": self.deliveries,
+            "sent": self.sent,
+            "failed": self.failed,
+            "exhausted": self.exhausted,
+            "superseded": self.superseded,
+            "purged": self.purged,
+            "batches": self.batches,
+            "errors": list(self.errors),
+        }
+
+
+async def _deliver_one(
+    delivery: OutboxDelivery,
+    handler: OutboxHandler,
+    semaphore: asyncio.Semaphore,
+    timeout: float,
+) -> str | None:
+    async with semaphore:
+        try:
+            await asyncio.wait_for(handler(delivery), timeout=timeout or None)
+            return None
+        except Exception as exc:
+            logger.warning(
+                "inventory_outbox_delivery_failed channel=%s aggregate=%s:%s error=%s",
+                delivery.channel,
+                delivery.aggregate_type,
+                delivery.aggregate_id,
+                exc,
+            )
+            return f"{type(exc).__name__}: {exc}"[:1000]
+
+
+async def relay_outbox_events(
+    session_factory: async_sessionmaker[AsyncSession],
+    *,
+    batch_size: int | None = None,
+    max_batches: int | None = None,
+    now: Callable[[], datetime] = _utcnow,
+) -> dict[str, Any]:
+    """
+    Разобрать очередь InventoryOutbox: пачки забираются, пока очередь не опустеет
+    или не исчерпан ``max_batches``; затем, если задан retention, чистятся старые
+    доставленные строки.
+    """
+    handlers = _active_handlers()
+    result = RelayResult()
+    batch_size = max(1, int(batch_size or _int_setting("INVENTORY_OUTBOX_BATCH_SIZE", 500)))
+    if max_batches is None:
+        max_batches = _int_setting("INVENTORY_OUTBOX_MAX_BATCHES", 20)
+    lease_seconds = max(1, _int_setting("INVENTORY_OUTBOX_LEASE_SECONDS", 300))
+    timeout = float(_int_setting("INVENTORY_OUTBOX_DELIVERY_TIMEOUT_SECONDS", 30))
+
+    if handlers:
+        semaphores = {channel: asyncio.Semaphore(limit) for channel, limit in _channel_limits(handlers.keys()).items()}
+        channels = sorted(handlers)
+        while not max_batches or result.batches < max_batches:
+            started = perf_counter()
+            async with session_factory() as session:
+                # До захвата: устаревшие failed-строки не должны уйти в ретрай поверх свежей доставки.
+                result.superseded += await supersede_failed_events(session, channels=channels, now=now())
+                rows = await claim_due_events(
+                    session, channels=channels, limit=batch_size, lease_seconds=lease_seconds, now=now()
+                )
+                if not rows:
+                    break
+                deliveries = coalesce_events(rows)
+                errors = await asyncio.gather(
+                    *(_deliver_one(d, handlers[d.channel], semaphores[d.channel], timeout) for d in deliveries)
+                )
+                sent_ids = [i for d, err in zip(deliveries, errors, strict=True) if err is None for i in d.event_ids]
+                failures = [(d, err) for d, err in zip(deliveries, errors, strict=True) if err is not None]
+                exhausted = await _archive(session, sent_ids=sent_ids, failures=failures, now=now())
+
+            result.batches += 1
+            result.claimed += len(rows)
+            result.deliveries += len(deliveries)
+            result.sent += len(sent_ids)
+            result.failed += len(rows) - len(sent_ids)
+            result.exhausted += exhausted
+            result.errors.extend(f"{d.channel}:{d.aggregate_type}:{d.aggregate_id}: {err}" for d, err in failures[:5])
+            if _RELAY_EVENTS is not None:
+                for d, err in zip(deliveries, errors, strict=True):
+                    _RELAY_EVENTS.labels(channel=d.channel, status="sent" if err is None else "failed").inc(
+                        len(d.event_ids)
+                    )
+            if _RELAY_BATCH_DURATION is not None:
+                _RELAY_BATCH_DURATION.observe(perf_counter() - started)
+            if len(rows) < batch_size:
+                break
+
+    retention_days = _int_setting("INVENTORY_OUTBOX_RETENTION_DAYS", 0)
+    async with session_factory() as session:
+        result.purged = await purge_sent_events(session, retention_days=retention_days, now=now())
+
+    result.errors = result.errors[:20]
+    return result.as_dict()
+
+
+async def run_inventory_outbox_relay_async() -> dict[str, Any]:
+    # Свой engine на запуск: APScheduler гоняет каждый запуск в новом event loop.
+    async_url, _source, _fp = resolve_async_database_url(settings)
+    engine = create_async_engine(async_url, echo=False, pool_pre_ping=True)
+    try:
+        summary = await relay_outbox_events(async_sessionmaker(engine, expire_on_commit=False))
+    finally:
+        await engine.dispose()
+    if summary["claimed"] or summary["purged"] or summary["superseded"]:
+        logger.info(
+            "Inventory outbox relay finished: claimed=%s deliveries=%s sent=%s failed=%s exhausted=%s "
+            "superseded=%s purged=%s",
+            summary["claimed"],
+            summary["deliveries"],
+            summary["sent"],
+            summary["failed"],
+            summary["exhausted"],
+            summary["superseded"],
+            summary["purged"],
+        )
+    return summary
+
+
+def run_inventory_outbox_relay() -> dict[str, Any]:
+    """Точка входа для APScheduler."""
+    return asyncio.run(run_inventory_outbox_relay_async())
+
+
+__all__ = [
+    "SUPERSEDED_ERROR",
+    "WEBHOOK_CHANNELS",
+    "OutboxDelivery",
+    "OutboxHandler",
+    "claim_due_events",
+    "coalesce_events",
+    "compute_backoff_seconds",
+    "purge_sent_events",
+    "register_outbox_handler",
+    "relay_outbox_events",
+    "run_inventory_outbox_relay",
+    "supersede_failed_events",
+    "unregister_outbox_handler",
+]
@@ -24,6 +24,12 @@ from app.services.kaspi_feed_upload_service import (
     should_block_feed_upload_url,
     update_feed_upload_job,
 )
+from app.worker.shard_leases import (
+    JOB_KASPI_FEED_UPLOAD_POLL,
+    ShardAssignment,
+    acquire_shards,
+    worker_sharding_enabled,
+)
 
 logger = get_logger(__name__)
 
@@ -104,7 +110,9 @@ async def _release_poll_lock(session: AsyncSession) -> None:
     await session.execute(text("SELECT pg_advisory_unlock(:k)").bindparams(k=_KASPI_FEED_UPLOAD_POLL_LOCK_KEY))
 
 
-async def _fetch_due_uploads(session: AsyncSession, *, limit: int) -> list[KaspiFeedUpload]:
+async def _fetch_due_uploads(
+    session: AsyncSession, *, limit: int, shards: ShardAssignment | None = None
+) -> list[KaspiFeedUpload]:
     now = _utcnow()
     stmt = (
         select(KaspiFeedUpload)
@@ -113,6 +121,8 @@ async def _fetch_due_uploads(session: AsyncSession, *, limit: int) -> list[Kaspi
         .order_by(KaspiFeedUpload.next_attempt_at.asc().nullsfirst(), KaspiFeedUpload.created_at.asc())
         .limit(limit)
     )
+    if shards is not None:
+        stmt = stmt.where(shards.where(KaspiFeedUpload.company_id))
     result = await session.execute(stmt)
     return list(result.scalars().all())
 
@@ -312,14 +322,20 @@ async def run_kaspi_feed_upload_poll_async() -> dict[str, Any]:
     AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
     lock_session = AsyncSessionLocal()
+    sharded = worker_sharding_enabled()
     try:
-        acquired = await _try_poll_lock(lock_session)
+        shards: ShardAssignment | None = None
+        if sharded:
+            shards = await acquire_shards(lock_session, JOB_KASPI_FEED_UPLOAD_POLL)
+            acquired = bool(shards.shards)
+        else:
+            acquired = await _try_poll_lock(lock_session)
         if not acquired:
             summary["skipped"] = 1
             return summary
 
         limit = int(getattr(settings, "KASPI_FEED_UPLOAD_BATCH_SIZE", 50) or 50)
-        uploads = await _fetch_due_uploads(lock_session, limit=limit)
+        uploads = await _fetch_due_uploads(lock_session, limit=limit, shards=shards)
         summary["queued"] = len(uploads)
         if not uploads:
             return summary
@@ -413,10 +429,11 @@ async def run_kaspi_feed_upload_poll_async() -> dict[str, Any]:
         )
         return summary
     finally:
-        try:
-            await _release_poll_lock(lock_session)
-        except Exception:
-            pass
+        if not sharded:
+            try:
+                await _release_poll_lock(lock_session)
+            except Exception:
+                pass
         await lock_session.close()
         await engine.dispose()
 
@@ -26,6 +26,12 @@ from app.services.kaspi_import_run_utils import (
     is_terminal_import_status,
     normalize_import_status,
 )
+from app.worker.shard_leases import (
+    JOB_KASPI_IMPORT_POLL,
+    ShardAssignment,
+    acquire_shards,
+    worker_sharding_enabled,
+)
 
 logger = get_logger(__name__)
 
@@ -74,7 +80,9 @@ async def _release_poll_lock(session: AsyncSession) -> None:
     await session.execute(text("SELECT pg_advisory_unlock(:k)").bindparams(k=_KASPI_IMPORT_POLL_LOCK_KEY))
 
 
-async def _fetch_due_runs(session: AsyncSession, *, limit: int) -> list[KaspiImportRun]:
+async def _fetch_due_runs(
+    session: AsyncSession, *, limit: int, shards: ShardAssignment | None = None
+) -> list[KaspiImportRun]:
     now = _utcnow()
     stmt = (
         select(KaspiImportRun)
@@ -88,6 +96,8 @@ async def _fetch_due_runs(session: AsyncSession, *, limit: int) -> list[KaspiImp
         .order_by(KaspiImportRun.next_poll_at.asc().nullsfirst(), KaspiImportRun.created_at.asc())
         .limit(limit)
     )
+    if shards is not None:
+        stmt = stmt.where(shards.where(KaspiImportRun.company_id))
     result = await session.execute(stmt)
     return list(result.scalars().all())
 
@@ -203,14 +213,21 @@ async def run_kaspi_import_poll_async() -> dict[str, Any]:
     AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
     lock_session = AsyncSessionLocal()
+    sharded = worker_sharding_enabled()
     try:
-        acquired = await _try_poll_lock(lock_session)
+        shards: ShardAssignment | None = None
+        if sharded:
+            # реплики делят тенантов по арендованным шардам вместо одной глобальной блокировки
+            shards = await acquire_shards(lock_session, JOB_KASPI_IMPORT_POLL)
+            acquired = bool(shards.shards)
+        else:
+            acquired = await _try_poll_lock(lock_session)
         if not acquired:
             summary["locked"] = 1
             return summary
 
         limit = int(settings.KASPI_IMPORT_POLL_BATCH_SIZE)
-        runs = await _fetch_due_runs(lock_session, limit=limit)
+        runs = await _fetch_due_runs(lock_session, limit=limit, shards=shards)
         if not runs:
             return summary
 
@@ -294,10 +311,11 @@ async def run_kaspi_import_poll_async() -> dict[str, Any]:
                 summary["failed"] += 1
         return summary
     finally:
-        try:
-            await _release_poll_lock(lock_session)
-        except Exception:
-            pass
+        if not sharded:
+            try:
+                await _release_poll_lock(lock_session)
+            except Exception:
+                pass
         await lock_session.close()
         await engine.dispose()
 
@@ -0,0 +1,425 @@
+"""
+Batched delivery of campaign messages over pooled SMTP connections.
+
+Instead of one APScheduler job (and one SMTP handshake) per message, a single
+delivery run:
+  - claims PENDING messages in chunks (``FOR UPDATE SKIP LOCKED`` -> SENDING),
+    so several worker replicas can drain the same queue without double sends;
+    a claim is a lease (``claimed_at``): SENDING messages whose lease expired
+    (worker crashed mid-batch) are reclaimed by the next run;
+  - sends them with bounded concurrency over a pool of authenticated SMTP
+    connections that are reused across messages and batches;
+  - throttles each SMTP provider (host:port) with a shared token bucket;
+  - writes SENT/FAILED statuses (and provider message ids) back with bulk
+    statements per batch.
+
+Enabled with CAMPAIGN_DELIVERY_BATCH_ENABLED=1 (see app/core/config.py).
+"""
+
+from __future__ import annotations
+
+import logging
+import queue
+import smtplib
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from email.utils import make_msgid
+from time import perf_counter
+from typing import Any
+
+from sqlalchemy import and_, bindparam, or_, select, update
+
+from app.models.campaign import Campaign, Message, MessageStatus
+from app.worker import scheduler_worker as sw
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import Counter, Histogram
+
+    _DELIVERY_MESSAGES = Counter(
+        "smartsell_campaign_delivery_messages_total",
+        "Campaign messages processed by the batched delivery worker",
+        ["status"],
+    )
+    _DELIVERY_SMTP_CONNECTIONS = Counter(
+        "smartsell_campaign_delivery_smtp_connections_total",
+        "SMTP connections opened by the batched delivery worker",
+    )
+    _DELIVERY_BATCH_DURATION = Histogram(
+        "smartsell_campaign_delivery_batch_duration_seconds",
+        "Batched delivery: claim-to-status-update duration per batch",
+    )
+except Exception:  # pragma: no cover - optional metrics dependency
+    _DELIVERY_MESSAGES = None
+    _DELIVERY_SMTP_CONNECTIONS = None
+    _DELIVERY_BATCH_DURATION = None
+
+
+# -------- Rate limiting per provider -------- #
+
+
+class _TokenBucket:
+    """Потокобезопасный token bucket: ``rate`` токенов в секунду, ёмкость ``burst``."""
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst if burst is not None else rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait_s = (1.0 - self._tokens) / self.rate
+            time.sleep(wait_s)
+
+
+_rate_limiters: dict[str, _TokenBucket] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def _provider_key(smtp: sw.SmtpConfig) -> str:
+    return f"{smtp.host}:{smtp.port}"
+
+
+def _get_rate_limiter(smtp: sw.SmtpConfig, rate_per_second: float) -> _TokenBucket:
+    """Один bucket на SMTP-провайдера на процесс — общий для всех запусков воркера."""
+    key = _provider_key(smtp)
+    with _rate_limiters_lock:
+        bucket = _rate_limiters.get(key)
+        if bucket is None or bucket.rate != float(rate_per_second):
+            bucket = _TokenBucket(rate_per_second)
+            _rate_limiters[key] = bucket
+        return bucket
+
+
+# -------- SMTP connection pool -------- #
+
+
+class SmtpConnectionPool:
+    """
+    Пул авторизованных SMTP-соединений.
+
+    Соединение берётся из пула на время одной отправки и возвращается обратно;
+    при ошибке соединение закрывается (следующая отправка откроет новое).
+    Размер пула ограничивает число одновременно открытых соединений.
+    """
+
+    def __init__(
+        self,
+        smtp: sw.SmtpConfig,
+        *,
+        size: int,
+        connect: Callable[[sw.SmtpConfig], smtplib.SMTP] | None = None,
+    ) -> None:
+        self._smtp = smtp
+        self._connect = connect or sw._open_smtp_connection
+        self._idle: queue.LifoQueue[smtplib.SMTP] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, int(size)))
+        self._all: set[smtplib.SMTP] = set()
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _acquire(self) -> smtplib.SMTP:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        server = self._connect(self._smtp)
+        with self._lock:
+            self._all.add(server)
+            self.opened += 1
+        if _DELIVERY_SMTP_CONNECTIONS is not None:
+            _DELIVERY_SMTP_CONNECTIONS.inc()
+        return server
+
+    def _discard(self, server: smtplib.SMTP) -> None:
+        with self._lock:
+            self._all.discard(server)
+        try:
+            server.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        self._slots.acquire()
+        try:
+            server = self._acquire()
+            try:
+                yield server
+            except Exception:
+                self._discard(server)
+                raise
+            else:
+                self._idle.put(server)
+        finally:
+            self._slots.release()
+
+    def send(self, msg: Any) -> str | None:
+        """
+        Отправить письмо через соединение из пула (один повтор при разрыве соединения).
+        Возвращает Message-ID письма — его сохраняем как provider_message_id.
+        """
+        try:
+            with self.connection() as server:
+                server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            with self.connection() as server:
+                server.send_message(msg)
+        return msg["Message-ID"]
+
+    def close(self) -> None:
+        with self._lock:
+            servers = list(self._all)
+            self._all.clear()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for server in servers:
+            try:
+                server.quit()
+            except Exception:
+                try:
+                    server.close()
+                except Exception:
+                    pass
+
+
+# -------- Claim / status updates -------- #
+
+
+@dataclass
+class _ClaimedMessage:
+    id: int
+    recipient: str
+    content: str
+    campaign_id: int
+    subject: str = "Campaign"
+
+
+@dataclass
+class DeliveryResult:
+    claimed: int = 0
+    sent: int = 0
+    failed: int = 0
+    batches: int = 0
+    smtp_connections: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "claimed": self.claimed,
+            "sent": self.sent,
+            "failed": self.failed,
+            "batches": self.batches,
+            "smtp_connections": self.smtp_connections,
+            "errors": list(self.errors),
+        }
+
+
+def _lease_seconds() -> int:
+    return max(1, int(getattr(sw.settings, "CAMPAIGN_DELIVERY_LEASE_SECONDS", 600) or 600))
+
+
+def claim_pending_messages(
+    db,
+    *,
+    limit: int,
+    campaign_ids: list[int] | None = None,
+    lease_seconds: int | None = None,
+) -> list[_ClaimedMessage]:
+    """
+    Атомарно перевести до ``limit`` PENDING-сообщений в SENDING и вернуть их.
+    Строки, заблокированные другим воркером, пропускаются (SKIP LOCKED).
+    SENDING-сообщения с истёкшим lease (``claimed_at`` старше ``lease_seconds``)
+    забираются повторно.
+    """
+    now = sw._utcnow_aware()
+    lease_cutoff = now - timedelta(seconds=lease_seconds or _lease_seconds())
+    claimable = or_(
+        Message.status == MessageStatus.PENDING,
+        and_(Message.status == MessageStatus.SENDING, Message.claimed_at <= lease_cutoff),
+    )
+    candidates = (
+        select(Message.id)
+        .where(claimable, Message.deleted_at.is_(None))
+        .order_by(Message.id.asc())
+        .limit(max(1, int(limit)))
+        .with_for_update(skip_locked=True)
+    )
+    if campaign_ids:
+        candidates = candidates.where(Message.campaign_id.in_(campaign_ids))
+
+    stmt = (
+        update(Message)
+        .where(Message.id.in_(candidates.scalar_subquery()))
+        .values(status=MessageStatus.SENDING, claimed_at=now)
+        .returning(Message.id, Message.recipient, Message.content, Message.campaign_id)
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.execute(stmt).all()
+    claimed = [
+        _ClaimedMessage(id=row[0], recipient=row[1], content=row[2] or "", campaign_id=row[3])
+        for row in sorted(rows, key=lambda r: r[0])
+    ]
+    if claimed:
+        campaign_id_set = {m.campaign_id for m in claimed}
+        titles = dict(db.execute(select(Campaign.id, Campaign.title).where(Campaign.id.in_(campaign_id_set))).all())
+        for item in claimed:
+            title = titles.get(item.campaign_id)
+            item.subject = f"Campaign: {title}" if title else "Campaign"
+    db.commit()
+    return claimed
+
+
+def _apply_statuses(db, *, sent: dict[int, str | None], failures: dict[int, str]) -> None:
+    """``sent``: message_id -> provider_message_id; ``failures``: message_id -> текст ошибки."""
+    now = sw._utcnow_naive()
+    if sent:
+        messages = Message.__table__
+        db.execute(
+            update(messages)
+            .where(messages.c.id == bindparam("message_id"), messages.c.status == MessageStatus.SENDING)
+            .values(
+                status=MessageStatus.SENT,
+                sent_at=now,
+                error_message=None,
+                provider_message_id=bindparam("provider_message_id"),
+            ),
+            [
+                {"message_id": message_id, "provider_message_id": provider_id}
+                for message_id, provider_id in sent.items()
+            ],
+        )
+    if failures:
+        db.execute(
+            update(Message),
+            [
+                {"id": message_id, "status": MessageStatus.FAILED, "error_message": error}
+                for message_id, error in failures.items()
+            ],
+        )
+    db.commit()
+
+
+# -------- Delivery run -------- #
+
+
+def _send_one(
+    pool: SmtpConnectionPool,
+    limiter: _TokenBucket,
+    smtp: sw.SmtpConfig,
+    item: _ClaimedMessage,
+) -> tuple[int, str | None, str | None]:
+    """Вернуть (message_id, provider_message_id, ошибка)."""
+    msg = sw._build_email(smtp, item.recipient, item.subject, item.content)
+    if not msg["Message-ID"]:
+        domain = (smtp.from_email or smtp.user or "").rpartition("@")[2] or None
+        msg["Message-ID"] = make_msgid(domain=domain)
+    try:
+        limiter.acquire()
+        provider_id = sw._smtp_send_with_retry(lambda: pool.send(msg))
+        return item.id, provider_id, None
+    except Exception as e:
+        logger.error("Ошибка отправки message_id=%s: %s", item.id, e)
+        return item.id, None, sw._truncate_error(f"{type(e).__name__}: {e}")
+
+
+def deliver_pending_messages(
+    *,
+    campaign_ids: list[int] | None = None,
+    batch_size: int | None = None,
+    max_batches: int | None = None,
+    concurrency: int | None = None,
+    rate_per_second: float | None = None,
+    connect: Callable[[sw.SmtpConfig], smtplib.SMTP] | None = None,
+) -> dict[str, Any]:
+    """
+    Разобрать очередь PENDING-сообщений пачками.
+
+    Пачки забираются, пока очередь не опустеет или не исчерпан лимит
+    ``max_batches``; SMTP-соединения переиспользуются между пачками.
+    """
+    settings = sw.settings
+    batch_size = int(batch_size or getattr(settings, "CAMPAIGN_DELIVERY_BATCH_SIZE", 200) or 200)
+    if max_batches is None:
+        max_batches = int(getattr(settings, "CAMPAIGN_DELIVERY_MAX_BATCHES", 50) or 0)
+    concurrency = max(1, int(concurrency or getattr(settings, "CAMPAIGN_DELIVERY_MAX_CONCURRENCY", 4) or 1))
+    if rate_per_second is None:
+        rate_per_second = float(getattr(settings, "CAMPAIGN_DELIVERY_RATE_PER_SECOND", 0) or 0)
+
+    smtp = sw._load_smtp_config()
+    limiter = _get_rate_limiter(smtp, rate_per_second)
+    pool = SmtpConnectionPool(smtp, size=concurrency, connect=connect)
+    result = DeliveryResult()
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="smtp-delivery") as executor:
+            while not max_batches or result.batches < max_batches:
+                started = perf_counter()
+                with sw.db_session() as db:
+                    claimed = claim_pending_messages(db, limit=batch_size, campaign_ids=campaign_ids)
+                    if not claimed:
+                        break
+                    result.batches += 1
+                    result.claimed += len(claimed)
+
+                    outcomes = list(executor.map(lambda item: _send_one(pool, limiter, smtp, item), claimed))
+                    sent = {message_id: provider_id for message_id, provider_id, error in outcomes if error is None}
+                    failures = {message_id: error for message_id, _pid, error in outcomes if error is not None}
+                    _apply_statuses(db, sent=sent, failures=failures)
+
+                result.sent += len(sent)
+                result.failed += len(failures)
+                result.errors.extend(f"message_id={mid}: {err}" for mid, err in list(failures.items())[:5])
+                if _DELIVERY_MESSAGES is not None:
+                    _DELIVERY_MESSAGES.labels(status="sent").inc(len(sent))
+                    _DELIVERY_MESSAGES.labels(status="failed").inc(len(failures))
+                if _DELIVERY_BATCH_DURATION is not None:
+                    _DELIVERY_BATCH_DURATION.observe(perf_counter() - started)
+                logger.info(
+                    "Campaign delivery batch: claimed=%s sent=%s failed=%s",
+                    len(claimed),
+                    len(sent),
+                    len(failures),
+                )
+                if len(claimed) < batch_size:
+                    break
+    finally:
+        result.smtp_connections = pool.opened
+        pool.close()
+
+    result.errors = result.errors[:20]
+    return result.as_dict()
+
+
+def run_message_delivery() -> None:
+    """Точка входа для APScheduler."""
+    summary = deliver_pending_messages()
+    if summary["claimed"]:
+        logger.info(
+            "Campaign delivery run finished: claimed=%s sent=%s failed=%s batches=%s smtp_connections=%s",
+            summary["claimed"],
+            summary["sent"],
+            summary["failed"],
+            summary["batches"],
+            summary["smtp_connections"],
+        )
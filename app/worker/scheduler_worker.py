@@ -35,7 +35,7 @@ from email.mime.text import MIMEText
 from typing import Any
 from uuid import uuid4
 
-from sqlalchemy import func, select, text, update
+from sqlalchemy import delete, func, select, text, update
 
 try:
     from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
@@ -113,11 +113,21 @@ if SessionLocal is None:
 
 from app.models.campaign import Campaign, CampaignProcessingStatus, Message, MessageStatus
 from app.models.company import Company
-from app.models.repricing import RepricingRule, RepricingRun
+from app.models.repricing import RepricingDirtyCompany, RepricingRule, RepricingRun, mark_repricing_dirty_stmt
 from app.services.campaign_cleanup import campaign_cleanup_run
 from app.services.campaign_runner import enqueue_due_campaigns_sync
 from app.services.repricing import run_reprcing_for_company
 from app.worker import campaign_processing
+from app.worker.shard_leases import (
+    JOB_KASPI_FEED_UPLOAD_POLL,
+    JOB_KASPI_IMPORT_POLL,
+    JOB_REPRICING_AUTORUN,
+    ShardAssignment,
+    acquire_shards,
+    release_shards_stmts,
+    run_worker_shard_heartbeat_async,
+    worker_sharding_enabled,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -337,25 +347,30 @@ def _build_email(smtp: SmtpConfig, recipient: str, subject: str, plain_text: str
     return msg
 
 
-def _send_via_smtp(smtp: SmtpConfig, msg: MIMEMultipart) -> None:
+def _open_smtp_connection(smtp: SmtpConfig) -> smtplib.SMTP:
+    """Открыть SMTP-соединение: connect + STARTTLS + login (если заданы учётные данные)."""
     if not smtp.host or not smtp.port:
         raise RuntimeError("SMTP не настроен: проверьте SMTP_HOST и SMTP_PORT")
 
-    def _configure(server: smtplib.SMTP) -> None:
+    if smtp.use_ssl:
+        server: smtplib.SMTP = smtplib.SMTP_SSL(host=smtp.host, port=smtp.port, timeout=smtp.connect_timeout)
+    else:
+        server = smtplib.SMTP(host=smtp.host, port=smtp.port, timeout=smtp.connect_timeout)
+    try:
         server.timeout = smtp.op_timeout
-        if smtp.use_tls:
+        if smtp.use_tls and not smtp.use_ssl:
             server.starttls()
         if smtp.user and smtp.password:
             server.login(smtp.user, smtp.password)
+    except Exception:
+        server.close()
+        raise
+    return server
 
-    if smtp.use_ssl:
-        with smtplib.SMTP_SSL(host=smtp.host, port=smtp.port, timeout=smtp.connect_timeout) as server:
-            _configure(server)
-            server.send_message(msg)
-    else:
-        with smtplib.SMTP(host=smtp.host, port=smtp.port, timeout=smtp.connect_timeout) as server:
-            _configure(server)
-            server.send_message(msg)
+
+def _send_via_smtp(smtp: SmtpConfig, msg: MIMEMultipart) -> None:
+    with _open_smtp_connection(smtp) as server:
+        server.send_message(msg)
 
 
 def _smtp_send_with_retry(
@@ -392,6 +407,11 @@ _JOB_ID_KASPI_IMPORT_POLL = "kaspi_import_poll"
 _JOB_ID_KASPI_FEED_UPLOAD_POLL = "kaspi_feed_upload_poll"
 _JOB_ID_CAMPAIGN_CLEANUP = "campaign_cleanup"
 _JOB_ID_REPRICING_AUTORUN = "repricing_autorun"
+_JOB_ID_MESSAGE_DELIVERY = "message_delivery"
+_JOB_ID_MESSAGE_DELIVERY_NOW = "message_delivery_now"
+_JOB_ID_INVENTORY_OUTBOX_RELAY = "inventory_outbox_relay"
+_JOB_ID_WORKER_SHARD_HEARTBEAT = "worker_shard_heartbeat"
+_JOB_ID_CATALOG_IMPORT_SWEEP = "catalog_import_sweep"
 
 
 # События планировщика для детального лога
@@ -490,10 +510,53 @@ def _schedule_message_send(message_id: int) -> bool:
     return True
 
 
+def _batch_delivery_enabled() -> bool:
+    return bool(getattr(settings, "CAMPAIGN_DELIVERY_BATCH_ENABLED", False))
+
+
+def _run_message_delivery() -> None:
+    from app.worker.message_delivery import run_message_delivery
+
+    run_message_delivery()
+
+
+def _schedule_message_delivery() -> bool:
+    """
+    Поставить один немедленный запуск батч-доставки (вместо job на каждое сообщение).
+    Повторные вызовы, пока запуск не начался, коалесцируются в один.
+    """
+    get_job = getattr(scheduler, "get_job", None)
+    if callable(get_job) and get_job(_JOB_ID_MESSAGE_DELIVERY_NOW) is not None:
+        return False
+    scheduler.add_job(
+        _run_message_delivery,
+        trigger=DateTrigger(run_date=_utcnow_aware()),
+        id=_JOB_ID_MESSAGE_DELIVERY_NOW,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=60,
+    )
+    logger.info("Запланирован батч-запуск доставки сообщений (job_id=%s)", _JOB_ID_MESSAGE_DELIVERY_NOW)
+    return True
+
+
 def _schedule_pending_messages_for_campaigns(campaign_ids: list[int]) -> int:
     if not campaign_ids:
         return 0
 
+    if _batch_delivery_enabled():
+        with db_session() as db:
+            pending = int(
+                db.query(func.count(Message.id))
+                .filter(Message.campaign_id.in_(campaign_ids), Message.status == MessageStatus.PENDING)
+                .scalar()
+                or 0
+            )
+        if pending:
+            _schedule_message_delivery()
+        return pending
+
     scheduled = 0
     with db_session() as db:
         rows = (
@@ -608,12 +671,57 @@ def run_campaign_cleanup_job() -> None:
     asyncio.run(run_campaign_cleanup_job_async())
 
 
+async def run_catalog_import_sweep_job_async() -> int:
+    """Stale CatalogImportBatch (in-process импорт умер вместе с процессом) → FAILED."""
+    from app.core.db import async_session_maker
+    from app.services.kaspi_catalog_import import fail_stale_catalog_imports
+
+    async with async_session_maker() as db:
+        swept = await fail_stale_catalog_imports(db)
+        await db.commit()
+    if swept:
+        logger.info("Catalog import sweep finished: failed_stale=%s", swept)
+    return swept
+
+
+def run_catalog_import_sweep_job() -> None:
+    asyncio.run(run_catalog_import_sweep_job_async())
+
+
 def _repricing_autorun_enabled() -> bool:
     import os
 
     return _env_truthy(os.getenv("REPRICING_AUTORUN_ENABLED", "0"))
 
 
+def _repricing_dirty_only() -> bool:
+    import os
+
+    return _env_truthy(os.getenv("REPRICING_AUTORUN_DIRTY_ONLY", "1"), default=True)
+
+
+def _repricing_autorun_time_budget() -> float:
+    import os
+
+    try:
+        return max(0.0, float(os.getenv("REPRICING_AUTORUN_TIME_BUDGET_SECONDS", "300") or 0))
+    except ValueError:
+        return 300.0
+
+
+async def _requeue_repricing_dirty(db, company_id: int) -> None:
+    """Неудачный прогон: компания остаётся грязной, но уходит в хвост очереди (без зацикливания на ней)."""
+    try:
+        await db.execute(
+            update(RepricingDirtyCompany)
+            .where(RepricingDirtyCompany.company_id == company_id)
+            .values(dirty_since=_utcnow_naive(), reason="failed")
+        )
+        await db.commit()
+    except Exception:
+        await db.rollback()
+
+
 async def run_repricing_autorun_job_async(*, now: datetime | None = None) -> dict | None:
     if not _scheduler_enabled():
         logger.info("Repricing autorun skipped: ENABLE_SCHEDULER=False")
@@ -622,18 +730,26 @@ async def run_repricing_autorun_job_async(*, now: datetime | None = None) -> dic
         logger.info("Repricing autorun skipped: REPRICING_AUTORUN_ENABLED=False")
         return None
 
-    acquired, lock_db = _try_repricing_advisory_lock()
-    if not acquired:
-        logger.info("repricing_autorun_lock_busy: scheduler lock busy")
-        return None
+    sharded = worker_sharding_enabled()
+    lock_db = None
+    if not sharded:
+        acquired, lock_db = _try_repricing_advisory_lock()
+        if not acquired:
+            logger.info("repricing_autorun_lock_busy: scheduler lock busy")
+            return None
 
     request_id = f"repricing-{uuid4()}"
     run_now = now or _utcnow_naive()
+    dirty_only = _repricing_dirty_only()
+    time_budget = _repricing_autorun_time_budget()
     summary = {
         "request_id": request_id,
         "eligible": 0,
+        "dirty": 0,
+        "clean": 0,
         "processed": 0,
         "skipped": 0,
+        "deferred": 0,
         "failed": 0,
         "errors": [],
     }
@@ -642,23 +758,41 @@ async def run_repricing_autorun_job_async(*, now: datetime | None = None) -> dic
         from app.core.db import async_session_maker
 
         async with async_session_maker() as db:
+            shards = ShardAssignment.unsharded(JOB_REPRICING_AUTORUN)
+            if sharded:
+                shards = await acquire_shards(db, JOB_REPRICING_AUTORUN)
+                if not shards.shards:
+                    logger.info("repricing_autorun_no_shards: all tenant shards leased by other workers")
+                    return summary
+            dirty_since = func.min(RepricingDirtyCompany.dirty_since).label("dirty_since")
             rule_rows = await db.execute(
                 select(
                     RepricingRule.company_id,
                     func.max(func.coalesce(RepricingRule.cooldown_seconds, 0)).label("cooldown_seconds"),
+                    dirty_since,
                 )
                 .select_from(RepricingRule)
                 .join(Company, Company.id == RepricingRule.company_id)
+                .outerjoin(RepricingDirtyCompany, RepricingDirtyCompany.company_id == RepricingRule.company_id)
                 .where(
                     RepricingRule.enabled.is_(True),
                     RepricingRule.is_active.is_(True),
                     Company.is_active.is_(True),
                     Company.deleted_at.is_(None),
+                    shards.where(RepricingRule.company_id),
                 )
                 .group_by(RepricingRule.company_id)
+                # давно ждущие компании первыми: при нехватке бюджета хвост уходит в следующий запуск
+                .order_by(dirty_since.asc().nullslast(), RepricingRule.company_id.asc())
             )
-            cooldowns = {row[0]: int(row[1] or 0) for row in rule_rows.all()}
-            summary["eligible"] = len(cooldowns)
+            rows = rule_rows.all()
+            summary["eligible"] = len(rows)
+            if dirty_only:
+                cooldowns = {row[0]: int(row[1] or 0) for row in rows if row[2] is not None}
+                summary["clean"] = len(rows) - len(cooldowns)
+            else:
+                cooldowns = {row[0]: int(row[1] or 0) for row in rows}
+            summary["dirty"] = len(cooldowns)
 
             if not cooldowns:
                 return summary
@@ -670,7 +804,12 @@ async def run_repricing_autorun_job_async(*, now: datetime | None = None) -> dic
             )
             last_runs = {row[0]: row[1] for row in last_run_rows.all()}
 
-            for company_id, cooldown in cooldowns.items():
+            started_at = time.monotonic()
+            for index, (company_id, cooldown) in enumerate(cooldowns.items()):
+                # хотя бы одна компания за запуск, чтобы очередь двигалась при любом бюджете
+                if index and time_budget and time.monotonic() - started_at >= time_budget:
+                    summary["deferred"] = len(cooldowns) - index
+                    break
                 last_finished = last_runs.get(company_id)
                 if cooldown and last_finished:
                     age_seconds = (run_now - last_finished).total_seconds()
@@ -678,19 +817,40 @@ async def run_repricing_autorun_job_async(*, now: datetime | None = None) -> dic
                         summary["skipped"] += 1
                         continue
                 try:
-                    await run_reprcing_for_company(
+                    if dirty_only:
+                        # снимаем отметку в той же транзакции: правки во время прогона пометят компанию заново
+                        await db.execute(
+                            delete(RepricingDirtyCompany).where(RepricingDirtyCompany.company_id == company_id)
+                        )
+                    run = await run_reprcing_for_company(
                         db,
                         company_id,
                         triggered_by_user_id=None,
                         dry_run=False,
                         request_id=f"{request_id}:{company_id}",
                     )
+                    if dirty_only and (run.changed or run.failed):
+                        # цены ещё сходятся к границам правил — остаёмся в очереди, но в её хвосте
+                        await db.execute(mark_repricing_dirty_stmt([company_id], reason="pending"))
                     await db.commit()
                     summary["processed"] += 1
                 except Exception as exc:
                     await db.rollback()
                     summary["failed"] += 1
                     summary["errors"].append(f"company_id={company_id}: {exc}")
+                    if dirty_only:
+                        await _requeue_repricing_dirty(db, company_id)
+
+            if dirty_only:
+                logger.info(
+                    "repricing_autorun_done request_id=%s eligible=%s dirty=%s clean=%s processed=%s deferred=%s",
+                    request_id,
+                    summary["eligible"],
+                    summary["dirty"],
+                    summary["clean"],
+                    summary["processed"],
+                    summary["deferred"],
+                )
 
         return summary
     finally:
@@ -702,6 +862,36 @@ def run_repricing_autorun_job() -> None:
     asyncio.run(run_repricing_autorun_job_async())
 
 
+def _sharded_jobs() -> list[str]:
+    """Шардированные задачи, зарегистрированные в этом воркере."""
+    jobs: list[str] = []
+    if _repricing_autorun_enabled():
+        jobs.append(JOB_REPRICING_AUTORUN)
+    if should_register_kaspi_import_poll():
+        jobs.append(JOB_KASPI_IMPORT_POLL)
+    if should_register_kaspi_feed_upload_poll():
+        jobs.append(JOB_KASPI_FEED_UPLOAD_POLL)
+    return jobs
+
+
+def run_worker_shard_heartbeat_job() -> None:
+    jobs = _sharded_jobs()
+    if jobs:
+        asyncio.run(run_worker_shard_heartbeat_async(jobs))
+
+
+def _release_worker_shards() -> None:
+    """Отдать аренды шардов при остановке, чтобы реплики подхватили их без ожидания TTL."""
+    if not worker_sharding_enabled():
+        return
+    try:
+        with db_session() as db:
+            for stmt in release_shards_stmts():
+                db.execute(stmt)
+    except Exception as e:
+        logger.warning("Не удалось освободить шарды воркера: %s", e)
+
+
 # -------- Публичные сервисные функции воркера -------- #
 
 
@@ -717,6 +907,17 @@ def enqueue_campaign(campaign_id: int) -> dict[str, int]:
         if not campaign:
             raise ValueError(f"Campaign {campaign_id} не найдена")
 
+        if _batch_delivery_enabled():
+            pending = int(
+                db.query(func.count(Message.id))
+                .filter(Message.campaign_id == campaign_id, Message.status == MessageStatus.PENDING)
+                .scalar()
+                or 0
+            )
+            if pending:
+                _schedule_message_delivery()
+            return {"enqueued": pending, "failed": 0}
+
         messages = (
             db.query(Message).filter(Message.campaign_id == campaign_id, Message.status == MessageStatus.PENDING).all()
         )
@@ -732,6 +933,77 @@ def enqueue_campaign(campaign_id: int) -> dict[str, int]:
     return {"enqueued": enqueued, "failed": failed}
 
 
+def _add_message_delivery_job() -> None:
+    """Периодический батч-доставщик: добирает PENDING-сообщения, оставшиеся после тиков кампаний."""
+    if not _batch_delivery_enabled():
+        logger.debug("Message delivery job skipped: CAMPAIGN_DELIVERY_BATCH_ENABLED=False")
+        return
+    interval_seconds = int(getattr(settings, "CAMPAIGN_DELIVERY_INTERVAL_SECONDS", 30) or 30)
+    scheduler.add_job(
+        _run_message_delivery,
+        trigger=IntervalTrigger(seconds=interval_seconds),
+        id=_JOB_ID_MESSAGE_DELIVERY,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=60,
+    )
+    logger.info("Message delivery job added (interval=%ds)", interval_seconds)
+
+
+def _add_inventory_outbox_relay_job() -> None:
+    """Периодический relay InventoryOutbox: доставляет накопленные события по каналам."""
+    if not getattr(settings, "INVENTORY_OUTBOX_RELAY_ENABLED", False):
+        logger.debug("Inventory outbox relay job skipped: INVENTORY_OUTBOX_RELAY_ENABLED=False")
+        return
+    from app.worker.inventory_outbox_relay import run_inventory_outbox_relay
+
+    interval_seconds = int(getattr(settings, "INVENTORY_OUTBOX_RELAY_INTERVAL_SECONDS", 15) or 15)
+    scheduler.add_job(
+        run_inventory_outbox_relay,
+        trigger=IntervalTrigger(seconds=interval_seconds),
+        id=_JOB_ID_INVENTORY_OUTBOX_RELAY,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=60,
+    )
+    logger.info("Inventory outbox relay job added (interval=%ds)", interval_seconds)
+
+
+def _add_catalog_import_sweep_job() -> None:
+    """Периодический sweep зависших импортов каталога (фоновые импорты идут in-process)."""
+    interval_seconds = int(getattr(settings, "KASPI_CATALOG_IMPORT_SWEEP_INTERVAL_SECONDS", 300) or 300)
+    scheduler.add_job(
+        run_catalog_import_sweep_job,
+        trigger=IntervalTrigger(seconds=interval_seconds),
+        id=_JOB_ID_CATALOG_IMPORT_SWEEP,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=120,
+    )
+    logger.info("Catalog import sweep job added (interval=%ds)", interval_seconds)
+
+
+def _add_worker_shard_heartbeat_job() -> None:
+    """Heartbeat аренд шардов: держит их между редкими запусками задач (repricing — раз в час)."""
+    if not worker_sharding_enabled() or not _sharded_jobs():
+        logger.debug("Worker shard heartbeat job skipped: no sharded jobs")
+        return
+    interval_seconds = int(getattr(settings, "WORKER_SHARD_HEARTBEAT_SECONDS", 30) or 30)
+    scheduler.add_job(
+        run_worker_shard_heartbeat_job,
+        trigger=IntervalTrigger(seconds=interval_seconds),
+        id=_JOB_ID_WORKER_SHARD_HEARTBEAT,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=30,
+    )
+    logger.info("Worker shard heartbeat job added (interval=%ds)", interval_seconds)
+
+
 def start() -> None:
     """
     Запуск планировщика:
@@ -838,6 +1110,10 @@ def start() -> None:
         if not getattr(settings, "KASPI_FEED_UPLOAD_ENABLED", False):
             logger.debug("Kaspi feed upload poll APScheduler job skipped: KASPI_FEED_UPLOAD_ENABLED=False")
 
+    _add_message_delivery_job()
+    _add_inventory_outbox_relay_job()
+    _add_catalog_import_sweep_job()
+
     if _repricing_autorun_enabled():
         import os
 
@@ -855,6 +1131,8 @@ def start() -> None:
     else:
         logger.info("Repricing autorun job skipped: REPRICING_AUTORUN_ENABLED=False")
 
+    _add_worker_shard_heartbeat_job()
+
     scheduler.start()
     logger.info("APScheduler запущен (timezone=%s)", getattr(settings, "SCHEDULER_TIMEZONE", "UTC"))
 
@@ -867,6 +1145,7 @@ def stop() -> None:
     try:
         logger.info("Остановка APScheduler worker")
         scheduler.shutdown(wait=True)
+        _release_worker_shards()
         logger.info("APScheduler остановлен")
     except Exception as e:
         logger.error("Ошибка при остановке планировщика: %s", e)
@@ -939,6 +1218,20 @@ def reload_jobs() -> None:
         except ImportError as e:
             logger.warning("Не удалось загрузить kaspi_import_poll: %s", e)
 
+    try:
+        scheduler.remove_job(_JOB_ID_MESSAGE_DELIVERY)
+    except Exception:
+        pass
+
+    _add_message_delivery_job()
+
+    try:
+        scheduler.remove_job(_JOB_ID_INVENTORY_OUTBOX_RELAY)
+    except Exception:
+        pass
+
+    _add_inventory_outbox_relay_job()
+
     try:
         scheduler.remove_job(_JOB_ID_REPRICING_AUTORUN)
     except Exception:
@@ -961,6 +1254,13 @@ def reload_jobs() -> None:
     else:
         logger.info("Repricing autorun job reload skipped: REPRICING_AUTORUN_ENABLED=False")
 
+    try:
+        scheduler.remove_job(_JOB_ID_WORKER_SHARD_HEARTBEAT)
+    except Exception:
+        pass
+
+    _add_worker_shard_heartbeat_job()
+
     logger.info("Базовые задачи планировщика пересозданы")
 
 
@@ -0,0 +1,273 @@
+"""
+Lease-based tenant sharding for scheduler jobs.
+
+Instead of one global advisory lock per job (only one replica ever does useful
+work), tenants are hashed into WORKER_SHARD_COUNT shards (``company_id % N``)
+and every shard of a job is leased by at most one worker:
+  - each worker heartbeats a membership row; the number of live members gives
+    the fair share ``ceil(N / members)``;
+  - a worker renews the shards it owns, claims free or expired ones up to its
+    share (``FOR UPDATE SKIP LOCKED``) and, at the start of a job run, hands
+    back shards above its share so a newly started replica picks them up;
+  - a crashed worker's leases expire after WORKER_SHARD_LEASE_SECONDS and are
+    taken over by the survivors.
+
+Jobs call ``acquire_shards`` at the start of a run and restrict their tenant
+queries with ``ShardAssignment.where(<company_id column>)``. The scheduler's
+heartbeat job keeps leases alive between runs of infrequent jobs (repricing
+autorun runs hourly), so the lease TTL does not depend on job intervals.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import socket
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+from uuid import uuid4
+
+from sqlalchemy import delete, false, func, or_, select, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.core.config import resolve_async_database_url, settings
+from app.core.logging import get_logger
+from app.models.worker_shard_lease import WorkerShardLease, WorkerShardMember
+
+logger = get_logger(__name__)
+
+try:
+    from prometheus_client import Gauge
+
+    _SHARDS_OWNED = Gauge(
+        "smartsell_worker_shards_owned",
+        "Tenant shards currently leased by this worker",
+        ["job"],
+    )
+except Exception:  # pragma: no cover - optional metrics dependency
+    _SHARDS_OWNED = None
+
+JOB_REPRICING_AUTORUN = "repricing_autorun"
+JOB_KASPI_IMPORT_POLL = "kaspi_import_poll"
+JOB_KASPI_FEED_UPLOAD_POLL = "kaspi_feed_upload_poll"
+
+# Идентификатор процесса-воркера: уникален между репликами и перезапусками
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+def worker_sharding_enabled() -> bool:
+    return bool(getattr(settings, "WORKER_SHARDING_ENABLED", False))
+
+
+def _shard_count() -> int:
+    return max(1, int(getattr(settings, "WORKER_SHARD_COUNT", 16) or 1))
+
+
+def _lease_seconds() -> int:
+    return max(1, int(getattr(settings, "WORKER_SHARD_LEASE_SECONDS", 90) or 90))
+
+
+def shard_of(company_id: int, shard_count: int) -> int:
+    return int(company_id) % max(1, int(shard_count))
+
+
+@dataclass
+class ShardAssignment:
+    """Шарды задачи, арендованные этим воркером на текущий запуск."""
+
+    job: str
+    shards: list[int] = field(default_factory=list)
+    shard_count: int = 1
+
+    @classmethod
+    def unsharded(cls, job: str) -> ShardAssignment:
+        return cls(job=job, shards=[0], shard_count=1)
+
+    @property
+    def owns_all(self) -> bool:
+        return len(self.shards) >= self.shard_count
+
+    def owns(self, company_id: int) -> bool:
+        return shard_of(company_id, self.shard_count) in self.shards
+
+    def where(self, company_id_column: Any) -> ColumnElement[bool]:
+        """Фильтр по тенантам своих шардов (без фильтра, если арендованы все)."""
+        if self.owns_all:
+            return true()
+        if not self.shards:
+            return false()
+        return (company_id_column % self.shard_count).in_(self.shards)
+
+
+async def _touch_member(session: AsyncSession, job: str, owner: str, *, now: datetime, expires_at: datetime) -> int:
+    stmt = pg_insert(WorkerShardMember).values(job=job, owner=owner, heartbeat_at=now, expires_at=expires_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WorkerShardMember.job, WorkerShardMember.owner],
+        set_={"heartbeat_at": now, "expires_at": expires_at},
+    )
+    await session.execute(stmt)
+    await session.execute(
+        delete(WorkerShardMember).where(WorkerShardMember.job == job, WorkerShardMember.expires_at <= now)
+    )
+    live = await session.scalar(select(func.count()).where(WorkerShardMember.job == job))
+    return max(1, int(live or 0))
+
+
+async def _ensure_shard_rows(session: AsyncSession, job: str, shard_count: int) -> None:
+    # При уменьшении WORKER_SHARD_COUNT лишние шарды просто исчезают
+    await session.execute(
+        delete(WorkerShardLease).where(WorkerShardLease.job == job, WorkerShardLease.shard >= shard_count)
+    )
+    await session.execute(
+        pg_insert(WorkerShardLease)
+        .values([{"job": job, "shard": shard} for shard in range(shard_count)])
+        .on_conflict_do_nothing(index_elements=[WorkerShardLease.job, WorkerShardLease.shard])
+    )
+
+
+async def acquire_shards(
+    session: AsyncSession,
+    job: str,
+    *,
+    owner: str | None = None,
+    shard_count: int | None = None,
+    lease_seconds: int | None = None,
+    rebalance: bool = True,
+    now: datetime | None = None,
+) -> ShardAssignment:
+    """
+    Продлить свои аренды и добрать свободные/просроченные шарды до справедливой доли.
+    ``rebalance=True`` (начало запуска задачи) дополнительно отдаёт шарды сверх доли,
+    чтобы их подхватила новая реплика. Коммитит транзакцию.
+    """
+    owner = owner or WORKER_ID
+    shard_count = max(1, int(shard_count or _shard_count()))
+    now = now or _utcnow()
+    expires_at = now + timedelta(seconds=int(lease_seconds or _lease_seconds()))
+
+    live = await _touch_member(session, job, owner, now=now, expires_at=expires_at)
+    fair_share = math.ceil(shard_count / live)
+    await _ensure_shard_rows(session, job, shard_count)
+
+    renewed = await session.execute(
+        update(WorkerShardLease)
+        .where(WorkerShardLease.job == job, WorkerShardLease.owner == owner)
+        .values(lease_expires_at=expires_at, heartbeat_at=now)
+        .returning(WorkerShardLease.shard)
+    )
+    owned = sorted(renewed.scalars().all())
+
+    if rebalance and len(owned) > fair_share:
+        excess = owned[fair_share:]
+        await session.execute(
+            update(WorkerShardLease)
+            .where(WorkerShardLease.job == job, WorkerShardLease.owner == owner, WorkerShardLease.shard.in_(excess))
+            .values(owner=None, lease_expires_at=None)
+        )
+        owned = owned[:fair_share]
+
+    missing = fair_share - len(owned)
+    if missing > 0:
+        free = (
+            select(WorkerShardLease.shard)
+            .where(
+                WorkerShardLease.job == job,
+                or_(WorkerShardLease.owner.is_(None), WorkerShardLease.lease_expires_at <= now),
+            )
+            .order_by(WorkerShardLease.shard)
+            .limit(missing)
+            .with_for_update(skip_locked=True)
+        )
+        claimed = await session.execute(
+            update(WorkerShardLease)
+            .where(WorkerShardLease.job == job, WorkerShardLease.shard.in_(free.scalar_subquery()))
+            .values(owner=owner, lease_expires_at=expires_at, heartbeat_at=now)
+            .returning(WorkerShardLease.shard)
+        )
+        owned = sorted([*owned, *claimed.scalars().all()])
+
+    await session.commit()
+
+    if _SHARDS_OWNED is not None:
+        _SHARDS_OWNED.labels(job=job).set(len(owned))
+    logger.debug(
+        "worker_shards_acquired",
+        extra={"job": job, "owner": owner, "shards": owned, "members": live, "fair_share": fair_share},
+    )
+    return ShardAssignment(job=job, shards=owned, shard_count=shard_count)
+
+
+def release_shards_stmts(owner: str | None = None, jobs: Iterable[str] | None = None) -> list[Any]:
+    """Statements, отдающие аренды и членство воркера (годятся и для sync, и для async сессии)."""
+    owner = owner or WORKER_ID
+    lease_cond = [WorkerShardLease.owner == owner]
+    member_cond = [WorkerShardMember.owner == owner]
+    if jobs is not None:
+        jobs = list(jobs)
+        lease_cond.append(WorkerShardLease.job.in_(jobs))
+        member_cond.append(WorkerShardMember.job.in_(jobs))
+    return [
+        update(WorkerShardLease).where(*lease_cond).values(owner=None, lease_expires_at=None),
+        delete(WorkerShardMember).where(*member_cond),
+    ]
+
+
+async def release_shards(session: AsyncSession, job: str, *, owner: str | None = None) -> None:
+    for stmt in release_shards_stmts(owner, [job]):
+        await session.execute(stmt)
+    await session.commit()
+    if _SHARDS_OWNED is not None:
+        _SHARDS_OWNED.labels(job=job).set(0)
+
+
+async def heartbeat_worker_shards(
+    session_factory: async_sessionmaker[AsyncSession],
+    jobs: Iterable[str],
+    *,
+    owner: str | None = None,
+) -> dict[str, list[int]]:
+    """Продлить аренды по всем задачам воркера (без отдачи шардов — их отдаёт сам запуск задачи)."""
+    owned: dict[str, list[int]] = {}
+    for job in jobs:
+        async with session_factory() as session:
+            try:
+                assignment = await acquire_shards(session, job, owner=owner, rebalance=False)
+                owned[job] = assignment.shards
+            except Exception:
+                await session.rollback()
+                logger.exception("worker_shard_heartbeat_failed", extra={"job": job})
+    return owned
+
+
+async def run_worker_shard_heartbeat_async(jobs: Iterable[str]) -> dict[str, list[int]]:
+    async_url, _source, _fp = resolve_async_database_url(settings)
+    engine = create_async_engine(async_url, echo=False, pool_pre_ping=True)
+    try:
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        return await heartbeat_worker_shards(session_factory, jobs)
+    finally:
+        await engine.dispose()
+
+
+__all__ = [
+    "JOB_KASPI_FEED_UPLOAD_POLL",
+    "JOB_KASPI_IMPORT_POLL",
+    "JOB_REPRICING_AUTORUN",
+    "ShardAssignment",
+    "WORKER_ID",
+    "acquire_shards",
+    "heartbeat_worker_shards",
+    "release_shards",
+    "release_shards_stmts",
+    "run_worker_shard_heartbeat_async",
+    "shard_of",
+    "worker_sharding_enabled",
+]
@@ -10,16 +10,20 @@ from typing import Any
 from sqlalchemy import and_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.db import async_session_maker
+from app.core.idempotency import purge_expired_idempotency_keys
 from app.core.logging import get_logger
 from app.core.rbac import Role
 from app.core.subscriptions.plan_catalog import get_plan_display_name, normalize_plan_id
-from app.models import AuditLog, Company, OtpAttempt, Product, ProductStock, User
+from app.models import AuditLog, Company, OtpAttempt, Product, User
 from app.services import EmailService, KaspiService
 from app.services.campaign_runner import enqueue_due_campaigns
-from app.services.subscriptions import renew_if_due
+from app.services.kaspi_orders_sync_runner import run_kaspi_orders_sync_due
+from app.services.low_stock import raise_low_stock_alerts
+from app.services.subscriptions import renew_due_subscriptions
 from app.utils.idempotency import cleanup_idempotency_records
-from app.worker.campaign_processing import process_campaign_queue_once
+from app.worker.campaign_processing import process_campaign_queue_concurrently
 
 logger = get_logger(__name__)
 
@@ -73,48 +77,17 @@ class TaskManager:
         logger.info("Background tasks stopped")
 
     async def _sync_kaspi_orders_task(self):
-        """Periodic task to sync orders from Kaspi"""
+        """Periodic task to sync orders from Kaspi (adaptive per-merchant schedule)"""
 
         while self.running:
             try:
-                await asyncio.sleep(900)  # Run every 15 minutes
+                await asyncio.sleep(int(getattr(settings, "KASPI_SYNC_SCHEDULER_TICK_SECONDS", 15) or 15))
 
-                async with async_session_maker() as db:
-                    # Get companies with Kaspi integration
-                    result = await db.execute(
-                        select(Company).where(
-                            and_(
-                                Company.kaspi_api_key.isnot(None),
-                                Company.is_active,
-                            )
-                        )
-                    )
-                    companies = result.scalars().all()
-
-                    for company in companies:
-                        try:
-                            merchant_uid = (company.kaspi_store_id or "").strip()
-                            if not merchant_uid:
-                                logger.warning(
-                                    "Kaspi sync skipped: missing merchant_uid for company %s",
-                                    company.id,
-                                )
-                                continue
-                            kaspi = KaspiService(company.kaspi_api_key)
-                            result = await kaspi.sync_orders(
-                                db=db,
-                                company_id=company.id,
-                                merchant_uid=merchant_uid,
-                            )
-
-                            if result["created"] > 0 or result["updated"] > 0:
-                                logger.info(
-                                    f"Kaspi sync for company {company.id}: "
-                                    f"created={result['created']}, updated={result['updated']}"
-                                )
-
-                        except Exception as e:
-                            logger.error(f"Kaspi sync error for company {company.id}: {e}")
+                # Мерчанты берутся по next_run_at через лизинг в KaspiOrderSyncState,
+                # поэтому несколько процессов с TaskManager не синхронизируют одну компанию дважды.
+                summary = await run_kaspi_orders_sync_due()
+                if summary.get("total"):
+                    logger.info("Kaspi sync tick: %s", summary)
 
             except Exception as e:
                 logger.error(f"Kaspi sync task error: {e}")
@@ -152,6 +125,13 @@ class TaskManager:
                     if old_logs:
                         logger.info(f"Cleaned up {len(old_logs)} old audit logs")
 
+                    # Expired idempotency keys are purged here instead of inline on reserve
+                    purged = await purge_expired_idempotency_keys(
+                        db, batch_size=int(getattr(settings, "IDEMPOTENCY_PURGE_BATCH_SIZE", 1000) or 1000)
+                    )
+                    if purged:
+                        logger.info(f"Purged {purged} expired idempotency keys")
+
                 # Clean up idempotency records
                 cleaned = await cleanup_idempotency_records()
                 if cleaned > 0:
@@ -223,8 +203,7 @@ class TaskManager:
         while self.running:
             try:
                 await asyncio.sleep(15)
-                async with async_session_maker() as db:
-                    await process_campaign_queue_once(db, limit=10)
+                await process_campaign_queue_concurrently(limit=10)
 
             except Exception as e:
                 logger.error(f"Campaign queue task error: {e}")
@@ -236,12 +215,10 @@ class TaskManager:
             try:
                 async with async_session_maker() as db:
                     try:
-                        processed = await renew_if_due(db, now=datetime.now(UTC))
-                        if processed:
-                            await db.commit()
-                            logger.info("Subscription renewals processed", extra={"count": processed})
-                        else:
-                            await db.rollback()
+                        # Коммит по чанкам внутри движка: блокировки держатся не дольше одного чанка.
+                        stats = await renew_due_subscriptions(db, now=datetime.now(UTC), commit_per_chunk=True)
+                        if stats.processed or stats.failed:
+                            logger.info("Subscription renewals processed", extra=stats.as_dict())
                     except Exception as e:
                         await db.rollback()
                         logger.error(f"Subscription renewal error: {e}")
@@ -253,77 +230,33 @@ class TaskManager:
     async def _send_low_stock_alerts(self, db: AsyncSession):
         """Send low stock alerts to company admins"""
 
-        try:
-            # Get products with low stock
+        email_service = EmailService()
+
+        async def _notify(company_id: int, products: list[dict[str, Any]]) -> None:
             result = await db.execute(
-                select(ProductStock)
-                .join(Product)
-                .join(Company)
-                .where(
+                select(User).where(
                     and_(
-                        ProductStock.quantity <= ProductStock.min_quantity,
-                        ProductStock.min_quantity > 0,
-                        Product.is_active,
-                        Company.is_active,
+                        User.company_id == company_id,
+                        User.role == Role.STORE_ADMIN.value,
+                        User.is_active,
+                        User.email.isnot(None),
                     )
                 )
             )
-            low_stock_items = result.scalars().all()
-
-            if not low_stock_items:
-                return
-
-            # Group by company
-            companies_stock = {}
-            for stock in low_stock_items:
-                company_id = stock.product.company_id
-                if company_id not in companies_stock:
-                    companies_stock[company_id] = []
-
-                companies_stock[company_id].append(
-                    {
-                        "name": stock.product.name,
-                        "sku": stock.product.sku,
-                        "stock": stock.quantity,
-                        "min_stock": stock.min_quantity,
-                    }
+            company_name = products[0]["company_name"]
+            for admin in result.scalars().all():
+                sent = await email_service.send_low_stock_alert(
+                    to_email=admin.email,
+                    products=products,
+                    company_name=company_name,
                 )
+                if not sent:
+                    raise RuntimeError(f"low stock alert email to {admin.email} was not sent")
+                logger.info(f"Low stock alert sent to {admin.email}")
 
-            # Send alerts
-            email_service = EmailService()
-
-            for company_id, products in companies_stock.items():
-                try:
-                    # Get company admins
-                    result = await db.execute(
-                        select(User).where(
-                            and_(
-                                User.company_id == company_id,
-                                User.role == Role.STORE_ADMIN.value,
-                                User.is_active,
-                                User.email.isnot(None),
-                            )
-                        )
-                    )
-                    admins = result.scalars().all()
-
-                    # Get company info
-                    result = await db.execute(select(Company).where(Company.id == company_id))
-                    company = result.scalar_one_or_none()
-
-                    if company and admins:
-                        for admin in admins:
-                            await email_service.send_low_stock_alert(
-                                to_email=admin.email,
-                                products=products,
-                                company_name=company.name,
-                            )
-
-                            logger.info(f"Low stock alert sent to {admin.email}")
-
-                except Exception as e:
-                    logger.error(f"Low stock alert error for company {company_id}: {e}")
-
+        try:
+            # Уже оповещённые уровни остатка не повторяются; отметка ставится только после отправки писем
+            await raise_low_stock_alerts(db, notify=_notify)
         except Exception as e:
             logger.error(f"Low stock alerts error: {e}")
 
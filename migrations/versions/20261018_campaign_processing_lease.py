@@ -0,0 +1,27 @@
+"""Add campaign processing lease columns.
+
+Revision ID: 20261018_campaign_processing_lease
+Revises: 20260305_user_otp_grace_setup
+Create Date: 2026-10-18
+"""
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261018_campaign_processing_lease"
+down_revision = "20260305_user_otp_grace_setup"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("campaigns", sa.Column("lease_owner", sa.String(length=128), nullable=True))
+    op.add_column("campaigns", sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index("ix_campaign_lease_expires_at", "campaigns", ["lease_expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_campaign_lease_expires_at", table_name="campaigns")
+    op.drop_column("campaigns", "lease_expires_at")
+    op.drop_column("campaigns", "lease_owner")
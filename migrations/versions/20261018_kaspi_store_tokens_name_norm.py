@@ -0,0 +1,30 @@
+"""Expression index on normalized kaspi_store_tokens.store_name.
+
+Revision ID: 20261018_kaspi_token_name_norm
+Revises: 20261018_order_kaspi_fingerprint
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261018_kaspi_token_name_norm"
+down_revision = "20261018_order_kaspi_fingerprint"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Поиск токена идёт по lower(trim(store_name)); обычный unique-индекс по store_name его не покрывает.
+    op.create_index(
+        "ix_kaspi_store_tokens_store_name_norm",
+        "kaspi_store_tokens",
+        [sa.text("lower(trim(store_name))")],
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_kaspi_store_tokens_store_name_norm", table_name="kaspi_store_tokens", if_exists=True)
@@ -0,0 +1,58 @@
+"""Background Kaspi sync-now jobs with progress.
+
+Revision ID: 20261018_kaspi_sync_now_jobs
+Revises: 20261018_repricing_dirty
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "20261018_kaspi_sync_now_jobs"
+down_revision = "20261018_repricing_dirty"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "kaspi_sync_now_jobs",
+        sa.Column(
+            "id",
+            postgresql.UUID(as_uuid=True),
+            server_default=sa.text("gen_random_uuid()"),
+            nullable=False,
+        ),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.Column("merchant_uid", sa.String(length=128), nullable=False),
+        sa.Column("status", sa.String(length=16), server_default=sa.text("'PENDING'"), nullable=False),
+        sa.Column("phase", sa.String(length=32), nullable=True),
+        sa.Column("pages_fetched", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("orders_fetched", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("orders_upserted", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column("http_status", sa.Integer(), nullable=True),
+        sa.Column("result_json", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column("error_code", sa.String(length=64), nullable=True),
+        sa.Column("error_message", sa.Text(), nullable=True),
+        sa.Column("request_id", sa.String(length=64), nullable=True),
+        sa.Column("requested_by_user_id", sa.Integer(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["company_id"], ["companies.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_kaspi_sync_now_jobs_company_merchant_status",
+        "kaspi_sync_now_jobs",
+        ["company_id", "merchant_uid", "status"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_kaspi_sync_now_jobs_company_merchant_status", table_name="kaspi_sync_now_jobs")
+    op.drop_table("kaspi_sync_now_jobs")
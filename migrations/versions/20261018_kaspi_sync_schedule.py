@@ -0,0 +1,37 @@
+"""Add adaptive schedule and lease columns to kaspi_order_sync_state.
+
+Revision ID: 20261018_kaspi_sync_schedule
+Revises: 20261018_sales_rollups
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261018_kaspi_sync_schedule"
+down_revision = "20261018_sales_rollups"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("kaspi_order_sync_state", sa.Column("next_run_at", sa.DateTime(), nullable=True))
+    op.add_column("kaspi_order_sync_state", sa.Column("sync_interval_seconds", sa.Integer(), nullable=True))
+    op.add_column(
+        "kaspi_order_sync_state",
+        sa.Column("consecutive_failures", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column("kaspi_order_sync_state", sa.Column("lease_owner", sa.String(length=128), nullable=True))
+    op.add_column("kaspi_order_sync_state", sa.Column("lease_expires_at", sa.DateTime(), nullable=True))
+    op.create_index("ix_kaspi_order_sync_state_next_run_at", "kaspi_order_sync_state", ["next_run_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_kaspi_order_sync_state_next_run_at", table_name="kaspi_order_sync_state")
+    op.drop_column("kaspi_order_sync_state", "lease_expires_at")
+    op.drop_column("kaspi_order_sync_state", "lease_owner")
+    op.drop_column("kaspi_order_sync_state", "consecutive_failures")
+    op.drop_column("kaspi_order_sync_state", "sync_interval_seconds")
+    op.drop_column("kaspi_order_sync_state", "next_run_at")
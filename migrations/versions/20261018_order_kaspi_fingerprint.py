@@ -0,0 +1,24 @@
+"""Add kaspi_fingerprint to orders.
+
+Revision ID: 20261018_order_kaspi_fingerprint
+Revises: 20261018_kaspi_sync_schedule
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261018_order_kaspi_fingerprint"
+down_revision = "20261018_kaspi_sync_schedule"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("orders", sa.Column("kaspi_fingerprint", sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("orders", "kaspi_fingerprint")
@@ -0,0 +1,33 @@
+"""Low-stock alert dedup column and partial index on product_stocks.
+
+Revision ID: 20261018_stock_low_alerts
+Revises: 20261018_kaspi_token_name_norm
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261018_stock_low_alerts"
+down_revision = "20261018_kaspi_token_name_norm"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("product_stocks", sa.Column("low_stock_alerted_qty", sa.Integer(), nullable=True))
+    # Скан низких остатков читает только позиции ниже порога; частичный индекс не растёт с каталогом.
+    op.create_index(
+        "ix_stock_low_partial",
+        "product_stocks",
+        ["warehouse_id", "product_id"],
+        postgresql_where=sa.text("quantity <= min_quantity AND min_quantity > 0"),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stock_low_partial", table_name="product_stocks", if_exists=True)
+    op.drop_column("product_stocks", "low_stock_alerted_qty")
@@ -0,0 +1,43 @@
+"""Repricing dirty-company queue for the autorun scheduler.
+
+Revision ID: 20261018_repricing_dirty
+Revises: 20261018_worker_shard_leases
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261018_repricing_dirty"
+down_revision = "20261018_worker_shard_leases"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "repricing_dirty_companies",
+        sa.Column("company_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("dirty_since", sa.DateTime(), nullable=False),
+        sa.Column("reason", sa.String(length=32), nullable=True),
+        sa.ForeignKeyConstraint(["company_id"], ["companies.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("company_id"),
+    )
+    op.create_index("ix_repricing_dirty_companies_since", "repricing_dirty_companies", ["dirty_since"])
+    # Компании с активными правилами до появления очереди — пересчитать один раз.
+    op.execute(
+        """
+        INSERT INTO repricing_dirty_companies (company_id, dirty_since, reason)
+        SELECT DISTINCT company_id, now() AT TIME ZONE 'utc', 'backfill'
+        FROM repricing_rules
+        WHERE enabled AND is_active
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_repricing_dirty_companies_since", table_name="repricing_dirty_companies")
+    op.drop_table("repricing_dirty_companies")
@@ -0,0 +1,65 @@
+"""Add sales_rollups table (hourly/daily per-company sales buckets).
+
+Revision ID: 20261018_sales_rollups
+Revises: 20261018_campaign_processing_lease
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261018_sales_rollups"
+down_revision = "20261018_campaign_processing_lease"
+branch_labels = None
+depends_on = None
+
+_BACKFILL_SQL = """
+INSERT INTO sales_rollups (
+    company_id, granularity, bucket_start, orders_count, revenue,
+    paid_orders_count, paid_revenue, items_sold, updated_at
+)
+SELECT
+    o.company_id,
+    '{granularity}',
+    date_trunc('{granularity}', o.created_at),
+    count(o.id),
+    coalesce(sum(o.total_amount), 0),
+    coalesce(sum(CASE WHEN o.status IN ('COMPLETED', 'PAID') THEN 1 ELSE 0 END), 0),
+    coalesce(sum(CASE WHEN o.status IN ('COMPLETED', 'PAID') THEN o.total_amount ELSE 0 END), 0),
+    coalesce(sum((SELECT coalesce(sum(oi.quantity), 0) FROM order_items oi WHERE oi.order_id = o.id)), 0),
+    now()
+FROM orders o
+GROUP BY o.company_id, date_trunc('{granularity}', o.created_at)
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "sales_rollups",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("granularity", sa.String(length=8), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("orders_count", sa.Integer(), nullable=False),
+        sa.Column("revenue", sa.Numeric(16, 2), nullable=False),
+        sa.Column("paid_orders_count", sa.Integer(), nullable=False),
+        sa.Column("paid_revenue", sa.Numeric(16, 2), nullable=False),
+        sa.Column("items_sold", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("company_id", "granularity", "bucket_start", name="uq_sales_rollups_company_bucket"),
+    )
+    op.create_index(
+        "ix_sales_rollups_company_gran_bucket",
+        "sales_rollups",
+        ["company_id", "granularity", "bucket_start"],
+        unique=False,
+    )
+    for granularity in ("hour", "day"):
+        op.execute(_BACKFILL_SQL.format(granularity=granularity))
+
+
+def downgrade() -> None:
+    op.drop_index("ix_sales_rollups_company_gran_bucket", table_name="sales_rollups")
+    op.drop_table("sales_rollups")
@@ -0,0 +1,52 @@
+"""One active background sync-now job per merchant.
+
+Revision ID: 20261018_sync_now_job_active_uniq
+Revises: 20261018_kaspi_sync_now_jobs
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261018_sync_now_job_active_uniq"
+down_revision = "20261018_kaspi_sync_now_jobs"
+branch_labels = None
+depends_on = None
+
+_ACTIVE = "status IN ('PENDING', 'RUNNING')"
+
+
+def upgrade() -> None:
+    # Дубли активных задач (гонка check-then-insert) — оставляем самую свежую, остальные закрываем.
+    op.execute(
+        sa.text(
+            f"""
+            UPDATE kaspi_sync_now_jobs AS j
+               SET status = 'FAILED',
+                   error_code = 'kaspi_sync_duplicate',
+                   finished_at = now() AT TIME ZONE 'utc',
+                   updated_at = now() AT TIME ZONE 'utc'
+             WHERE j.{_ACTIVE}
+               AND EXISTS (
+                   SELECT 1 FROM kaspi_sync_now_jobs AS n
+                    WHERE n.company_id = j.company_id
+                      AND n.merchant_uid = j.merchant_uid
+                      AND n.{_ACTIVE}
+                      AND (n.created_at, n.id::text) > (j.created_at, j.id::text)
+               )
+            """
+        )
+    )
+    op.create_index(
+        "uq_kaspi_sync_now_jobs_active",
+        "kaspi_sync_now_jobs",
+        ["company_id", "merchant_uid"],
+        unique=True,
+        postgresql_where=sa.text(_ACTIVE),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_kaspi_sync_now_jobs_active", table_name="kaspi_sync_now_jobs")
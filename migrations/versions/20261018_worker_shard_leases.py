@@ -0,0 +1,43 @@
+"""Worker shard lease and membership tables.
+
+Revision ID: 20261018_worker_shard_leases
+Revises: 20261018_stock_low_alerts
+Create Date: 2026-10-18
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261018_worker_shard_leases"
+down_revision = "20261018_stock_low_alerts"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "worker_shard_leases",
+        sa.Column("job", sa.String(length=64), nullable=False),
+        sa.Column("shard", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("owner", sa.String(length=128), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("job", "shard"),
+    )
+    op.create_index("ix_worker_shard_leases_job_owner", "worker_shard_leases", ["job", "owner"])
+    op.create_table(
+        "worker_shard_members",
+        sa.Column("job", sa.String(length=64), nullable=False),
+        sa.Column("owner", sa.String(length=128), nullable=False),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("job", "owner"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("worker_shard_members")
+    op.drop_index("ix_worker_shard_leases_job_owner", table_name="worker_shard_leases")
+    op.drop_table("worker_shard_leases")
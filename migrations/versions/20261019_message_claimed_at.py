@@ -0,0 +1,26 @@
+"""Add claimed_at lease column to messages.
+
+Revision ID: 20261019_message_claimed_at
+Revises: 20261018_sync_now_job_active_uniq
+Create Date: 2026-10-19
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "20261019_message_claimed_at"
+down_revision = "20261018_sync_now_job_active_uniq"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("messages", sa.Column("claimed_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index("ix_message_status_claimed_at", "messages", ["status", "claimed_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_message_status_claimed_at", table_name="messages")
+    op.drop_column("messages", "claimed_at")
@@ -0,0 +1,137 @@
+"""
+Benchmark: bulk upsert strategies for Kaspi imports/backfills.
+
+Compares, on a scratch table shaped like ``kaspi_offers`` (dropped afterwards):
+  * per-row   — one INSERT ... ON CONFLICT per row (old sync_kaspi_mc_offers)
+  * values500 — multi-row VALUES upsert in 500-row chunks (old catalog import)
+  * copy      — app.core.db.bulk_upsert (COPY into staging + one merge)
+
+Each strategy loads N fresh rows (insert pass) and then the same N rows again
+(update pass). Needs DATABASE_URL pointing at Postgres (asyncpg).
+
+    python -m scripts.bench_bulk_load --sizes 10000,100000,1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from collections.abc import Callable, Iterator
+from datetime import datetime
+from typing import Any
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.db import bulk_upsert, get_async_session_maker
+
+_metadata = sa.MetaData()
+_bench_offers = sa.Table(
+    "bench_bulk_offers",
+    _metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("company_id", sa.Integer, nullable=False),
+    sa.Column("merchant_uid", sa.String(128), nullable=False),
+    sa.Column("sku", sa.String(128), nullable=False),
+    sa.Column("title", sa.String(255)),
+    sa.Column("price", sa.Numeric(18, 2)),
+    sa.Column("stock_count", sa.Integer),
+    sa.Column("raw", JSONB, nullable=False),
+    sa.Column("updated_at", sa.DateTime, nullable=False),
+    sa.UniqueConstraint("company_id", "merchant_uid", "sku"),
+)
+_COLUMNS = ["company_id", "merchant_uid", "sku", "title", "price", "stock_count", "raw", "updated_at"]
+_KEY = ["company_id", "merchant_uid", "sku"]
+
+
+def _rows(n: int, revision: int) -> Iterator[dict[str, Any]]:
+    now = datetime.utcnow()
+    for i in range(n):
+        yield {
+            "company_id": 1,
+            "merchant_uid": "BENCH",
+            "sku": f"SKU-{i:08d}",
+            "title": f"Offer {i} r{revision}",
+            "price": 1000 + i % 997 + revision,
+            "stock_count": i % 50,
+            "raw": {"sku": f"SKU-{i:08d}", "rev": revision, "cityPrices": [{"cityId": "750000000", "value": i}]},
+            "updated_at": now,
+        }
+
+
+def _upsert_stmt(rows: list[dict[str, Any]]):
+    stmt = insert(_bench_offers).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=_KEY,
+        set_={c: stmt.excluded[c] for c in _COLUMNS if c not in _KEY},
+    )
+
+
+async def _per_row(session: AsyncSession, rows: Iterator[dict[str, Any]]) -> None:
+    for row in rows:
+        await session.execute(_upsert_stmt([row]))
+
+
+async def _values500(session: AsyncSession, rows: Iterator[dict[str, Any]]) -> None:
+    chunk: list[dict[str, Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= 500:
+            await session.execute(_upsert_stmt(chunk))
+            chunk = []
+    if chunk:
+        await session.execute(_upsert_stmt(chunk))
+
+
+async def _copy(session: AsyncSession, rows: Iterator[dict[str, Any]]) -> None:
+    await bulk_upsert(session, _bench_offers, rows, columns=_COLUMNS, conflict_columns=_KEY)
+
+
+async def _run(session: AsyncSession, fn: Callable, n: int) -> tuple[float, float]:
+    await session.execute(sa.text("TRUNCATE bench_bulk_offers"))
+    await session.commit()
+    timings = []
+    for revision in (1, 2):
+        start = time.perf_counter()
+        await fn(session, _rows(n, revision))
+        await session.commit()
+        timings.append(time.perf_counter() - start)
+    return timings[0], timings[1]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk upsert strategies benchmark")
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--per-row-max", type=int, default=100000, help="skip per-row above this size")
+    parser.add_argument("--values-max", type=int, default=1000000, help="skip values500 above this size")
+    args = parser.parse_args()
+
+    strategies: list[tuple[str, Callable, int]] = [
+        ("per-row", _per_row, args.per_row_max),
+        ("values500", _values500, args.values_max),
+        ("copy", _copy, 10**12),
+    ]
+    async with get_async_session_maker()() as session:
+        await session.run_sync(lambda s: _metadata.create_all(s.connection()))
+        await session.commit()
+        try:
+            for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+                for name, fn, limit in strategies:
+                    if size > limit:
+                        print(f"{size:>9} rows  {name:<10} skipped (> {limit})")
+                        continue
+                    insert_s, update_s = await _run(session, fn, size)
+                    print(
+                        f"{size:>9} rows  {name:<10} insert {insert_s:8.2f}s ({size / insert_s:10.0f} rows/s)"
+                        f"   update {update_s:8.2f}s ({size / update_s:10.0f} rows/s)"
+                    )
+        finally:
+            await session.rollback()
+            await session.run_sync(lambda s: _metadata.drop_all(s.connection()))
+            await session.commit()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
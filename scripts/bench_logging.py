@@ -0,0 +1,101 @@
+"""
+Microbenchmark: cost of a single log call on the request path.
+
+Compares direct file/console handlers (default) with the bounded queue
+pipeline (LOG_QUEUE_ENABLED=1). Only the caller-side cost is timed; the queue
+listener drains in the background and is flushed before the numbers are printed.
+
+    python -m scripts.bench_logging --calls 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import logging
+import logging.handlers
+import queue
+import tempfile
+import time
+from pathlib import Path
+
+from app.core.logging import (
+    BatchingQueueListener,
+    BatchingRotatingFileHandler,
+    BatchingStreamHandler,
+    DroppingQueueHandler,
+    JsonLineFormatter,
+)
+
+_FMT = "%(asctime)s [%(levelname)s] %(name)s:%(filename)s:%(funcName)s:%(lineno)d - %(message)s"
+
+
+def _direct_handlers(logs_dir: Path) -> list[logging.Handler]:
+    console = logging.StreamHandler(io.StringIO())
+    console.setFormatter(logging.Formatter(_FMT))
+    file = logging.handlers.RotatingFileHandler(logs_dir / "direct.log", maxBytes=0, encoding="utf8")
+    file.setFormatter(logging.Formatter(_FMT))
+    return [console, file]
+
+
+def _batching_handlers(logs_dir: Path, json_lines: bool) -> list[logging.Handler]:
+    formatter = JsonLineFormatter() if json_lines else logging.Formatter(_FMT)
+    console = BatchingStreamHandler(io.StringIO())
+    console.setFormatter(formatter)
+    file = BatchingRotatingFileHandler(logs_dir / "queued.log", maxBytes=0, encoding="utf8")
+    file.setFormatter(formatter)
+    return [console, file]
+
+
+def _run(lg: logging.Logger, calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        lg.info("request_end method=%s path=%s status=%s duration_ms=%s", "GET", "/api/v1/orders", 200, i)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Log call cost: direct handlers vs queue pipeline")
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--json-lines", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        logs_dir = Path(tmp)
+
+        direct = logging.getLogger("bench.direct")
+        direct.propagate = False
+        direct.setLevel(logging.INFO)
+        handlers = _direct_handlers(logs_dir)
+        direct.handlers = handlers
+        direct_s = _run(direct, args.calls)
+        for h in handlers:
+            h.close()
+
+        queued = logging.getLogger("bench.queued")
+        queued.propagate = False
+        queued.setLevel(logging.INFO)
+        handlers = _batching_handlers(logs_dir, args.json_lines)
+        q: queue.Queue = queue.Queue(maxsize=args.queue_size)
+        queue_handler = DroppingQueueHandler(q)
+        listener = BatchingQueueListener(q, *handlers, batch_size=args.batch_size, stats=queue_handler.stats)
+        queued.handlers = [queue_handler]
+        listener.start()
+        queued_s = _run(queued, args.calls)
+        listener.stop()
+        for h in handlers:
+            h.close()
+
+    def per_call(seconds: float) -> float:
+        return seconds / args.calls * 1e6
+
+    print(f"calls:          {args.calls}")
+    print(f"direct:         {per_call(direct_s):8.2f} us/call")
+    print(f"queue pipeline: {per_call(queued_s):8.2f} us/call")
+    print(f"queue stats:    {queue_handler.stats.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: login-style password verification under concurrency.
+
+Compares, with production argon2 parameters:
+  * inline    — verify_password() called directly on the event loop (old /auth/login)
+  * offloaded — verify_password_async() in the bounded hashing pool
+
+For each concurrency level N, N coroutines verify passwords in a loop while a
+probe task measures event-loop lag (how late a 10 ms sleep wakes up), which is
+what every other request on the worker experiences during a login burst.
+
+    python -m scripts.bench_password_hashing --concurrency 1,8,32,128 --seconds 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+from passlib.context import CryptContext
+
+import app.core.security as security
+
+_PASSWORD = "Bench-Passw0rd!"
+
+
+async def _lag_probe(stop: asyncio.Event, samples: list[float], interval: float = 0.01) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval) * 1000)
+
+
+async def _run(verify: Callable[[str, str], Awaitable[bool]], hashed: str, concurrency: int, seconds: float):
+    stop = asyncio.Event()
+    lag: list[float] = []
+    done = 0
+    shed = 0
+
+    async def _worker() -> None:
+        nonlocal done, shed
+        while not stop.is_set():
+            try:
+                await verify(_PASSWORD, hashed)
+                done += 1
+            except security.PasswordHashingBusy:
+                shed += 1
+                await asyncio.sleep(0.01)
+
+    probe = asyncio.create_task(_lag_probe(stop, lag))
+    workers = [asyncio.create_task(_worker()) for _ in range(concurrency)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(probe, *workers)
+    lag.sort()
+    p99 = lag[min(len(lag) - 1, int(len(lag) * 0.99))] if lag else 0.0
+    return done / seconds, shed, p99, max(lag, default=0.0)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Password hashing offload benchmark")
+    parser.add_argument("--concurrency", default="1,8,32,128")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    # Бенчмарк всегда на боевых параметрах argon2, даже если ENVIRONMENT=testing.
+    security.pwd_context = CryptContext(**security._password_context_options(False))
+    hashed = security.get_password_hash(_PASSWORD)
+
+    async def _inline(plain: str, hashed_password: str) -> bool:
+        ok = security.verify_password(plain, hashed_password)
+        await asyncio.sleep(0)  # как у хендлера: дальше идёт await к БД
+        return ok
+
+    print(f"pool: {security.password_hash_pool_stats()}")
+    for concurrency in (int(c) for c in args.concurrency.split(",") if c.strip()):
+        for name, verify in (("inline", _inline), ("offloaded", security.verify_password_async)):
+            rate, shed, p99, worst = await _run(verify, hashed, concurrency, args.seconds)
+            print(
+                f"c={concurrency:<4} {name:<10} {rate:8.1f} logins/s  shed {shed:6d}"
+                f"  loop lag p99 {p99:8.1f} ms  max {worst:8.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""
+Microbenchmark: per-event cost of structlog secret redaction.
+
+Compares the compiled/memoized redaction engine (app.core.logging) with the
+previous substring-scan implementation on a flat request event and on a large
+Kaspi-like payload.
+
+    python -m scripts.bench_redaction --events 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Any
+
+from app.core.logging import _redact_processor
+
+_LEGACY_KEYS = ("secret", "password", "token", "dsn", "api_key", "api_secret", "access_key", "key")
+
+
+def _legacy_mask(v: Any) -> Any:
+    s = str(v)
+    return "***" if len(s) <= 6 else s[:3] + "***" + s[-3:]
+
+
+def _legacy_redact(data: Any) -> Any:
+    if isinstance(data, dict):
+        out: dict[str, Any] = {}
+        for k, v in data.items():
+            lk = str(k).lower()
+            if any(x in lk for x in _LEGACY_KEYS) and "public" not in lk:
+                out[k] = _legacy_mask(v)
+            else:
+                out[k] = _legacy_redact(v)
+        return out
+    if isinstance(data, list):
+        return [_legacy_redact(v) for v in data]
+    if isinstance(data, tuple):
+        return tuple(_legacy_redact(v) for v in data)
+    return data
+
+
+def _flat_event() -> dict[str, Any]:
+    return {
+        "event": "request_end",
+        "method": "GET",
+        "path": "/api/v1/orders",
+        "status": 200,
+        "duration_ms": 12.5,
+        "request_id": "3f1c2a",
+        "logger": "http",
+        "level": "info",
+        "timestamp": "2026-01-01T00:00:00Z",
+    }
+
+
+def _payload_event(entries: int) -> dict[str, Any]:
+    return {
+        "event": "kaspi_orders_page",
+        "company_id": 1,
+        "response": {
+            "data": [
+                {
+                    "id": f"order-{i}",
+                    "type": "orders",
+                    "attributes": {
+                        "code": str(100000 + i),
+                        "totalPrice": 1000 + i,
+                        "state": "NEW",
+                        "customer": {"firstName": "A", "lastName": "B", "cellPhone": "7000000000"},
+                        "entries": [{"sku": f"SKU-{i}-{j}", "quantity": 1, "basePrice": 500} for j in range(3)],
+                    },
+                }
+                for i in range(entries)
+            ],
+            "meta": {"pageCount": 10, "totalCount": entries * 10},
+        },
+        "headers": {"X-Auth-Token": "secret-token-value", "Accept": "application/json"},
+    }
+
+
+def _time(fn, event: dict[str, Any], events: int) -> float:
+    start = time.perf_counter()
+    for _ in range(events):
+        fn(event)
+    return (time.perf_counter() - start) / events * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-event cost of log redaction")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--payload-entries", type=int, default=50)
+    args = parser.parse_args()
+
+    def engine(event: dict[str, Any]) -> Any:
+        return _redact_processor(None, None, event)
+
+    payload_events = max(1, args.events // 50)
+    cases = [
+        ("flat event", _flat_event(), args.events),
+        (f"payload ({args.payload_entries} orders)", _payload_event(args.payload_entries), payload_events),
+    ]
+    for name, event, events in cases:
+        legacy_us = _time(_legacy_redact, event, events)
+        engine_us = _time(engine, event, events)
+        print(f"{name:<24} legacy {legacy_us:10.2f} us/event   engine {engine_us:10.2f} us/event")
+
+
+if __name__ == "__main__":
+    main()
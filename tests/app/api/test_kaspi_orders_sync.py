@@ -10,6 +10,7 @@ from app.models import Order, OrderItem
 from app.models.kaspi_catalog_item import KaspiCatalogItem
 from app.models.kaspi_order_sync_state import KaspiOrderSyncState
 from app.models.order import OrderStatusHistory
+from app.models.preorder import Preorder
 from app.services import kaspi_service
 from app.services.kaspi_service import KaspiService
 
@@ -920,6 +921,56 @@ async def test_order_items_update_values(monkeypatch, async_client, async_db_ses
     assert str(item_map["SKU-2"].unit_price) in {"200", "200.00"}
 
 
+@pytest.mark.asyncio
+async def test_unchanged_orders_are_skipped(monkeypatch, async_client, async_db_session, company_a_admin_headers):
+    payload = {"total": 1100}
+
+    async def fake_get_orders(self, *, date_from=None, date_to=None, status=None, page=1, page_size=100):  # noqa: ARG001
+        return _orders_payload_with_items(total=payload["total"]) if page == 1 else []
+
+    monkeypatch.setattr(KaspiService, "get_orders", fake_get_orders)
+
+    first = await async_client.post("/api/v1/kaspi/orders/sync", headers=company_a_admin_headers)
+    assert first.status_code == 200, first.text
+    assert first.json()["inserted"] == 1
+
+    order = (
+        await async_db_session.execute(sa.select(Order).where(Order.company_id == 1001, Order.external_id == "ext-1"))
+    ).scalar_one()
+    assert order.kaspi_fingerprint
+    fingerprint, order_updated_at = order.kaspi_fingerprint, order.updated_at
+    item_ids = set(
+        (await async_db_session.execute(sa.select(OrderItem.id).where(OrderItem.order_id == order.id))).scalars()
+    )
+    kaspi_preorder = sa.select(Preorder.id).where(
+        Preorder.company_id == 1001, Preorder.source == "kaspi", Preorder.external_id == "ext-1"
+    )
+    await async_db_session.execute(sa.delete(Preorder).where(Preorder.id.in_(kaspi_preorder)))
+    await async_db_session.commit()
+
+    second = await async_client.post("/api/v1/kaspi/orders/sync", headers=company_a_admin_headers)
+    assert second.status_code == 200, second.text
+    data = second.json()
+    assert (data["inserted"], data["updated"], data["unchanged"]) == (0, 0, 1)
+    # пропуск касается только upsert заказа/позиций — предзаказ восстанавливается
+    assert (await async_db_session.execute(kaspi_preorder)).scalar_one_or_none() is not None
+
+    await async_db_session.refresh(order)
+    assert order.updated_at == order_updated_at
+    assert (
+        set((await async_db_session.execute(sa.select(OrderItem.id).where(OrderItem.order_id == order.id))).scalars())
+        == item_ids
+    )
+
+    payload["total"] = 1300
+    third = await async_client.post("/api/v1/kaspi/orders/sync", headers=company_a_admin_headers)
+    assert third.status_code == 200, third.text
+    data = third.json()
+    assert (data["updated"], data["unchanged"]) == (1, 0)
+    await async_db_session.refresh(order)
+    assert order.kaspi_fingerprint != fingerprint
+
+
 @pytest.mark.asyncio
 async def test_pagination_fetches_all_pages(monkeypatch, async_client, async_db_session, company_a_admin_headers):
     calls = {"n": 0}
@@ -1078,6 +1129,46 @@ async def test_status_history_is_idempotent(monkeypatch, async_client, async_db_
     assert statuses == ["pending", "shipped"]
 
 
+@pytest.mark.asyncio
+async def test_status_history_records_only_transitions(
+    monkeypatch, async_client, async_db_session, company_a_admin_headers
+):
+    ts1 = datetime(2025, 1, 1, 10, 0, tzinfo=UTC)
+    ts2 = datetime(2025, 1, 1, 11, 0, tzinfo=UTC)
+    ts3 = datetime(2025, 1, 1, 12, 0, tzinfo=UTC)
+
+    for kaspi_status, ts in (("NEW", ts1), ("NEW", ts2), ("SHIPPED", ts3)):
+
+        async def fake_get_orders(
+            self, *, date_from=None, date_to=None, status=None, page=1, page_size=100, _s=kaspi_status, _ts=ts
+        ):  # noqa: ARG001
+            return _orders_payload_with_status_timestamp(status=_s, ts=_ts) if page == 1 else []
+
+        monkeypatch.setattr(KaspiService, "get_orders", fake_get_orders)
+        resp = await async_client.post("/api/v1/kaspi/orders/sync", headers=company_a_admin_headers)
+        assert resp.status_code == 200, resp.text
+
+    order = (
+        await async_db_session.execute(sa.select(Order).where(Order.company_id == 1001, Order.external_id == "ext-1"))
+    ).scalar_one()
+    history = (
+        (
+            await async_db_session.execute(
+                sa.select(OrderStatusHistory)
+                .where(OrderStatusHistory.order_id == order.id)
+                .order_by(OrderStatusHistory.changed_at)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    # второй прогон поменял payload, но не статус — записи в истории нет
+    assert [(h.old_status.value, h.new_status.value) for h in history] == [
+        ("pending", "pending"),
+        ("pending", "shipped"),
+    ]
+
+
 @pytest.mark.asyncio
 async def test_double_sync_idempotent_no_duplicates(
     monkeypatch, async_client, async_db_session, company_a_admin_headers
@@ -6,11 +6,12 @@ from datetime import datetime, timedelta
 
 import pytest
 from httpx import AsyncClient
+from passlib.hash import argon2
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.v1 import auth as auth_mod
-from app.core.security import create_access_token, get_password_hash
+from app.core.security import create_access_token, get_password_hash, needs_rehash, pwd_context, verify_password
 from app.models import Company, OtpAttempt, User, UserSession
 from app.services.otp_providers import is_otp_active
 from app.utils.otp import hash_otp_code
@@ -190,6 +191,39 @@ class TestAuth:
         assert "access_token" in data
         assert "refresh_token" in data
 
+    @pytest.mark.asyncio
+    async def test_login_rehashes_legacy_hash(self, async_client: AsyncClient, async_db_session: AsyncSession):
+        """Outdated hashes are upgraded after a successful login, off the request path"""
+        if pwd_context.default_scheme() != "argon2":
+            pytest.skip("argon2 not available")
+
+        company = Company(name="Rehash Company")
+        async_db_session.add(company)
+        await async_db_session.flush()
+
+        # argon2 с параметрами, отличными от текущих, считается устаревшим хешем
+        legacy_hash = argon2.using(time_cost=2, memory_cost=2048, parallelism=1).hash(STRONG_PW)
+        assert needs_rehash(legacy_hash)
+        user = User(
+            company_id=company.id,
+            phone="+77001234599",
+            hashed_password=legacy_hash,
+            role="admin",
+            otp_grace_until=datetime.utcnow() + timedelta(days=1),
+        )
+        async_db_session.add(user)
+        await async_db_session.commit()
+
+        response = await async_client.post(
+            "/api/auth/login", json={"identifier": "+77001234599", "password": STRONG_PW}
+        )
+        assert response.status_code == 200, response.text
+
+        await async_db_session.refresh(user)
+        assert user.hashed_password != legacy_hash
+        assert not needs_rehash(user.hashed_password)
+        assert verify_password(STRONG_PW, user.hashed_password)
+
     @pytest.mark.asyncio
     async def test_login_with_password_in_prod_allows_grace(
         self, async_client: AsyncClient, async_db_session: AsyncSession, monkeypatch
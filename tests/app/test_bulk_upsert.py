@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+
+from app.core.db import bulk_upsert
+from app.models.company import Company
+from app.models.kaspi_offer import KaspiOffer
+
+_COLUMNS = ["company_id", "merchant_uid", "sku", "title", "price", "raw", "created_at", "updated_at"]
+
+
+async def _ensure_company(session) -> None:
+    if await session.get(Company, 1001) is None:
+        session.add(Company(id=1001, name="Company 1001", kaspi_store_id="store-a"))
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_copies_and_merges(async_db_session):
+    await _ensure_company(async_db_session)
+    now = datetime.utcnow()
+
+    rows = [
+        {
+            "company_id": 1001,
+            "merchant_uid": "M1",
+            "sku": f"BULK-{i}",
+            "title": f"t{i}",
+            "price": i,
+            "raw": {"i": i},
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(25)
+    ]
+    result = await bulk_upsert(
+        async_db_session,
+        KaspiOffer,
+        rows,
+        columns=_COLUMNS,
+        conflict_columns=["company_id", "merchant_uid", "sku"],
+        chunk_rows=10,
+    )
+    await async_db_session.commit()
+    assert (result.staged, result.inserted, result.updated) == (25, 25, 0)
+
+    async def _updates():
+        # Повтор ключа в одной загрузке: побеждает последняя строка.
+        for title in ("first", "last"):
+            yield (1001, "M1", "BULK-3", title, 99, {"v": title}, now, now)
+        yield (1001, "M1", "BULK-NEW", "new", 1, {"n": 1}, now, now)
+
+    result = await bulk_upsert(
+        async_db_session,
+        KaspiOffer,
+        _updates(),
+        columns=_COLUMNS,
+        conflict_columns=["company_id", "merchant_uid", "sku"],
+        update_columns=["title", "price", "updated_at"],
+        update_set={"raw": "COALESCE(EXCLUDED.raw, t.raw)"},
+    )
+    await async_db_session.commit()
+    assert (result.staged, result.inserted, result.updated) == (3, 1, 1)
+
+    offers = {
+        o.sku: o
+        for o in (await async_db_session.execute(sa.select(KaspiOffer).where(KaspiOffer.sku.like("BULK-%")))).scalars()
+    }
+    assert len(offers) == 26
+    assert (offers["BULK-3"].title, int(offers["BULK-3"].price), offers["BULK-3"].raw) == ("last", 99, {"v": "last"})
+    assert offers["BULK-7"].raw == {"i": 7}
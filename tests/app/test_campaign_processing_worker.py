@@ -5,6 +5,7 @@ from datetime import UTC, datetime, timedelta
 import pytest
 from sqlalchemy import select
 
+import tests.conftest as base_conftest
 from app.core.config import settings
 from app.models.campaign import Campaign, CampaignProcessingStatus, CampaignStatus, ChannelType, Message, MessageStatus
 from app.models.company import Company
@@ -347,3 +348,155 @@ async def test_campaign_worker_failure_reaches_max(async_db_session, monkeypatch
     assert campaign.processing_status == CampaignProcessingStatus.FAILED
     assert campaign.last_error == "max_attempts_exceeded"
     assert campaign.next_attempt_at is None
+
+
+async def test_campaign_worker_concurrent_processes_leased_campaigns(async_db_session):
+    campaigns = [
+        await _seed_campaign(
+            async_db_session,
+            company_id=91050 + idx,
+            processing_status=CampaignProcessingStatus.QUEUED,
+        )
+        for idx in range(3)
+    ]
+
+    results = await campaign_processing.process_campaign_queue_concurrently(
+        limit=50,
+        concurrency=2,
+        session_factory=base_conftest.TestingSessionLocal,
+    )
+    processed = {item["campaign_id"] for item in results}
+    assert {c.id for c in campaigns} <= processed
+
+    for campaign in campaigns:
+        await async_db_session.refresh(campaign)
+        assert campaign.processing_status == CampaignProcessingStatus.DONE
+        assert campaign.lease_owner is None
+        assert campaign.lease_expires_at is None
+
+
+async def test_campaign_worker_concurrent_skips_active_lease(async_db_session):
+    campaign = await _seed_campaign(
+        async_db_session,
+        company_id=91060,
+        processing_status=CampaignProcessingStatus.QUEUED,
+    )
+    campaign.lease_owner = "other-worker"
+    campaign.lease_expires_at = datetime.now(UTC) + timedelta(minutes=5)
+    await async_db_session.commit()
+
+    results = await campaign_processing.process_campaign_queue_concurrently(
+        limit=50,
+        session_factory=base_conftest.TestingSessionLocal,
+    )
+    assert campaign.id not in {item["campaign_id"] for item in results}
+
+    await async_db_session.refresh(campaign)
+    assert campaign.processing_status == CampaignProcessingStatus.QUEUED
+    assert campaign.lease_owner == "other-worker"
+
+    campaign.lease_expires_at = datetime.now(UTC) - timedelta(seconds=1)
+    await async_db_session.commit()
+
+    results = await campaign_processing.process_campaign_queue_concurrently(
+        limit=50,
+        session_factory=base_conftest.TestingSessionLocal,
+    )
+    assert campaign.id in {item["campaign_id"] for item in results}
+
+
+async def test_campaign_worker_concurrent_lock_denied_releases_lease(async_db_session, monkeypatch):
+    campaign = await _seed_campaign(
+        async_db_session,
+        company_id=91070,
+        processing_status=CampaignProcessingStatus.QUEUED,
+    )
+
+    async def _deny_lock(*_args, **_kwargs):
+        return False
+
+    monkeypatch.setattr(campaign_processing, "_try_campaign_advisory_lock", _deny_lock)
+
+    results = await campaign_processing.process_campaign_queue_concurrently(
+        limit=50,
+        session_factory=base_conftest.TestingSessionLocal,
+    )
+    assert results == []
+
+    await async_db_session.refresh(campaign)
+    assert campaign.processing_status == CampaignProcessingStatus.QUEUED
+    assert campaign.lease_owner is None
+
+
+async def test_campaign_worker_concurrent_runs_action_without_row_lock(async_db_session, monkeypatch):
+    campaign = await _seed_campaign(
+        async_db_session,
+        company_id=91080,
+        processing_status=CampaignProcessingStatus.QUEUED,
+    )
+    observed: dict[str, object] = {}
+
+    async def _action(db, leased):
+        # Во время действия строка кампании не заблокирована, статус PROCESSING уже закоммичен
+        async with base_conftest.TestingSessionLocal() as probe:
+            row = (
+                await probe.execute(select(Campaign).where(Campaign.id == leased.id).with_for_update(nowait=True))
+            ).scalar_one()
+            observed["status"] = row.processing_status
+            observed["lease_owner"] = row.lease_owner
+            await probe.rollback()
+
+    monkeypatch.setattr(campaign_processing, "_perform_campaign_action", _action)
+
+    results = await campaign_processing.process_campaign_queue_concurrently(
+        limit=50,
+        session_factory=base_conftest.TestingSessionLocal,
+    )
+    assert campaign.id in {item["campaign_id"] for item in results}
+    assert observed["status"] == CampaignProcessingStatus.PROCESSING
+    assert observed["lease_owner"]
+
+    await async_db_session.refresh(campaign)
+    assert campaign.processing_status == CampaignProcessingStatus.DONE
+    assert campaign.lease_owner is None
+
+
+async def test_campaign_worker_concurrent_reclaims_abandoned_processing(async_db_session):
+    campaign = await _seed_campaign(
+        async_db_session,
+        company_id=91090,
+        processing_status=CampaignProcessingStatus.PROCESSING,
+    )
+    campaign.lease_owner = "crashed-worker"
+    campaign.lease_expires_at = datetime.now(UTC) - timedelta(seconds=1)
+    await async_db_session.commit()
+
+    results = await campaign_processing.process_campaign_queue_concurrently(
+        limit=50,
+        session_factory=base_conftest.TestingSessionLocal,
+    )
+    assert campaign.id in {item["campaign_id"] for item in results}
+
+    await async_db_session.refresh(campaign)
+    assert campaign.processing_status == CampaignProcessingStatus.DONE
+    assert campaign.lease_owner is None
+
+
+async def test_campaign_worker_leased_campaign_requires_live_lease(async_db_session):
+    campaign = await _seed_campaign(
+        async_db_session,
+        company_id=91100,
+        processing_status=CampaignProcessingStatus.QUEUED,
+    )
+    now = datetime.now(UTC)
+    campaign.lease_owner = "me"
+    campaign.lease_expires_at = now - timedelta(seconds=1)
+    await async_db_session.commit()
+
+    result = await campaign_processing._process_leased_campaign(
+        base_conftest.TestingSessionLocal, campaign.id, owner="me", now=now, lease_seconds=60
+    )
+    assert result is None
+
+    await async_db_session.refresh(campaign)
+    assert campaign.processing_status == CampaignProcessingStatus.QUEUED
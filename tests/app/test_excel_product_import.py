@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import select
+
+from app.models.company import Company
+from app.models.product import Product
+from app.models.warehouse import ProductStock, Warehouse
+from app.utils.excel import ExcelProcessor
+
+_COMPANY_ID = 93101
+
+
+async def _ensure_company(session) -> None:
+    if await session.get(Company, _COMPANY_ID) is None:
+        session.add(Company(id=_COMPANY_ID, name=f"Company {_COMPANY_ID}"))
+        await session.flush()
+
+
+def _upload(rows: list[dict]) -> UploadFile:
+    buffer = BytesIO()
+    pd.DataFrame(rows).to_excel(buffer, index=False)
+    buffer.seek(0)
+    return UploadFile(file=buffer, filename="products.xlsx")
+
+
+def test_prepare_import_frame_validates_column_wise():
+    df = pd.DataFrame(
+        {
+            "sku": ["A1", " ", "A2", "A1", "A3"],
+            "name": ["Alpha", "Blank", "Beta", "Alpha v2", "Gamma"],
+            "price": [100, 50, "abc", 120.456, 10],
+            "quantity": [1, None, 2, 5, -1],
+        }
+    )
+    frame, errors = ExcelProcessor._prepare_import_frame(df)
+
+    assert errors == [(3, "Row 3: Invalid data"), (4, "Row 4: Invalid data"), (6, "Row 6: Invalid quantity")]
+    records = frame.to_dict("records")
+    assert [rec["sku"] for rec in records] == ["A1"]
+    assert records[0]["name"] == "Alpha v2"
+    assert records[0]["price"] == Decimal("120.46")
+    assert records[0]["quantity"] == 5
+    assert records[0]["description"] is None
+
+
+def test_prepare_import_frame_normalizes_sku_before_dedupe():
+    df = pd.DataFrame({"sku": [" ab-1 ", "AB-1", "cd-2"], "name": ["One", "One v2", "Two"], "price": [10, 11, 12]})
+    frame, errors = ExcelProcessor._prepare_import_frame(df)
+
+    assert errors == []
+    records = frame.to_dict("records")
+    assert [(rec["sku"], rec["name"]) for rec in records] == [("AB-1", "One v2"), ("CD-2", "Two")]
+
+
+@pytest.mark.asyncio
+async def test_import_products_bulk_upserts_and_sets_stock(async_db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.utils.excel.settings.UPLOAD_DIR", str(tmp_path), raising=False)
+    await _ensure_company(async_db_session)
+    async_db_session.add(Product(company_id=_COMPANY_ID, sku="XL-1", name="Old", price=Decimal("1.00")))
+    await async_db_session.commit()
+
+    processor = ExcelProcessor()
+    result = await processor.import_products_from_excel(
+        _upload(
+            [
+                {"sku": "XL-1", "name": "Updated", "price": 15.5, "quantity": 4, "description": "desc"},
+                {"sku": " xl-2", "name": "New", "price": 20, "quantity": 7, "description": None},
+                {"sku": "", "name": "Broken", "price": 5, "quantity": 1, "description": None},
+            ]
+        ),
+        _COMPANY_ID,
+        async_db_session,
+    )
+
+    assert result["total_rows"] == 3
+    assert result["created"] == 1
+    assert result["updated"] == 1
+    assert result["errors"] == ["Row 4: Invalid data"]
+
+    products = {
+        p.sku: p
+        for p in (await async_db_session.execute(select(Product).where(Product.company_id == _COMPANY_ID)))
+        .scalars()
+        .all()
+    }
+    await async_db_session.refresh(products["XL-1"])
+    assert products["XL-1"].name == "Updated"
+    assert products["XL-1"].price == Decimal("15.50")
+    assert products["XL-1"].description == "desc"
+    assert products["XL-2"].price == Decimal("20.00")
+
+    warehouse = (
+        (await async_db_session.execute(select(Warehouse).where(Warehouse.company_id == _COMPANY_ID))).scalars().one()
+    )
+    stocks = {
+        s.product_id: s.quantity
+        for s in (await async_db_session.execute(select(ProductStock).where(ProductStock.warehouse_id == warehouse.id)))
+        .scalars()
+        .all()
+    }
+    assert stocks == {products["XL-1"].id: 4, products["XL-2"].id: 7}
+
+
+@pytest.mark.asyncio
+async def test_import_skips_deleted_products_and_over_reserved_stock(async_db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.utils.excel.settings.UPLOAD_DIR", str(tmp_path), raising=False)
+    await _ensure_company(async_db_session)
+    deleted = Product(company_id=_COMPANY_ID, sku="XL-DEL", name="Gone", price=Decimal("1.00"))
+    reserved = Product(company_id=_COMPANY_ID, sku="XL-RES", name="Reserved", price=Decimal("1.00"))
+    deleted.deleted_at = datetime.utcnow()
+    warehouse = Warehouse(company_id=_COMPANY_ID, name="Main", is_main=True)
+    async_db_session.add_all([deleted, reserved, warehouse])
+    await async_db_session.flush()
+    async_db_session.add(
+        ProductStock(product_id=reserved.id, warehouse_id=warehouse.id, quantity=10, reserved_quantity=6)
+    )
+    await async_db_session.commit()
+
+    result = await ExcelProcessor().import_products_from_excel(
+        _upload(
+            [
+                {"sku": "XL-DEL", "name": "Revived", "price": 9, "quantity": 3},
+                {"sku": "XL-RES", "name": "Reserved v2", "price": 12, "quantity": 5},
+            ]
+        ),
+        _COMPANY_ID,
+        async_db_session,
+    )
+
+    assert result["errors"] == [
+        "Row 2: Product XL-DEL is deleted",
+        "Row 3: reserved_quantity cannot exceed quantity",
+    ]
+    await async_db_session.refresh(deleted)
+    assert deleted.name == "Gone"
+    assert deleted.deleted_at is not None
+    stock = (
+        await async_db_session.execute(select(ProductStock).where(ProductStock.product_id == reserved.id))
+    ).scalar_one()
+    await async_db_session.refresh(stock)
+    assert (stock.quantity, stock.reserved_quantity) == (10, 6)
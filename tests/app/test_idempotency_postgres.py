@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
 import pytest
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.idempotency import IdempotencyEnforcer
+from app.core.idempotency import IdempotencyEnforcer, purge_expired_idempotency_keys
+from app.models.idempotency_key import IdempotencyKey
 
 
 @pytest.mark.asyncio
@@ -35,3 +40,111 @@ async def test_idempotency_tenant_scoped(async_db_session: AsyncSession):
     allowed, status = await enforcer.reserve(async_db_session, company_id=2, key="shared", ttl_seconds=60)
     assert allowed is True
     assert status is None
+
+
+@pytest.mark.asyncio
+async def test_idempotency_expired_key_is_reclaimed_and_purged(async_db_session: AsyncSession):
+    enforcer = IdempotencyEnforcer(default_ttl=60)
+    await enforcer.set_result(async_db_session, company_id=3, key="old", status_code=201, ttl_seconds=60)
+    await async_db_session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.company_id == 3, IdempotencyKey.key == "old")
+        .values(expires_at=datetime.utcnow() - timedelta(seconds=5))
+    )
+    await async_db_session.commit()
+
+    allowed, status = await enforcer.reserve(async_db_session, company_id=3, key="old", ttl_seconds=60)
+    assert allowed is True
+    assert status is None
+
+    await async_db_session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.company_id == 3, IdempotencyKey.key == "old")
+        .values(expires_at=datetime.utcnow() - timedelta(seconds=5))
+    )
+    await async_db_session.commit()
+
+    purged = await purge_expired_idempotency_keys(async_db_session, batch_size=1)
+    assert purged >= 1
+    res = await async_db_session.execute(select(IdempotencyKey).where(IdempotencyKey.company_id == 3))
+    assert res.scalars().all() == []
+
+
+class _DictRedis:
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+
+    async def set(self, key, value, nx=False, px=None, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.decode() if isinstance(value, bytes) else str(value)
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+
+@pytest.mark.asyncio
+async def test_idempotency_redis_fast_path_and_replay(async_db_session: AsyncSession):
+    redis = _DictRedis()
+    enforcer = IdempotencyEnforcer(redis=redis, default_ttl=60)
+
+    allowed, _ = await enforcer.reserve(async_db_session, company_id=4, key="fast", ttl_seconds=60)
+    assert allowed is True
+    # успешный SET NX не трогает PostgreSQL
+    res = await async_db_session.execute(select(IdempotencyKey).where(IdempotencyKey.company_id == 4))
+    assert res.scalar_one_or_none() is None
+
+    def _no_session():
+        raise AssertionError("Redis fast path must not open a DB session")
+
+    allowed, status = await enforcer.reserve(_no_session, company_id=4, key="fast", ttl_seconds=60)
+    assert (allowed, status) == (False, None)
+
+    await enforcer.set_result(
+        async_db_session, company_id=4, key="fast", status_code=200, ttl_seconds=60, body={"ok": True}
+    )
+    allowed, status = await enforcer.reserve(async_db_session, company_id=4, key="fast", ttl_seconds=60)
+    assert (allowed, status) == (False, 200)
+    assert await enforcer.get_replay(4, "fast") == (200, b'{"ok":true}')
+
+    res = await async_db_session.execute(select(IdempotencyKey).where(IdempotencyKey.company_id == 4))
+    assert res.scalar_one().status_code == 200
+
+
+class _BrokenRedis:
+    async def set(self, *_args, **_kwargs):
+        raise ConnectionError("redis down")
+
+    async def get(self, *_args, **_kwargs):
+        raise ConnectionError("redis down")
+
+
+@pytest.mark.asyncio
+async def test_idempotency_redis_outage_falls_back_to_postgres(async_db_session: AsyncSession):
+    enforcer = IdempotencyEnforcer(redis=_BrokenRedis(), default_ttl=60)
+
+    @asynccontextmanager
+    async def _session_factory():
+        yield async_db_session
+
+    allowed, _ = await enforcer.reserve(_session_factory, company_id=6, key="down", ttl_seconds=60)
+    assert allowed is True
+    res = await async_db_session.execute(select(IdempotencyKey).where(IdempotencyKey.company_id == 6))
+    assert res.scalar_one().status_code is None
+
+    allowed, status = await enforcer.reserve(_session_factory, company_id=6, key="down", ttl_seconds=60)
+    assert (allowed, status) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_idempotency_replay_cache_is_bounded(async_db_session: AsyncSession):
+    enforcer = IdempotencyEnforcer(default_ttl=60, replay_max_bytes=32, replay_cache_size=2)
+
+    await enforcer.set_result(async_db_session, company_id=5, key="big", status_code=200, body={"x": "y" * 64})
+    assert await enforcer.get_replay(5, "big") is None
+
+    for key in ("a", "b", "c"):
+        await enforcer.set_result(async_db_session, company_id=5, key=key, status_code=200, body={"k": key})
+    assert await enforcer.get_replay(5, "a") is None
+    assert await enforcer.get_replay(5, "c") == (200, b'{"k":"c"}')
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.models.inventory_outbox import InventoryOutbox
+from app.worker import inventory_outbox_relay as relay
+from app.worker.inventory_outbox_relay import OutboxDelivery, claim_due_events, relay_outbox_events
+
+
+@pytest.fixture
+def session_factory(async_db_session: AsyncSession) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(bind=async_db_session.bind, expire_on_commit=False)
+
+
+@pytest.fixture
+def deliveries(monkeypatch: pytest.MonkeyPatch) -> list[OutboxDelivery]:
+    monkeypatch.setattr(relay, "_handlers", {})
+    monkeypatch.setattr(settings, "INVENTORY_OUTBOX_WEBHOOK_URL", "", raising=False)
+    monkeypatch.setattr(settings, "INVENTORY_OUTBOX_BACKOFF_BASE_SECONDS", 30, raising=False)
+    monkeypatch.setattr(settings, "INVENTORY_OUTBOX_MAX_ATTEMPTS", 3, raising=False)
+    seen: list[OutboxDelivery] = []
+
+    async def _handler(delivery: OutboxDelivery) -> None:
+        seen.append(delivery)
+
+    relay.register_outbox_handler("marketplace", _handler)
+    return seen
+
+
+async def _add_events(session_factory, *events: dict) -> list[int]:
+    async with session_factory() as session:
+        rows = [InventoryOutbox(status="pending", attempts=0, **ev) for ev in events]
+        session.add_all(rows)
+        await session.commit()
+        return [row.id for row in rows]
+
+
+async def _rows(session_factory) -> dict[int, InventoryOutbox]:
+    async with session_factory() as session:
+        result = await session.execute(sa.select(InventoryOutbox))
+        return {row.id: row for row in result.scalars()}
+
+
+def _price_event(product_id: int, price: str, channel: str = "marketplace") -> dict:
+    return {
+        "aggregate_type": "product",
+        "aggregate_id": str(product_id),
+        "event_type": "price.repriced",
+        "payload": {"product_id": product_id, "new_price": price},
+        "channel": channel,
+    }
+
+
+async def test_relay_coalesces_per_aggregate_and_archives(session_factory, deliveries):
+    ids = await _add_events(
+        session_factory,
+        _price_event(1, "100"),
+        _price_event(2, "500"),
+        {**_price_event(1, "95"), "event_type": "stock.changed"},
+        _price_event(1, "90"),
+        _price_event(3, "10", channel="erp"),
+    )
+
+    summary = await relay_outbox_events(session_factory)
+
+    assert summary["claimed"] == 4
+    assert summary["deliveries"] == 2
+    assert summary["sent"] == 4
+    by_aggregate = {d.aggregate_id: d for d in deliveries}
+    assert by_aggregate["1"].payload == {"product_id": 1, "new_price": "90"}
+    assert by_aggregate["1"].event_types == ["price.repriced", "stock.changed"]
+    assert by_aggregate["1"].event_ids == [ids[0], ids[2], ids[3]]
+
+    rows = await _rows(session_factory)
+    assert {rows[i].status for i in ids[:4]} == {"sent"}
+    assert all(rows[i].processed_at is not None for i in ids[:4])
+    # для erp обработчика нет — событие остаётся в очереди
+    assert rows[ids[4]].status == "pending"
+    assert rows[ids[4]].next_attempt_at is None
+
+
+async def test_failed_delivery_backs_off_then_parks(session_factory, deliveries):
+    calls = 0
+
+    async def _failing(delivery: OutboxDelivery) -> None:
+        nonlocal calls
+        calls += 1
+        raise RuntimeError("marketplace down")
+
+    relay.register_outbox_handler("marketplace", _failing)
+    (event_id,) = await _add_events(session_factory, _price_event(1, "100"))
+    now = datetime.utcnow()
+
+    summary = await relay_outbox_events(session_factory, now=lambda: now)
+    row = (await _rows(session_factory))[event_id]
+    assert summary["failed"] == 1
+    assert (row.status, row.attempts) == ("failed", 1)
+    assert row.next_attempt_at == now + timedelta(seconds=30)
+    assert "marketplace down" in row.last_error
+
+    # до next_attempt_at событие не берётся
+    await relay_outbox_events(session_factory, now=lambda: now + timedelta(seconds=29))
+    assert calls == 1
+
+    await relay_outbox_events(session_factory, now=lambda: now + timedelta(seconds=31))
+    row = (await _rows(session_factory))[event_id]
+    assert row.attempts == 2
+    assert row.next_attempt_at == now + timedelta(seconds=31 + 60)
+
+    summary = await relay_outbox_events(session_factory, now=lambda: now + timedelta(hours=1))
+    row = (await _rows(session_factory))[event_id]
+    assert summary["exhausted"] == 1
+    assert (row.status, row.attempts, row.next_attempt_at) == ("failed", 3, None)
+
+    await relay_outbox_events(session_factory, now=lambda: now + timedelta(days=1))
+    assert calls == 3
+
+
+async def test_producer_channels_route_to_webhook_urls(session_factory, deliveries, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "INVENTORY_OUTBOX_WEBHOOK_URL", "https://hooks.local/default", raising=False)
+    monkeypatch.setattr(settings, "INVENTORY_OUTBOX_CHANNEL_WEBHOOK_URLS", "erp=https://erp.local/hook", raising=False)
+    posted: list[tuple[str, str]] = []
+
+    async def _fake_webhook(delivery: OutboxDelivery, *, url: str) -> None:
+        posted.append((delivery.channel, url))
+
+    monkeypatch.setattr(relay, "_deliver_webhook", _fake_webhook)
+    await _add_events(
+        session_factory,
+        _price_event(1, "1", channel="erp"),
+        _price_event(2, "2", channel="task"),
+        _price_event(3, "3", channel="webhook"),
+        _price_event(4, "4", channel="marketplace"),
+    )
+
+    summary = await relay_outbox_events(session_factory)
+
+    assert summary["sent"] == 4
+    assert sorted(posted) == [
+        ("erp", "https://erp.local/hook"),
+        ("task", "https://hooks.local/default"),
+        ("webhook", "https://hooks.local/default"),
+    ]
+    # зарегистрированный handler канала важнее webhook-транспорта
+    assert [d.channel for d in deliveries] == ["marketplace"]
+
+
+async def test_failed_event_superseded_by_later_delivery_is_not_retried(session_factory, deliveries):
+    async def _failing(delivery: OutboxDelivery) -> None:
+        raise RuntimeError("marketplace down")
+
+    relay.register_outbox_handler("marketplace", _failing)
+    (stale_id,) = await _add_events(session_factory, _price_event(1, "100"))
+    now = datetime.utcnow()
+    await relay_outbox_events(session_factory, now=lambda: now)
+
+    async def _ok(delivery: OutboxDelivery) -> None:
+        deliveries.append(delivery)
+
+    relay.register_outbox_handler("marketplace", _ok)
+    (fresh_id,) = await _add_events(session_factory, _price_event(1, "90"))
+    await relay_outbox_events(session_factory, now=lambda: now + timedelta(seconds=1))
+    assert [d.event_ids for d in deliveries] == [[fresh_id]]
+
+    # ретрай старой цены поверх доставленной новой не уходит
+    summary = await relay_outbox_events(session_factory, now=lambda: now + timedelta(minutes=5))
+    assert summary["superseded"] == 1
+    assert summary["claimed"] == 0
+    assert len(deliveries) == 1
+    row = (await _rows(session_factory))[stale_id]
+    assert (row.status, row.next_attempt_at, row.last_error) == ("sent", None, relay.SUPERSEDED_ERROR)
+
+
+async def test_channel_concurrency_limit(session_factory, deliveries, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "INVENTORY_OUTBOX_CHANNEL_CONCURRENCY", "marketplace=2", raising=False)
+    in_flight = peak = 0
+
+    async def _slow(delivery: OutboxDelivery) -> None:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+
+    relay.register_outbox_handler("marketplace", _slow)
+    await _add_events(session_factory, *(_price_event(i, "1") for i in range(6)))
+
+    summary = await relay_outbox_events(session_factory)
+
+    assert summary["deliveries"] == 6
+    assert peak == 2
+
+
+async def test_claim_skips_rows_locked_by_another_relay(session_factory, deliveries):
+    first, second, newer = await _add_events(
+        session_factory, _price_event(1, "1"), _price_event(2, "2"), _price_event(1, "0.5")
+    )
+
+    async with session_factory() as locker:
+        await locker.execute(sa.select(InventoryOutbox.id).where(InventoryOutbox.id == first).with_for_update())
+        async with session_factory() as session:
+            rows = await claim_due_events(session, channels=["marketplace"], limit=10, lease_seconds=60)
+        await locker.rollback()
+
+    # более новое событие агрегата 1 ждёт, пока старое не освободится
+    assert [row["id"] for row in rows] == [second]
+    assert (await _rows(session_factory))[newer].next_attempt_at is None
+
+
+async def test_claim_holds_back_aggregate_leased_by_another_relay(session_factory, deliveries):
+    (first,) = await _add_events(session_factory, _price_event(1, "1"))
+    now = datetime.utcnow()
+    async with session_factory() as session:
+        leased = await claim_due_events(session, channels=["marketplace"], limit=10, lease_seconds=60, now=now)
+    assert [row["id"] for row in leased] == [first]
+
+    newer, other = await _add_events(session_factory, _price_event(1, "2"), _price_event(2, "3"))
+    async with session_factory() as session:
+        rows = await claim_due_events(session, channels=["marketplace"], limit=10, lease_seconds=60, now=now)
+    assert [row["id"] for row in rows] == [other]
+
+    # lease истёк (relay упал) — старое и новое событие уходят вместе, одной доставкой
+    await relay_outbox_events(session_factory, now=lambda: now + timedelta(seconds=61))
+    assert [d.event_ids for d in deliveries if d.aggregate_id == "1"] == [[first, newer]]
+
+
+async def test_old_sent_events_are_purged(session_factory, deliveries, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "INVENTORY_OUTBOX_RETENTION_DAYS", 7, raising=False)
+    old, fresh = await _add_events(session_factory, _price_event(1, "1"), _price_event(2, "2"))
+    async with session_factory() as session:
+        await session.execute(
+            sa.update(InventoryOutbox)
+            .where(InventoryOutbox.id == old)
+            .values(status="sent", processed_at=datetime.utcnow() - timedelta(days=8))
+        )
+        await session.commit()
+
+    summary = await relay_outbox_events(session_factory)
+
+    assert summary["purged"] == 1
+    assert set(await _rows(session_factory)) == {fresh}
+
+
+async def test_sent_events_are_kept_by_default(session_factory, deliveries, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "INVENTORY_OUTBOX_RETENTION_DAYS", 0, raising=False)
+    (old,) = await _add_events(session_factory, _price_event(1, "1"))
+    async with session_factory() as session:
+        await session.execute(
+            sa.update(InventoryOutbox)
+            .where(InventoryOutbox.id == old)
+            .values(status="sent", processed_at=datetime.utcnow() - timedelta(days=365))
+        )
+        await session.commit()
+
+    summary = await relay_outbox_events(session_factory)
+
+    assert summary["purged"] == 0
+    assert set(await _rows(session_factory)) == {old}
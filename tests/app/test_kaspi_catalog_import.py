@@ -1,8 +1,13 @@
+from datetime import datetime, timedelta
+
 import pytest
 from sqlalchemy import select
 
+import tests.conftest as base_conftest
+from app.core import db as core_db
 from app.models.catalog_import import CatalogImportBatch, CatalogImportRow
 from app.models.kaspi_offer import KaspiOffer
+from app.services.kaspi_catalog_import import STALE_IMPORT_ERROR, stale_after_seconds
 
 
 def _csv_bytes(text: str) -> bytes:
@@ -469,3 +474,87 @@ async def test_kaspi_catalog_import_dry_run(async_client, async_db_session, comp
     assert batch is None
     assert row is None
     assert offer is None
+
+
+@pytest.mark.asyncio
+async def test_kaspi_catalog_import_background_job(
+    async_client,
+    async_db_session,
+    company_a_admin_headers,
+    monkeypatch,
+):
+    monkeypatch.setattr(core_db, "get_async_session_maker", lambda: base_conftest.TestingSessionLocal)
+    monkeypatch.setattr("app.core.config.settings.KASPI_CATALOG_IMPORT_CHUNK_SIZE", 2, raising=False)
+
+    csv_data = "SKU,Title,Price,Stock\nB1,Item 1,1000,1\n,No SKU,10,1\nB2,Item 2,2000,2\nB1,Item 1,1500,3\n"
+    resp = await async_client.post(
+        "/api/v1/kaspi/catalog/import",
+        headers=company_a_admin_headers,
+        params={"merchantUid": "M1", "background": "true"},
+        files={"file": ("catalog.csv", _csv_bytes(csv_data), "text/csv")},
+    )
+    assert resp.status_code == 202
+    data = resp.json()
+    assert data["status"] == "PENDING"
+    batch_id = data["batch_id"]
+
+    detail = await async_client.get(
+        f"/api/v1/kaspi/catalog/import/batches/{batch_id}",
+        headers=company_a_admin_headers,
+    )
+    assert detail.status_code == 200
+    body = detail.json()
+    assert body["status"] == "DONE"
+    assert body["rows_total"] == 4
+    assert body["rows_ok"] == 3
+    assert body["rows_failed"] == 1
+
+    await async_db_session.rollback()
+    offers = {
+        o.sku: o
+        for o in (await async_db_session.execute(select(KaspiOffer).where(KaspiOffer.merchant_uid == "M1")))
+        .scalars()
+        .all()
+    }
+    assert set(offers) == {"B1", "B2"}
+    assert float(offers["B1"].price or 0) == 1500.0
+    assert offers["B1"].stock_count == 3
+
+
+@pytest.mark.asyncio
+async def test_kaspi_catalog_import_stale_batches_marked_failed(
+    async_client, async_db_session, company_a_admin_headers
+):
+    stale_at = datetime.utcnow() - timedelta(seconds=stale_after_seconds() + 60)
+    stale = CatalogImportBatch(
+        company_id=1001,
+        filename="stale.csv",
+        content_hash="stale-hash",
+        status="RUNNING",
+        merchant_uid="M1",
+        started_at=stale_at,
+        created_at=stale_at,
+        updated_at=stale_at,
+    )
+    live = CatalogImportBatch(
+        company_id=1001,
+        filename="live.csv",
+        content_hash="live-hash",
+        status="RUNNING",
+        merchant_uid="M1",
+        started_at=datetime.utcnow(),
+    )
+    async_db_session.add_all([stale, live])
+    await async_db_session.commit()
+
+    detail = await async_client.get(
+        f"/api/v1/kaspi/catalog/import/batches/{stale.id}",
+        headers=company_a_admin_headers,
+    )
+    assert detail.status_code == 200
+    assert detail.json()["status"] == "FAILED"
+    assert detail.json()["error_summary"] == STALE_IMPORT_ERROR
+
+    listed = await async_client.get("/api/v1/kaspi/catalog/import/batches", headers=company_a_admin_headers)
+    statuses = {item["id"]: item["status"] for item in listed.json()}
+    assert statuses[str(live.id)] == "RUNNING"
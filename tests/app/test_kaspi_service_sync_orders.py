@@ -4,6 +4,7 @@ import asyncio
 from datetime import UTC, datetime, timedelta
 
 import pytest
+import sqlalchemy as sa
 
 from app.models.company import Company
 from app.models.kaspi_order_sync_state import KaspiOrderSyncState
@@ -62,6 +63,47 @@ async def test_kaspi_service_sync_orders_uses_env_state_list(async_db_session, m
     assert states == list(DEFAULT_KASPI_ORDER_STATES)
 
 
+@pytest.mark.asyncio
+async def test_kaspi_service_sync_orders_reports_progress_per_page(async_db_session, monkeypatch):
+    service = KaspiService(api_key="token", base_url="https://kaspi.kz")
+
+    company = await async_db_session.get(Company, 1001)
+    if company is None:
+        company = Company(id=1001, name="Company 1001", kaspi_store_id="store-a")
+        async_db_session.add(company)
+        await async_db_session.commit()
+
+    calls: list[str | None] = []
+
+    async def _iter_orders_pages(*, state=None, **kwargs):  # noqa: ANN001, ARG001
+        calls.append(state)
+        if len(calls) > 1:
+            return
+        yield [{"id": "P-1", "status": "NEW"}, {"id": "P-2", "status": "NEW"}]
+        yield [{"id": "P-3", "status": "NEW"}]
+
+    progress: list[dict] = []
+
+    async def _on_progress(update):  # noqa: ANN001
+        progress.append(update)
+
+    monkeypatch.setenv("KASPI_ORDERS_SYNC_STATES", "NEW")
+    monkeypatch.setattr(service, "_iter_orders_pages", _iter_orders_pages)
+
+    result = await service.sync_orders(
+        db=async_db_session,
+        company_id=1001,
+        request_id="req-progress",
+        on_progress=_on_progress,
+    )
+
+    assert result["ok"] is True
+    assert [(p["pages_fetched"], p["orders_fetched"], p["orders_upserted"]) for p in progress] == [
+        (1, 2, 2),
+        (2, 3, 3),
+    ]
+
+
 @pytest.mark.asyncio
 async def test_kaspi_service_sync_orders_clamps_stale_window_to_14_days(async_db_session, monkeypatch):
     service = KaspiService(api_key="token", base_url="https://kaspi.kz")
@@ -131,3 +173,139 @@ async def test_kaspi_service_sync_orders_clamps_backfill_to_14_days(async_db_ses
     assert result["ok"] is True
     assert "date_from" in captured and "date_to" in captured
     assert captured["date_to"] - captured["date_from"] <= timedelta(days=14)
+
+
+@pytest.mark.asyncio
+async def test_kaspi_service_sync_orders_fans_out_states_and_slices(async_db_session, monkeypatch):
+    # settings, которые видит сервис: другие тесты могут перезагружать app.core.config
+    from app.services.kaspi_service_sync import settings
+
+    service = KaspiService(api_key="token", base_url="https://kaspi.kz")
+    company = await async_db_session.get(Company, 1001)
+    if company is None:
+        company = Company(id=1001, name="Company 1001", kaspi_store_id="store-a")
+        async_db_session.add(company)
+        await async_db_session.commit()
+
+    monkeypatch.setattr(settings, "KASPI_ORDERS_FETCH_CONCURRENCY", 3, raising=False)
+    monkeypatch.setattr(settings, "KASPI_ORDERS_FETCH_SLICE_HOURS", 24, raising=False)
+    streams: list[tuple[str | None, datetime]] = []
+    in_flight = {"now": 0, "max": 0}
+
+    async def _iter_orders_pages(*, date_from, date_to, state=None, **kwargs):  # noqa: ANN001, ARG001
+        streams.append((state, date_from))
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        ts = date_to - timedelta(minutes=1)
+        yield [
+            {
+                "id": f"fan-{state}-{ts:%m%d%H%M}",
+                "status": "NEW",
+                "totalPrice": 100,
+                "creationDate": int(ts.replace(tzinfo=UTC).timestamp() * 1000),
+            }
+        ]
+
+    monkeypatch.setattr(service, "_iter_orders_pages", _iter_orders_pages)
+
+    result = await service.sync_orders(
+        db=async_db_session,
+        company_id=1001,
+        request_id="req-fanout",
+        statuses=["NEW", "PICKUP"],
+        backfill_days=3,
+    )
+
+    assert result["ok"] is True
+    assert result["fetched"] == len(streams) == 8
+    assert 1 < in_flight["max"] <= 3
+    state = (
+        await async_db_session.execute(sa.select(KaspiOrderSyncState).where(KaspiOrderSyncState.company_id == 1001))
+    ).scalar_one()
+    newest = max(ts for _, ts in streams)
+    assert state.last_synced_at is not None and state.last_synced_at > newest
+    assert state.last_external_order_id.startswith("fan-PICKUP-")
+
+
+@pytest.mark.asyncio
+async def test_recalculate_order_totals_matches_calculate_totals(async_db_session):
+    from decimal import Decimal
+
+    from sqlalchemy.orm import selectinload
+
+    from app.models.order import Order, OrderItem
+
+    company = await async_db_session.get(Company, 1001)
+    if company is None:
+        async_db_session.add(Company(id=1001, name="Company 1001"))
+        await async_db_session.flush()
+
+    cases = [
+        # (tax, shipping, discount, [(unit_price, quantity, stored_total_price)])
+        ("0", "0", "0", [("19.99", 3, "59.97"), ("0.01", 7, "0.07")]),
+        ("12.50", "990.00", "100.25", [("1234.56", 2, "2000.00"), ("10.00", 1, "10.00")]),
+        ("0", "0", "5000.00", [("100.00", 1, "100.00")]),  # скидка больше суммы -> 0
+        ("3.00", "7.00", "0", []),  # без позиций
+        ("0.05", "0", "0.10", [("0.05", 3, "0.15"), ("333.33", 3, "1000.00")]),
+    ]
+    order_ids: list[int] = []
+    for idx, (tax, shipping, discount, items) in enumerate(cases):
+        order = Order(
+            company_id=1001,
+            order_number=f"RECALC-{idx}",
+            currency="KZT",
+            subtotal=Decimal("1"),
+            total_amount=Decimal("1"),
+            tax_amount=Decimal(tax),
+            shipping_amount=Decimal(shipping),
+            discount_amount=Decimal(discount),
+        )
+        async_db_session.add(order)
+        await async_db_session.flush()
+        for n, (unit_price, quantity, total_price) in enumerate(items):
+            async_db_session.add(
+                OrderItem(
+                    order_id=order.id,
+                    sku=f"SKU-{idx}-{n}",
+                    name="Item",
+                    unit_price=Decimal(unit_price),
+                    quantity=quantity,
+                    total_price=Decimal(total_price),
+                )
+            )
+        order_ids.append(order.id)
+    await async_db_session.commit()
+
+    async def _load() -> dict[int, Order]:
+        async_db_session.expunge_all()
+        res = await async_db_session.execute(
+            sa.select(Order).options(selectinload(Order.items)).where(Order.id.in_(order_ids))
+        )
+        return {o.id: o for o in res.scalars()}
+
+    expected: dict[int, tuple] = {}
+    for order in (await _load()).values():
+        order.calculate_totals()
+        expected[order.id] = (
+            order.subtotal,
+            order.total_amount,
+            sorted((i.sku, Decimal(i.total_price)) for i in order.items),
+        )
+    async_db_session.expunge_all()
+
+    service = KaspiService(api_key="token", base_url="https://kaspi.kz")
+    await service._recalculate_order_totals(async_db_session, order_ids=order_ids[:-1])
+    await async_db_session.commit()
+
+    actual = await _load()
+    for order_id in order_ids[:-1]:
+        order = actual[order_id]
+        assert (
+            order.subtotal,
+            order.total_amount,
+            sorted((i.sku, i.total_price) for i in order.items),
+        ) == expected[order_id]
+    # заказ вне набора не трогается
+    assert actual[order_ids[-1]].subtotal == Decimal("1.00")
@@ -739,3 +739,187 @@ async def test_kaspi_sync_now_query_only_accepts(
     )
     assert resp.status_code == 200
     assert "secret-token" not in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_kaspi_sync_now_background_job_reports_progress(
+    async_client,
+    async_db_session,
+    monkeypatch,
+    company_a_admin_headers,
+):
+    import tests.conftest as base_conftest
+    from app.api.v1 import kaspi as kaspi_module
+    from app.core import db as core_db
+
+    monkeypatch.setattr(core_db, "get_async_session_maker", lambda: base_conftest.TestingSessionLocal)
+    await _ensure_company(async_db_session, 1001, "store-a")
+
+    async def _get_token(session, store_name: str):
+        return "token-a"
+
+    monkeypatch.setattr(KaspiStoreToken, "get_token", _get_token)
+
+    async_db_session.add(KaspiOffer(company_id=1001, merchant_uid="M1", sku="S1", title="Item 1", price=1000))
+    await async_db_session.commit()
+
+    async def _lock_true(*args, **kwargs):
+        return True
+
+    async def _unlock(*args, **kwargs):
+        return None
+
+    async def _sync_orders(*args, on_progress=None, **kwargs):
+        # страницы синка отдают прогресс через колбэк
+        await on_progress({"pages_fetched": 1, "orders_fetched": 100, "orders_upserted": 40})
+        await on_progress({"pages_fetched": 2, "orders_fetched": 150, "orders_upserted": 55})
+        return {"ok": True, "fetched": 150}
+
+    async def _submit_import(*args, **kwargs):
+        return {"code": "IC-1", "status": "UPLOADED"}
+
+    async def _get_status(*args, **kwargs):
+        return {"status": "UPLOADED"}
+
+    monkeypatch.setattr(kaspi_module, "_try_sync_now_lock", _lock_true)
+    monkeypatch.setattr(kaspi_module, "_release_sync_now_lock", _unlock)
+    monkeypatch.setattr(kaspi_module.KaspiService, "sync_orders", _sync_orders)
+    monkeypatch.setattr(kaspi_module.KaspiGoodsImportClient, "submit_import", _submit_import)
+    monkeypatch.setattr(kaspi_module.KaspiGoodsImportClient, "get_status", _get_status)
+    monkeypatch.setattr(kaspi_module, "_build_kaspi_offers_xml", lambda *args, **kwargs: "<xml/>")
+
+    resp = await async_client.post(
+        "/api/v1/kaspi/sync/now",
+        headers=company_a_admin_headers,
+        params={"background": "true"},
+        json={"merchant_uid": "M1"},
+    )
+    assert resp.status_code == 202
+    accepted = resp.json()
+    assert accepted["status"] == "PENDING"
+    job_id = accepted["job_id"]
+    assert resp.headers["Location"].endswith(f"/sync/now/jobs/{job_id}")
+
+    detail = await async_client.get(f"/api/v1/kaspi/sync/now/jobs/{job_id}", headers=company_a_admin_headers)
+    assert detail.status_code == 200
+    job = detail.json()
+    assert job["status"] == "DONE"
+    assert job["phase"] == "offers_feed"
+    assert job["pages_fetched"] == 2
+    assert job["orders_fetched"] == 150
+    assert job["orders_upserted"] == 55
+    assert job["http_status"] == 200
+    assert job["result"]["goods_import_code"] == "IC-1"
+    assert job["result"]["orders_sync"]["ok"] is True
+    assert job["started_at"] and job["finished_at"]
+
+    events = await async_client.get(f"/api/v1/kaspi/sync/now/jobs/{job_id}/events", headers=company_a_admin_headers)
+    assert events.status_code == 200
+    assert events.headers["content-type"].startswith("text/event-stream")
+    assert events.text.startswith("event: done\n")
+    assert json.loads(events.text.split("data: ", 1)[1])["job_id"] == job_id
+
+    missing = await async_client.get(
+        "/api/v1/kaspi/sync/now/jobs/00000000-0000-0000-0000-000000000000",
+        headers=company_a_admin_headers,
+    )
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_kaspi_sync_now_background_job_records_lock_conflict(
+    async_client,
+    async_db_session,
+    monkeypatch,
+    company_a_admin_headers,
+):
+    import tests.conftest as base_conftest
+    from app.api.v1 import kaspi as kaspi_module
+    from app.core import db as core_db
+
+    monkeypatch.setattr(core_db, "get_async_session_maker", lambda: base_conftest.TestingSessionLocal)
+    await _ensure_company(async_db_session, 1001, "store-a")
+
+    async def _get_token(session, store_name: str):
+        return "token-a"
+
+    async def _lock_false(*args, **kwargs):
+        return False
+
+    monkeypatch.setattr(KaspiStoreToken, "get_token", _get_token)
+    monkeypatch.setattr(kaspi_module, "_try_sync_now_lock", _lock_false)
+
+    resp = await async_client.post(
+        "/api/v1/kaspi/sync/now",
+        headers=company_a_admin_headers,
+        params={"background": "true"},
+        json={"merchant_uid": "M1"},
+    )
+    assert resp.status_code == 202
+    job_id = resp.json()["job_id"]
+
+    job = (await async_client.get(f"/api/v1/kaspi/sync/now/jobs/{job_id}", headers=company_a_admin_headers)).json()
+    assert job["status"] == "FAILED"
+    assert job["http_status"] == 409
+    assert job["error_code"] == "kaspi_sync_in_progress"
+
+
+@pytest.mark.asyncio
+async def test_kaspi_sync_now_background_single_active_job_and_stale_reporting(
+    async_client,
+    async_db_session,
+    monkeypatch,
+    company_a_admin_headers,
+):
+    import sqlalchemy as sa
+    from sqlalchemy.exc import IntegrityError
+
+    import tests.conftest as base_conftest
+    from app.api.v1 import kaspi as kaspi_module
+    from app.core import db as core_db
+    from app.models.kaspi_sync_now_job import KaspiSyncNowJob
+
+    monkeypatch.setattr(core_db, "get_async_session_maker", lambda: base_conftest.TestingSessionLocal)
+    await _ensure_company(async_db_session, 1001, "store-a")
+
+    async def _get_token(session, store_name: str):
+        return "token-a"
+
+    monkeypatch.setattr(KaspiStoreToken, "get_token", _get_token)
+    monkeypatch.setattr(kaspi_module, "_sync_now_background_timeout", lambda: 60.0)
+
+    running = KaspiSyncNowJob(company_id=1001, merchant_uid="M1", status="RUNNING", phase="orders_sync")
+    stale_at = datetime.utcnow() - timedelta(seconds=600)
+    stale = KaspiSyncNowJob(
+        company_id=1001, merchant_uid="M2", status="RUNNING", created_at=stale_at, updated_at=stale_at
+    )
+    async_db_session.add_all([running, stale])
+    await async_db_session.commit()
+
+    # второй активной задачи на мерчанта БД не допускает
+    async with base_conftest.TestingSessionLocal() as other:
+        other.add(KaspiSyncNowJob(company_id=1001, merchant_uid="M1", status="PENDING"))
+        with pytest.raises(IntegrityError):
+            await other.commit()
+
+    resp = await async_client.post(
+        "/api/v1/kaspi/sync/now",
+        headers=company_a_admin_headers,
+        params={"background": "true"},
+        json={"merchant_uid": "M1"},
+    )
+    assert resp.status_code == 202
+    assert resp.json()["job_id"] == str(running.id)
+
+    detail = await async_client.get(f"/api/v1/kaspi/sync/now/jobs/{stale.id}", headers=company_a_admin_headers)
+    body = detail.json()
+    assert (body["status"], body["error_code"]) == ("FAILED", "kaspi_sync_stale")
+    assert body["finished_at"]
+
+    events = await async_client.get(f"/api/v1/kaspi/sync/now/jobs/{stale.id}/events", headers=company_a_admin_headers)
+    assert events.text.startswith("event: done\n")
+
+    count = await async_db_session.execute(
+        sa.select(sa.func.count()).select_from(KaspiSyncNowJob).where(KaspiSyncNowJob.company_id == 1001)
+    )
+    assert count.scalar_one() == 2
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.core.kaspi_token_cache as token_cache
+from app.core.config import settings
+from app.core.kaspi_token_cache import KaspiTokenCache
+from app.models.marketplace import KaspiStoreToken
+
+
+@pytest.fixture
+def cache(monkeypatch: pytest.MonkeyPatch) -> KaspiTokenCache:
+    monkeypatch.setattr(settings, "KASPI_TOKEN_CACHE_TTL_SECONDS", 60, raising=False)
+    instance = KaspiTokenCache(enabled=True)
+    monkeypatch.setattr(token_cache, "kaspi_token_cache", instance)
+    return instance
+
+
+def test_cache_keeps_tokens_encrypted_and_normalizes_keys(cache: KaspiTokenCache):
+    cache.put("  My Store ", "secret-token-123")
+
+    assert cache.get("my store") == "secret-token-123"
+    ciphertext, _expires_at = cache._entries["my store"]
+    assert b"secret-token-123" not in ciphertext
+
+
+def test_cache_expires_and_evicts(cache: KaspiTokenCache, monkeypatch: pytest.MonkeyPatch):
+    now = [1000.0]
+    monkeypatch.setattr(token_cache.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(settings, "KASPI_TOKEN_CACHE_MAX_ENTRIES", 2, raising=False)
+
+    cache.put("a", "ta")
+    cache.put("b", "tb")
+    cache.put("c", "tc")
+    assert cache.get("a") is None  # вытеснен LRU
+    assert cache.get("b") == "tb"
+
+    now[0] += 61
+    assert cache.get("b") is None
+    assert cache.stats()["size"] == 1
+
+
+def test_put_after_invalidation_is_ignored(cache: KaspiTokenCache):
+    generation = cache.generation()
+    cache.invalidate("store")
+    cache.put("store", "stale-token", generation=generation)
+
+    assert cache.get("store") is None
+
+
+class _FakeTokenSession:
+    """Эмулирует pgp_sym_* на словаре: считает расшифровки (SELECT pgp_sym_decrypt)."""
+
+    def __init__(self):
+        self.tokens: dict[str, str] = {}
+        self.decrypts = 0
+
+    async def execute(self, sql, params=None):
+        text = str(sql)
+        rows: list[tuple] = []
+        if "pgp_sym_decrypt" in text:
+            self.decrypts += 1
+            token = self.tokens.get(params["store"].strip().lower())
+            rows = [(token.encode(),)] if token else []
+        elif text.lstrip().startswith("INSERT"):
+            self.tokens[params["store"]] = params["tok"]
+            rows = [(None, params["store"], b"", None, None)]
+        elif text.lstrip().startswith("DELETE"):
+            removed = self.tokens.pop(params["name"].strip().lower(), None)
+            return _FakeResult([], rowcount=int(removed is not None))
+        return _FakeResult(rows)
+
+    async def commit(self):
+        return None
+
+    async def rollback(self):
+        return None
+
+
+class _FakeResult:
+    def __init__(self, rows: list[tuple], rowcount: int = 0):
+        self._rows = rows
+        self.rowcount = rowcount
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+
+async def test_get_token_uses_cache_and_invalidates_on_write(cache: KaspiTokenCache):
+    session = _FakeTokenSession()
+    await KaspiStoreToken.upsert_token(session, "Cache-Store", "token-v1")
+
+    assert await KaspiStoreToken.get_token(session, "cache-store") == "token-v1"
+    assert await KaspiStoreToken.get_token(session, " CACHE-STORE ") == "token-v1"
+    assert session.decrypts == 1
+    assert cache.hits == 1
+
+    await KaspiStoreToken.upsert_token(session, "cache-store", "token-v2")
+    assert await KaspiStoreToken.get_token(session, "cache-store") == "token-v2"
+    assert session.decrypts == 2
+
+    assert await KaspiStoreToken.delete_by_store(session, "cache-store")
+    assert await KaspiStoreToken.get_token(session, "cache-store") is None
+
+
+async def test_store_name_lookup_can_use_expression_index(async_db_session: AsyncSession):
+    await async_db_session.execute(sa.text("SET LOCAL enable_seqscan = off"))
+    plan = (
+        await async_db_session.execute(
+            sa.text(
+                "EXPLAIN SELECT 1 FROM kaspi_store_tokens WHERE lower(trim(store_name)) = lower(trim(:store)) LIMIT 1"
+            ),
+            {"store": "Some Store"},
+        )
+    ).scalars()
+    assert "ix_kaspi_store_tokens_store_name_norm" in "\n".join(plan)
+    await async_db_session.rollback()
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from app.core import logging as app_logging
+from app.core.logging import _redact_processor, redact_secrets
+
+
+def test_redact_secrets_masks_nested_keys() -> None:
+    data = {
+        "merchant_uid": "m-1",
+        "api_key": "abcdef123456",
+        "public_key": "visible",
+        "items": [{"Token": "xyz"}, ("plain", {"client_secret": "supersecretvalue"})],
+    }
+
+    out = redact_secrets(data)
+
+    assert out["merchant_uid"] == "m-1"
+    assert out["api_key"] == "abc***456"
+    assert out["public_key"] == "visible"
+    assert out["items"][0] == {"Token": "***"}
+    assert out["items"][1] == ("plain", {"client_secret": "sup***lue"})
+    assert data["api_key"] == "abcdef123456"
+
+
+def test_redact_processor_fast_path_keeps_flat_event() -> None:
+    event = {"event": "request_end", "status": 200, "path": "/api/v1/orders"}
+    assert _redact_processor(None, None, event) is event
+
+    event_with_secret = {"event": "login", "password": "hunter22"}
+    assert _redact_processor(None, None, event_with_secret)["password"] == "hun***r22"
+
+
+def test_redact_secrets_depth_and_size_limits(monkeypatch) -> None:
+    monkeypatch.setattr(app_logging, "_REDACT_MAX_DEPTH", 2)
+    monkeypatch.setattr(app_logging, "_REDACT_MAX_ITEMS", 3)
+
+    nested = {"a": {"b": {"token": "x", "c": 1}}}
+    assert redact_secrets(nested) == {"a": {"b": "***"}}
+
+    assert redact_secrets([1, 2, 3, 4, 5]) == [1, 2, 3, "...(+2 more)"]
+    assert redact_secrets({"k1": 1, "k2": 2, "k3": 3, "k4": 4}) == {"k1": 1, "k2": 2, "k3": 3, "__truncated__": 1}
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+import logging
+import queue
+
+from app.core.logging import (
+    BatchingQueueListener,
+    BatchingRotatingFileHandler,
+    DroppingQueueHandler,
+    JsonLineFormatter,
+)
+
+
+def _logger(name: str, handler: logging.Handler) -> logging.Logger:
+    lg = logging.getLogger(name)
+    lg.handlers = [handler]
+    lg.setLevel(logging.DEBUG)
+    lg.propagate = False
+    return lg
+
+
+def test_queue_pipeline_writes_json_lines_in_batches(tmp_path) -> None:
+    path = tmp_path / "app.log"
+    file_handler = BatchingRotatingFileHandler(str(path), maxBytes=10 * 1024 * 1024, encoding="utf8")
+    file_handler.setFormatter(JsonLineFormatter())
+    q: queue.Queue = queue.Queue(maxsize=1000)
+    queue_handler = DroppingQueueHandler(q)
+    listener = BatchingQueueListener(q, file_handler, batch_size=50, stats=queue_handler.stats)
+    lg = _logger("test.log_queue.batches", queue_handler)
+
+    for i in range(120):
+        lg.info("order %s synced", i, extra={"company_id": 7})
+    lg.info(json.dumps({"event": "structlog_event", "page": 3}))
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        lg.exception("sync failed")
+
+    listener.start()
+    listener.stop()
+    file_handler.close()
+
+    lines = [json.loads(line) for line in path.read_text(encoding="utf8").splitlines()]
+    assert len(lines) == 122
+    assert lines[0]["message"] == "order 0 synced"
+    assert lines[0]["company_id"] == 7
+    assert lines[0]["level"] == "INFO"
+    assert lines[120]["event"] == "structlog_event" and lines[120]["page"] == 3
+    assert "ValueError: boom" in lines[121]["exc_info"]
+    stats = queue_handler.stats.snapshot()
+    assert stats["dropped"] == 0
+    assert stats["batches"] >= 3
+    assert stats["max_batch"] == 50
+
+
+def test_queue_handler_drops_when_full_without_blocking() -> None:
+    q: queue.Queue = queue.Queue(maxsize=2)
+    queue_handler = DroppingQueueHandler(q)
+    lg = _logger("test.log_queue.drops", queue_handler)
+
+    for i in range(5):
+        lg.info("info %s", i)
+    lg.error("error kept only if there is room")
+
+    stats = queue_handler.stats.snapshot()
+    assert q.qsize() == 2
+    assert stats["enqueued"] == 2
+    assert stats["overflow"] == 4
+    assert stats["dropped"] == 4
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.company import Company
+from app.models.inventory_outbox import InventoryOutbox
+from app.models.product import Product
+from app.models.warehouse import ProductStock, Warehouse, low_stock_report, scan_and_enqueue_reorder_alerts
+from app.services.low_stock import raise_low_stock_alerts
+
+
+async def _seed(db: AsyncSession, company_id: int, stocks: list[tuple[str, int, int]]) -> dict[str, int]:
+    """stocks: (sku, quantity, min_quantity) -> {sku: stock_id}"""
+    db.add(Company(id=company_id, name=f"Company {company_id}"))
+    await db.flush()
+    warehouse = Warehouse(company_id=company_id, name=f"WH-{company_id}", is_main=True)
+    db.add(warehouse)
+    await db.flush()
+    ids: dict[str, int] = {}
+    for sku, quantity, min_quantity in stocks:
+        product = Product(company_id=company_id, name=f"Product {sku}", slug=sku.lower(), sku=sku, price=100)
+        db.add(product)
+        await db.flush()
+        stock = ProductStock(
+            product_id=product.id,
+            warehouse_id=warehouse.id,
+            quantity=quantity,
+            reserved_quantity=0,
+            min_quantity=min_quantity,
+        )
+        db.add(stock)
+        await db.flush()
+        ids[sku] = stock.id
+    await db.commit()
+    return ids
+
+
+async def _outbox_count(db: AsyncSession) -> int:
+    return int((await db.execute(sa.select(sa.func.count(InventoryOutbox.id)))).scalar_one())
+
+
+async def test_low_stock_scan_groups_tenants_and_deduplicates(async_db_session: AsyncSession):
+    a = await _seed(async_db_session, 3101, [("A-LOW", 2, 5), ("A-OK", 10, 5), ("A-UNTRACKED", 0, 0)])
+    b = await _seed(async_db_session, 3102, [("B-LOW", 0, 1)])
+
+    alerts = await raise_low_stock_alerts(async_db_session)
+
+    assert {cid: [p["sku"] for p in items] for cid, items in alerts.items()} == {3101: ["A-LOW"], 3102: ["B-LOW"]}
+    assert alerts[3101][0] == {
+        "name": "Product A-LOW",
+        "sku": "A-LOW",
+        "stock": 2,
+        "min_stock": 5,
+        "warehouse": "WH-3101",
+        "company_name": "Company 3101",
+    }
+    events = (await async_db_session.execute(sa.select(InventoryOutbox))).scalars().all()
+    assert sorted(e.aggregate_id for e in events) == sorted([str(a["A-LOW"]), str(b["B-LOW"])])
+    assert {e.event_type for e in events} == {"reorder.alert"}
+
+    # тот же уровень остатка — повторного алерта нет
+    assert await raise_low_stock_alerts(async_db_session) == {}
+    assert await _outbox_count(async_db_session) == 2
+
+    # остаток упал ещё — новый алерт; пополнение сбрасывает отметку
+    await async_db_session.execute(sa.update(ProductStock).where(ProductStock.id == a["A-LOW"]).values(quantity=1))
+    await async_db_session.commit()
+    assert [p["stock"] for p in (await raise_low_stock_alerts(async_db_session))[3101]] == [1]
+
+    await async_db_session.execute(sa.update(ProductStock).where(ProductStock.id == a["A-LOW"]).values(quantity=20))
+    await async_db_session.commit()
+    assert await raise_low_stock_alerts(async_db_session) == {}
+    alerted = await async_db_session.scalar(
+        sa.select(ProductStock.low_stock_alerted_qty).where(ProductStock.id == a["A-LOW"])
+    )
+    assert alerted is None
+
+    await async_db_session.execute(sa.update(ProductStock).where(ProductStock.id == a["A-LOW"]).values(quantity=1))
+    await async_db_session.commit()
+    assert 3101 in await raise_low_stock_alerts(async_db_session)
+    assert await _outbox_count(async_db_session) == 4
+
+
+async def test_low_stock_mark_is_set_only_after_notification(async_db_session: AsyncSession):
+    ids = await _seed(async_db_session, 3103, [("C-LOW", 1, 5)])
+    notified: list[tuple[int, list[str]]] = []
+
+    async def _failing(company_id: int, alerts: list[dict]) -> None:
+        raise RuntimeError("smtp down")
+
+    async def _ok(company_id: int, alerts: list[dict]) -> None:
+        notified.append((company_id, [a["sku"] for a in alerts]))
+
+    assert await raise_low_stock_alerts(async_db_session, company_id=3103, notify=_failing) == {}
+    alerted = await async_db_session.scalar(
+        sa.select(ProductStock.low_stock_alerted_qty).where(ProductStock.id == ids["C-LOW"])
+    )
+    assert alerted is None
+    assert await _outbox_count(async_db_session) == 0
+
+    # письмо не ушло — следующий прогон поднимает тот же алерт
+    alerts = await raise_low_stock_alerts(async_db_session, company_id=3103, notify=_ok)
+    assert [a["sku"] for a in alerts[3103]] == ["C-LOW"]
+    assert notified == [(3103, ["C-LOW"])]
+    assert await _outbox_count(async_db_session) == 1
+    assert await raise_low_stock_alerts(async_db_session, company_id=3103, notify=_ok) == {}
+
+
+async def test_low_stock_claim_can_use_partial_index(async_db_session: AsyncSession):
+    await async_db_session.execute(sa.text("SET LOCAL enable_seqscan = off"))
+    plan = (
+        await async_db_session.execute(
+            sa.text(
+                "EXPLAIN SELECT id FROM product_stocks WHERE quantity <= min_quantity AND min_quantity > 0"
+                " AND warehouse_id = 1"
+            )
+        )
+    ).scalars()
+    assert "ix_stock_low_partial" in "\n".join(plan)
+    await async_db_session.rollback()
+
+
+def test_reorder_scan_bulk_enqueues_company_scoped(db_session):
+    for company_id in (3201, 3202):
+        db_session.add(Company(id=company_id, name=f"Company {company_id}"))
+        db_session.flush()
+        warehouse = Warehouse(company_id=company_id, name=f"WH-{company_id}", is_main=True)
+        product = Product(company_id=company_id, name="P", slug=f"p-{company_id}", sku=f"S-{company_id}", price=1)
+        db_session.add_all([warehouse, product])
+        db_session.flush()
+        db_session.add(
+            ProductStock(
+                product_id=product.id,
+                warehouse_id=warehouse.id,
+                quantity=1,
+                reserved_quantity=0,
+                min_quantity=4,
+                max_quantity=10,
+            )
+        )
+    db_session.flush()
+
+    report = low_stock_report(db_session, company_id=3201)
+    assert [(r["quantity"], r["min_quantity"]) for r in report] == [(1, 4)]
+
+    events = scan_and_enqueue_reorder_alerts(db_session, company_id=3201)
+    assert len(events) == 1
+    assert events[0].payload["suggested_purchase_qty"] == 9
+    assert events[0].payload["warehouse_name"] == "WH-3201"
+    assert scan_and_enqueue_reorder_alerts(db_session, company_id=3201) == []
+    assert len(scan_and_enqueue_reorder_alerts(db_session)) == 1
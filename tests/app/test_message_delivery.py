@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import smtplib
+from datetime import timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+import tests.conftest as base_conftest
+from app.models.campaign import Campaign, CampaignStatus, ChannelType, Message, MessageStatus
+from app.models.company import Company
+from app.worker import message_delivery, scheduler_worker
+
+
+def _session():
+    if base_conftest.sync_engine is None:
+        raise RuntimeError("sync_engine is not initialized; ensure test_db fixture runs first")
+    return sessionmaker(bind=base_conftest.sync_engine, expire_on_commit=False, autoflush=False)()
+
+
+def _seed_campaign(*, company_id: int, recipients: list[str]) -> tuple[int, list[int]]:
+    with _session() as s:
+        company = s.query(Company).filter(Company.id == company_id).first()
+        if not company:
+            company = Company(id=company_id, name=f"Company {company_id}")
+            s.add(company)
+            s.flush()
+
+        campaign = Campaign(
+            title=f"Batch {company_id}",
+            description="test",
+            status=CampaignStatus.READY,
+            scheduled_at=None,
+            company_id=company.id,
+        )
+        s.add(campaign)
+        s.flush()
+
+        messages = [
+            Message(
+                campaign_id=campaign.id,
+                recipient=recipient,
+                content="Hello",
+                status=MessageStatus.PENDING,
+                channel=ChannelType.EMAIL,
+            )
+            for recipient in recipients
+        ]
+        s.add_all(messages)
+        s.commit()
+        return campaign.id, [m.id for m in messages]
+
+
+class _FakeSmtp:
+    def __init__(self, sent: list[str], fail_for: set[str]):
+        self._sent = sent
+        self._fail_for = fail_for
+        self.closed = False
+
+    def send_message(self, msg):
+        if msg["To"] in self._fail_for:
+            raise smtplib.SMTPRecipientsRefused({msg["To"]: (550, b"rejected")})
+        self._sent.append(msg["To"])
+        return {}
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_batched_delivery_reuses_connections(monkeypatch, test_db):
+    _ = test_db
+    recipients = [f"user{i}@example.com" for i in range(12)]
+    campaign_id, message_ids = _seed_campaign(company_id=9401, recipients=recipients)
+
+    sent: list[str] = []
+    opened: list[_FakeSmtp] = []
+
+    def _connect(_smtp):
+        conn = _FakeSmtp(sent, set())
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(
+        scheduler_worker,
+        "_load_smtp_config",
+        lambda: scheduler_worker.SmtpConfig(
+            host="smtp.test",
+            port=587,
+            user="",
+            password="",
+            from_email="noreply@example.com",
+            from_name="SmartSell",
+            use_tls=False,
+            use_ssl=False,
+        ),
+    )
+
+    summary = message_delivery.deliver_pending_messages(
+        campaign_ids=[campaign_id],
+        batch_size=5,
+        concurrency=2,
+        rate_per_second=0,
+        connect=_connect,
+    )
+
+    assert summary["claimed"] == 12
+    assert summary["sent"] == 12
+    assert summary["failed"] == 0
+    assert summary["batches"] == 3
+    assert sorted(sent) == sorted(recipients)
+    assert 1 <= len(opened) <= 2
+    assert all(conn.closed for conn in opened)
+
+    with _session() as s:
+        rows = s.query(Message).filter(Message.id.in_(message_ids)).all()
+        assert {m.status for m in rows} == {MessageStatus.SENT}
+        assert all(m.sent_at is not None for m in rows)
+        assert all(m.provider_message_id and m.provider_message_id.startswith("<") for m in rows)
+        assert len({m.provider_message_id for m in rows}) == len(rows)
+
+
+def test_batched_delivery_marks_failures(monkeypatch, test_db):
+    _ = test_db
+    campaign_id, message_ids = _seed_campaign(company_id=9402, recipients=["ok@example.com", "bad@example.com"])
+
+    monkeypatch.setattr(scheduler_worker, "_smtp_send_with_retry", lambda fn, **_kw: fn())
+    monkeypatch.setattr(
+        scheduler_worker,
+        "_load_smtp_config",
+        lambda: scheduler_worker.SmtpConfig(
+            host="smtp.test",
+            port=587,
+            user="",
+            password="",
+            from_email="noreply@example.com",
+            from_name="SmartSell",
+            use_tls=False,
+            use_ssl=False,
+        ),
+    )
+
+    sent: list[str] = []
+    summary = message_delivery.deliver_pending_messages(
+        campaign_ids=[campaign_id],
+        batch_size=10,
+        concurrency=1,
+        rate_per_second=0,
+        connect=lambda _smtp: _FakeSmtp(sent, {"bad@example.com"}),
+    )
+
+    assert summary["sent"] == 1
+    assert summary["failed"] == 1
+
+    with _session() as s:
+        rows = {m.recipient: m for m in s.query(Message).filter(Message.id.in_(message_ids)).all()}
+        assert rows["ok@example.com"].status == MessageStatus.SENT
+        assert rows["bad@example.com"].status == MessageStatus.FAILED
+        assert "SMTPRecipientsRefused" in (rows["bad@example.com"].error_message or "")
+        assert len(rows["bad@example.com"].error_message) <= scheduler_worker._ERROR_MESSAGE_LIMIT
+
+
+def test_claim_skips_non_pending(test_db):
+    _ = test_db
+    campaign_id, message_ids = _seed_campaign(company_id=9403, recipients=["a@example.com", "b@example.com"])
+    with _session() as s:
+        s.query(Message).filter(Message.id == message_ids[0]).update({"status": MessageStatus.SENT})
+        s.commit()
+
+    with _session() as s:
+        claimed = message_delivery.claim_pending_messages(s, limit=10, campaign_ids=[campaign_id])
+        assert [item.id for item in claimed] == [message_ids[1]]
+        assert claimed[0].subject == "Campaign: Batch 9403"
+
+    with _session() as s:
+        again = message_delivery.claim_pending_messages(s, limit=10, campaign_ids=[campaign_id])
+        assert again == []
+        assert s.get(Message, message_ids[1]).status == MessageStatus.SENDING
+
+
+def test_claim_reclaims_sending_messages_with_expired_lease(test_db):
+    _ = test_db
+    campaign_id, message_ids = _seed_campaign(company_id=9405, recipients=["a@example.com", "b@example.com"])
+
+    with _session() as s:
+        claimed = message_delivery.claim_pending_messages(s, limit=10, campaign_ids=[campaign_id])
+        assert sorted(item.id for item in claimed) == sorted(message_ids)
+        assert all(s.get(Message, mid).claimed_at is not None for mid in message_ids)
+
+    # Воркер «упал» после claim: пока lease жив, сообщения не забираются повторно
+    with _session() as s:
+        assert message_delivery.claim_pending_messages(s, limit=10, campaign_ids=[campaign_id]) == []
+
+    stale = scheduler_worker._utcnow_aware() - timedelta(seconds=120)
+    with _session() as s:
+        s.query(Message).filter(Message.id == message_ids[0]).update({"claimed_at": stale})
+        s.commit()
+
+    with _session() as s:
+        reclaimed = message_delivery.claim_pending_messages(s, limit=10, campaign_ids=[campaign_id], lease_seconds=60)
+        assert [item.id for item in reclaimed] == [message_ids[0]]
+        row = s.get(Message, message_ids[0])
+        assert row.status == MessageStatus.SENDING
+        assert row.claimed_at > stale
+
+
+def test_scheduler_coalesces_delivery_job_when_batch_enabled(monkeypatch, test_db):
+    _ = test_db
+    campaign_id, _ids = _seed_campaign(company_id=9404, recipients=["a@example.com", "b@example.com"])
+
+    class _Job:
+        def __init__(self, job_id: str):
+            self.id = job_id
+
+    class _StubScheduler:
+        def __init__(self) -> None:
+            self._jobs: dict[str, _Job] = {}
+
+        def get_job(self, job_id: str):
+            return self._jobs.get(job_id)
+
+        def add_job(self, *_args, id: str | None = None, **_kwargs):
+            job = _Job(id or f"job-{len(self._jobs) + 1}")
+            self._jobs[job.id] = job
+            return job
+
+        def get_jobs(self):
+            return list(self._jobs.values())
+
+    stub_scheduler = _StubScheduler()
+    monkeypatch.setattr(scheduler_worker, "scheduler", stub_scheduler)
+    monkeypatch.setattr(scheduler_worker.settings, "CAMPAIGN_DELIVERY_BATCH_ENABLED", True, raising=False)
+
+    assert scheduler_worker._schedule_pending_messages_for_campaigns([campaign_id]) == 2
+    assert scheduler_worker._schedule_pending_messages_for_campaigns([campaign_id]) == 2
+
+    jobs = stub_scheduler.get_jobs()
+    assert [job.id for job in jobs] == [scheduler_worker._JOB_ID_MESSAGE_DELIVERY_NOW]
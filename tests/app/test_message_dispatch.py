@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.integrations.errors import ProviderNotConfiguredError
+from app.integrations.providers.noop import NoOpOtpProvider
+from app.services import message_dispatch
+from app.services.message_dispatch import MessageDispatcher, MessageQueueFull, dispatch_otp
+
+
+class _FakeOtpProvider:
+    name = "fake-sms"
+    version = 3
+
+    def __init__(self, outcomes: list | None = None):
+        self.outcomes = list(outcomes or [])
+        self.calls: list[dict] = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def send_otp(self, phone, code, ttl_seconds, metadata=None):
+        await self.release.wait()
+        self.calls.append({"phone": phone, "code": code, "ttl_seconds": ttl_seconds})
+        outcome = self.outcomes.pop(0) if self.outcomes else {"status": "ok", "success": True}
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def dispatcher(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_ENABLED", True, raising=False)
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_RETRY_BASE_SECONDS", 0.0, raising=False)
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_RATE_PER_SECOND", 0.0, raising=False)
+    instance = MessageDispatcher()
+    monkeypatch.setattr(message_dispatch, "dispatcher", instance)
+    return instance
+
+
+async def test_dispatch_otp_enqueues_and_returns_immediately(dispatcher: MessageDispatcher):
+    provider = _FakeOtpProvider()
+    provider.release.clear()
+
+    result = await dispatch_otp(provider, phone="+77001234567", code="1234", ttl_seconds=300)
+
+    assert result == {"status": "queued", "provider": "fake-sms", "version": 3, "success": None}
+    assert provider.calls == []
+
+    provider.release.set()
+    assert await dispatcher.drain(timeout=2)
+    assert provider.calls == [{"phone": "+77001234567", "code": "1234", "ttl_seconds": 300}]
+    await dispatcher.shutdown()
+
+
+async def test_transient_failures_are_retried(dispatcher: MessageDispatcher, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_MAX_ATTEMPTS", 3, raising=False)
+    provider = _FakeOtpProvider(
+        [
+            ProviderNotConfiguredError("otp_provider_unavailable"),
+            {"status": "error", "provider_status": 502, "success": None},
+            {"status": "ok", "success": True},
+        ]
+    )
+
+    await dispatch_otp(provider, phone="+77001234567", code="1234", ttl_seconds=300)
+
+    assert await dispatcher.drain(timeout=2)
+    assert len(provider.calls) == 3
+    await dispatcher.shutdown()
+
+
+async def test_permanent_failures_are_not_retried(dispatcher: MessageDispatcher, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_MAX_ATTEMPTS", 3, raising=False)
+    provider = _FakeOtpProvider([ProviderNotConfiguredError("otp_provider_auth_failed")])
+
+    await dispatch_otp(provider, phone="+77001234567", code="1234", ttl_seconds=300)
+
+    assert await dispatcher.drain(timeout=2)
+    assert len(provider.calls) == 1
+    await dispatcher.shutdown()
+
+
+async def test_full_queue_sheds_with_503(dispatcher: MessageDispatcher, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_WORKERS", 1, raising=False)
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_QUEUE_SIZE", 1, raising=False)
+    provider = _FakeOtpProvider()
+    provider.release.clear()
+
+    await dispatch_otp(provider, phone="+77000000001", code="1", ttl_seconds=60)
+    await asyncio.sleep(0)  # воркер забирает первое сообщение и ждёт провайдера
+    await dispatch_otp(provider, phone="+77000000002", code="2", ttl_seconds=60)
+
+    with pytest.raises(MessageQueueFull) as exc_info:
+        await dispatch_otp(provider, phone="+77000000003", code="3", ttl_seconds=60)
+    assert exc_info.value.http_status == 503
+
+    provider.release.set()
+    assert await dispatcher.drain(timeout=2)
+    assert [c["code"] for c in provider.calls] == ["1", "2"]
+    await dispatcher.shutdown()
+
+
+async def test_noop_provider_is_called_inline(dispatcher: MessageDispatcher, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "ENVIRONMENT", "development", raising=False)
+
+    result = await dispatch_otp(NoOpOtpProvider(), phone="+77001234567", code="1234", ttl_seconds=300)
+
+    assert result["status"] == "noop"
+    assert result["code"] == "1234"
+    assert dispatcher.stats()["workers"] == 0
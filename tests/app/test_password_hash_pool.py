@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+import app.core.security as security
+
+
+async def test_async_hash_and_verify_roundtrip():
+    hashed = await security.get_password_hash_async("S3cure-Passw0rd!")
+
+    assert await security.verify_password_async("S3cure-Passw0rd!", hashed)
+    assert not await security.verify_password_async("wrong-password", hashed)
+    assert security.password_hash_pool_stats()["inflight"] == 0
+
+
+async def test_pool_sheds_load_when_queue_is_full(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(security.settings, "PASSWORD_HASH_WORKERS", 1, raising=False)
+    monkeypatch.setattr(security.settings, "PASSWORD_HASH_QUEUE_LIMIT", 0, raising=False)
+    monkeypatch.setattr(security, "_hash_executor", None)
+    monkeypatch.setattr(security, "_hash_inflight", 0)
+
+    release = threading.Event()
+    blocked = asyncio.ensure_future(security._run_password_job(release.wait, 5))
+    await asyncio.sleep(0)
+    try:
+        with pytest.raises(security.PasswordHashingBusy) as exc_info:
+            await security.get_password_hash_async("another-password")
+        assert exc_info.value.http_status == 503
+        assert exc_info.value.headers == {"Retry-After": "1"}
+    finally:
+        release.set()
+        await blocked
+        security._hash_executor.shutdown(wait=True)
+
+    assert security.password_hash_pool_stats()["inflight"] == 0
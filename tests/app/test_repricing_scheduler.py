@@ -4,9 +4,10 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 
 import pytest
-from sqlalchemy import select
+from sqlalchemy import select, update
 
-from app.models.repricing import RepricingRule, RepricingRun
+from app.models.product import Product
+from app.models.repricing import RepricingDirtyCompany, RepricingRule, RepricingRun
 from app.worker import scheduler_worker
 
 pytestmark = pytest.mark.asyncio
@@ -111,3 +112,69 @@ async def test_repricing_autorun_respects_cooldown(
         .all()
     )
     assert len(runs) == 1
+
+
+async def test_repricing_autorun_processes_only_dirty_companies(
+    monkeypatch,
+    test_db,
+    async_db_session,
+    factory,
+):
+    _ = test_db
+    monkeypatch.setenv("ENABLE_SCHEDULER", "1")
+    monkeypatch.setenv("REPRICING_AUTORUN_ENABLED", "1")
+
+    company = await factory["create_company"]()
+    product = Product(company_id=company.id, name="Dirty", slug="dirty-1", sku="DIRTY-1", price=Decimal("100.00"))
+    rule = _rule_payload(company.id)
+    rule.min_price = Decimal("90.00")
+    async_db_session.add_all([product, rule])
+    await async_db_session.commit()
+
+    # 100 -> 95 -> 90: пока цены двигаются, компания остаётся в очереди
+    for expected_price in ("95.00", "90.00"):
+        result = await scheduler_worker.run_repricing_autorun_job_async()
+        assert (result["processed"], result["clean"]) == (1, 0)
+        await async_db_session.refresh(product)
+        assert product.price == Decimal(expected_price)
+
+    result = await scheduler_worker.run_repricing_autorun_job_async()
+    assert result["processed"] == 1
+    result = await scheduler_worker.run_repricing_autorun_job_async()
+    assert (result["eligible"], result["dirty"], result["clean"], result["processed"]) == (1, 0, 1, 0)
+
+    product.price = Decimal("200.00")
+    await async_db_session.commit()
+    result = await scheduler_worker.run_repricing_autorun_job_async()
+    assert (result["dirty"], result["processed"]) == (1, 1)
+
+
+async def test_repricing_autorun_time_budget_defers_newest_dirty(
+    monkeypatch,
+    test_db,
+    async_db_session,
+    factory,
+):
+    _ = test_db
+    monkeypatch.setenv("ENABLE_SCHEDULER", "1")
+    monkeypatch.setenv("REPRICING_AUTORUN_ENABLED", "1")
+    monkeypatch.setenv("REPRICING_AUTORUN_TIME_BUDGET_SECONDS", "0.000001")
+
+    newer = await factory["create_company"]()
+    older = await factory["create_company"]()
+    async_db_session.add_all([_rule_payload(newer.id), _rule_payload(older.id)])
+    await async_db_session.commit()
+    await async_db_session.execute(
+        update(RepricingDirtyCompany)
+        .where(RepricingDirtyCompany.company_id == older.id)
+        .values(dirty_since=datetime.utcnow() - timedelta(hours=1))
+    )
+    await async_db_session.commit()
+
+    result = await scheduler_worker.run_repricing_autorun_job_async()
+    assert (result["dirty"], result["processed"], result["deferred"]) == (2, 1, 1)
+    remaining = (await async_db_session.execute(select(RepricingDirtyCompany.company_id))).scalars().all()
+    assert remaining == [newer.id]
+
+    result = await scheduler_worker.run_repricing_autorun_job_async()
+    assert (result["processed"], result["deferred"], result["clean"]) == (1, 0, 1)
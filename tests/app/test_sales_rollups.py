@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+import tests.conftest as base_conftest
+from app.models.company import Company
+from app.models.order import Order, OrderItem, OrderSource, OrderStatus
+from app.models.sales_rollup import SalesRollup, refresh_rollup_days, refresh_rollups_for_orders_async
+from app.services import sales_rollups
+from app.services.sales_rollups import read_sales_buckets, rebuild_sales_rollups
+
+_COMPANY_ID = 93001
+
+
+@pytest.fixture
+def rollups_enabled(monkeypatch):
+    from app.core import config
+
+    # модель читает флаг через app.core.config, сервис — через свой импорт settings
+    monkeypatch.setattr(config.settings, "SALES_ROLLUPS_ENABLED", True, raising=False)
+    monkeypatch.setattr(sales_rollups.settings, "SALES_ROLLUPS_ENABLED", True, raising=False)
+
+
+async def _ensure_company(session) -> None:
+    if await session.get(Company, _COMPANY_ID) is None:
+        session.add(Company(id=_COMPANY_ID, name=f"Company {_COMPANY_ID}"))
+        await session.flush()
+
+
+def _order(ext_id: str, created_at: datetime, *, status: OrderStatus, total: str) -> Order:
+    return Order(
+        company_id=_COMPANY_ID,
+        order_number=f"ROLLUP-{_COMPANY_ID}-{ext_id}",
+        external_id=ext_id,
+        source=OrderSource.MANUAL,
+        status=status,
+        total_amount=Decimal(total),
+        currency="KZT",
+        created_at=created_at,
+        updated_at=created_at,
+    )
+
+
+async def _rollups(session, granularity: str) -> dict[datetime, SalesRollup]:
+    res = await session.execute(
+        select(SalesRollup)
+        .where(SalesRollup.company_id == _COMPANY_ID, SalesRollup.granularity == granularity)
+        # upsert сохраняет id строки — обходим identity map сессии
+        .execution_options(populate_existing=True)
+    )
+    return {row.bucket_start: row for row in res.scalars().all()}
+
+
+def test_plan_segments_splits_closed_and_open_periods():
+    now = datetime(2026, 3, 10, 14, 25)
+    daily, hourly, raw = sales_rollups._plan_segments(datetime(2026, 3, 7, 22, 30), datetime(2026, 3, 10, 16), now)
+
+    assert daily == [(datetime(2026, 3, 8), datetime(2026, 3, 10))]
+    assert hourly == [
+        (datetime(2026, 3, 7, 23), datetime(2026, 3, 8)),
+        (datetime(2026, 3, 10), datetime(2026, 3, 10, 14)),
+    ]
+    assert raw == [
+        (datetime(2026, 3, 7, 22, 30), datetime(2026, 3, 7, 23), False),
+        (datetime(2026, 3, 10, 14), datetime(2026, 3, 10, 16), True),
+    ]
+
+    daily, hourly, raw = sales_rollups._plan_segments(datetime(2026, 3, 10, 14, 1), datetime(2026, 3, 10, 14, 5), now)
+    assert (daily, hourly) == ([], [])
+    assert raw == [(datetime(2026, 3, 10, 14, 1), datetime(2026, 3, 10, 14, 5), True)]
+
+
+@pytest.mark.asyncio
+async def test_rollups_follow_order_writes_and_match_raw(async_db_session, rollups_enabled):
+    await _ensure_company(async_db_session)
+    day = (datetime.utcnow() - timedelta(days=3)).replace(hour=10, minute=15, second=0, microsecond=0)
+
+    paid = _order("r1", day, status=OrderStatus.PAID, total="100.00")
+    pending = _order("r2", day + timedelta(hours=2), status=OrderStatus.PENDING, total="40.00")
+    async_db_session.add_all([paid, pending])
+    await async_db_session.flush()
+    async_db_session.add(
+        OrderItem(
+            order_id=paid.id,
+            sku="ROLL-1",
+            name="Item",
+            quantity=3,
+            unit_price=Decimal("10.00"),
+            total_price=Decimal("30.00"),
+        )
+    )
+    await async_db_session.commit()
+
+    daily = await _rollups(async_db_session, "day")
+    bucket = daily[day.replace(hour=0, minute=0)]
+    assert bucket.orders_count == 2
+    assert bucket.revenue == Decimal("140.00")
+    assert bucket.paid_orders_count == 1
+    assert bucket.paid_revenue == Decimal("100.00")
+    assert bucket.items_sold == 3
+    assert set(await _rollups(async_db_session, "hour")) >= {day.replace(minute=0), day.replace(hour=12, minute=0)}
+
+    pending.status = OrderStatus.COMPLETED
+    await async_db_session.commit()
+    bucket = (await _rollups(async_db_session, "day"))[day.replace(hour=0, minute=0)]
+    assert bucket.paid_orders_count == 2
+    assert bucket.paid_revenue == Decimal("140.00")
+
+    current = _order("r3", datetime.utcnow(), status=OrderStatus.PAID, total="7.00")
+    async_db_session.add(current)
+    await async_db_session.commit()
+
+    buckets = await read_sales_buckets(
+        async_db_session, company_id=_COMPANY_ID, date_from=day - timedelta(days=1), date_to=datetime.utcnow()
+    )
+    assert sum(b.orders_count for b in buckets) == 3
+    assert sum(b.paid_revenue for b in buckets) == Decimal("147.00")
+    assert sum(b.items_sold for b in buckets) == 3
+
+
+@pytest.mark.asyncio
+async def test_rebuild_restores_rollups(async_db_session):
+    await _ensure_company(async_db_session)
+    day = (datetime.utcnow() - timedelta(days=5)).replace(hour=8, minute=0, second=0, microsecond=0)
+    async_db_session.add(_order("b1", day, status=OrderStatus.PAID, total="55.00"))
+    await async_db_session.commit()
+
+    await async_db_session.execute(SalesRollup.__table__.delete().where(SalesRollup.company_id == _COMPANY_ID))
+    await async_db_session.commit()
+    assert await _rollups(async_db_session, "day") == {}
+
+    await rebuild_sales_rollups(async_db_session, company_id=_COMPANY_ID, date_from=day, date_to=day)
+
+    daily = await _rollups(async_db_session, "day")
+    assert daily[day.replace(hour=0)].paid_revenue == Decimal("55.00")
+
+
+@pytest.mark.asyncio
+async def test_core_order_writes_refresh_rollups(async_db_session, rollups_enabled):
+    await _ensure_company(async_db_session)
+    day = (datetime.utcnow() - timedelta(days=7)).replace(hour=9, minute=0, second=0, microsecond=0)
+    first = _order("c1", day, status=OrderStatus.PENDING, total="30.00")
+    second = _order("c2", day + timedelta(hours=1), status=OrderStatus.PENDING, total="20.00")
+    async_db_session.add_all([first, second])
+    await async_db_session.commit()
+
+    # Core UPDATE мимо after_flush
+    await Order.bulk_update_status_async(async_db_session, [first.id, second.id], new_status=OrderStatus.PAID)
+    await async_db_session.commit()
+    bucket = (await _rollups(async_db_session, "day"))[day.replace(hour=0)]
+    assert bucket.paid_orders_count == 2
+    assert bucket.paid_revenue == Decimal("50.00")
+
+    # Перенос заказа в другой день: старый часовой бакет опустел и удаляется, новый появляется через upsert
+    moved_to = day + timedelta(days=1)
+    await async_db_session.execute(Order.__table__.update().where(Order.id == second.id).values(created_at=moved_to))
+    await refresh_rollups_for_orders_async(async_db_session, [first.id, second.id])
+    await async_db_session.commit()
+
+    hourly = await _rollups(async_db_session, "hour")
+    assert day + timedelta(hours=1) not in hourly
+    assert hourly[moved_to].orders_count == 1
+    daily = await _rollups(async_db_session, "day")
+    assert daily[day.replace(hour=0)].orders_count == 1
+    assert daily[moved_to.replace(hour=0)].revenue == Decimal("20.00")
+
+
+def test_incremental_refresh_waits_for_concurrent_refresh_of_same_day(test_db):
+    _ = test_db
+    day = datetime(2026, 3, 1)
+    with base_conftest.sync_engine.connect() as holder, base_conftest.sync_engine.connect() as other:
+        holder.execute(select(text("pg_advisory_xact_lock(:c, :d)")), {"c": _COMPANY_ID, "d": day.toordinal()})
+        other.execute(text("SET LOCAL lock_timeout = '200ms'"))
+        with pytest.raises(OperationalError):
+            refresh_rollup_days(other, [(_COMPANY_ID, day)])
+        other.rollback()
+        # Другой день той же компании не блокируется
+        assert refresh_rollup_days(other, [(_COMPANY_ID, day + timedelta(days=1))]) == 1
+        other.rollback()
+        holder.rollback()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.models.company import Company
+from app.models.kaspi_import_run import KaspiImportRun
+from app.models.worker_shard_lease import WorkerShardLease
+from app.worker.kaspi_import_poll import _fetch_due_runs
+from app.worker.shard_leases import ShardAssignment, acquire_shards, release_shards, shard_of
+
+
+@pytest.fixture
+def session_factory(async_db_session: AsyncSession) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(bind=async_db_session.bind, expire_on_commit=False)
+
+
+async def _acquire(session_factory, owner: str, **kwargs) -> list[int]:
+    kwargs.setdefault("shard_count", 4)
+    kwargs.setdefault("lease_seconds", 60)
+    async with session_factory() as session:
+        return (await acquire_shards(session, "test_job", owner=owner, **kwargs)).shards
+
+
+async def test_replicas_split_shards_fairly(session_factory):
+    now = datetime.utcnow()
+    assert await _acquire(session_factory, "w1", now=now) == [0, 1, 2, 3]
+
+    # новая реплика ждёт, пока владелец отдаст излишек на старте своего запуска
+    assert await _acquire(session_factory, "w2", now=now) == []
+    # heartbeat без rebalance ничего не отдаёт
+    assert await _acquire(session_factory, "w1", now=now, rebalance=False) == [0, 1, 2, 3]
+    assert await _acquire(session_factory, "w1", now=now) == [0, 1]
+    assert await _acquire(session_factory, "w2", now=now) == [2, 3]
+
+    async with session_factory() as session:
+        owners = dict((await session.execute(sa.select(WorkerShardLease.shard, WorkerShardLease.owner))).all())
+    assert owners == {0: "w1", 1: "w1", 2: "w2", 3: "w2"}
+
+
+async def test_expired_worker_shards_are_taken_over(session_factory):
+    now = datetime.utcnow()
+    await _acquire(session_factory, "w1", now=now)
+    await _acquire(session_factory, "w1", now=now)
+    assert await _acquire(session_factory, "w2", now=now) == []
+
+    # w1 перестал слать heartbeat — после TTL его членство и аренды переходят к w2
+    assert await _acquire(session_factory, "w2", now=now + timedelta(seconds=61)) == [0, 1, 2, 3]
+
+    async with session_factory() as session:
+        await release_shards(session, "test_job", owner="w2")
+    assert await _acquire(session_factory, "w3", now=now + timedelta(seconds=62)) == [0, 1, 2, 3]
+
+
+async def test_import_poll_fetches_only_owned_tenants(async_db_session: AsyncSession):
+    for company_id in (4100, 4101):
+        async_db_session.add(Company(id=company_id, name=f"Company {company_id}", kaspi_store_id=f"store-{company_id}"))
+    await async_db_session.flush()
+    for company_id in (4100, 4101):
+        async_db_session.add(
+            KaspiImportRun(
+                company_id=company_id,
+                merchant_uid="store",
+                import_code=f"RUN-{company_id}",
+                kaspi_import_code=f"IC-{company_id}",
+                status="UPLOADED",
+                request_payload=[],
+            )
+        )
+    await async_db_session.commit()
+
+    shards = ShardAssignment(job="kaspi_import_poll", shards=[shard_of(4101, 4)], shard_count=4)
+    runs = await _fetch_due_runs(async_db_session, limit=10, shards=shards)
+    assert [run.company_id for run in runs] == [4101]
+
+    everything = await _fetch_due_runs(async_db_session, limit=10, shards=ShardAssignment.unsharded("x"))
+    assert {run.company_id for run in everything} == {4100, 4101}
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+from decimal import Decimal
+from io import BytesIO
+
+import pytest
+from openpyxl import load_workbook
+
+from app.services.exports.xlsx_stream import build_xlsx, stream_xlsx, write_xlsx
+
+
+class _Unseekable:
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def test_write_xlsx_to_unseekable_stream_roundtrips():
+    sink = _Unseekable()
+    written = write_xlsx(
+        sink,
+        sheet_title="orders",
+        headers=["id", "name", "amount", "note"],
+        rows=[[1, "Ann & <Co>", Decimal("10.50"), None], [2, "ctrl\x01char", 3.5, "x"]],
+    )
+    assert written == 2
+
+    wb = load_workbook(BytesIO(b"".join(sink.chunks)))
+    sheet = wb.active
+    assert sheet.title == "orders"
+    rows = list(sheet.iter_rows(values_only=True))
+    assert rows[0] == ("id", "name", "amount", "note")
+    assert rows[1] == (1, "Ann & <Co>", 10.5, None)
+    assert rows[2] == (2, "ctrlchar", 3.5, "x")
+
+
+@pytest.mark.asyncio
+async def test_stream_xlsx_yields_chunks_incrementally():
+    pulled: list[int] = []
+
+    async def _batches():
+        for batch_no in range(20):
+            pulled.append(batch_no)
+            yield [[batch_no * 500 + i, f"row-{batch_no}-{i}"] for i in range(500)]
+
+    chunks = []
+    first_chunk_after = None
+    async for chunk in stream_xlsx(sheet_title="big", headers=["n", "label"], batches=_batches(), chunk_size=4096):
+        if first_chunk_after is None:
+            first_chunk_after = len(pulled)
+        chunks.append(chunk)
+
+    assert len(chunks) > 1
+    assert first_chunk_after is not None and first_chunk_after < 20
+
+    sheet = load_workbook(BytesIO(b"".join(chunks)), read_only=True).active
+    rows = list(sheet.iter_rows(values_only=True))
+    assert len(rows) == 10_001
+    assert rows[-1] == (9999, "row-19-499")
+
+
+@pytest.mark.asyncio
+async def test_stream_xlsx_stops_worker_when_client_goes_away():
+    pulled: list[int] = []
+
+    async def _batches():
+        for batch_no in range(1000):
+            pulled.append(batch_no)
+            yield [[i, "x" * 200] for i in range(200)]
+
+    gen = stream_xlsx(sheet_title="s", headers=["n", "x"], batches=_batches(), chunk_size=1024)
+    await gen.__anext__()
+    await gen.aclose()
+    await asyncio.sleep(0)
+
+    assert len(pulled) < 1000
+
+
+def test_build_xlsx_matches_headers():
+    content = build_xlsx(sheet_title="products", headers=["product_id", "sku"], rows=iter([[7, "SKU-7"]]))
+    rows = list(load_workbook(BytesIO(content)).active.iter_rows(values_only=True))
+    assert rows == [("product_id", "sku"), (7, "SKU-7")]
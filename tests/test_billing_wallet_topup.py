@@ -14,7 +14,7 @@ from app.core.subscriptions import plan_catalog
 from app.models.billing import Subscription, WalletBalance, WalletTransaction
 from app.models.company import Company
 from app.models.user import User
-from app.services.subscriptions import activate_plan, renew_if_due
+from app.services.subscriptions import activate_plan, renew_due_subscriptions, renew_if_due
 
 pytestmark = pytest.mark.asyncio
 
@@ -491,3 +491,69 @@ async def test_admin_trial_then_wallet_renewal(async_client, async_db_session, a
     assert sub.status == "active"
     assert sub.period_end == _add_months_anchor(previous_period_end, anchor_day, 1)
     assert wallet.balance == Decimal("70.00")
+
+
+async def test_renewal_engine_commits_per_chunk_and_reports_run(async_db_session, monkeypatch):
+    monkeypatch.setitem(
+        plan_catalog.PLAN_CATALOG,
+        "business",
+        plan_catalog.PlanCatalogEntry(
+            plan_id="business",
+            display_name="Business",
+            price=Decimal("30.00"),
+            currency="KZT",
+        ),
+    )
+
+    period_end = datetime(2026, 3, 1, 0, 0, tzinfo=UTC)
+    subs = []
+    for idx, balance in enumerate(("100.00", "100.00", "5.00")):
+        company = Company(id=9010 + idx, name=f"Chunked Renew Co {idx}")
+        async_db_session.add(company)
+        await async_db_session.flush()
+        async_db_session.add(WalletBalance(company_id=company.id, balance=Decimal(balance), currency="KZT"))
+        sub = Subscription(
+            company_id=company.id,
+            plan="business",
+            status="active",
+            billing_cycle="monthly",
+            price=Decimal("30.00"),
+            currency="KZT",
+            started_at=period_end - timedelta(days=28),
+            period_start=period_end - timedelta(days=28),
+            period_end=period_end,
+            next_billing_date=period_end,
+            billing_anchor_day=1,
+        )
+        async_db_session.add(sub)
+        subs.append(sub)
+    await async_db_session.commit()
+
+    stats = await renew_due_subscriptions(
+        async_db_session,
+        now=datetime(2026, 3, 1, 12, 0, tzinfo=UTC),
+        chunk_size=2,
+        commit_per_chunk=True,
+    )
+
+    assert stats.processed == 3
+    assert stats.renewed == 2
+    assert stats.past_due == 1
+    assert stats.failed == 0
+    assert stats.chunks == 2
+    assert stats.as_dict()["throughput_per_s"] >= 0
+
+    for sub in subs:
+        await async_db_session.refresh(sub)
+    assert [sub.status for sub in subs] == ["active", "active", "past_due"]
+    assert subs[0].period_end == datetime(2026, 4, 1, 0, 0, tzinfo=UTC)
+
+    debits = (
+        await async_db_session.execute(
+            sa.select(sa.func.count())
+            .select_from(WalletTransaction)
+            .where(WalletTransaction.description == "subscription_renewal")
+            .where(WalletTransaction.reference_id.in_([sub.id for sub in subs]))
+        )
+    ).scalar_one()
+    assert debits == 2
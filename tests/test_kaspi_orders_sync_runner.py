@@ -211,3 +211,66 @@ async def test_runner_respects_max_concurrent(monkeypatch, async_db_session):
     assert result["total"] == 5
     assert result["success"] == 5
     assert max_active <= 2, f"Expected max 2 concurrent, got {max_active}"
+
+
+@pytest.mark.asyncio
+async def test_adaptive_runner_reschedules_by_volume_and_skips_not_due(monkeypatch, async_db_session):
+    """Due merchants are synced once and rescheduled: busy ones sooner, quiet ones later."""
+    from app.models.kaspi_order_sync_state import KaspiOrderSyncState
+    from app.services import kaspi_service
+    from app.services.kaspi_orders_sync_runner import run_kaspi_orders_sync_due
+
+    for company in (await async_db_session.execute(select(Company))).scalars().all():
+        company.is_active = False
+    async_db_session.add(Company(id=9301, name="Busy Merchant", is_active=True, kaspi_store_id="store-9301"))
+    async_db_session.add(Company(id=9302, name="Quiet Merchant", is_active=True, kaspi_store_id="store-9302"))
+    await async_db_session.commit()
+
+    sync_calls = []
+
+    async def fake_sync_orders(self, *, db, company_id, **kwargs):  # noqa: ARG001
+        sync_calls.append(company_id)
+        return {"ok": True, "fetched": 120 if company_id == 9301 else 0, "inserted": 0, "updated": 0}
+
+    monkeypatch.setattr(kaspi_service.KaspiService, "sync_orders", fake_sync_orders)
+
+    result = await run_kaspi_orders_sync_due()
+    assert sorted(sync_calls) == [9301, 9302]
+    assert result["success"] == 2
+
+    states = {
+        s.company_id: s
+        for s in (
+            await async_db_session.execute(
+                select(KaspiOrderSyncState).where(KaspiOrderSyncState.company_id.in_([9301, 9302]))
+            )
+        )
+        .scalars()
+        .all()
+    }
+    assert states[9301].sync_interval_seconds < states[9302].sync_interval_seconds
+    assert states[9301].next_run_at is not None and states[9301].lease_owner is None
+
+    again = await run_kaspi_orders_sync_due()
+    assert again["total"] == 0
+    assert sorted(sync_calls) == [9301, 9302]
+
+
+@pytest.mark.asyncio
+async def test_sync_schedule_leases_are_exclusive_and_backoff_grows(async_db_session):
+    from app.services import kaspi_orders_sync_scheduler as scheduler
+
+    for company in (await async_db_session.execute(select(Company))).scalars().all():
+        company.is_active = False
+    async_db_session.add(Company(id=9303, name="Leased Merchant", is_active=True, kaspi_store_id="store-9303"))
+    await async_db_session.commit()
+
+    first = await scheduler.claim_due_companies(async_db_session, owner="worker-a")
+    second = await scheduler.claim_due_companies(async_db_session, owner="worker-b")
+    assert [row[0] for row in first] == [9303]
+    assert second == []
+
+    assert scheduler.next_sync_interval(outcome="failed", failures=1) < scheduler.next_sync_interval(
+        outcome="failed", failures=3
+    )
+    assert scheduler.next_sync_interval(outcome="rate_limited", previous=60, retry_after=900) == 900
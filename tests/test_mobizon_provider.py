@@ -7,11 +7,13 @@ import pytest
 from cryptography.fernet import Fernet
 from httpx import Response
 
+from app.core.config import settings
 from app.core.provider_registry import ProviderRegistry
 from app.core.security import create_access_token, get_password_hash
 from app.integrations.providers.mobizon.otp import MobizonOtpProvider
 from app.models.integration_provider import IntegrationProviderEvent
 from app.models.user import User
+from app.services.message_dispatch import dispatcher as message_dispatcher
 from app.services.otp_providers import OtpProviderResolver
 from app.services.provider_configs import ProviderConfigService
 
@@ -49,6 +51,7 @@ async def test_send_otp_success(monkeypatch, async_client, async_db_session):
     headers = {"Authorization": f"Bearer {token}"}
     monkeypatch.setenv("ENVIRONMENT", "development")
     monkeypatch.setenv("DEBUG_PROVIDER_INFO", "1")
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_ENABLED", True, raising=False)
 
     await async_client.post(
         "/api/admin/integrations/providers",
@@ -68,7 +71,10 @@ async def test_send_otp_success(monkeypatch, async_client, async_db_session):
         json={"config": {"api_key": "k1", "base_url": "https://mobizon.test", "timeout_seconds": 1}},
     )
 
+    sent: list[str] = []
+
     async def fake_request(self, method, path, data=None, json=None, params=None, headers=None, **_kwargs):
+        sent.append((data or {}).get("recipient"))
         return Response(200, json={"data": {"messageId": "m-1"}})
 
     monkeypatch.setattr(MobizonOtpProvider, "_request", fake_request)
@@ -80,7 +86,11 @@ async def test_send_otp_success(monkeypatch, async_client, async_db_session):
     assert resp.status_code == 200, resp.text
     data = resp.json().get("data") or {}
     assert data.get("provider") == "mobizon"
-    assert data.get("provider_success") is True
+    # SMS уходит через очередь диспетчера: ответ не ждёт провайдера
+    assert data.get("provider_status") == "queued"
+    assert data.get("provider_success") is None
+    assert await message_dispatcher.drain(timeout=5)
+    assert sent == ["77000001010"]
 
 
 @pytest.mark.asyncio
@@ -91,6 +101,7 @@ async def test_send_otp_failure(monkeypatch, async_client, async_db_session):
     headers = {"Authorization": f"Bearer {token}"}
     monkeypatch.setenv("ENVIRONMENT", "development")
     monkeypatch.setenv("DEBUG_PROVIDER_INFO", "1")
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_ENABLED", True, raising=False)
 
     await async_client.post(
         "/api/admin/integrations/providers",
@@ -110,10 +121,15 @@ async def test_send_otp_failure(monkeypatch, async_client, async_db_session):
         json={"config": {"api_key": "k1", "base_url": "https://mobizon.test", "timeout_seconds": 1}},
     )
 
+    attempts: list[str] = []
+
     async def fake_request(self, method, path, data=None, json=None, params=None, headers=None, **_kwargs):
+        attempts.append(path)
         return Response(500, json={"error": "fail"})
 
     monkeypatch.setattr(MobizonOtpProvider, "_request", fake_request)
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_MAX_ATTEMPTS", 2, raising=False)
+    monkeypatch.setattr(settings, "MESSAGE_DISPATCH_RETRY_BASE_SECONDS", 0.0, raising=False)
 
     resp = await async_client.post(
         "/api/v1/auth/request-otp",
@@ -123,7 +139,10 @@ async def test_send_otp_failure(monkeypatch, async_client, async_db_session):
     data = resp.json().get("data") or {}
     assert data.get("provider") == "mobizon"
     assert data.get("provider_success") is None
-    assert data.get("provider_status") == "error"
+    assert data.get("provider_status") == "queued"
+    # 5xx провайдера — временная ошибка: диспетчер повторяет отправку
+    assert await message_dispatcher.drain(timeout=5)
+    assert len(attempts) == 2
 
 
 @pytest.mark.asyncio
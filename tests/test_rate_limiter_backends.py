@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import pytest
+
+from app.core.rate_limiter import RateLimiter
+
+
+class _FakeRedis:
+    """Minimal script cache emulation: evaluates the bucket in Python."""
+
+    def __init__(self) -> None:
+        self.scripts: set[str] = set()
+        self.calls: list[str] = []
+        self.buckets: dict[str, list[float]] = {}
+
+    async def script_load(self, script: str) -> str:
+        self.calls.append("script_load")
+        self.scripts.add("sha-1")
+        return "sha-1"
+
+    def _run(self, key, rate, burst, now_ms, cost, _ttl, debt=0):
+        tokens, ts = self.buckets.get(key, [float(burst), float(now_ms)])
+        tokens = min(float(burst), tokens + max(0.0, now_ms - ts) * (rate / 1000.0))
+        tokens = max(0.0, tokens - debt)
+        if tokens >= cost:
+            self.buckets[key] = [tokens - cost, float(now_ms)]
+            return [1, int(tokens - cost), 0]
+        self.buckets[key] = [tokens, float(now_ms)]
+        return [0, int(tokens), 1000]
+
+    async def evalsha(self, sha: str, _numkeys: int, key: str, *args):
+        self.calls.append("evalsha")
+        if sha not in self.scripts:
+            raise RuntimeError("NOSCRIPT No matching script. Please use EVAL.")
+        return self._run(key, *args)
+
+    async def eval(self, _script: str, _numkeys: int, key: str, *args):
+        self.calls.append("eval")
+        self.scripts.add("sha-1")
+        return self._run(key, *args)
+
+
+@pytest.mark.asyncio
+async def test_redis_path_uses_evalsha_and_recovers_from_noscript():
+    redis = _FakeRedis()
+    limiter = RateLimiter(redis=redis, env="test")
+
+    assert (await limiter.allow("api", "a", 5, 60))[0] is True
+    assert (await limiter.allow("api", "a", 5, 60))[0] is True
+    assert redis.calls == ["script_load", "evalsha", "evalsha"]
+
+    redis.scripts.clear()
+    assert (await limiter.allow("api", "a", 5, 60))[0] is True
+    assert redis.calls[-2:] == ["evalsha", "eval"]
+
+
+@pytest.mark.asyncio
+async def test_local_headroom_skips_redis_far_from_limit_and_charges_debt():
+    redis = _FakeRedis()
+    limiter = RateLimiter(redis=redis, env="test", local_headroom=0.5)
+
+    results = [(await limiter.allow("feed", "k", 10, 60))[0] for _ in range(12)]
+
+    assert results[:10] == [True] * 10
+    assert results[10:] == [False, False]
+    assert redis.calls.count("evalsha") < 12
+    key = limiter._key("feed", "k")
+    assert int(redis.buckets[key][0]) == 0
+
+
+def test_memory_store_is_bounded_lru():
+    limiter = RateLimiter(redis=None, env="test", memory_max_keys=3)
+
+    for ident in ("a", "b", "c"):
+        assert limiter._allow_mem("api", ident, 1, 60)[0] is True
+    assert limiter._allow_mem("api", "a", 1, 60)[0] is False
+
+    limiter._allow_mem("api", "d", 1, 60)
+    assert len(limiter._mem) == 3
+    assert limiter._key("api", "b") not in limiter._mem
+    assert limiter._key("api", "a") in limiter._mem
+
+    allowed, retry = limiter._allow_mem("api", "a", 1, 60)
+    assert allowed is False
+    assert 1 <= retry <= 60
+
+
+def test_memory_fallback_keeps_sliding_window(monkeypatch):
+    limiter = RateLimiter(redis=None, env="test")
+    clock = {"now": 1000.0}
+    monkeypatch.setattr("app.core.rate_limiter.time.time", lambda: clock["now"])
+
+    assert [limiter._allow_mem("api", "k", 2, 60)[0] for _ in range(3)] == [True, True, False]
+    # на границе окна лимит не удваивается: через 59с старые запросы ещё в окне
+    clock["now"] += 59
+    assert limiter._allow_mem("api", "k", 2, 60)[0] is False
+    clock["now"] += 2
+    assert [limiter._allow_mem("api", "k", 2, 60)[0] for _ in range(3)] == [True, True, False]